@@ -0,0 +1,44 @@
+"""add_kpi_red_queue_lease
+
+Revision ID: 020_kpi_red_queue_lease
+Revises: 019_fix_claims_gap_expected_amount
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '020_kpi_red_queue_lease'
+down_revision = '019_fix_claims_gap_expected_amount'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Lease para que varios workers reclamen la cola con FOR UPDATE SKIP LOCKED
+    op.add_column(
+        'cabinet_kpi_red_recovery_queue',
+        sa.Column('claimed_by', sa.String(), nullable=True),
+        schema='ops'
+    )
+    op.add_column(
+        'cabinet_kpi_red_recovery_queue',
+        sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+        schema='ops'
+    )
+
+    # Índice para el claim: solo filas pending, en el orden de reclamo
+    op.create_index(
+        'idx_cabinet_kpi_red_recovery_queue_claim',
+        'cabinet_kpi_red_recovery_queue',
+        ['attempt_count', 'created_at'],
+        schema='ops',
+        postgresql_where=sa.text("status = 'pending'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_cabinet_kpi_red_recovery_queue_claim', table_name='cabinet_kpi_red_recovery_queue', schema='ops')
+    op.drop_column('cabinet_kpi_red_recovery_queue', 'lease_expires_at', schema='ops')
+    op.drop_column('cabinet_kpi_red_recovery_queue', 'claimed_by', schema='ops')
@@ -0,0 +1,52 @@
+"""create_mv_refresh_input_state
+
+Revision ID: 021_mv_refresh_input_state
+Revises: 020_kpi_red_queue_lease
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '021_mv_refresh_input_state'
+down_revision = '020_kpi_red_queue_lease'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Log de refresh (antes solo en sql/ops/mv_refresh_log.sql) + motivo de refresh omitido
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS ops.mv_refresh_log (
+            id bigserial PRIMARY KEY,
+            refreshed_at timestamptz NOT NULL DEFAULT now(),
+            schema_name text NOT NULL,
+            mv_name text NOT NULL,
+            status text NOT NULL,
+            duration_ms int NULL,
+            error_message text NULL
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mv_refresh_log_mv_time
+        ON ops.mv_refresh_log (schema_name, mv_name, refreshed_at DESC)
+    """)
+    op.execute("ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS skip_reason text")
+
+    # Contadores de cambios (pg_stat_user_tables) de cada tabla base al último refresh exitoso de cada MV
+    op.create_table(
+        'mv_refresh_input_state',
+        sa.Column('schema_name', sa.Text(), nullable=False),
+        sa.Column('mv_name', sa.Text(), nullable=False),
+        sa.Column('table_name', sa.Text(), nullable=False),
+        sa.Column('change_counter', sa.BigInteger(), nullable=False),
+        sa.Column('captured_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('schema_name', 'mv_name', 'table_name'),
+        schema='ops'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('mv_refresh_input_state', schema='ops')
+    op.execute("ALTER TABLE ops.mv_refresh_log DROP COLUMN IF EXISTS skip_reason")
@@ -0,0 +1,38 @@
+"""create_ivm_state
+
+Revision ID: 022_ivm_state
+Revises: 021_mv_refresh_input_state
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '022_ivm_state'
+down_revision = '021_mv_refresh_input_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Estado de las tablas resumen mantenidas incrementalmente (app/services/incremental_views.py).
+    # Las tablas ops.ivm_* se crean desde su vista fuente en el primer rebuild completo.
+    op.create_table(
+        'ivm_state',
+        sa.Column('view_name', sa.Text(), nullable=False),
+        sa.Column('watermark', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_full_rebuild_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_incremental_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_incremental_keys', sa.Integer(), nullable=True),
+        sa.Column('last_verify_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_verify_diff', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('view_name'),
+        schema='ops'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ivm_state', schema='ops')
@@ -0,0 +1,40 @@
+"""create_mv_read_stats
+
+Revision ID: 023_mv_read_stats
+Revises: 022_ivm_state
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '023_mv_read_stats'
+down_revision = '022_ivm_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Muestras de lecturas (seq_scan + idx_scan) por MV: el scheduler adaptativo calcula lecturas/hora
+    op.create_table(
+        'mv_read_stats',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('sampled_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('schema_name', sa.Text(), nullable=False),
+        sa.Column('mv_name', sa.Text(), nullable=False),
+        sa.Column('read_count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        schema='ops'
+    )
+    op.create_index(
+        'idx_mv_read_stats_mv_time',
+        'mv_read_stats',
+        ['schema_name', 'mv_name', 'sampled_at'],
+        schema='ops'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_mv_read_stats_mv_time', table_name='mv_read_stats', schema='ops')
+    op.drop_table('mv_read_stats', schema='ops')
@@ -0,0 +1,63 @@
+"""catalog_change_notify
+
+Revision ID: 024_catalog_change_notify
+Revises: 023_mv_read_stats
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '024_catalog_change_notify'
+down_revision = '023_mv_read_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Notifica por NOTIFY ct4_catalog cada DDL (migraciones, CREATE INDEX, REFRESH) para que
+    # los workers invaliden su cache de catálogo (app/services/mv_cache.py).
+    # Relaciones: payload = schema.nombre; el resto (índices, funciones...) invalida todo ('*').
+    op.execute("""
+        CREATE OR REPLACE FUNCTION ops.notify_catalog_change()
+        RETURNS event_trigger
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            cmd record;
+        BEGIN
+            FOR cmd IN SELECT * FROM pg_event_trigger_ddl_commands() LOOP
+                IF cmd.object_type IN ('table', 'view', 'materialized view') THEN
+                    PERFORM pg_notify('ct4_catalog', cmd.object_identity);
+                ELSE
+                    PERFORM pg_notify('ct4_catalog', '*');
+                END IF;
+            END LOOP;
+        END;
+        $$
+    """)
+    # Los event triggers requieren superusuario: sin permisos la cache sigue funcionando por TTL
+    op.execute("""
+        DO $$
+        BEGIN
+            DROP EVENT TRIGGER IF EXISTS ct4_catalog_change;
+            CREATE EVENT TRIGGER ct4_catalog_change ON ddl_command_end
+                EXECUTE FUNCTION ops.notify_catalog_change();
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'Sin permisos para crear el event trigger ct4_catalog_change; la cache de catálogo usará solo TTL';
+        END
+        $$
+    """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        DO $$
+        BEGIN
+            DROP EVENT TRIGGER IF EXISTS ct4_catalog_change;
+        EXCEPTION WHEN insufficient_privilege THEN
+            NULL;
+        END
+        $$
+    """)
+    op.execute("DROP FUNCTION IF EXISTS ops.notify_catalog_change()")
@@ -0,0 +1,40 @@
+"""mv_refresh_log_metrics
+
+Revision ID: 025_mv_refresh_log_metrics
+Revises: 024_catalog_change_notify
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '025_mv_refresh_log_metrics'
+down_revision = '024_catalog_change_notify'
+branch_labels = None
+depends_on = None
+
+# Métricas por refresh (app/services/mv_refresh_metrics.py); rows_after_refresh ya existe
+# en la versión extendida del log (sql/ops/mv_refresh_log_extended.sql)
+METRIC_COLUMNS = [
+    ("refresh_method", "text"),
+    ("lock_wait_ms", "int"),
+    ("rows_before", "bigint"),
+    ("rows_after_refresh", "bigint"),
+    ("table_bytes_before", "bigint"),
+    ("table_bytes_after", "bigint"),
+    ("index_bytes_before", "bigint"),
+    ("index_bytes_after", "bigint"),
+    ("dead_tuples_before", "bigint"),
+    ("dead_tuples_after", "bigint"),
+]
+
+
+def upgrade() -> None:
+    for column, column_type in METRIC_COLUMNS:
+        op.execute(f"ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS {column} {column_type}")
+
+
+def downgrade() -> None:
+    for column, _ in METRIC_COLUMNS:
+        if column != "rows_after_refresh":
+            op.execute(f"ALTER TABLE ops.mv_refresh_log DROP COLUMN IF EXISTS {column}")
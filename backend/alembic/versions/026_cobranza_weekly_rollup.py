@@ -0,0 +1,48 @@
+"""cobranza_weekly_rollup
+
+Revision ID: 026_cobranza_weekly_rollup
+Revises: 025_mv_refresh_log_metrics
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '026_cobranza_weekly_rollup'
+down_revision = '025_mv_refresh_log_metrics'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Rollup semanal de ops.mv_yango_cabinet_cobranza_enriched_14d (app/services/cobranza_rollup.py).
+    # Se llena en el siguiente refresh de la MV; mientras está vacío los endpoints leen la MV.
+    op.create_table(
+        'yango_cobranza_weekly_rollup',
+        sa.Column('week_start', sa.Date(), nullable=True),
+        sa.Column('scout_id', sa.Integer(), nullable=True),
+        sa.Column('scout_quality_bucket', sa.Text(), nullable=True),
+        sa.Column('scout_source_group', sa.Text(), nullable=True),
+        sa.Column('has_person_key', sa.Boolean(), nullable=False),
+        sa.Column('reached_m1_14d', sa.Boolean(), nullable=True),
+        sa.Column('reached_m5_14d', sa.Boolean(), nullable=True),
+        sa.Column('reached_m25_14d', sa.Boolean(), nullable=True),
+        sa.Column('has_debt', sa.Boolean(), nullable=False),
+        sa.Column('row_count', sa.BigInteger(), nullable=False),
+        sa.Column('amount_due_sum', sa.Numeric(), nullable=True),
+        sa.Column('total_paid_sum', sa.Numeric(), nullable=True),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        schema='ops'
+    )
+    op.create_index(
+        'idx_yango_cobranza_weekly_rollup_week',
+        'yango_cobranza_weekly_rollup',
+        [sa.text('week_start DESC')],
+        schema='ops'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_yango_cobranza_weekly_rollup_week', table_name='yango_cobranza_weekly_rollup', schema='ops')
+    op.drop_table('yango_cobranza_weekly_rollup', schema='ops')
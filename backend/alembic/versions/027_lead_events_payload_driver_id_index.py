@@ -0,0 +1,47 @@
+"""lead_events_payload_driver_id_index
+
+Revision ID: 027_lead_events_payload_driver_id_index
+Revises: 026_cobranza_weekly_rollup
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '027_lead_events_payload_driver_id_index'
+down_revision = '026_cobranza_weekly_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Búsquedas por payload_json->>'driver_id' (conteos de /identity/orphans, v_driver_orphans,
+    # backfills): la expresión debe coincidir exactamente con la de las consultas.
+    # CONCURRENTLY: lead_events sigue recibiendo ingesta durante el build; no puede correr en
+    # la transacción de la migración. Un intento fallido deja el índice INVALID: se descarta antes
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_lead_events_payload_driver_id',
+            table_name='lead_events',
+            schema='observational',
+            postgresql_concurrently=True,
+            if_exists=True
+        )
+        op.create_index(
+            'idx_lead_events_payload_driver_id',
+            'lead_events',
+            [sa.text("(payload_json ->> 'driver_id')")],
+            schema='observational',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_lead_events_payload_driver_id',
+            table_name='lead_events',
+            schema='observational',
+            postgresql_concurrently=True
+        )
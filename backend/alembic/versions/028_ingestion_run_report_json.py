@@ -0,0 +1,30 @@
+"""ingestion_run_report_json
+
+Revision ID: 028_ingestion_run_report_json
+Revises: 027_lead_events_payload_driver_id_index
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '028_ingestion_run_report_json'
+down_revision = '027_lead_events_payload_driver_id_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Reporte de runs terminados (app/services/run_report.py); los runs previos lo
+    # guardan en la primera lectura de /identity/runs/{run_id}/report
+    op.add_column(
+        'ingestion_runs',
+        sa.Column('report_json', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        schema='ops'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('ingestion_runs', 'report_json', schema='ops')
@@ -0,0 +1,31 @@
+"""create_job_watermarks
+
+Revision ID: 029_create_job_watermarks
+Revises: 028_ingestion_run_report_json
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '029_create_job_watermarks'
+down_revision = '028_ingestion_run_report_json'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Último punto procesado por los jobs incrementales (p. ej. jobs/seed_kpi_red_queue.py --delta)
+    op.create_table(
+        'job_watermarks',
+        sa.Column('job_name', sa.Text(), nullable=False),
+        sa.Column('watermark', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('job_name'),
+        schema='ops'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_watermarks', schema='ops')
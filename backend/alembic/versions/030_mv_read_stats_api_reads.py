@@ -0,0 +1,30 @@
+"""mv_read_stats_api_reads
+
+Revision ID: 030_mv_read_stats_api_reads
+Revises: 029_create_job_watermarks
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '030_mv_read_stats_api_reads'
+down_revision = '029_create_job_watermarks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # ops.mv_read_stats pasa de guardar contadores acumulados de pg_stat_user_tables (seq_scan + idx_scan,
+    # que incluyen los scans del propio refresh) a lecturas de la API por flush (app/services/api_reads.py).
+    # Las muestras anteriores no son comparables.
+    op.execute("DELETE FROM ops.mv_read_stats")
+    op.execute(
+        "COMMENT ON COLUMN ops.mv_read_stats.read_count IS "
+        "'Lecturas de la API de la relación desde el flush anterior del worker'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM ops.mv_read_stats")
+    op.execute("COMMENT ON COLUMN ops.mv_read_stats.read_count IS NULL")
@@ -0,0 +1,43 @@
+"""drop_incremental_views
+
+Revision ID: 031_drop_incremental_views
+Revises: 030_mv_read_stats_api_reads
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '031_drop_incremental_views'
+down_revision = '030_mv_read_stats_api_reads'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Se retiran las tablas resumen incrementales (ops.ivm_*): sus MVs se siguen refrescando
+    # completas porque otras vistas/MVs las leen, y el delta no veía todos sus inputs.
+    # Las tablas y la vista de lectura se creaban en runtime (primer rebuild): IF EXISTS
+    op.execute("DROP VIEW IF EXISTS ops.v_ivm_yango_cabinet_claims_for_collection")
+    op.execute("DROP TABLE IF EXISTS ops.ivm_yango_cabinet_claims_for_collection")
+    op.execute("DROP TABLE IF EXISTS ops.ivm_cabinet_financial_14d")
+    op.drop_table('ivm_state', schema='ops')
+
+
+def downgrade() -> None:
+    # Solo el estado (022_ivm_state); las tablas ops.ivm_* no se recrean
+    op.create_table(
+        'ivm_state',
+        sa.Column('view_name', sa.Text(), nullable=False),
+        sa.Column('watermark', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_full_rebuild_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_incremental_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_incremental_keys', sa.Integer(), nullable=True),
+        sa.Column('last_verify_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_verify_diff', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('view_name'),
+        schema='ops'
+    )
@@ -11,7 +11,7 @@ import csv
 import io
 import logging
 
-from app.core.db import get_db, SessionLocal
+from app.core.db import get_db, BatchSessionLocal
 from app.schemas.cabinet_leads import CabinetLeadsUploadResponse
 from app.services.cabinet_leads_processor import CabinetLeadsProcessor
 
@@ -206,7 +206,7 @@ def _process_new_leads_background(
     refresh_index: bool = True
 ):
     """Ejecuta el procesamiento de nuevos leads en background"""
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         logger.info(f"Iniciando procesamiento automático de nuevos leads (date_from={date_from}, date_to={date_to})")
         
@@ -866,7 +866,7 @@ def _process_ingestion_after_upload(date_from: Optional[date] = None, date_to: O
     """Ejecuta procesamiento automático después del upload"""
     from datetime import date as date_type
     
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         logger.info(f"Iniciando procesamiento automático después de upload CSV (date_from={date_from}, date_to={date_to})")
         
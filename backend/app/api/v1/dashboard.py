@@ -14,6 +14,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import ProgrammingError
 
 from app.core.db import get_db
+from app.services.count_cache import count_rows
+from app.services.mv_freshness import read_freshness
+from app.services.single_flight import coalesce
 from app.schemas.dashboard import (
     ScoutByWeek,
     ScoutOpenItem,
@@ -31,6 +34,28 @@ from app.schemas.dashboard import (
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# GROUPING(semana, scout) de cada fila del resumen de scouts
+TOTAL_GROUPING = 3
+WEEK_GROUPING = 1
+SCOUT_GROUPING = 2
+# GROUPING(semana, iso_semana) de cada fila del resumen Yango
+YANGO_TOTAL_GROUPING = 3
+YANGO_WEEK_GROUPING = 0
+
+
+def week_rows(rows, grouping_id: int, limit: Optional[int] = None) -> list:
+    """
+    Filas por semana de un resultado GROUPING SETS, en el orden de la consulta por
+    semana que reemplaza: ORDER BY week_start_monday DESC, que en Postgres deja la
+    semana NULL (sin fecha) primero, y luego LIMIT.
+    """
+    weeks = sorted(
+        (row for row in rows if row.grouping_id == grouping_id),
+        key=lambda row: (row.week_start_monday is None, row.week_start_monday or date.min),
+        reverse=True
+    )
+    return weeks[:limit] if limit is not None else weeks
+
 
 def _view_exists(db: Session, schema: str, view_name: str) -> bool:
     """Verifica si una vista existe en la base de datos."""
@@ -47,6 +72,7 @@ def _view_exists(db: Session, schema: str, view_name: str) -> bool:
 
 
 @router.get("/scout/summary", response_model=ScoutSummaryResponse)
+@coalesce("dashboard_scout_summary")
 def get_scout_summary(
     db: Session = Depends(get_db),
     week_start: Optional[date] = Query(None, description="Fecha inicio de semana"),
@@ -83,79 +109,67 @@ def get_scout_summary(
     where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
     
     try:
-        # Totales payable
-        totals_payable_query = text(f"""
-            SELECT 
-                COALESCE(SUM(amount), 0) AS payable_amount,
-                COUNT(*) AS payable_items,
-                COUNT(DISTINCT driver_id) AS payable_drivers,
-                COUNT(DISTINCT scout_id) AS payable_scouts
-            FROM {base_table}
-            WHERE {where_clause}
+        # Un solo recorrido de las filas filtradas: totales, por semana y por scout con
+        # GROUPING SETS. grouping_id = GROUPING(semana, scout): 3 total, 1 semana, 2 scout.
+        summary_query = text(f"""
+            WITH filtered AS (
+                SELECT
+                    date_trunc('week', payable_date)::date AS week_start_monday,
+                    to_char(payable_date, 'IYYY-IW') AS iso_year_week,
+                    amount, driver_id, scout_id
+                FROM {base_table}
+                WHERE {where_clause}
+            ),
+            sets AS (
+                SELECT
+                    GROUPING(week_start_monday, scout_id) AS grouping_id,
+                    week_start_monday,
+                    MIN(iso_year_week) AS iso_year_week,
+                    scout_id,
+                    COALESCE(SUM(amount), 0) AS amount,
+                    COUNT(*) AS items,
+                    COUNT(DISTINCT driver_id) AS drivers,
+                    COUNT(DISTINCT scout_id) AS scouts
+                FROM filtered
+                GROUP BY GROUPING SETS ((), (week_start_monday), (scout_id))
+            )
+            SELECT
+                sets.*,
+                COALESCE(s.scout_name_normalized, 'Scout ' || sets.scout_id::text) AS scout_name
+            FROM sets
+            LEFT JOIN ops.v_dim_scouts s ON sets.grouping_id = {SCOUT_GROUPING} AND s.scout_id = sets.scout_id
         """)
         
-        result_payable = db.execute(totals_payable_query, params).fetchone()
-        totals_payable = {
-            "payable_amount": Decimal(str(result_payable.payable_amount or 0)),
-            "payable_items": result_payable.payable_items or 0,
-            "payable_drivers": result_payable.payable_drivers or 0,
-            "payable_scouts": result_payable.payable_scouts or 0
-        }
+        rows = db.execute(summary_query, params).fetchall()
+        total_row = next((row for row in rows if row.grouping_id == TOTAL_GROUPING), None)
+        scout_rows = sorted(
+            (row for row in rows if row.grouping_id == SCOUT_GROUPING and row.scout_id is not None),
+            key=lambda row: row.amount,
+            reverse=True
+        )[:10]
         
         # No hay blocked items en la tabla base
-        totals_blocked = {
-            "blocked_amount": Decimal("0"),
-            "blocked_items": 0
-        }
-        
-        totals = ScoutTotals(**totals_payable, **totals_blocked)
-        
-        # Por semana (payable)
-        by_week_query = text(f"""
-            SELECT 
-                date_trunc('week', payable_date)::date AS week_start_monday,
-                to_char(payable_date, 'IYYY-IW') AS iso_year_week,
-                COALESCE(SUM(amount), 0) AS payable_amount,
-                COUNT(*) AS payable_items
-            FROM {base_table}
-            WHERE {where_clause}
-            GROUP BY week_start_monday, iso_year_week
-            ORDER BY week_start_monday DESC
-            LIMIT 52
-        """)
-        
-        weeks_payable = db.execute(by_week_query, params).fetchall()
+        totals = ScoutTotals(
+            payable_amount=Decimal(str(total_row.amount if total_row else 0)),
+            payable_items=total_row.items if total_row else 0,
+            payable_drivers=total_row.drivers if total_row else 0,
+            payable_scouts=total_row.scouts if total_row else 0,
+            blocked_amount=Decimal("0"),
+            blocked_items=0
+        )
         
         by_week = [
             ScoutByWeek(
                 week_start_monday=row.week_start_monday,
                 iso_year_week=row.iso_year_week,
-                payable_amount=Decimal(str(row.payable_amount or 0)),
-                payable_items=row.payable_items or 0,
+                payable_amount=Decimal(str(row.amount or 0)),
+                payable_items=row.items or 0,
                 blocked_amount=Decimal("0"),
                 blocked_items=0
             )
-            for row in weeks_payable
+            for row in week_rows(rows, WEEK_GROUPING, limit=52)
         ]
         
-        # Top scouts - JOIN con v_dim_scouts para obtener nombres
-        top_scouts_query = text(f"""
-            SELECT 
-                l.scout_id,
-                COALESCE(s.scout_name_normalized, 'Scout ' || l.scout_id::text) AS scout_name,
-                COALESCE(SUM(l.amount), 0) AS amount,
-                COUNT(*) AS items,
-                COUNT(DISTINCT l.driver_id) AS drivers
-            FROM {base_table} l
-            LEFT JOIN ops.v_dim_scouts s ON l.scout_id = s.scout_id
-            WHERE {where_clause.replace("scout_id", "l.scout_id").replace("driver_id", "l.driver_id").replace("paid_at", "l.paid_at")}
-            AND l.scout_id IS NOT NULL
-            GROUP BY l.scout_id, s.scout_name_normalized
-            ORDER BY amount DESC
-            LIMIT 10
-        """)
-        
-        top_scouts_rows = db.execute(top_scouts_query, params).fetchall()
         top_scouts = [
             TopScout(
                 acquisition_scout_id=row.scout_id,
@@ -164,7 +178,7 @@ def get_scout_summary(
                 items=row.items or 0,
                 drivers=row.drivers or 0
             )
-            for row in top_scouts_rows
+            for row in scout_rows
         ]
         
         return ScoutSummaryResponse(
@@ -228,14 +242,8 @@ def get_scout_open_items(
     
     where_clause = " AND ".join(where_conditions)
     
-    # Contar total
-    count_query = text(f"""
-        SELECT COUNT(*) AS total
-        FROM {view_name}
-        WHERE {where_clause}
-    """)
-    
-    total = db.execute(count_query, params).scalar()
+    # Total cacheado por filtro (count_cache), sin recorrer la vista en cada página
+    total, total_is_estimate = count_rows(db, view_name, f"WHERE {where_clause}", params)
     
     # Obtener items
     items_query = text(f"""
@@ -286,12 +294,14 @@ def get_scout_open_items(
     return ScoutOpenItemsResponse(
         items=items,
         total=total,
+        total_is_estimate=total_is_estimate,
         limit=limit,
         offset=offset
     )
 
 
 @router.get("/yango/summary", response_model=YangoSummaryResponse)
+@coalesce("dashboard_yango_summary")
 def get_yango_summary(
     db: Session = Depends(get_db),
     week_start: Optional[date] = Query(None, description="Fecha inicio de semana"),
@@ -313,26 +323,10 @@ def get_yango_summary(
     
     where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
     
-    # Totales
-    totals_query = text(f"""
-        SELECT 
-            COALESCE(SUM(total_amount_payable), 0) AS receivable_amount,
-            SUM(count_payments) AS receivable_items,
-            SUM(count_drivers) AS receivable_drivers
-        FROM ops.v_yango_receivable_payable
-        WHERE {where_clause}
-    """)
-    
-    result_totals = db.execute(totals_query, params).fetchone()
-    totals = YangoTotals(
-        receivable_amount=Decimal(str(result_totals.receivable_amount or 0)),
-        receivable_items=result_totals.receivable_items or 0,
-        receivable_drivers=result_totals.receivable_drivers or 0
-    )
-    
-    # Por semana
-    by_week_query = text(f"""
+    # Totales y por semana en un solo recorrido (GROUPING SETS)
+    summary_query = text(f"""
         SELECT 
+            GROUPING(pay_week_start_monday, pay_iso_year_week) AS grouping_id,
             pay_week_start_monday AS week_start_monday,
             pay_iso_year_week AS iso_year_week,
             COALESCE(SUM(total_amount_payable), 0) AS amount,
@@ -340,11 +334,17 @@ def get_yango_summary(
             SUM(count_drivers) AS drivers
         FROM ops.v_yango_receivable_payable
         WHERE {where_clause}
-        GROUP BY pay_week_start_monday, pay_iso_year_week
-        ORDER BY pay_week_start_monday DESC
+        GROUP BY GROUPING SETS ((), (pay_week_start_monday, pay_iso_year_week))
     """)
     
-    weeks_rows = db.execute(by_week_query, params).fetchall()
+    rows = db.execute(summary_query, params).fetchall()
+    total_row = next((row for row in rows if row.grouping_id == YANGO_TOTAL_GROUPING), None)
+    totals = YangoTotals(
+        receivable_amount=Decimal(str(total_row.amount if total_row else 0)),
+        receivable_items=(total_row.items if total_row else None) or 0,
+        receivable_drivers=(total_row.drivers if total_row else None) or 0
+    )
+    
     by_week = [
         YangoByWeek(
             week_start_monday=row.week_start_monday,
@@ -353,12 +353,13 @@ def get_yango_summary(
             items=row.items or 0,
             drivers=row.drivers or 0
         )
-        for row in weeks_rows
+        for row in week_rows(rows, YANGO_WEEK_GROUPING)
     ]
     
     return YangoSummaryResponse(
         totals=totals,
-        by_week=by_week
+        by_week=by_week,
+        freshness=read_freshness(db, "ops.v_yango_receivable_payable")
     )
 
 
@@ -382,14 +383,10 @@ def get_yango_receivable_items(
     
     where_clause = " AND ".join(where_conditions)
     
-    # Contar total
-    count_query = text(f"""
-        SELECT COUNT(*) AS total
-        FROM ops.v_yango_receivable_payable_detail
-        WHERE {where_clause}
-    """)
-    
-    total = db.execute(count_query, params).scalar()
+    # Total cacheado por filtro (count_cache), sin recorrer la vista en cada página
+    total, total_is_estimate = count_rows(
+        db, "ops.v_yango_receivable_payable_detail", f"WHERE {where_clause}", params
+    )
     
     # Obtener items
     items_query = text(f"""
@@ -450,8 +447,10 @@ def get_yango_receivable_items(
     return YangoReceivableItemsResponse(
         items=items,
         total=total,
+        total_is_estimate=total_is_estimate,
         limit=limit,
-        offset=offset
+        offset=offset,
+        freshness=read_freshness(db, "ops.v_yango_receivable_payable_detail")
     )
 
 
@@ -5,7 +5,9 @@ from typing import Optional, List
 from uuid import UUID
 from datetime import date, datetime
 import json
-from app.core.db import get_db, SessionLocal
+from app.core.db import get_db, get_maintenance_db, BatchSessionLocal
+from app.core.db_utils import fetch_by_keys
+from app.core.pagination import SortKey, keyset_condition, next_cursor, order_by
 from app.models.canon import (
     IdentityRegistry, 
     IdentityLink, 
@@ -41,15 +43,24 @@ from app.schemas.identity import (
 )
 from app.schemas.ingestion import IngestionRun as IngestionRunSchema
 from app.schemas.identity_runs import IdentityRunsResponse, IdentityRunRow, IngestionRunStatus, IngestionJobType
+from app.services.count_cache import count_rows
 from app.services.ingestion import IngestionService
+from app.services.mv_cache import invalidate
 from app.services.normalization import normalize_phone, normalize_name, normalize_license, tokenize_name
+from app.services.run_report import get_run_report as get_stored_run_report
 from app.services.scouting_observation import ScoutingObservationService
 
 router = APIRouter()
 
+# Orden de /orphans (driver_id es la PK: desempate único para el keyset)
+ORPHANS_KEYS = (
+    SortKey("detected_at", descending=True, nullable=False),
+    SortKey("driver_id", descending=True, nullable=False),
+)
+
 
 @router.post("/drivers-index/refresh", response_model=IngestionRunSchema)
-def refresh_drivers_index(db: Session = Depends(get_db)):
+def refresh_drivers_index(db: Session = Depends(get_maintenance_db)):
     service = IngestionService(db)
     run = service.refresh_drivers_index_job()
     return run
@@ -64,7 +75,7 @@ def _run_ingestion_background(
     incremental: bool,
     refresh_index: bool
 ):
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         service = IngestionService(db)
         service.run_ingestion(
@@ -634,11 +645,19 @@ def _get_weekly_breakdowns(
     week_start_expr_links = func.cast(func.date_trunc('week', func.cast(IdentityLink.snapshot_date, Date)), Date)
     week_label_expr_links = func.to_char(func.date_trunc('week', func.cast(IdentityLink.snapshot_date, Date)), 'IYYY-"W"IW')
     
+    # Conteos agrupados en SQL (no una fila por link)
     links_query = db.query(
         week_start_expr_links.label('week_start'),
         week_label_expr_links.label('week_label'),
         IdentityLink.source_table,
         IdentityLink.match_rule,
+        IdentityLink.confidence_level,
+        func.count(IdentityLink.id).label('cnt')
+    ).group_by(
+        week_start_expr_links,
+        week_label_expr_links,
+        IdentityLink.source_table,
+        IdentityLink.match_rule,
         IdentityLink.confidence_level
     )
     
@@ -655,9 +674,9 @@ def _get_weekly_breakdowns(
             except:
                 week_start_val = date.today()
         key = (week_start_val, row.week_label, row.source_table)
-        matched_by_rule[key][row.match_rule] += 1
+        matched_by_rule[key][row.match_rule] += row.cnt
         conf_level = row.confidence_level.value if hasattr(row.confidence_level, 'value') else str(row.confidence_level)
-        matched_by_confidence[key][conf_level] += 1
+        matched_by_confidence[key][conf_level] += row.cnt
     
     week_start_expr_unmatched = func.cast(func.date_trunc('week', func.cast(IdentityUnmatched.snapshot_date, Date)), Date)
     week_label_expr_unmatched = func.to_char(func.date_trunc('week', func.cast(IdentityUnmatched.snapshot_date, Date)), 'IYYY-"W"IW')
@@ -666,6 +685,12 @@ def _get_weekly_breakdowns(
         week_start_expr_unmatched.label('week_start'),
         week_label_expr_unmatched.label('week_label'),
         IdentityUnmatched.source_table,
+        IdentityUnmatched.reason_code,
+        func.count(IdentityUnmatched.id).label('cnt')
+    ).group_by(
+        week_start_expr_unmatched,
+        week_label_expr_unmatched,
+        IdentityUnmatched.source_table,
         IdentityUnmatched.reason_code
     )
     
@@ -682,7 +707,7 @@ def _get_weekly_breakdowns(
             except:
                 week_start_val = date.today()
         key = (week_start_val, row.week_label, row.source_table)
-        unmatched_by_reason[key][row.reason_code] += 1
+        unmatched_by_reason[key][row.reason_code] += row.cnt
     
     return {
         'matched_by_rule': matched_by_rule,
@@ -1000,10 +1025,6 @@ def get_run_report(
     event_date_to: Optional[date] = Query(None, description="Fecha fin del evento"),
     include_weekly: bool = Query(True, description="Incluir datos semanales")
 ):
-    from app.models.ops import RunStatus
-    from collections import defaultdict
-    from typing import Dict, Any
-    
     run = db.query(IngestionRun).filter(IngestionRun.id == run_id).first()
     if not run:
         raise HTTPException(status_code=404, detail="Run no encontrado")
@@ -1018,84 +1039,15 @@ def get_run_report(
         "incremental": run.incremental
     }
     
-    links_query = db.query(IdentityLink).filter(IdentityLink.run_id == run_id)
-    unmatched_query = db.query(IdentityUnmatched).filter(IdentityUnmatched.run_id == run_id)
-    
-    links = links_query.all()
-    unmatched_list = unmatched_query.all()
-    
-    counts_by_source_table = defaultdict(lambda: {"total_processed": 0, "matched_count": 0, "unmatched_count": 0, "skipped_count": 0})
-    
-    for link in links:
-        source = link.source_table
-        counts_by_source_table[source]["matched_count"] += 1
-        counts_by_source_table[source]["total_processed"] += 1
-    
-    for um in unmatched_list:
-        source = um.source_table
-        counts_by_source_table[source]["unmatched_count"] += 1
-        counts_by_source_table[source]["total_processed"] += 1
-    
-    matched_by_rule = defaultdict(int)
-    matched_by_confidence = defaultdict(int)
-    
-    for link in links:
-        matched_by_rule[link.match_rule] += 1
-        conf_level = link.confidence_level.value if hasattr(link.confidence_level, 'value') else str(link.confidence_level)
-        matched_by_confidence[conf_level] += 1
-    
-    unmatched_by_reason = defaultdict(int)
-    missing_keys_counter = defaultdict(int)
-    
-    for um in unmatched_list:
-        unmatched_by_reason[um.reason_code] += 1
-        if um.reason_code == "MISSING_KEYS" and um.details and "missing_keys" in um.details:
-            missing_keys = um.details.get("missing_keys", [])
-            if isinstance(missing_keys, list):
-                for key in missing_keys:
-                    missing_keys_counter[key] += 1
-    
-    top_missing_keys = [{"key": k, "count": v} for k, v in sorted(missing_keys_counter.items(), key=lambda x: x[1], reverse=True)[:10]]
-    
-    top_unmatched = [
-        {
-            "id": um.id,
-            "source_table": um.source_table,
-            "source_pk": um.source_pk,
-            "reason_code": um.reason_code,
-            "details": um.details,
-            "candidates_preview": um.candidates_preview
-        }
-        for um in unmatched_list[:10]
-    ]
-    
-    top_matched = [
-        {
-            "id": link.id,
-            "source_table": link.source_table,
-            "source_pk": link.source_pk,
-            "match_rule": link.match_rule,
-            "confidence_level": link.confidence_level.value if hasattr(link.confidence_level, 'value') else str(link.confidence_level),
-            "match_score": link.match_score
-        }
-        for link in links[:10]
-    ]
+    # Conteos en SQL; guardados en el run una vez terminado (app/services/run_report.py)
+    report = get_stored_run_report(db, run)
     
     response_data = {
         "run": run_dict,
-        "counts_by_source_table": dict(counts_by_source_table),
-        "matched_breakdown": {
-            "by_match_rule": dict(matched_by_rule),
-            "by_confidence": dict(matched_by_confidence)
-        },
-        "unmatched_breakdown": {
-            "by_reason_code": dict(unmatched_by_reason),
-            "top_missing_keys": top_missing_keys
-        },
-        "samples": {
-            "top_unmatched": top_unmatched,
-            "top_matched": top_matched
-        }
+        "counts_by_source_table": report["counts_by_source_table"],
+        "matched_breakdown": report["matched_breakdown"],
+        "unmatched_breakdown": report["unmatched_breakdown"],
+        "samples": report["samples"]
     }
     
     if group_by == "week" and include_weekly:
@@ -1365,6 +1317,26 @@ def get_window_metrics(
 # Orphans / Cuarentena Endpoints
 # ============================================================================
 
+def _lead_events_counts_by_driver(db: Session, driver_ids: List[str]) -> dict:
+    """lead_events por driver_id del payload (índice de expresión de la migración 027)."""
+    payload_driver_id = LeadEventModel.payload_json["driver_id"].astext
+    query = (
+        select(payload_driver_id.label("driver_id"), func.count().label("n"))
+        .group_by(payload_driver_id)
+    )
+    return {row.driver_id: row.n for row in fetch_by_keys(db, query, payload_driver_id, driver_ids)}
+
+
+def _driver_links_counts_by_driver(db: Session, driver_ids: List[str]) -> dict:
+    """identity_links de la fuente drivers por driver_id (uq_identity_links_source)."""
+    query = (
+        select(IdentityLink.source_pk.label("driver_id"), func.count().label("n"))
+        .where(IdentityLink.source_table == "drivers")
+        .group_by(IdentityLink.source_pk)
+    )
+    return {row.driver_id: row.n for row in fetch_by_keys(db, query, IdentityLink.source_pk, driver_ids)}
+
+
 @router.get("/orphans", response_model=OrphansListResponse)
 def list_orphans(
     db: Session = Depends(get_db),
@@ -1372,18 +1344,24 @@ def list_orphans(
     page_size: int = Query(50, ge=1, le=500, description="Tamaño de página"),
     status: Optional[str] = Query(None, description="Filtrar por status: quarantined, resolved_relinked, resolved_created_lead, purged"),
     detected_reason: Optional[str] = Query(None, description="Filtrar por razón: no_lead_no_events, no_lead_has_events_repair_failed, legacy_driver_without_origin, manual_detection"),
-    driver_id: Optional[str] = Query(None, description="Buscar por driver_id exacto")
+    driver_id: Optional[str] = Query(None, description="Buscar por driver_id exacto"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a page")
 ):
     """
     Lista drivers huérfanos en cuarentena con paginación y filtros.
     """
     query = db.query(DriverOrphanQuarantine)
+    # Los mismos filtros en SQL para el total (count_cache)
+    count_conditions = []
+    count_params = {}
     
     # Aplicar filtros
     if status:
         try:
             status_enum = OrphanStatus(status)
             query = query.filter(cast(DriverOrphanQuarantine.status, String) == status_enum.value)
+            count_conditions.append("status::text = :status")
+            count_params["status"] = status_enum.value
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Status inválido: {status}")
     
@@ -1391,49 +1369,47 @@ def list_orphans(
         try:
             reason_enum = OrphanDetectedReason(detected_reason)
             query = query.filter(cast(DriverOrphanQuarantine.detected_reason, String) == reason_enum.value)
+            count_conditions.append("detected_reason::text = :detected_reason")
+            count_params["detected_reason"] = reason_enum.value
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Razón inválida: {detected_reason}")
     
     if driver_id:
         query = query.filter(DriverOrphanQuarantine.driver_id == driver_id)
+        count_conditions.append("driver_id = :driver_id")
+        count_params["driver_id"] = driver_id
     
-    # Contar total
-    total = query.count()
+    # Total cacheado por filtro (o estimado si el recorrido es grande)
+    count_where = "WHERE " + " AND ".join(count_conditions) if count_conditions else ""
+    total, total_is_estimate = count_rows(db, "canon.driver_orphan_quarantine", count_where, count_params)
     
-    # Paginación
+    # Paginación (keyset si viene cursor)
     offset = (page - 1) * page_size
-    orphans_db = query.order_by(DriverOrphanQuarantine.detected_at.desc()).offset(offset).limit(page_size).all()
+    keyset_params = {}
+    keyset = keyset_condition(ORPHANS_KEYS, cursor, keyset_params)
+    if keyset:
+        query = query.filter(text(keyset).bindparams(**keyset_params))
+        offset = 0
+    orphans_db = query.order_by(text(order_by(ORPHANS_KEYS))).offset(offset).limit(page_size).all()
+    
+    # Enriquecer la página completa: una consulta agrupada por fuente, no una por huérfano
+    page_driver_ids = [orphan_db.driver_id for orphan_db in orphans_db]
+    lead_events_counts = _lead_events_counts_by_driver(db, page_driver_ids)
+    driver_links_counts = _driver_links_counts_by_driver(db, page_driver_ids)
+    persons = {
+        str(person.person_key): person
+        for person in fetch_by_keys(
+            db,
+            db.query(IdentityRegistry),
+            IdentityRegistry.person_key,
+            (orphan_db.person_key for orphan_db in orphans_db),
+            pg_type="uuid",
+        )
+    }
     
-    # Enriquecer con información adicional
     orphans = []
     for orphan_db in orphans_db:
-        # Buscar información adicional del driver/persona
-        lead_events_count = db.execute(text("""
-            SELECT COUNT(*) 
-            FROM observational.lead_events le 
-            WHERE (le.payload_json->>'driver_id')::text = :driver_id
-        """), {"driver_id": orphan_db.driver_id}).scalar() or 0
-        
-        driver_links_count = db.execute(text("""
-            SELECT COUNT(*) 
-            FROM canon.identity_links il 
-            WHERE il.source_table = 'drivers' 
-            AND il.source_pk = :driver_id
-        """), {"driver_id": orphan_db.driver_id}).scalar() or 0
-        
-        # Obtener información de persona si existe
-        primary_phone = None
-        primary_license = None
-        primary_full_name = None
-        
-        if orphan_db.person_key:
-            person = db.query(IdentityRegistry).filter(
-                IdentityRegistry.person_key == orphan_db.person_key
-            ).first()
-            if person:
-                primary_phone = person.primary_phone
-                primary_license = person.primary_license
-                primary_full_name = person.primary_full_name
+        person = persons.get(str(orphan_db.person_key)) if orphan_db.person_key else None
         
         orphan_dict = {
             "driver_id": orphan_db.driver_id,
@@ -1445,11 +1421,11 @@ def list_orphans(
             "status": orphan_db.status.value if isinstance(orphan_db.status, OrphanStatus) else str(orphan_db.status),
             "resolved_at": orphan_db.resolved_at,
             "resolution_notes": orphan_db.resolution_notes,
-            "primary_phone": primary_phone,
-            "primary_license": primary_license,
-            "primary_full_name": primary_full_name,
-            "driver_links_count": driver_links_count,
-            "lead_events_count": lead_events_count
+            "primary_phone": person.primary_phone if person else None,
+            "primary_license": person.primary_license if person else None,
+            "primary_full_name": person.primary_full_name if person else None,
+            "driver_links_count": driver_links_counts.get(orphan_db.driver_id, 0),
+            "lead_events_count": lead_events_counts.get(orphan_db.driver_id, 0)
         }
         orphans.append(OrphanDriver(**orphan_dict))
     
@@ -1458,9 +1434,11 @@ def list_orphans(
     return OrphansListResponse(
         orphans=orphans,
         total=total,
+        total_is_estimate=total_is_estimate,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor(ORPHANS_KEYS, orphans_db, page_size)
     )
 
 
@@ -1570,6 +1548,11 @@ def run_orphans_fix(
                 detail=f"Error ejecutando script: {result.stderr}"
             )
         
+        if execute:
+            # La cuarentena cambió: descartar sus totales cacheados en todos los workers
+            invalidate(db, "canon.driver_orphan_quarantine")
+            db.commit()
+        
         # Parsear output para extraer información (simplificado)
         # En producción, el script debería retornar JSON
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
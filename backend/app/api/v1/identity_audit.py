@@ -23,6 +23,7 @@ from app.schemas.identity_audit import (
     ResolveAlertRequest, MuteAlertRequest, BatchResolveRequest,
     OriginAuditStats
 )
+from app.services.count_cache import count_rows
 from app.services.origin_determination import OriginDeterminationService
 
 logger = logging.getLogger(__name__)
@@ -322,14 +323,8 @@ def list_origin_alerts(
     
     where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
     
-    # Contar total
-    count_query = text(f"""
-        SELECT COUNT(*) as total
-        FROM ops.v_identity_origin_alerts
-        {where_clause}
-    """)
-    total_result = db.execute(count_query, params).fetchone()
-    total = total_result.total if total_result else 0
+    # Total cacheado por filtro (o estimado si el recorrido es grande)
+    total, total_is_estimate = count_rows(db, "ops.v_identity_origin_alerts", where_clause, params)
     
     # Query principal con paginación
     query = text(f"""
@@ -375,6 +370,7 @@ def list_origin_alerts(
     return OriginAlertListResponse(
         items=items,
         total=total,
+        total_is_estimate=total_is_estimate,
         skip=skip,
         limit=limit
     )
@@ -8,8 +8,9 @@ from typing import Optional
 from datetime import datetime, date, timezone
 import logging
 
-from app.core.db import get_db
+from app.core.db import get_db, get_batch_db, get_maintenance_db
 from app.core.db_utils import row_to_dict
+from app.core.pagination import SortKey, keyset_condition, next_cursor, order_by
 from app.models.ops import Alert, AlertSeverity
 from app.schemas.ops_alerts import OpsAlertsResponse, OpsAlertRow, AlertSeverity as AlertSeveritySchema
 from app.schemas.ops_data_health import IdentitySystemHealthRow
@@ -41,6 +42,13 @@ logger = logging.getLogger(__name__)
 # Incluir subrouter de payments
 router.include_router(ops_payments.router, prefix="/payments", tags=["ops-payments"])
 
+# Orden de /identity-gaps con desempate por lead_id (paginación keyset)
+IDENTITY_GAPS_KEYS = (
+    SortKey("gap_age_days", descending=True),
+    SortKey("lead_date", descending=True),
+    SortKey("lead_id", nullable=False),
+)
+
 
 @router.get("/health")
 def ops_health():
@@ -612,7 +620,15 @@ def get_mv_health(
                 CASE
                     WHEN l.refreshed_at IS NULL THEN NULL
                     ELSE floor(extract(epoch from (now() - l.refreshed_at))/60)::int
-                END AS minutes_since_refresh
+                END AS minutes_since_refresh,
+                r.refresh_method AS last_refresh_method,
+                r.lock_wait_ms AS last_lock_wait_ms,
+                r.rows_before AS last_rows_before,
+                r.rows_after_refresh,
+                r.table_bytes_after,
+                r.index_bytes_after,
+                r.dead_tuples_after,
+                st.n_dead_tup AS dead_tuples
             FROM pg_matviews m
             LEFT JOIN LATERAL (
                 SELECT refreshed_at, status, error_message
@@ -621,6 +637,17 @@ def get_mv_health(
                 ORDER BY refreshed_at DESC
                 LIMIT 1
             ) l ON true
+            LEFT JOIN LATERAL (
+                SELECT refresh_method, lock_wait_ms, rows_before, rows_after_refresh,
+                    table_bytes_after, index_bytes_after, dead_tuples_after
+                FROM ops.mv_refresh_log
+                WHERE schema_name = m.schemaname AND mv_name = m.matviewname
+                    AND status = 'SUCCESS'
+                ORDER BY refreshed_at DESC
+                LIMIT 1
+            ) r ON true
+            LEFT JOIN pg_stat_user_tables st
+                ON st.schemaname = m.schemaname AND st.relname = m.matviewname
             WHERE m.schemaname IN ('ops','canon')
         """
         params = {}
@@ -675,13 +702,22 @@ def get_mv_health(
         result = db.execute(text(query_str), params)
         rows = result.fetchall()
         
-        # Convertir a schemas
+        # Convertir a schemas (con recomendaciones de VACUUM/REINDEX según bloat)
+        from app.services.mv_refresh_metrics import bloat_recommendations, load_baselines
+        baselines = load_baselines(db, [(row.schema_name, row.mv_name) for row in rows])
         calculated_at = datetime.now(timezone.utc)
         items = []
         for row in rows:
             row_dict = row_to_dict(row)
             # Agregar calculated_at
             row_dict['calculated_at'] = calculated_at
+            latest = dict(row_dict)
+            if row_dict.get('dead_tuples') is not None:
+                # Dead tuples actuales (el autovacuum pudo limpiar desde el último refresh)
+                latest['dead_tuples_after'] = row_dict['dead_tuples']
+            row_dict['recommendations'] = bloat_recommendations(
+                latest, baselines.get((row.schema_name, row.mv_name))
+            )
             items.append(MvHealthRow.model_validate(row_dict))
         
         return MvHealthResponse(
@@ -973,7 +1009,7 @@ def get_source_registry(
 
 
 @router.post("/yango-payments/ingest")
-def ingest_yango_payments(db: Session = Depends(get_db)):
+def ingest_yango_payments(db: Session = Depends(get_batch_db)):
     """
     Ejecuta la ingesta de pagos Yango desde module_ct_cabinet_payments al ledger.
     
@@ -1022,7 +1058,8 @@ def get_identity_gaps(
     risk_level: Optional[str] = Query(None, description="Filtrar por risk_level: high, medium, low"),
     gap_reason: Optional[str] = Query(None, description="Filtrar por gap_reason: no_identity, no_origin, activity_without_identity, no_activity, resolved"),
     page: int = Query(1, ge=1, description="Número de página (1-indexed)"),
-    page_size: int = Query(100, ge=1, le=1000, description="Tamaño de página (máx 1000)")
+    page_size: int = Query(100, ge=1, le=1000, description="Tamaño de página (máx 1000)"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (meta.next_cursor de la respuesta anterior); reemplaza a page")
 ):
     """
     Obtiene análisis de brechas de identidad para leads Cabinet.
@@ -1064,14 +1101,7 @@ def get_identity_gaps(
         if conditions:
             query_str += " WHERE " + " AND ".join(conditions)
         
-        # Contar total
-        count_query = f"SELECT COUNT(*) FROM ops.v_identity_gap_analysis"
-        if conditions:
-            count_query += " WHERE " + " AND ".join(conditions)
-        count_result = db.execute(text(count_query), params)
-        total = count_result.scalar() or 0
-        
-        # Obtener breakdown
+        # Breakdown: un solo recorrido de la vista del que salen también el total y los totals
         breakdown_query = f"""
             SELECT gap_reason, risk_level, COUNT(*) as count
             FROM ops.v_identity_gap_analysis
@@ -1090,18 +1120,12 @@ def get_identity_gaps(
             for row in breakdown_rows
         ]
         
-        # Obtener totals
-        totals_query = f"""
-            SELECT 
-                COUNT(*) as total_leads,
-                COUNT(*) FILTER (WHERE gap_reason != 'resolved') as unresolved,
-                COUNT(*) FILTER (WHERE gap_reason = 'resolved') as resolved
-            FROM ops.v_identity_gap_analysis
-        """
-        if conditions:
-            totals_query += " WHERE " + " AND ".join(conditions)
-        totals_result = db.execute(text(totals_query), params)
-        totals_row = totals_result.fetchone()
+        total = sum(row.count for row in breakdown_rows)
+        resolved = sum(row.count for row in breakdown_rows if row.gap_reason == "resolved")
+        unresolved = sum(
+            row.count for row in breakdown_rows
+            if row.gap_reason is not None and row.gap_reason != "resolved"
+        )
         
         # Obtener freshness y matched_last_24h
         freshness_query = text("""
@@ -1123,19 +1147,22 @@ def get_identity_gaps(
                 job_freshness_hours = round(delta.total_seconds() / 3600, 1)
         
         totals = IdentityGapTotals(
-            total_leads=totals_row.total_leads or 0,
-            unresolved=totals_row.unresolved or 0,
-            resolved=totals_row.resolved or 0,
-            pct_unresolved=round(100.0 * (totals_row.unresolved or 0) / max(totals_row.total_leads or 1, 1), 2),
+            total_leads=total,
+            unresolved=unresolved,
+            resolved=resolved,
+            pct_unresolved=round(100.0 * unresolved / max(total, 1), 2),
             matched_last_24h=matched_last_24h,
             last_job_run=last_run.isoformat() if last_run else None,
             job_freshness_hours=job_freshness_hours
         )
         
-        # Obtener items paginados
-        query_str += " ORDER BY gap_age_days DESC, lead_date DESC LIMIT :limit OFFSET :offset"
+        # Obtener items paginados (keyset si viene cursor)
+        keyset = keyset_condition(IDENTITY_GAPS_KEYS, cursor, params)
+        if keyset:
+            query_str += (" AND " if conditions else " WHERE ") + keyset
+        query_str += f" ORDER BY {order_by(IDENTITY_GAPS_KEYS)} LIMIT :limit OFFSET :offset"
         params["limit"] = page_size
-        params["offset"] = offset
+        params["offset"] = 0 if cursor else offset
         result = db.execute(text(query_str), params)
         rows = result.fetchall()
         
@@ -1152,10 +1179,14 @@ def get_identity_gaps(
                 "page": page,
                 "page_size": page_size,
                 "total": total,
-                "total_pages": (total + page_size - 1) // page_size
+                "total_is_estimate": False,
+                "total_pages": (total + page_size - 1) // page_size,
+                "next_cursor": next_cursor(IDENTITY_GAPS_KEYS, rows, page_size)
             }
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("get_identity_gaps failed")
         raise HTTPException(
@@ -1317,6 +1348,14 @@ def get_performance_diagnostics(db: Session = Depends(get_db)):
         from app.services.mv_cache import get_cache_stats
         diagnostics["mv_cache"] = get_cache_stats()
         
+        # 7. Caches de respuestas (hits/misses por endpoint)
+        from app.services.response_cache import get_response_cache_stats
+        diagnostics["response_cache"] = get_response_cache_stats()
+        
+        # 8. Coalescing de requests idénticos concurrentes (queries ahorradas = coalesced)
+        from app.services.single_flight import get_single_flight_stats
+        diagnostics["single_flight"] = get_single_flight_stats()
+        
         return diagnostics
         
     except Exception as e:
@@ -1341,10 +1380,21 @@ def get_mv_maintenance_status(db: Session = Depends(get_db)):
     - Tamaño
     - Último refresh y su estado
     - Tiempo desde el último refresh
+
+    Incluye también el plan de refresh adaptativo (intervalo y franja por MV,
+    carga prevista vs presupuesto) y el cumplimiento del SLO de staleness.
     """
     try:
         from app.services.mv_maintenance import get_mv_status
-        return {"mvs": get_mv_status(db)}
+        from app.services.mv_refresh_scheduler import get_schedule_status
+        mvs = get_mv_status(db)
+        try:
+            schedule = get_schedule_status(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"No se pudo calcular el plan de refresh adaptativo: {e}")
+            schedule = {"error": str(e)}
+        return {"mvs": mvs, "schedule": schedule}
     except Exception as e:
         logger.exception("get_mv_maintenance_status failed")
         raise HTTPException(
@@ -1355,7 +1405,7 @@ def get_mv_maintenance_status(db: Session = Depends(get_db)):
 
 @router.post("/mv-maintenance/refresh")
 def refresh_materialized_views(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_maintenance_db),
     priority: Optional[int] = Query(None, ge=1, le=3, description="Solo MVs con esta prioridad o superior (1=más críticas)"),
     mv_name: Optional[str] = Query(None, description="Nombre específico de MV a refrescar (ej: mv_cabinet_financial_14d)")
 ):
@@ -4,22 +4,29 @@ Endpoints para operaciones de payments dentro del módulo ops.
 El controller solo registra rutas y delega en app.services.ops_payments.
 Toda la lógica de negocio está en los servicios.
 """
-import io
-import csv
 import logging
-from datetime import date, datetime
+from datetime import date
 from decimal import Decimal
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import Response, StreamingResponse
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.orm import Session
 
 from app.core.db import get_db
 from app.core.db_utils import row_to_dict
+from app.services.cobranza_rollup import (
+    ROLLUP_TABLE as COBRANZA_ROLLUP,
+    SCOUT_METRICS_SQL as ROLLUP_SCOUT_METRICS_SQL,
+    WEEKLY_KPIS_SQL as ROLLUP_WEEKLY_KPIS_SQL,
+    rollup_current,
+)
+from app.services.csv_export import ExportFormat, stream_export
 from app.services.mv_cache import get_best_view, mv_exists
+from app.services.mv_freshness import read_freshness
+from app.services.response_cache import response_cache
+from app.services.single_flight import coalesce
 from app.services.ops_payments import (
     get_driver_matrix as service_get_driver_matrix,
     OrderByOption as ServiceOrderByOption,
@@ -55,7 +62,6 @@ from app.schemas.kpi_red_recovery import (
     KpiRedRecoveryMetricsResponse,
     KpiRedRecoveryMetricsDaily,
 )
-from time import time
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -63,8 +69,8 @@ router = APIRouter()
 # Cache para cobranza_yango y weekly_kpis (solo en controller mientras no se migren a servicio)
 CACHE_TTL = 60
 CACHE_TTL_WEEKLY = 180
-_scout_metrics_cache: Dict[Tuple, Tuple[float, ScoutAttributionMetrics]] = {}
-_weekly_kpis_cache: Dict[Tuple, Tuple[float, dict]] = {}
+_scout_metrics_cache = response_cache("scout_attribution_metrics", ttl=CACHE_TTL, max_entries=100)
+_weekly_kpis_cache = response_cache("weekly_kpis", ttl=CACHE_TTL_WEEKLY, max_entries=50)
 
 # Re-exportar para Query()
 OrderByOption = ServiceOrderByOption
@@ -81,6 +87,7 @@ def get_driver_matrix(
     limit: int = Query(200, ge=1, le=1000, description="Límite de resultados (máx 1000). Default: 200."),
     offset: int = Query(0, ge=0, description="Offset para paginación"),
     order: ServiceOrderByOption = Query(ServiceOrderByOption.week_start_desc, description="Ordenamiento"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset"),
 ):
     """Obtiene la matriz de drivers con milestones M1/M5/M25 y estados Yango/window."""
     return service_get_driver_matrix(
@@ -93,10 +100,12 @@ def get_driver_matrix(
         limit=limit,
         offset=offset,
         order=order,
+        cursor=cursor,
     )
 
 
 @router.get("/cabinet-financial-14d", response_model=CabinetFinancialResponse)
+@coalesce("cabinet_financial_14d")
 def get_cabinet_financial_14d(
     db: Session = Depends(get_db),
     only_with_debt: bool = Query(False, description="Si true, solo drivers con deuda pendiente (amount_due_yango > 0)"),
@@ -486,7 +495,8 @@ def get_cabinet_financial_14d(
             limit=limit,
             offset=offset,
             returned=len(data),
-            total=total
+            total=total,
+            freshness=read_freshness(db, view_name)
         )
         
         return CabinetFinancialResponse(
@@ -518,7 +528,8 @@ def export_cabinet_financial_14d_csv(
     min_debt: Optional[float] = Query(None, ge=0, description="Filtra por deuda mínima"),
     reached_milestone: Optional[str] = Query(None, description="Filtra por milestone: 'm1', 'm5', 'm25'"),
     week_start: Optional[date] = Query(None, description="Filtra por semana (lunes de la semana ISO)"),
-    use_materialized: bool = Query(True, description="Usar vista materializada")
+    use_materialized: bool = Query(True, description="Usar vista materializada"),
+    export_format: ExportFormat = Query("csv", alias="format", description="Formato: csv, parquet o arrow (Arrow IPC stream)")
 ):
     """
     Exporta datos de Cabinet Financial 14d a CSV.
@@ -526,32 +537,19 @@ def export_cabinet_financial_14d_csv(
     Aplica los mismos filtros que el endpoint GET /cabinet-financial-14d
     pero exporta todos los resultados (sin límite de paginación).
     
-    Hard cap: 200,000 filas máximo.
+    Sin límite de filas: se envía en streaming (memoria constante).
+    format=parquet|arrow exporta columnas tipadas (Parquet / Arrow IPC) en vez de CSV.
     """
     try:
         # Seleccionar vista (prioridad: MV enriched > MV legacy > vista normal)
         if use_materialized:
-            check_mv_enriched = db.execute(text("""
-                SELECT EXISTS (
-                    SELECT 1 FROM pg_matviews 
-                    WHERE schemaname = 'ops' 
-                    AND matviewname = 'mv_yango_cabinet_cobranza_enriched_14d'
-                )
-            """))
-            mv_enriched_exists = check_mv_enriched.scalar()
+            mv_enriched_exists = mv_exists(db, "ops", "mv_yango_cabinet_cobranza_enriched_14d")
             
             if mv_enriched_exists:
                 view_name = "ops.mv_yango_cabinet_cobranza_enriched_14d"
                 has_scout_fields = True
             else:
-                check_mv_legacy = db.execute(text("""
-                    SELECT EXISTS (
-                        SELECT 1 FROM pg_matviews 
-                        WHERE schemaname = 'ops' 
-                        AND matviewname = 'mv_cabinet_financial_14d'
-                    )
-                """))
-                mv_legacy_exists = check_mv_legacy.scalar()
+                mv_legacy_exists = mv_exists(db, "ops", "mv_cabinet_financial_14d")
                 view_name = "ops.mv_cabinet_financial_14d" if mv_legacy_exists else "ops.v_cabinet_financial_14d"
                 has_scout_fields = False
         else:
@@ -593,21 +591,6 @@ def export_cabinet_financial_14d_csv(
         
         where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
         
-        # Verificar conteo antes de exportar (hard cap defensivo)
-        count_sql = f"""
-            SELECT COUNT(*) AS total
-            FROM {view_name}
-            WHERE {where_clause}
-        """
-        count_result = db.execute(text(count_sql), params).fetchone()
-        total = count_result.total if count_result else 0
-        
-        if total > 200000:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Export excede límite de 200,000 filas. Total filtrado: {total}. Aplique filtros más restrictivos."
-            )
-        
         # Query para exportar (todas las columnas con nombres amigables, incluyendo scout)
         if has_scout_fields:
             sql = f"""
@@ -710,67 +693,8 @@ def export_cabinet_financial_14d_csv(
             ORDER BY cf.lead_date DESC NULLS LAST, cf.driver_id
             """
         
-        # Obtener datos
-        result = db.execute(text(sql), params)
-        rows_data = result.mappings().all()
-        
-        # Generar CSV en memoria
-        output = io.StringIO()
-        
-        if rows_data:
-            fieldnames = list(rows_data[0].keys())
-            writer = csv.DictWriter(output, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
-            writer.writeheader()
-            
-            for row in rows_data:
-                # Convertir valores None a string vacío y prevenir CSV injection
-                row_dict = {}
-                for k, v in dict(row).items():
-                    if v is None:
-                        row_dict[k] = ''
-                    elif isinstance(v, bool):
-                        row_dict[k] = 'Sí' if v else 'No'
-                    elif isinstance(v, str) and v and v[0] in ('=', '+', '-', '@'):
-                        # Prefijar con ' para prevenir ejecución de fórmulas en Excel
-                        row_dict[k] = "'" + v
-                    else:
-                        row_dict[k] = v
-                writer.writerow(row_dict)
-        else:
-            # CSV vacío con headers (incluyendo scout)
-            fieldnames = [
-                "Driver ID", "Conductor", "Lead Date", "Semana ISO", "Conectado",
-                "Fecha Conexion", "Viajes 14D", "M1 Alcanzado", "M5 Alcanzado", "M25 Alcanzado",
-                "Esperado M1 (S/)", "Esperado M5 (S/)", "Esperado M25 (S/)", "Esperado Total (S/)",
-                "Claim M1 Existe", "Claim M1 Pagado", "Claim M5 Existe", "Claim M5 Pagado",
-                "Claim M25 Existe", "Claim M25 Pagado", "Pagado M1 (S/)", "Pagado M5 (S/)",
-                "Pagado M25 (S/)", "Pagado Total (S/)", "Deuda (S/)",
-                "Scout ID", "Scout Nombre", "Calidad Scout", "Scout Fuente", "Scout Fecha Atribución", "Scout Prioridad"
-            ]
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        # Generar nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-        filename = f"cabinet_financial_14d_{timestamp}.csv"
-        
-        # Codificar CSV a bytes UTF-8 con BOM
-        csv_bytes = csv_content.encode('utf-8')
-        bom_bytes = b'\xef\xbb\xbf'
-        csv_content_with_bom = bom_bytes + csv_bytes
-        
-        # Retornar CSV como respuesta
-        return Response(
-            content=csv_content_with_bom,
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Type": "text/csv; charset=utf-8"
-            }
-        )
+        # Streaming desde un cursor de servidor (CSV: BOM UTF-8 y booleanos como Sí/No)
+        return stream_export(sql, params, "cabinet_financial_14d", export_format, bool_labels=("Sí", "No"))
         
     except HTTPException:
         raise
@@ -818,59 +742,49 @@ def get_scout_attribution_metrics(
     """
     try:
         # Generar clave de cache basada en filtros
-        cache_key = (
-            only_with_debt,
-            min_debt,
-            reached_milestone,
-            scout_id,
-            use_materialized
+        cache_key = _scout_metrics_cache.key(
+            only_with_debt=only_with_debt,
+            min_debt=min_debt,
+            reached_milestone=reached_milestone,
+            scout_id=scout_id,
+            use_materialized=use_materialized
         )
         
-        # Verificar cache
-        current_time = time()
-        if cache_key in _scout_metrics_cache:
-            cached_time, cached_metrics = _scout_metrics_cache[cache_key]
-            if current_time - cached_time < CACHE_TTL:
-                return ScoutAttributionMetricsResponse(
-                    status="ok",
-                    metrics=cached_metrics,
-                    filters={
-                        "only_with_debt": only_with_debt,
-                        "min_debt": min_debt,
-                        "reached_milestone": reached_milestone,
-                        "scout_id": scout_id
-                    }
-                )
+        # Verificar cache: (métricas, relación leída); la frescura se evalúa en cada request
+        cached_metrics = _scout_metrics_cache.get(cache_key)
+        if cached_metrics is not None:
+            metrics, source = cached_metrics
+            return ScoutAttributionMetricsResponse(
+                status="ok",
+                metrics=metrics,
+                filters={
+                    "only_with_debt": only_with_debt,
+                    "min_debt": min_debt,
+                    "reached_milestone": reached_milestone,
+                    "scout_id": scout_id
+                },
+                freshness=read_freshness(db, source)
+            )
         
         # Seleccionar vista (prioridad: MV enriched > MV legacy > vista normal)
         if use_materialized:
-            check_mv_enriched = db.execute(text("""
-                SELECT EXISTS (
-                    SELECT 1 FROM pg_matviews 
-                    WHERE schemaname = 'ops' 
-                    AND matviewname = 'mv_yango_cabinet_cobranza_enriched_14d'
-                )
-            """))
-            mv_enriched_exists = check_mv_enriched.scalar()
+            mv_enriched_exists = mv_exists(db, "ops", "mv_yango_cabinet_cobranza_enriched_14d")
             
             if mv_enriched_exists:
                 view_name = "ops.mv_yango_cabinet_cobranza_enriched_14d"
                 has_scout_fields = True
             else:
-                check_mv_legacy = db.execute(text("""
-                    SELECT EXISTS (
-                        SELECT 1 FROM pg_matviews 
-                        WHERE schemaname = 'ops' 
-                        AND matviewname = 'mv_cabinet_financial_14d'
-                    )
-                """))
-                mv_legacy_exists = check_mv_legacy.scalar()
+                mv_legacy_exists = mv_exists(db, "ops", "mv_cabinet_financial_14d")
                 view_name = "ops.mv_cabinet_financial_14d" if mv_legacy_exists else "ops.v_cabinet_financial_14d"
                 has_scout_fields = False
         else:
             view_name = "ops.v_cabinet_financial_14d"
             has_scout_fields = False
         
+        # Rollup semanal de la MV enriched (si está al día con su último refresh):
+        # mismos filtros salvo min_debt (no es dimensión)
+        use_rollup = has_scout_fields and min_debt is None and rollup_current(db)
+        
         # Construir WHERE conditions
         params = {}
         where_conditions = []
@@ -898,7 +812,13 @@ def get_scout_attribution_metrics(
         where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
         
         # Query de métricas
-        if has_scout_fields:
+        if use_rollup:
+            rollup_where = " AND ".join(
+                "has_debt" if condition == "amount_due_yango > 0" else condition
+                for condition in where_conditions
+            ) or "1=1"
+            metrics_sql = ROLLUP_SCOUT_METRICS_SQL.format(where_clause=rollup_where)
+        elif has_scout_fields:
             metrics_sql = f"""
                 SELECT 
                     COUNT(*) AS total_drivers,
@@ -1046,14 +966,9 @@ def get_scout_attribution_metrics(
             top_missing_examples=top_missing_examples
         )
         
-        # Guardar en cache
-        _scout_metrics_cache[cache_key] = (current_time, metrics)
-        
-        # Limpiar cache expirado (mantener solo últimos 100 entries)
-        if len(_scout_metrics_cache) > 100:
-            expired_keys = [k for k, (t, _) in _scout_metrics_cache.items() if current_time - t >= CACHE_TTL]
-            for k in expired_keys:
-                _scout_metrics_cache.pop(k, None)
+        # Guardar en cache (se invalida al refrescar la vista usada)
+        tags = [view_name, COBRANZA_ROLLUP] if use_rollup else [view_name]
+        _scout_metrics_cache.put(cache_key, (metrics, view_name), tags=tags)
         
         return ScoutAttributionMetricsResponse(
             status="ok",
@@ -1063,7 +978,8 @@ def get_scout_attribution_metrics(
                 "min_debt": min_debt,
                 "reached_milestone": reached_milestone,
                 "scout_id": scout_id
-            }
+            },
+            freshness=read_freshness(db, view_name)
         )
         
     except HTTPException:
@@ -1077,6 +993,7 @@ def get_scout_attribution_metrics(
 
 
 @router.get("/yango/cabinet/cobranza-yango/weekly-kpis", response_model=WeeklyKpisResponse)
+@coalesce("weekly_kpis")
 def get_weekly_kpis(
     db: Session = Depends(get_db),
     only_with_debt: bool = Query(False, description="Si true, solo drivers con deuda pendiente"),
@@ -1095,59 +1012,51 @@ def get_weekly_kpis(
     """
     try:
         # Verificar cache primero
-        cache_key = (
-            only_with_debt,
-            min_debt,
-            reached_milestone,
-            scout_id,
-            scout_quality_bucket,
-            week_start_from,
-            week_start_to,
-            limit_weeks,
-            use_materialized
+        cache_key = _weekly_kpis_cache.key(
+            only_with_debt=only_with_debt,
+            min_debt=min_debt,
+            reached_milestone=reached_milestone,
+            scout_id=scout_id,
+            scout_quality_bucket=scout_quality_bucket,
+            week_start_from=week_start_from,
+            week_start_to=week_start_to,
+            limit_weeks=limit_weeks,
+            use_materialized=use_materialized
         )
-        current_time = time()
-        if cache_key in _weekly_kpis_cache:
-            cached_time, cached_data = _weekly_kpis_cache[cache_key]
-            if current_time - cached_time < CACHE_TTL_WEEKLY:
-                logger.debug("Returning cached weekly KPIs")
-                return cached_data
+        cached_data = _weekly_kpis_cache.get(cache_key)
+        if cached_data is not None:
+            logger.debug("Returning cached weekly KPIs")
+            # La frescura se evalúa en cada request (puede encolar un refresh)
+            return cached_data.model_copy(update={"freshness": read_freshness(db, cached_data.freshness.source)})
         
         # Seleccionar vista (prioridad: MV enriched > MV legacy > vista normal)
         if use_materialized:
-            check_mv_enriched = db.execute(text("""
-                SELECT EXISTS (
-                    SELECT 1 FROM pg_matviews 
-                    WHERE schemaname = 'ops' 
-                    AND matviewname = 'mv_yango_cabinet_cobranza_enriched_14d'
-                )
-            """))
-            mv_enriched_exists = check_mv_enriched.scalar()
+            mv_enriched_exists = mv_exists(db, "ops", "mv_yango_cabinet_cobranza_enriched_14d")
             
             if mv_enriched_exists:
                 view_name = "ops.mv_yango_cabinet_cobranza_enriched_14d"
                 has_week_start = True
             else:
-                check_mv_legacy = db.execute(text("""
-                    SELECT EXISTS (
-                        SELECT 1 FROM pg_matviews 
-                        WHERE schemaname = 'ops' 
-                        AND matviewname = 'mv_cabinet_financial_14d'
-                    )
-                """))
-                mv_legacy_exists = check_mv_legacy.scalar()
+                mv_legacy_exists = mv_exists(db, "ops", "mv_cabinet_financial_14d")
                 view_name = "ops.mv_cabinet_financial_14d" if mv_legacy_exists else "ops.v_cabinet_financial_14d"
                 has_week_start = False
         else:
             view_name = "ops.v_cabinet_financial_14d"
             has_week_start = False
         
+        # Rollup semanal de la MV enriched (si está al día con su último refresh):
+        # mismos filtros salvo min_debt (no es dimensión)
+        use_rollup = has_week_start and min_debt is None and rollup_current(db)
+        
         # Construir WHERE conditions
         params = {}
         where_conditions = []
         
         if only_with_debt:
-            where_conditions.append("amount_due_yango > 0" if has_week_start else "cf.amount_due_yango > 0")
+            if use_rollup:
+                where_conditions.append("has_debt")
+            else:
+                where_conditions.append("amount_due_yango > 0" if has_week_start else "cf.amount_due_yango > 0")
         
         if min_debt is not None:
             params["min_debt"] = min_debt
@@ -1188,7 +1097,9 @@ def get_weekly_kpis(
         where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
         
         # Query de agregación semanal
-        if has_week_start:
+        if use_rollup:
+            metrics_sql = ROLLUP_WEEKLY_KPIS_SQL.format(where_clause=where_clause)
+        elif has_week_start:
             metrics_sql = f"""
                 SELECT 
                     week_start,
@@ -1262,17 +1173,13 @@ def get_weekly_kpis(
                 "week_start_from": week_start_from.isoformat() if week_start_from else None,
                 "week_start_to": week_start_to.isoformat() if week_start_to else None,
                 "limit_weeks": limit_weeks
-            }
+            },
+            freshness=read_freshness(db, view_name)
         )
         
-        # Guardar en cache
-        _weekly_kpis_cache[cache_key] = (current_time, result)
-        
-        # Limpiar cache expirado (mantener solo últimos 50 entries)
-        if len(_weekly_kpis_cache) > 50:
-            expired_keys = [k for k, (t, _) in _weekly_kpis_cache.items() if current_time - t >= CACHE_TTL_WEEKLY]
-            for k in expired_keys:
-                _weekly_kpis_cache.pop(k, None)
+        # Guardar en cache (se invalida al refrescar la vista usada)
+        tags = [view_name, COBRANZA_ROLLUP] if use_rollup else [view_name]
+        _weekly_kpis_cache.put(cache_key, result, tags=tags)
         
         return result
         
@@ -1578,16 +1485,13 @@ def export_cabinet_limbo_csv(
     week_start: Optional[date] = Query(None, description="Filtra por semana"),
     lead_date_from: Optional[date] = Query(None, description="Filtra por lead_date desde"),
     lead_date_to: Optional[date] = Query(None, description="Filtra por lead_date hasta"),
-    limit: int = Query(10000, ge=1, le=50000, description="Límite de resultados para export (máx 50000)")
+    limit: int = Query(10000, ge=1, le=50000, description="Límite de resultados para export (máx 50000)"),
+    export_format: ExportFormat = Query("csv", alias="format", description="Formato: csv, parquet o arrow (Arrow IPC stream)")
 ):
     """
     Exporta leads en limbo a CSV.
     """
     try:
-        from fastapi.responses import StreamingResponse
-        import io
-        import csv
-        
         # Construir WHERE dinámico (mismo que get_cabinet_limbo)
         where_conditions = []
         params = {}
@@ -1615,7 +1519,7 @@ def export_cabinet_limbo_csv(
         params["limit"] = limit
         
         # Query para datos
-        data_query = text(f"""
+        data_query = f"""
             SELECT 
                 lead_id,
                 lead_source_pk,
@@ -1626,75 +1530,25 @@ def export_cabinet_limbo_csv(
                 lead_name,
                 person_key::text AS person_key,
                 driver_id,
-                trips_14d,
+                COALESCE(trips_14d, 0) AS trips_14d,
                 window_end_14d,
-                reached_m1_14d,
-                reached_m5_14d,
-                reached_m25_14d,
-                expected_amount_14d,
-                has_claim_m1,
-                has_claim_m5,
-                has_claim_m25,
+                COALESCE(reached_m1_14d, false) AS reached_m1_14d,
+                COALESCE(reached_m5_14d, false) AS reached_m5_14d,
+                COALESCE(reached_m25_14d, false) AS reached_m25_14d,
+                COALESCE(expected_amount_14d, 0)::float8 AS expected_amount_14d,
+                COALESCE(has_claim_m1, false) AS has_claim_m1,
+                COALESCE(has_claim_m5, false) AS has_claim_m5,
+                COALESCE(has_claim_m25, false) AS has_claim_m25,
                 limbo_stage,
                 limbo_reason_detail
             FROM ops.v_cabinet_leads_limbo
             WHERE {where_clause}
             ORDER BY week_start DESC, lead_date DESC, lead_id
             LIMIT :limit
-        """)
-        
-        result = db.execute(data_query, params)
-        rows = result.fetchall()
+        """
         
-        # Crear CSV en memoria
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow([
-            'lead_id', 'lead_source_pk', 'lead_date', 'week_start',
-            'park_phone', 'asset_plate_number', 'lead_name',
-            'person_key', 'driver_id', 'trips_14d', 'window_end_14d',
-            'reached_m1_14d', 'reached_m5_14d', 'reached_m25_14d',
-            'expected_amount_14d', 'has_claim_m1', 'has_claim_m5', 'has_claim_m25',
-            'limbo_stage', 'limbo_reason_detail'
-        ])
-        
-        # Data
-        for row in rows:
-            writer.writerow([
-                row.lead_id,
-                row.lead_source_pk,
-                row.lead_date.isoformat() if row.lead_date else '',
-                row.week_start.isoformat() if row.week_start else '',
-                row.park_phone or '',
-                row.asset_plate_number or '',
-                row.lead_name or '',
-                row.person_key or '',
-                row.driver_id or '',
-                row.trips_14d or 0,
-                row.window_end_14d.isoformat() if row.window_end_14d else '',
-                row.reached_m1_14d or False,
-                row.reached_m5_14d or False,
-                row.reached_m25_14d or False,
-                float(row.expected_amount_14d) if row.expected_amount_14d else 0,
-                row.has_claim_m1 or False,
-                row.has_claim_m5 or False,
-                row.has_claim_m25 or False,
-                row.limbo_stage,
-                row.limbo_reason_detail or ''
-            ])
-        
-        output.seek(0)
-        
-        from datetime import datetime
-        filename = f"cabinet_limbo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        # Streaming desde un cursor de servidor (CSV: BOM UTF-8 y escape de CSV injection)
+        return stream_export(data_query, params, "cabinet_limbo", export_format)
         
     except HTTPException:
         raise
@@ -1969,16 +1823,13 @@ def export_cabinet_claims_gap_csv(
     lead_date_from: Optional[date] = Query(None, description="Filtra por lead_date desde"),
     lead_date_to: Optional[date] = Query(None, description="Filtra por lead_date hasta"),
     milestone_value: Optional[int] = Query(None, description="Filtra por milestone_value"),
-    limit: int = Query(10000, ge=1, le=50000, description="Límite de resultados para export (máx 50000)")
+    limit: int = Query(10000, ge=1, le=50000, description="Límite de resultados para export (máx 50000)"),
+    export_format: ExportFormat = Query("csv", alias="format", description="Formato: csv, parquet o arrow (Arrow IPC stream)")
 ):
     """
     Exporta gaps de claims a CSV.
     """
     try:
-        from fastapi.responses import StreamingResponse
-        import io
-        import csv
-        
         # Construir WHERE dinámico (mismo que get_cabinet_claims_gap)
         where_conditions = []
         params = {}
@@ -2007,7 +1858,7 @@ def export_cabinet_claims_gap_csv(
         params["limit"] = limit
         
         # Query para datos
-        data_query = text(f"""
+        data_query = f"""
             SELECT 
                 lead_id,
                 lead_source_pk,
@@ -2016,62 +1867,21 @@ def export_cabinet_claims_gap_csv(
                 lead_date,
                 week_start,
                 milestone_value,
-                trips_14d,
-                milestone_achieved,
-                expected_amount,
-                claim_expected,
-                claim_exists,
+                COALESCE(trips_14d, 0) AS trips_14d,
+                COALESCE(milestone_achieved, false) AS milestone_achieved,
+                COALESCE(expected_amount, 0)::float8 AS expected_amount,
+                COALESCE(claim_expected, false) AS claim_expected,
+                COALESCE(claim_exists, false) AS claim_exists,
                 claim_status,
                 gap_reason
             FROM ops.v_cabinet_claims_gap_14d
             WHERE {where_clause}
             ORDER BY week_start DESC, lead_date DESC, milestone_value DESC
             LIMIT :limit
-        """)
-        
-        result = db.execute(data_query, params)
-        rows = result.fetchall()
-        
-        # Crear CSV en memoria
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow([
-            'lead_id', 'lead_source_pk', 'driver_id', 'person_key', 'lead_date', 'week_start',
-            'milestone_value', 'trips_14d', 'milestone_achieved', 'expected_amount',
-            'claim_expected', 'claim_exists', 'claim_status', 'gap_reason'
-        ])
+        """
         
-        # Data
-        for row in rows:
-            writer.writerow([
-                row.lead_id,
-                row.lead_source_pk,
-                row.driver_id or '',
-                row.person_key or '',
-                row.lead_date.isoformat() if row.lead_date else '',
-                row.week_start.isoformat() if row.week_start else '',
-                row.milestone_value,
-                row.trips_14d or 0,
-                row.milestone_achieved or False,
-                float(row.expected_amount) if row.expected_amount else 0,
-                row.claim_expected or False,
-                row.claim_exists or False,
-                row.claim_status,
-                row.gap_reason
-            ])
-        
-        output.seek(0)
-        
-        from datetime import datetime
-        filename = f"cabinet_claims_gap_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        # Streaming desde un cursor de servidor (CSV: BOM UTF-8 y escape de CSV injection)
+        return stream_export(data_query, params, "cabinet_claims_gap", export_format)
         
     except HTTPException:
         raise
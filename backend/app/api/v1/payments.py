@@ -5,19 +5,18 @@ Ejemplo de uso:
 GET /api/v1/payments/eligibility?is_payable=true&payable_from=2025-11-01&payable_to=2025-12-31&limit=50
 """
 from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from sqlalchemy.exc import ProgrammingError, OperationalError
 from typing import Optional
-from datetime import date, datetime
+from datetime import date
 from uuid import UUID
 from decimal import Decimal
 import logging
-import csv
-import io
 
 from app.core.db import get_db
+from app.core.pagination import SortKey, keyset_condition, next_cursor, order_by as sql_order_by
+from app.services.csv_export import ExportFormat, stream_export
 from app.schemas.payments import (
     PaymentEligibilityRow,
     PaymentEligibilityResponse,
@@ -46,7 +45,8 @@ def get_payment_eligibility(
     limit: int = Query(200, ge=1, le=1000, description="Límite de resultados (máx 1000)"),
     offset: int = Query(0, ge=0, description="Offset para paginación"),
     order_by: OrderByField = Query(OrderByField.payable_date, description="Campo para ordenar"),
-    order_dir: OrderDirection = Query(OrderDirection.asc, description="Dirección del ordenamiento")
+    order_dir: OrderDirection = Query(OrderDirection.asc, description="Dirección del ordenamiento"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset")
 ):
     """
     Consulta la vista ops.v_payment_calculation con filtros opcionales.
@@ -127,19 +127,30 @@ def get_payment_eligibility(
             detail=f"order_dir debe ser 'asc' o 'desc', recibido: {order_direction}"
         )
     
+    # Orden pedido + desempate por el grano de la vista (persona, origen, regla) para el keyset
+    keys = (
+        SortKey(order_by_field, descending=order_direction == "desc"),
+        SortKey("person_key"),
+        SortKey("origin_tag"),
+        SortKey("rule_id"),
+    )
+    keyset = keyset_condition(keys, cursor, params)
+    if keyset:
+        where_conditions.append(keyset)
+    
     # Construir query SQL
     sql = "SELECT * FROM ops.v_payment_calculation WHERE 1=1"
     
     if where_conditions:
         sql += " AND " + " AND ".join(where_conditions)
     
-    sql += f" ORDER BY {order_by_field} {order_direction}"
+    sql += f" ORDER BY {sql_order_by(keys)}"
     sql += " LIMIT :limit OFFSET :offset"
     
     # Agregar limit y offset (ya convertidos a int) directamente
     # SQLAlchemy/psycopg2 manejará la conversión de tipos automáticamente
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
     
     # Logging (sin datos sensibles)
     log_filters = {
@@ -182,7 +193,8 @@ def get_payment_eligibility(
             status="ok",
             count=len(rows),
             filters=filters_dict,
-            rows=[PaymentEligibilityRow(**row) for row in rows]
+            rows=[PaymentEligibilityRow(**row) for row in rows],
+            next_cursor=next_cursor(keys, rows_data, limit)
         )
     except Exception as e:
         logger.error(f"Error executing payment eligibility query: {e}")
@@ -426,17 +438,18 @@ def get_driver_matrix(
 
 @router.get("/driver-matrix/export")
 def export_driver_matrix(
-    db: Session = Depends(get_db),
     week_from: Optional[date] = Query(None, description="Filtra por week_start >= week_from"),
     week_to: Optional[date] = Query(None, description="Filtra por week_start <= week_to"),
     search: Optional[str] = Query(None, description="Busca por driver_id, person_key, driver_name"),
-    only_pending: Optional[bool] = Query(None, description="Filtra drivers con algún milestone pendiente")
+    only_pending: Optional[bool] = Query(None, description="Filtra drivers con algún milestone pendiente"),
+    export_format: ExportFormat = Query("csv", alias="format", description="Formato: csv, parquet o arrow (Arrow IPC stream)")
 ):
     """
     Exporta la matriz de drivers a CSV con BOM UTF-8.
     
     Mismos filtros que /driver-matrix pero sin paginación.
-    Retorna CSV con todas las columnas de la vista.
+    Retorna CSV con todas las columnas de la vista, en streaming.
+    format=parquet|arrow devuelve las mismas columnas tipadas (Parquet / Arrow IPC).
     """
     # Construir WHERE dinámico (mismo que en get_driver_matrix)
     where_conditions = []
@@ -483,64 +496,10 @@ def export_driver_matrix(
     """
     
     try:
-        result = db.execute(text(sql), params)
-        rows_data = result.mappings().all()
-        
-        if not rows_data:
-            # Retornar CSV vacío con headers
-            output = io.StringIO()
-            fieldnames = [
-                "driver_id", "person_key", "driver_name", "lead_date", "week_start", "origin_tag",
-                "connected_flag", "connected_date",
-                "m1_achieved_flag", "m1_achieved_date", "m1_expected_amount_yango", "m1_yango_payment_status",
-                "m1_window_status", "m1_overdue_days",
-                "m5_achieved_flag", "m5_achieved_date", "m5_expected_amount_yango", "m5_yango_payment_status",
-                "m5_window_status", "m5_overdue_days",
-                "m25_achieved_flag", "m25_achieved_date", "m25_expected_amount_yango", "m25_yango_payment_status",
-                "m25_window_status", "m25_overdue_days",
-                "scout_due_flag", "scout_paid_flag", "scout_amount"
-            ]
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-        else:
-            # Convertir a dicts y escribir CSV
-            output = io.StringIO()
-            fieldnames = list(rows_data[0].keys())
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for row in rows_data:
-                row_dict = dict(row)
-                # Convertir UUIDs a strings
-                for key, value in row_dict.items():
-                    if isinstance(value, UUID):
-                        row_dict[key] = str(value)
-                    elif value is None:
-                        row_dict[key] = ""
-                writer.writerow(row_dict)
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        # Generar nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"driver_matrix_{timestamp}.csv"
-        
-        # Codificar CSV a bytes UTF-8
-        csv_bytes = csv_content.encode('utf-8')
-        
-        # Agregar BOM UTF-8-SIG (EF BB BF) al inicio
-        bom_bytes = b'\xef\xbb\xbf'
-        csv_content_with_bom = bom_bytes + csv_bytes
-        
-        return Response(
-            content=csv_content_with_bom,
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Type": "text/csv; charset=utf-8"
-            }
-        )
+        # Streaming desde un cursor de servidor (CSV: BOM UTF-8 y UUIDs como texto)
+        return stream_export(sql, params, "driver_matrix", export_format)
+    except HTTPException:
+        raise
     except ProgrammingError as e:
         logger.error(f"Error SQL en driver-matrix export: {e}")
         raise HTTPException(
@@ -9,7 +9,6 @@ Endpoints:
 - GET /payments/reconciliation/driver/{driver_id} - Detalle de un conductor
 """
 from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from sqlalchemy.exc import ProgrammingError, OperationalError
@@ -18,16 +17,18 @@ from datetime import date, datetime
 from uuid import UUID
 import logging
 import hashlib
-import csv
-import io
-from time import time
-from typing import Dict, Tuple, Any
 
 from app.core.db import get_db
+from app.core.pagination import SortKey, add_condition, keyset_condition, next_cursor, order_by
+from app.services.csv_export import ExportFormat, stream_export
+from app.services.mv_freshness import read_freshness
+from app.services.response_cache import response_cache
 
 # Cache para claims-to-collect (TTL en segundos)
 CACHE_TTL_CLAIMS = 120  # 2 minutos
-_claims_cache: Dict[Tuple, Tuple[float, Any]] = {}
+_claims_cache = response_cache("claims_to_collect", ttl=CACHE_TTL_CLAIMS)
+# ops.v_yango_cabinet_claims_exigimos lee de esta MV: su refresh invalida la cache
+CLAIMS_TO_COLLECT_DEPENDS_ON = ("ops.mv_yango_cabinet_claims_for_collection",)
 from app.schemas.payments import (
     YangoReconciliationSummaryRow,
     YangoReconciliationSummaryResponse,
@@ -56,6 +57,28 @@ from app.schemas.cabinet_recovery import (
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Claves de paginación keyset (mismo orden que el ORDER BY de cada endpoint, con desempate)
+RECONCILIATION_ITEMS_KEYS = (
+    SortKey("pay_week_start_monday", descending=True),
+    SortKey("milestone_value"),
+    SortKey("lead_date", descending=True),
+    SortKey("driver_id"),
+)
+LEDGER_KEYS = (
+    SortKey("l.pay_date", descending=True),
+    SortKey("l.payment_key", nullable=False),
+)
+CLAIMS_TO_COLLECT_KEYS = (
+    SortKey("days_overdue_yango", descending=True),
+    SortKey("expected_amount", descending=True),
+    SortKey("driver_id"),
+    SortKey("milestone_value"),
+)
+CABINET_RECONCILIATION_KEYS = (
+    SortKey("driver_id"),
+    SortKey("milestone_value"),
+)
+
 
 @router.get("/payments/reconciliation/summary", response_model=YangoReconciliationSummaryResponse)
 def get_reconciliation_summary(
@@ -172,7 +195,8 @@ def get_reconciliation_items(
     driver_id: Optional[str] = Query(None, description="Filtra por driver_id"),
     paid_status: Optional[str] = Query(None, description="Filtra por paid_status"),
     limit: int = Query(1000, ge=1, le=10000, description="Límite de resultados"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset")
 ):
     """
     Obtiene items detallados de reconciliación de pagos Yango.
@@ -200,6 +224,9 @@ def get_reconciliation_items(
     if where_conditions:
         where_clause = "WHERE " + " AND ".join(where_conditions)
     
+    # Keyset: la condición del cursor solo va en la query de datos (no en el total)
+    data_where_clause = add_condition(where_clause, keyset_condition(RECONCILIATION_ITEMS_KEYS, cursor, params))
+    
     # Query para contar total
     count_sql = f"""
         SELECT COUNT(*) AS total
@@ -238,13 +265,13 @@ def get_reconciliation_items(
             match_rule,
             match_confidence
         FROM ops.v_yango_payments_claims_cabinet_14d
-        {where_clause}
-        ORDER BY pay_week_start_monday DESC, milestone_value ASC, lead_date DESC
+        {data_where_clause}
+        ORDER BY {order_by(RECONCILIATION_ITEMS_KEYS)}
         LIMIT :limit OFFSET :offset
     """
     
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
     
     try:
         # Obtener total
@@ -285,7 +312,8 @@ def get_reconciliation_items(
             count=len(rows),
             total=total,
             filters={k: v for k, v in filters.items() if v is not None},
-            rows=rows
+            rows=rows,
+            next_cursor=next_cursor(RECONCILIATION_ITEMS_KEYS, rows_data, limit)
         )
     except Exception as e:
         logger.error(f"Error en reconciliation items: {e}")
@@ -302,7 +330,8 @@ def get_ledger_unmatched(
     driver_id: Optional[str] = Query(None, description="Filtra por driver_id"),
     identity_status: Optional[str] = Query(None, description="Filtra por identity_status"),
     limit: int = Query(1000, ge=1, le=10000, description="Límite de resultados"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset")
 ):
     """
     Obtiene registros del ledger que no tienen match contra claims.
@@ -333,6 +362,9 @@ def get_ledger_unmatched(
     
     where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
     
+    # Keyset: la condición del cursor solo va en la query de datos (no en el total)
+    data_where_clause = add_condition(where_clause, keyset_condition(LEDGER_KEYS, cursor, params))
+    
     # Query para contar total
     count_sql = f"""
         SELECT COUNT(*) AS total
@@ -361,13 +393,13 @@ def get_ledger_unmatched(
             l.person_key_final,
             l.identity_status
         FROM ops.v_yango_payments_ledger_latest_enriched l
-        {where_clause}
-        ORDER BY l.pay_date DESC, l.payment_key
+        {data_where_clause}
+        ORDER BY {order_by(LEDGER_KEYS)}
         LIMIT :limit OFFSET :offset
     """
     
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
     
     try:
         # Obtener total
@@ -393,7 +425,8 @@ def get_ledger_unmatched(
             count=len(rows),
             total=total,
             filters={k: v for k, v in filters.items() if v is not None},
-            rows=rows
+            rows=rows,
+            next_cursor=next_cursor(LEDGER_KEYS, rows_data, limit)
         )
     except Exception as e:
         logger.error(f"Error en ledger unmatched: {e}")
@@ -409,7 +442,8 @@ def get_ledger_matched(
     is_paid: Optional[bool] = Query(None, description="Filtra por is_paid"),
     driver_id: Optional[str] = Query(None, description="Filtra por driver_id"),
     limit: int = Query(1000, ge=1, le=10000, description="Límite de resultados"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset")
 ):
     """
     Obtiene registros del ledger que tienen match contra claims.
@@ -436,6 +470,9 @@ def get_ledger_matched(
     
     where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
     
+    # Keyset: la condición del cursor solo va en la query de datos (no en el total)
+    data_where_clause = add_condition(where_clause, keyset_condition(LEDGER_KEYS, cursor, params))
+    
     # Query para contar total
     count_sql = f"""
         SELECT COUNT(*) AS total
@@ -464,13 +501,13 @@ def get_ledger_matched(
             l.person_key_final,
             l.identity_status
         FROM ops.v_yango_payments_ledger_latest_enriched l
-        {where_clause}
-        ORDER BY l.pay_date DESC, l.payment_key
+        {data_where_clause}
+        ORDER BY {order_by(LEDGER_KEYS)}
         LIMIT :limit OFFSET :offset
     """
     
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
     
     try:
         # Obtener total
@@ -495,7 +532,8 @@ def get_ledger_matched(
             count=len(rows),
             total=total,
             filters={k: v for k, v in filters.items() if v is not None},
-            rows=rows
+            rows=rows,
+            next_cursor=next_cursor(LEDGER_KEYS, rows_data, limit)
         )
     except Exception as e:
         logger.error(f"Error en ledger matched: {e}")
@@ -696,7 +734,8 @@ def get_cabinet_claims_to_collect(
     milestone_value: Optional[int] = Query(None, description="Filtra por milestone (1, 5, 25)"),
     search: Optional[str] = Query(None, description="Búsqueda en driver_name o driver_id"),
     limit: int = Query(50, ge=1, le=200, description="Límite de resultados por página"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset")
 ):
     """
     Obtiene lista de claims exigibles a Yango (EXIGIMOS).
@@ -707,20 +746,20 @@ def get_cabinet_claims_to_collect(
     READ-ONLY: No recalcula estados, solo consume la vista existente.
     """
     # Verificar cache primero
-    cache_key = (
-        date_from.isoformat() if date_from else None,
-        date_to.isoformat() if date_to else None,
-        milestone_value,
-        search,
-        limit,
-        offset
+    cache_key = _claims_cache.key(
+        date_from=date_from,
+        date_to=date_to,
+        milestone_value=milestone_value,
+        search=search,
+        limit=limit,
+        offset=offset,
+        cursor=cursor
     )
-    current_time = time()
-    if cache_key in _claims_cache:
-        cached_time, cached_data = _claims_cache[cache_key]
-        if current_time - cached_time < CACHE_TTL_CLAIMS:
-            logger.debug("Returning cached claims-to-collect")
-            return cached_data
+    cached_data = _claims_cache.get(cache_key)
+    if cached_data is not None:
+        logger.debug("Returning cached claims-to-collect")
+        # La frescura se evalúa en cada request (puede encolar un refresh)
+        return cached_data.model_copy(update={"freshness": read_freshness(db, CLAIMS_TO_COLLECT_DEPENDS_ON[0])})
     
     # Construir query base (QUERY 3.1)
     where_conditions = []
@@ -748,6 +787,9 @@ def get_cabinet_claims_to_collect(
     if where_conditions:
         where_clause = "WHERE " + " AND ".join(where_conditions)
     
+    # Keyset: la condición del cursor solo va en la query de datos (no en el total)
+    data_where_clause = add_condition(where_clause, keyset_condition(CLAIMS_TO_COLLECT_KEYS, cursor, params))
+    
     # Query para contar total
     count_sql = f"""
         SELECT COUNT(*) AS total
@@ -778,17 +820,13 @@ def get_cabinet_claims_to_collect(
             pay_date,
             suggested_driver_id
         FROM ops.v_yango_cabinet_claims_exigimos
-        {where_clause}
-        ORDER BY 
-            days_overdue_yango DESC,
-            expected_amount DESC,
-            driver_id,
-            milestone_value
+        {data_where_clause}
+        ORDER BY {order_by(CLAIMS_TO_COLLECT_KEYS)}
         LIMIT :limit OFFSET :offset
     """
     
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
     
     try:
         # Obtener total
@@ -823,11 +861,13 @@ def get_cabinet_claims_to_collect(
             count=len(rows),
             total=total,
             filters={k: v for k, v in filters.items() if v is not None},
-            rows=rows
+            rows=rows,
+            next_cursor=next_cursor(CLAIMS_TO_COLLECT_KEYS, rows_data, limit),
+            freshness=read_freshness(db, CLAIMS_TO_COLLECT_DEPENDS_ON[0])
         )
         
         # Guardar en caché
-        _claims_cache[cache_key] = (current_time, response)
+        _claims_cache.put(cache_key, response, tags=CLAIMS_TO_COLLECT_DEPENDS_ON)
         
         return response
     except OperationalError as e:
@@ -1138,7 +1178,8 @@ def get_cabinet_claim_drilldown(
             payment_exact=payment_exact,
             payments_other_milestones=payments_other_milestones,
             reconciliation=reconciliation,
-            misapplied_explanation=misapplied_explanation
+            misapplied_explanation=misapplied_explanation,
+            freshness=read_freshness(db, "ops.mv_yango_cabinet_claims_for_collection")
         )
     except HTTPException:
         raise
@@ -1152,11 +1193,11 @@ def get_cabinet_claim_drilldown(
 
 @router.get("/cabinet/claims/export")
 def export_cabinet_claims_csv(
-    db: Session = Depends(get_db),
     date_from: Optional[date] = Query(None, description="Filtra por fecha lead desde"),
     date_to: Optional[date] = Query(None, description="Filtra por fecha lead hasta"),
     milestone_value: Optional[int] = Query(None, description="Filtra por milestone (1, 5, 25)"),
-    search: Optional[str] = Query(None, description="Búsqueda en driver_name o driver_id")
+    search: Optional[str] = Query(None, description="Búsqueda en driver_name o driver_id"),
+    export_format: ExportFormat = Query("csv", alias="format", description="Formato: csv, parquet o arrow (Arrow IPC stream)")
 ):
     """
     Exporta lista de claims exigibles a Yango (EXIGIMOS) a CSV.
@@ -1168,7 +1209,8 @@ def export_cabinet_claims_csv(
     Orden: days_overdue_yango DESC, expected_amount DESC
     
     READ-ONLY: No recalcula estados, solo consume la vista existente.
-    Hard cap: 200,000 filas máximo (error 413 si excede).
+    Sin límite de filas: se envía en streaming (memoria constante).
+    format=parquet|arrow exporta columnas tipadas (Parquet / Arrow IPC) en vez de CSV.
     """
     # Construir query base (QUERY 3.2)
     where_conditions = []
@@ -1197,21 +1239,6 @@ def export_cabinet_claims_csv(
         where_clause = "WHERE " + " AND ".join(where_conditions)
     
     try:
-        # Verificar conteo antes de exportar (hard cap defensivo)
-        count_sql = f"""
-            SELECT COUNT(*) AS total
-            FROM ops.v_yango_cabinet_claims_exigimos
-            {where_clause}
-        """
-        count_result = db.execute(text(count_sql), params).fetchone()
-        total = count_result.total if count_result else 0
-        
-        if total > 200000:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Export excede límite de 200,000 filas. Total filtrado: {total}. Aplique filtros más restrictivos."
-            )
-        
         # Query para obtener datos (QUERY 3.2 - columnas exportables con nombres amigables)
         sql = f"""
         SELECT 
@@ -1252,74 +1279,12 @@ def export_cabinet_claims_csv(
             milestone_value
         """
         
-        # Obtener datos
-        result = db.execute(text(sql), params)
-        rows_data = result.mappings().all()
-        
-        # Generar CSV en memoria
-        output = io.StringIO()
-        
-        # Obtener nombres de columnas del primer row (ya vienen con alias de SQL)
-        if rows_data:
-            fieldnames = list(rows_data[0].keys())
-            writer = csv.DictWriter(output, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
-            writer.writeheader()
-            
-            for row in rows_data:
-                # Convertir valores None a string vacío para CSV
-                # Mitigar CSV injection: prefijar celdas que empiezan con (=,+,-,@) con '
-                row_dict = {}
-                for k, v in dict(row).items():
-                    if v is None:
-                        row_dict[k] = ''
-                    elif isinstance(v, str) and v and v[0] in ('=', '+', '-', '@'):
-                        # Prefijar con ' para prevenir ejecución de fórmulas en Excel
-                        row_dict[k] = "'" + v
-                    else:
-                        row_dict[k] = v
-                writer.writerow(row_dict)
-        else:
-            # CSV vacío con headers
-            fieldnames = [
-                "Driver ID", "Nombre Conductor", "Milestone",
-                "Monto Exigible (S/)", "Fecha Lead", "Fecha Vencimiento",
-                "Días Vencidos", "Bucket Vencimiento", "Estado Pago",
-                "Razón", "Estado Identidad", "Regla Matching",
-                "Confianza Matching", "Reconciliable", "Payment Key",
-                "Fecha Pago Encontrado", "Driver ID Sugerido", "Person Key"
-            ]
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        # Generar nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-        filename = f"yango_cabinet_claims_{timestamp}.csv"
-        
-        # Codificar CSV a bytes UTF-8 (sin BOM aún)
-        csv_bytes = csv_content.encode('utf-8')
-        
-        # Agregar BOM UTF-8-SIG (EF BB BF) al inicio de los bytes
-        # BOM: b'\xef\xbb\xbf' = bytes EF BB BF en hexadecimal
-        bom_bytes = b'\xef\xbb\xbf'
-        csv_content_with_bom = bom_bytes + csv_bytes
-        
-        # Retornar CSV como respuesta con UTF-8 BOM
-        # NOTA: El BOM está en los bytes del contenido, no solo en el charset del header
-        # Verificación manual:
-        #   $r = Invoke-WebRequest -Uri "http://localhost:8000/api/v1/yango/cabinet/claims/export?limit=1"
+        # Streaming desde un cursor de servidor (CSV: BOM UTF-8 para Excel y escape de CSV injection)
+        # Verificación manual del BOM:
+        #   $r = Invoke-WebRequest -Uri "http://localhost:8000/api/v1/yango/cabinet/claims/export"
         #   $b = $r.Content; $h = ($b[0..2] | ForEach-Object { "{0:X2}" -f $_ }) -join ' '
         #   # Debe mostrar: "EF BB BF"
-        return Response(
-            content=csv_content_with_bom,
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Type": "text/csv; charset=utf-8"
-            }
-        )
+        return stream_export(sql, params, "yango_cabinet_claims", export_format)
     except HTTPException:
         raise
     except OperationalError as e:
@@ -1429,7 +1394,8 @@ def get_cabinet_reconciliation(
     date_from: Optional[date] = Query(None, description="Fecha inicio (filtra por pay_date si existe, si no por achieved_date)"),
     date_to: Optional[date] = Query(None, description="Fecha fin (filtra por pay_date si existe, si no por achieved_date)"),
     limit: int = Query(100, ge=1, le=10000, description="Límite de resultados"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor keyset (next_cursor de la respuesta anterior); reemplaza a offset")
 ):
     """
     Obtiene datos de reconciliación canónica de milestones Cabinet.
@@ -1472,6 +1438,9 @@ def get_cabinet_reconciliation(
     if where_conditions:
         where_clause = "WHERE " + " AND ".join(where_conditions)
     
+    # Keyset: la condición del cursor solo va en la query de datos (no en el total)
+    data_where_clause = add_condition(where_clause, keyset_condition(CABINET_RECONCILIATION_KEYS, cursor, params))
+    
     # Query para contar total
     count_sql = f"""
         SELECT COUNT(*) AS total
@@ -1503,13 +1472,13 @@ def get_cabinet_reconciliation(
             latest_snapshot_at,
             reconciliation_status
         FROM ops.v_cabinet_milestones_reconciled
-        {where_clause}
-        ORDER BY driver_id, milestone_value
+        {data_where_clause}
+        ORDER BY {order_by(CABINET_RECONCILIATION_KEYS)}
         LIMIT :limit OFFSET :offset
     """
     
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
     
     try:
         # Obtener total
@@ -1546,7 +1515,8 @@ def get_cabinet_reconciliation(
             count=len(rows),
             total=total,
             filters={k: v for k, v in filters.items() if v is not None},
-            rows=rows
+            rows=rows,
+            next_cursor=next_cursor(CABINET_RECONCILIATION_KEYS, rows_data, limit)
         )
     except OperationalError as e:
         # Error de conexión a BD
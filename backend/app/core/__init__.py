@@ -2,6 +2,7 @@
 Núcleo de la aplicación: configuración, BD y utilidades.
 
 - config: Settings, database_url, CORS, etc. (app.core.config)
-- db: engine, SessionLocal, get_db, Base (app.core.db)
-- db_utils: row_to_dict (app.core.db_utils)
+- db: engines por perfil (interactive/batch/maintenance/export), SessionLocal, BatchSessionLocal,
+  MaintenanceSessionLocal, ExportSessionLocal, get_db, Base (app.core.db)
+- db_utils: row_to_dict, any_array/fetch_by_keys para listas grandes de claves (app.core.db_utils)
 """
@@ -53,6 +53,34 @@ class Settings(BaseSettings):
     name_similarity_threshold: float = 0.66
     admin_token: str = ""
     lead_system_start_date: str = "2024-01-01"
+    # Refresh de MVs: cuántas ramas independientes del DAG se refrescan a la vez
+    mv_refresh_max_parallel: int = 3
+    # Refresh por cambios: una MV sin cambios en sus tablas base se omite como mucho estos minutos
+    mv_refresh_max_skip_minutes: int = 60
+    # Espera máxima a que termine un refresh idéntico en curso
+    mv_refresh_wait_timeout_seconds: int = 1800
+    # Refresh adaptativo: segundos de refresh por hora que se permiten fuera de la ventana off-peak
+    mv_refresh_budget_seconds_per_hour: int = 600
+    mv_refresh_min_interval_minutes: int = 5
+    # Ventana off-peak (horas locales "inicio-fin", fin exclusivo) y coste a partir del cual una MV diaria va ahí
+    mv_refresh_offpeak_hours: str = "1-6"
+    mv_refresh_offpeak_cost_seconds: int = 120
+    # Perfiles de conexión (ver app.core.db): statement_timeout en ms (0 = sin límite) y memoria de sesión
+    db_interactive_statement_timeout_ms: int = 30000
+    db_batch_statement_timeout_ms: int = 600000
+    db_batch_work_mem: str = "64MB"
+    db_maintenance_statement_timeout_ms: int = 0
+    db_maintenance_work_mem: str = "256MB"
+    db_maintenance_maintenance_work_mem: str = "1GB"
+    # Exports en streaming: descargas simultáneas (tamaño del pool), espera por una conexión libre
+    # antes de responder 503, y corte de una descarga cuyo cliente deja de leer
+    db_export_pool_size: int = 2
+    db_export_pool_timeout_seconds: int = 5
+    db_export_statement_timeout_ms: int = 600000
+    db_export_idle_in_transaction_timeout_ms: int = 60000
+    # Cache de respuestas (ver app.services.response_cache): vacío = memoria de cada proceso;
+    # redis://... = una cache compartida por todos los workers (requiere el paquete redis)
+    response_cache_redis_url: str = ""
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,36 +1,143 @@
 """
-Conexión a base de datos: engine, sesiones y dependencia get_db.
+Conexión a base de datos: engines por perfil, sesiones y dependencias get_db.
+
+Perfiles (cada uno con su propio pool, statement_timeout, work_mem y application_name):
+- interactive: requests de la API (engine / SessionLocal / get_db). Timeout corto.
+- batch: ingestas y procesamiento de leads (BatchSessionLocal / get_batch_db).
+- maintenance: REFRESH de MVs, índices, rebuilds (MaintenanceSessionLocal / get_maintenance_db).
+  Sin timeout por defecto y con memoria de sesión amplia.
+- export: descargas CSV/Parquet en streaming (app/services/csv_export.py). Cada descarga
+  retiene una conexión con una transacción abierta mientras el cliente lee: pool chico
+  (acota las descargas simultáneas), espera corta por conexión e
+  idle_in_transaction_session_timeout para que un cliente detenido no frene el vacuum.
+
+Los pools son independientes: un job pesado no consume conexiones de la API.
+Los engines se crean al importar pero no abren conexiones hasta usarse.
 """
-from typing import Generator
+from dataclasses import dataclass
+from typing import Dict, Generator, Optional
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session, DeclarativeBase
 
 from app.core.config import settings
 
+PROFILE_INTERACTIVE = "interactive"
+PROFILE_BATCH = "batch"
+PROFILE_MAINTENANCE = "maintenance"
+PROFILE_EXPORT = "export"
+
 
 class Base(DeclarativeBase):
     """Base para modelos SQLAlchemy."""
     pass
 
 
+@dataclass(frozen=True)
+class EngineProfile:
+    """Pool y parámetros de sesión de un tipo de carga."""
+    name: str
+    pool_size: int
+    max_overflow: int
+    statement_timeout_ms: int  # 0 = sin límite
+    application_name: str
+    work_mem: Optional[str] = None
+    maintenance_work_mem: Optional[str] = None
+    idle_in_transaction_timeout_ms: int = 0  # 0 = sin límite
+    pool_timeout_seconds: int = 30  # espera máxima por una conexión libre del pool
+
+    def connect_options(self) -> str:
+        options = [f"-c statement_timeout={self.statement_timeout_ms}"]
+        if self.idle_in_transaction_timeout_ms:
+            options.append(f"-c idle_in_transaction_session_timeout={self.idle_in_transaction_timeout_ms}")
+        if self.work_mem:
+            options.append(f"-c work_mem={self.work_mem}")
+        if self.maintenance_work_mem:
+            options.append(f"-c maintenance_work_mem={self.maintenance_work_mem}")
+        return " ".join(options)
+
+
+PROFILES: Dict[str, EngineProfile] = {
+    PROFILE_INTERACTIVE: EngineProfile(
+        name=PROFILE_INTERACTIVE,
+        pool_size=10,
+        max_overflow=20,
+        statement_timeout_ms=settings.db_interactive_statement_timeout_ms,
+        application_name="ct4-api",
+    ),
+    PROFILE_BATCH: EngineProfile(
+        name=PROFILE_BATCH,
+        pool_size=3,
+        max_overflow=3,
+        statement_timeout_ms=settings.db_batch_statement_timeout_ms,
+        application_name="ct4-batch",
+        work_mem=settings.db_batch_work_mem,
+    ),
+    PROFILE_MAINTENANCE: EngineProfile(
+        name=PROFILE_MAINTENANCE,
+        # Refresh paralelo: una conexión por refresh más la del advisory lock de cada uno
+        pool_size=4,
+        max_overflow=4,
+        statement_timeout_ms=settings.db_maintenance_statement_timeout_ms,
+        application_name="ct4-maintenance",
+        work_mem=settings.db_maintenance_work_mem,
+        maintenance_work_mem=settings.db_maintenance_maintenance_work_mem,
+    ),
+    PROFILE_EXPORT: EngineProfile(
+        name=PROFILE_EXPORT,
+        pool_size=settings.db_export_pool_size,
+        max_overflow=0,
+        statement_timeout_ms=settings.db_export_statement_timeout_ms,
+        application_name="ct4-export",
+        idle_in_transaction_timeout_ms=settings.db_export_idle_in_transaction_timeout_ms,
+        pool_timeout_seconds=settings.db_export_pool_timeout_seconds,
+    ),
+}
+
+
 def get_db_url() -> str:
     """URL de conexión. Útil para scripts con su propio engine."""
     return settings.database_url
 
 
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    pool_size=10,
-    max_overflow=20,
-    connect_args={
-        "connect_timeout": 10,
-        "options": "-c statement_timeout=30000"
-    }
-)
+def _create_profile_engine(profile: EngineProfile) -> Engine:
+    return create_engine(
+        settings.database_url,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=profile.pool_size,
+        max_overflow=profile.max_overflow,
+        pool_timeout=profile.pool_timeout_seconds,
+        connect_args={
+            "connect_timeout": 10,
+            "application_name": profile.application_name,
+            "options": profile.connect_options()
+        }
+    )
+
+
+engine = _create_profile_engine(PROFILES[PROFILE_INTERACTIVE])
+batch_engine = _create_profile_engine(PROFILES[PROFILE_BATCH])
+maintenance_engine = _create_profile_engine(PROFILES[PROFILE_MAINTENANCE])
+export_engine = _create_profile_engine(PROFILES[PROFILE_EXPORT])
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+BatchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=batch_engine)
+MaintenanceSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=maintenance_engine)
+ExportSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=export_engine)
+
+_SESSION_FACTORIES = {
+    PROFILE_INTERACTIVE: SessionLocal,
+    PROFILE_BATCH: BatchSessionLocal,
+    PROFILE_MAINTENANCE: MaintenanceSessionLocal,
+    PROFILE_EXPORT: ExportSessionLocal,
+}
+
+
+def session_for(profile: str) -> Session:
+    """Nueva sesión del perfil indicado (interactive, batch, maintenance o export)."""
+    return _SESSION_FACTORIES[profile]()
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -40,3 +147,21 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+def get_batch_db() -> Generator[Session, None, None]:
+    """Dependencia para endpoints que ejecutan ingestas síncronas (perfil batch)."""
+    db = BatchSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_maintenance_db() -> Generator[Session, None, None]:
+    """Dependencia para endpoints que ejecutan REFRESH/índices (perfil maintenance)."""
+    db = MaintenanceSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -3,8 +3,31 @@ Utilidades para resultados de base de datos.
 
 Centraliza la conversión fila SQLAlchemy/Result -> dict para validación con Pydantic,
 evitando repetir el mismo patrón en todos los endpoints y servicios.
+
+También centraliza el binding de listas grandes de claves: en lugar de
+`IN (:p1, :p2, ...)` (SQL enorme y un plan nuevo por cada tamaño de lista) se
+enlazan como un único array tipado de Postgres (`col = ANY(CAST(:keys AS text[]))`),
+troceado automáticamente, o se vuelcan a una tabla temporal para conjuntos muy grandes.
 """
-from typing import Any
+from typing import Any, Iterable, Iterator, List, Sequence, TypeVar
+from uuid import uuid4
+
+from sqlalchemy import Text, any_, bindparam, cast, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PGUUID
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.sql import column as sql_column, table as sql_table
+
+T = TypeVar("T")
+
+# Claves por array enlazado (un único parámetro por chunk)
+ARRAY_CHUNK_SIZE = 10000
+# A partir de este número de claves se usa tabla temporal + JOIN
+TEMP_TABLE_THRESHOLD = 100000
+
+_PG_TYPES = {
+    "text": Text(),
+    "uuid": PGUUID(as_uuid=False),
+}
 
 
 def row_to_dict(row: Any) -> dict[str, Any]:
@@ -17,3 +40,89 @@ def row_to_dict(row: Any) -> dict[str, Any]:
     if hasattr(row, "_asdict"):
         return row._asdict()
     return dict(row)
+
+
+def chunked(values: Sequence[T], size: int = ARRAY_CHUNK_SIZE) -> Iterator[List[T]]:
+    """Trocea una secuencia en listas de como mucho `size` elementos."""
+    for start in range(0, len(values), size):
+        yield list(values[start:start + size])
+
+
+def array_keys(keys: Iterable[Any]) -> List[str]:
+    """Normaliza claves para un parámetro array: sin None, sin duplicados, como str."""
+    return list(dict.fromkeys(str(k) for k in keys if k is not None))
+
+
+def any_array(col: Any, keys: Iterable[Any], pg_type: str = "text", name: str = "keys") -> Any:
+    """
+    Expresión `col = ANY(CAST(:keys AS <pg_type>[]))` para usar en filter()/where().
+    Un solo parámetro enlazado sin importar cuántas claves haya.
+    """
+    param = bindparam(name, value=array_keys(keys), type_=ARRAY(Text()))
+    return col == any_(cast(param, ARRAY(_PG_TYPES[pg_type])))
+
+
+def fetch_by_keys(
+    db: Session,
+    query: Any,
+    col: Any,
+    keys: Iterable[Any],
+    pg_type: str = "text",
+    chunk_size: int = ARRAY_CHUNK_SIZE,
+    temp_table_threshold: int = TEMP_TABLE_THRESHOLD,
+) -> list:
+    """
+    Ejecuta `query` (ORM Query o Select) restringida a `col` ∈ `keys` y devuelve todas las filas.
+
+    - Hasta `temp_table_threshold` claves: chunks de `chunk_size` con `col = ANY(:keys)`.
+    - Por encima: las claves se cargan en una tabla temporal y se hace JOIN.
+    """
+    key_list = array_keys(keys)
+    if not key_list:
+        return []
+
+    if len(key_list) > temp_table_threshold:
+        tmp = load_keys_temp_table(db, key_list, pg_type=pg_type, chunk_size=chunk_size)
+        # Sin finally: si el JOIN falla la transacción está abortada y un DROP taparía el error
+        # original (InFailedSqlTransaction); la tabla desaparece con el ROLLBACK
+        rows = _run(db, query.join(tmp, tmp.c.key == col))
+        db.execute(text(f"DROP TABLE IF EXISTS {tmp.name}"))
+        return rows
+
+    rows = []
+    for chunk in chunked(key_list, chunk_size):
+        restricted = query.filter(any_array(col, chunk, pg_type)) if isinstance(query, Query) \
+            else query.where(any_array(col, chunk, pg_type))
+        rows.extend(_run(db, restricted))
+    return rows
+
+
+def load_keys_temp_table(
+    db: Session,
+    keys: Iterable[Any],
+    pg_type: str = "text",
+    chunk_size: int = ARRAY_CHUNK_SIZE,
+) -> Any:
+    """
+    Crea una tabla temporal `(key <pg_type> PRIMARY KEY)` con las claves y la analiza.
+    Devuelve un objeto tabla ligero (`tmp.c.key`) para JOINs. La tabla es ON COMMIT DROP:
+    dura hasta el fin de la transacción (COMMIT o ROLLBACK); el llamador puede eliminarla
+    antes con DROP TABLE.
+    """
+    if pg_type not in _PG_TYPES:
+        raise ValueError(f"pg_type no soportado: {pg_type}")
+    name = f"tmp_keys_{uuid4().hex[:12]}"
+    db.execute(text(f"CREATE TEMP TABLE {name} (key {pg_type} PRIMARY KEY) ON COMMIT DROP"))
+    for chunk in chunked(array_keys(keys), chunk_size):
+        db.execute(
+            text(f"INSERT INTO {name} (key) SELECT DISTINCT unnest(CAST(:keys AS {pg_type}[])) ON CONFLICT DO NOTHING"),
+            {"keys": chunk},
+        )
+    db.execute(text(f"ANALYZE {name}"))
+    return sql_table(name, sql_column("key", _PG_TYPES[pg_type]))
+
+
+def _run(db: Session, query: Any) -> list:
+    if isinstance(query, Query):
+        return query.all()
+    return db.execute(query).all()
@@ -0,0 +1,194 @@
+"""
+Paginación por keyset (cursor) para endpoints de listas.
+
+Con LIMIT/OFFSET cada página cuesta proporcional al offset y, si la MV se refresca
+entre páginas, las filas se desplazan (se repiten o se saltan). Con keyset la página
+siguiente se pide como "filas después de la última vista" según las mismas claves
+del ORDER BY: cada página cuesta lo mismo y no depende de lo que haya antes.
+
+Uso en un endpoint (opt-in: sin cursor sigue funcionando el offset):
+
+    KEYS = (SortKey("l.pay_date", descending=True), SortKey("l.payment_key", nullable=False))
+    condition = keyset_condition(KEYS, cursor, params)   # None si no hay cursor
+    ... {add_condition(where_clause, condition)} ORDER BY {order_by(KEYS)} LIMIT :limit
+    next_cursor(KEYS, rows, limit)                        # token para la respuesta
+
+Las claves deben identificar la fila (la última suele ser un desempate único).
+El cursor es opaco para el cliente: base64url de un JSON con los valores de las claves
+de la última fila y una huella de las claves (un cursor de otro endpoint u otro orden
+se rechaza con 400).
+"""
+import base64
+import binascii
+import hashlib
+import json
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from fastapi import HTTPException
+
+
+@dataclass(frozen=True)
+class SortKey:
+    """Una clave del ORDER BY."""
+    column: str  # expresión SQL (p. ej. "l.pay_date")
+    descending: bool = False
+    nulls_last: Optional[bool] = None  # None = default de Postgres (ASC: LAST, DESC: FIRST)
+    nullable: bool = True
+    field: Optional[str] = None  # nombre en la fila; por defecto la columna sin alias de tabla
+
+    @property
+    def row_field(self) -> str:
+        return self.field or self.column.split(".")[-1]
+
+    @property
+    def sorts_nulls_last(self) -> bool:
+        return (not self.descending) if self.nulls_last is None else self.nulls_last
+
+    def order_sql(self) -> str:
+        direction = "DESC" if self.descending else "ASC"
+        nulls = "LAST" if self.sorts_nulls_last else "FIRST"
+        return f"{self.column} {direction} NULLS {nulls}"
+
+
+def order_by(keys: Sequence[SortKey]) -> str:
+    """Lista del ORDER BY (sin la palabra clave) para `keys`."""
+    return ", ".join(key.order_sql() for key in keys)
+
+
+def keyset_condition(
+    keys: Sequence[SortKey],
+    cursor: Optional[str],
+    params: Dict[str, Any],
+    prefix: str = "ks",
+) -> Optional[str]:
+    """
+    Condición SQL "fila posterior al cursor" (None sin cursor). Añade a `params`
+    los valores del cursor como :<prefix>_0, :<prefix>_1, ...
+    """
+    if not cursor:
+        return None
+    values = decode_cursor(keys, cursor)
+    binds = []
+    for index, value in enumerate(values):
+        name = f"{prefix}_{index}"
+        params[name] = value
+        binds.append(f":{name}")
+
+    # Comparación de filas (a, b) < (x, y): una sola condición indexable. Solo es exacta si
+    # todas las claves van en el mismo sentido, el cursor no tiene NULLs y ninguna clave
+    # puede tener NULLs ordenados al final (quedarían fuera al comparar con NULL).
+    same_direction = len({key.descending for key in keys}) == 1
+    if same_direction and all(v is not None for v in values) and not any(
+        key.nullable and key.sorts_nulls_last for key in keys
+    ):
+        columns = ", ".join(key.column for key in keys)
+        operator = "<" if keys[0].descending else ">"
+        return f"({columns}) {operator} ({', '.join(binds)})"
+
+    # Forma expandida: (k1 después) OR (k1 = v1 AND k2 después) OR ...
+    disjuncts = []
+    for index, key in enumerate(keys):
+        after = _after(key, values[index], binds[index])
+        if after is None:
+            continue
+        equal_prefix = [_equal(keys[j], values[j], binds[j]) for j in range(index)]
+        disjuncts.append("(" + " AND ".join(equal_prefix + [after]) + ")")
+    return "(" + " OR ".join(disjuncts) + ")" if disjuncts else "FALSE"
+
+
+def add_condition(where_clause: str, condition: Optional[str]) -> str:
+    """Añade `condition` a un where_clause vacío o que empieza por WHERE."""
+    if not condition:
+        return where_clause
+    if not where_clause.strip():
+        return f"WHERE {condition}"
+    return f"{where_clause} AND {condition}"
+
+
+def next_cursor(keys: Sequence[SortKey], rows: Sequence[Any], limit: int) -> Optional[str]:
+    """Cursor de la página siguiente, o None si esta página fue la última."""
+    if not rows or len(rows) < limit:
+        return None
+    return encode_cursor(keys, rows[-1])
+
+
+def encode_cursor(keys: Sequence[SortKey], row: Any) -> str:
+    values = [_encode_value(_row_value(row, key.row_field)) for key in keys]
+    payload = json.dumps({"k": _fingerprint(keys), "v": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(keys: Sequence[SortKey], cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values = payload["v"]
+        if payload["k"] != _fingerprint(keys) or len(values) != len(keys):
+            raise ValueError("cursor de otro endpoint u orden")
+        return [_decode_value(v) for v in values]
+    except (ValueError, KeyError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=f"cursor inválido: {e}")
+
+
+def _equal(key: SortKey, value: Any, bind: str) -> str:
+    return f"{key.column} IS NULL" if value is None else f"{key.column} = {bind}"
+
+
+def _after(key: SortKey, value: Any, bind: str) -> Optional[str]:
+    """Condición "k va después de value" para una clave (None = ninguna fila va después)."""
+    if value is None:
+        # Tras un NULL solo quedan filas si los NULLs van primero
+        return None if key.sorts_nulls_last else f"{key.column} IS NOT NULL"
+    condition = f"{key.column} {'<' if key.descending else '>'} {bind}"
+    if key.nullable and key.sorts_nulls_last:
+        return f"({condition} OR {key.column} IS NULL)"
+    return condition
+
+
+def _row_value(row: Any, field: str) -> Any:
+    if hasattr(row, "_mapping"):
+        return row._mapping[field]
+    if isinstance(row, Mapping):
+        return row[field]
+    return getattr(row, field)
+
+
+def _fingerprint(keys: Sequence[SortKey]) -> str:
+    return hashlib.sha1(order_by(keys).encode("utf-8")).hexdigest()[:10]
+
+
+# Tipos que JSON no conserva: se guardan como {"<tag>": "texto"}
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"t": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    if isinstance(value, UUID):
+        return {"u": str(value)}
+    if isinstance(value, Enum):
+        # Columnas Enum del ORM
+        return value.value
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    (tag, text_value), = value.items()
+    if tag == "t":
+        return datetime.fromisoformat(text_value)
+    if tag == "d":
+        return date.fromisoformat(text_value)
+    if tag == "n":
+        return Decimal(text_value)
+    if tag == "u":
+        return str(UUID(text_value))
+    raise ValueError(f"tipo de valor desconocido: {tag}")
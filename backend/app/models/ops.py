@@ -74,6 +74,8 @@ class IngestionRun(Base):
     scope_date_from = Column(Date, nullable=True)
     scope_date_to = Column(Date, nullable=True)
     incremental = Column(Boolean, nullable=True, server_default='true')
+    # Reporte del run terminado (app/services/run_report.py)
+    report_json = Column(JSON, nullable=True)
 
     def __repr__(self) -> str:
         return f"<IngestionRun(id={self.id}, status={self.status}, job_type={self.job_type})>"
@@ -133,5 +135,7 @@ class CabinetKpiRedRecoveryQueue(Base):
     last_attempt_at = Column(DateTime(timezone=True), nullable=True)
     matched_person_key = Column(UUID(as_uuid=True), ForeignKey("canon.identity_registry.person_key", ondelete="SET NULL"), nullable=True)
     fail_reason = Column(Text, nullable=True)
+    claimed_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
\ No newline at end of file
@@ -6,6 +6,8 @@ from typing import Optional
 from datetime import date
 from decimal import Decimal
 
+from app.schemas.ops_mv_health import DataFreshness
+
 
 class CabinetFinancialRow(BaseModel):
     """Fila individual de la vista financiera"""
@@ -88,6 +90,7 @@ class CabinetFinancialMeta(BaseModel):
     offset: int = Field(..., description="Offset para paginación")
     returned: int = Field(..., description="Número de resultados devueltos")
     total: int = Field(..., description="Total de resultados disponibles")
+    freshness: Optional[DataFreshness] = Field(None, description="Frescura de la fuente leída (data_as_of, is_stale)")
 
 
 class CabinetFinancialResponse(BaseModel):
@@ -115,6 +118,7 @@ class ScoutAttributionMetricsResponse(BaseModel):
     status: str = Field(default="ok", description="Estado de la respuesta")
     metrics: ScoutAttributionMetrics = Field(..., description="Métricas de atribución scout")
     filters: dict = Field(default_factory=dict, description="Filtros aplicados")
+    freshness: Optional[DataFreshness] = Field(None, description="Frescura de la fuente leída (data_as_of, is_stale)")
 
 
 class WeeklyKpiRow(BaseModel):
@@ -136,6 +140,7 @@ class WeeklyKpisResponse(BaseModel):
     status: str = Field(default="ok", description="Estado de la respuesta")
     weeks: list[WeeklyKpiRow] = Field(..., description="Lista de KPIs por semana")
     filters: dict = Field(default_factory=dict, description="Filtros aplicados")
+    freshness: Optional[DataFreshness] = Field(None, description="Frescura de la fuente leída (data_as_of, is_stale)")
 
 
 class CabinetLimboRow(BaseModel):
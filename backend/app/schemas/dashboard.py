@@ -3,6 +3,8 @@ from typing import Optional, List
 from datetime import date
 from decimal import Decimal
 
+from app.schemas.ops_mv_health import DataFreshness
+
 
 # Scout Summary Schemas
 class ScoutTotals(BaseModel):
@@ -15,8 +17,9 @@ class ScoutTotals(BaseModel):
 
 
 class ScoutByWeek(BaseModel):
-    week_start_monday: date
-    iso_year_week: str
+    # None: items sin payable_date (semana desconocida)
+    week_start_monday: Optional[date]
+    iso_year_week: Optional[str]
     payable_amount: Decimal
     payable_items: int
     blocked_amount: Decimal
@@ -59,6 +62,7 @@ class ScoutOpenItem(BaseModel):
 class ScoutOpenItemsResponse(BaseModel):
     items: List[ScoutOpenItem]
     total: int
+    total_is_estimate: bool = False
     limit: int
     offset: int
 
@@ -71,8 +75,9 @@ class YangoTotals(BaseModel):
 
 
 class YangoByWeek(BaseModel):
-    week_start_monday: date
-    iso_year_week: str
+    # None: pagos sin semana de pago
+    week_start_monday: Optional[date]
+    iso_year_week: Optional[str]
     amount: Decimal
     items: int
     drivers: int
@@ -81,6 +86,7 @@ class YangoByWeek(BaseModel):
 class YangoSummaryResponse(BaseModel):
     totals: YangoTotals
     by_week: List[YangoByWeek]
+    freshness: Optional[DataFreshness] = None
 
 
 # Yango Receivable Items Schema
@@ -106,5 +112,7 @@ class YangoReceivableItem(BaseModel):
 class YangoReceivableItemsResponse(BaseModel):
     items: List[YangoReceivableItem]
     total: int
+    total_is_estimate: bool = False
     limit: int
     offset: int
+    freshness: Optional[DataFreshness] = None
@@ -198,9 +198,11 @@ class OrphanDriver(BaseModel):
 class OrphansListResponse(BaseModel):
     orphans: List[OrphanDriver]
     total: int
+    total_is_estimate: bool = False
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None
 
 
 class OrphansMetricsResponse(BaseModel):
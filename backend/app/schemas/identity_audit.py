@@ -99,6 +99,7 @@ class OriginAuditListResponse(BaseModel):
 class OriginAlertListResponse(BaseModel):
     items: List[OriginAlertRow]
     total: int
+    total_is_estimate: bool = False
     skip: int
     limit: int
 
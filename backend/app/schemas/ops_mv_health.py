@@ -21,12 +21,33 @@ class MvHealthRow(BaseModel):
     minutes_since_refresh: Optional[int] = None
     last_refresh_status: Optional[str] = None  # 'SUCCESS' | 'FAILED' | None
     last_refresh_error: Optional[str] = None
+    # Métricas del último refresh exitoso (ops.mv_refresh_log)
+    last_refresh_method: Optional[str] = None  # 'concurrent' | 'normal'
+    last_lock_wait_ms: Optional[int] = None
+    last_rows_before: Optional[int] = None
+    rows_after_refresh: Optional[int] = None
+    table_bytes_after: Optional[int] = None
+    index_bytes_after: Optional[int] = None
+    dead_tuples_after: Optional[int] = None
+    dead_tuples: Optional[int] = None  # actuales (pg_stat_user_tables)
+    recommendations: list[str] = []  # VACUUM / REINDEX si el bloat supera los umbrales
     calculated_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class DataFreshness(BaseModel):
+    """Frescura de la fuente (MV o vista) que respaldó una respuesta."""
+    source: str
+    source_kind: str  # 'materialized_view' | 'view'
+    data_as_of: Optional[datetime] = None
+    age_seconds: Optional[int] = None
+    max_age_seconds: int
+    is_stale: Optional[bool] = None  # None si no hay registro de refresh
+    refresh_enqueued: bool = False  # True si se encoló un refresh en background
+
+
 class MvHealthResponse(BaseModel):
     """Response paginado para salud de Materialized Views."""
     items: list[MvHealthRow]
@@ -5,6 +5,8 @@ from decimal import Decimal
 from enum import Enum
 from uuid import UUID
 
+from app.schemas.ops_mv_health import DataFreshness
+
 
 # Yango Reconciliation Summary Schemas
 class YangoReconciliationSummaryRow(BaseModel):
@@ -74,6 +76,7 @@ class YangoReconciliationItemsResponse(BaseModel):
     total: int
     filters: Dict[str, Any]
     rows: List[YangoReconciliationItemRow]
+    next_cursor: Optional[str] = None
 
 
 # Yango Ledger Unmatched Schemas
@@ -106,6 +109,7 @@ class YangoLedgerUnmatchedResponse(BaseModel):
     total: int
     filters: Dict[str, Any]
     rows: List[YangoLedgerUnmatchedRow]
+    next_cursor: Optional[str] = None
 
 
 # Yango Driver Detail Schemas
@@ -179,6 +183,7 @@ class PaymentEligibilityResponse(BaseModel):
     count: int
     filters: Dict[str, Any]
     rows: List[PaymentEligibilityRow]
+    next_cursor: Optional[str] = None
 
 
 # Yango Cabinet Claims Schemas
@@ -213,6 +218,8 @@ class YangoCabinetClaimsResponse(BaseModel):
     total: int
     filters: Dict[str, Any]
     rows: List[YangoCabinetClaimRow]
+    next_cursor: Optional[str] = None
+    freshness: Optional[DataFreshness] = None
 
 
 # Yango Cabinet Claim Drilldown Schemas
@@ -257,6 +264,7 @@ class YangoCabinetClaimDrilldownResponse(BaseModel):
     payments_other_milestones: List[PaymentInfo] = []
     reconciliation: Optional[ReconciliationInfo] = None
     misapplied_explanation: Optional[str] = None
+    freshness: Optional[DataFreshness] = None
 
 
 # Yango Cabinet MV Health Schema
@@ -365,6 +373,9 @@ class OpsDriverMatrixMeta(BaseModel):
     offset: int
     returned: int
     total: int
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
+    freshness: Optional[DataFreshness] = None
 
 
 class OpsDriverMatrixResponse(BaseModel):
@@ -410,4 +421,5 @@ class CabinetReconciliationResponse(BaseModel):
     count: int
     total: int
     filters: Dict[str, Any]
-    rows: List[CabinetReconciliationRow]
\ No newline at end of file
+    rows: List[CabinetReconciliationRow]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,123 @@
+"""
+API read counters per relation, for the adaptive refresh scheduler.
+
+pg_stat_user_tables scan counters cannot tell an API read from the refresh
+machinery's own scans (REFRESH CONCURRENTLY's diff, post-refresh rebuilds, counts).
+Scheduling on them would feed refreshes back into the read frequency. Here reads
+are counted in the API process itself:
+
+- `install(engine)` hooks the interactive engine (requests only; refreshes run on
+  the maintenance engine). Each SELECT counts one read for every schema-qualified
+  relation it names;
+- statements executed with the `SKIP_READ_TRACKING` execution option are not
+  counted (count_cache's COUNT/EXPLAIN for a page that is already counted);
+- `flush(db)` moves this process' counters to ops.mv_read_stats, one row per
+  relation and flush. Every worker flushes its own from the scheduler tick.
+
+Reads name views as often as MVs. `attribute_reads` charges a read of a
+relation to the MVs behind it, through plain views (MvDependencyGraph.upstream_mvs).
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.services.mv_dependencies import RELKIND_MATVIEW, MvDependencyGraph
+
+logger = logging.getLogger(__name__)
+
+# Opción de ejecución: text(...).execution_options(**{SKIP_READ_TRACKING: True})
+SKIP_READ_TRACKING = "ct4_skip_read_tracking"
+TRACKED_SCHEMAS = ("ops", "canon", "observational", "public")
+READ_STATS_RETENTION_DAYS = 7
+
+_RELATION = re.compile(
+    rf'\b({"|".join(TRACKED_SCHEMAS)})\s*\.\s*"?([a-z_][a-z0-9_]*)"?',
+    re.IGNORECASE,
+)
+_READ_STATEMENT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+_counts: Counter = Counter()
+_lock = threading.Lock()
+_installed: Set[int] = set()
+
+
+def extract_relations(statement: str) -> Set[str]:
+    """Schema-qualified relations ("schema.name", lowercase) read by a SELECT; empty for other statements."""
+    if not _READ_STATEMENT.match(statement):
+        return set()
+    return {f"{schema.lower()}.{name.lower()}" for schema, name in _RELATION.findall(statement)}
+
+
+def record_reads(relations: Iterable[str]) -> None:
+    with _lock:
+        _counts.update(relations)
+
+
+def install(engine: Engine) -> None:
+    """Count the reads executed through `engine` (idempotent)."""
+    if id(engine) in _installed:
+        return
+    _installed.add(id(engine))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and context.execution_options.get(SKIP_READ_TRACKING):
+            return
+        relations = extract_relations(statement)
+        if relations:
+            record_reads(relations)
+
+
+def flush(db: Session) -> int:
+    """Store this process' counters in ops.mv_read_stats and prune old rows. Returns relations stored."""
+    with _lock:
+        counts = dict(_counts)
+        _counts.clear()
+    if counts:
+        try:
+            db.execute(
+                text("""
+                    INSERT INTO ops.mv_read_stats (schema_name, mv_name, read_count)
+                    VALUES (:schema_name, :mv_name, :read_count)
+                """),
+                [
+                    {"schema_name": relation.split(".", 1)[0], "mv_name": relation.split(".", 1)[1], "read_count": n}
+                    for relation, n in counts.items()
+                ]
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # Se devuelven al contador para el siguiente flush
+            with _lock:
+                _counts.update(counts)
+            logger.warning(f"Could not store API read counters: {e}")
+            return 0
+    db.execute(text("""
+        DELETE FROM ops.mv_read_stats
+        WHERE sampled_at < NOW() - :days * INTERVAL '1 day'
+    """), {"days": READ_STATS_RETENTION_DAYS})
+    db.commit()
+    return len(counts)
+
+
+def attribute_reads(relation_reads: Dict[str, float], graph: MvDependencyGraph) -> Dict[str, float]:
+    """Reads per MV: its own reads plus those of the plain views that read it."""
+    per_mv: Dict[str, float] = {}
+    for relation, reads in relation_reads.items():
+        if graph.kinds.get(relation) == RELKIND_MATVIEW:
+            mvs = {relation}
+        elif relation in graph.edges:
+            # Vista: las MVs que lee, atravesando otras vistas (no otras MVs)
+            mvs = graph.upstream_mvs(relation)
+        else:
+            continue
+        for mv in mvs:
+            per_mv[mv] = per_mv.get(mv, 0.0) + reads
+    return per_mv
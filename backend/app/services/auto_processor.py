@@ -13,7 +13,8 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy import text
 
-from app.core.db import SessionLocal
+from app.core.db import BatchSessionLocal, MaintenanceSessionLocal, engine
+from app.services import api_reads
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,10 @@ logger = logging.getLogger(__name__)
 AUTO_PROCESS_ENABLED = os.getenv("AUTO_PROCESS_LEADS", "true").lower() == "true"
 AUTO_PROCESS_INTERVAL_MINUTES = int(os.getenv("AUTO_PROCESS_INTERVAL_MINUTES", "5"))
 AUTO_PROCESS_MIN_PENDING = int(os.getenv("AUTO_PROCESS_MIN_PENDING", "1"))
+# Refresh adaptativo de MVs (intervalo por MV según coste, lecturas de la API y SLO de staleness).
+# Opt-in: cuenta las lecturas de la API de este worker (api_reads) solo si está activo
+MV_ADAPTIVE_REFRESH_ENABLED = os.getenv("MV_ADAPTIVE_REFRESH", "false").lower() == "true"
+MV_ADAPTIVE_REFRESH_TICK_MINUTES = int(os.getenv("MV_ADAPTIVE_REFRESH_TICK_MINUTES", "5"))
 
 # Scheduler global
 _scheduler: Optional[BackgroundScheduler] = None
@@ -30,7 +35,7 @@ _last_run_result = None
 
 def get_pending_leads_count() -> dict:
     """Obtiene el conteo de leads pendientes de procesar."""
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         query = text("""
             WITH lead_source_pks AS (
@@ -99,7 +104,7 @@ def process_pending_leads() -> dict:
         # Importar aquí para evitar imports circulares
         from app.services.cabinet_leads_processor import CabinetLeadsProcessor
         
-        db = SessionLocal()
+        db = BatchSessionLocal()
         try:
             processor = CabinetLeadsProcessor(db)
             result = processor.process_all(
@@ -138,7 +143,7 @@ def process_pending_leads() -> dict:
 
 def ingest_yango_payments() -> dict:
     """Ejecuta la ingesta de pagos desde module_ct_cabinet_payments al ledger."""
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         logger.info("[AUTO-PROCESSOR] Ejecutando ingesta de pagos Yango...")
         result = db.execute(text("SELECT ops.ingest_yango_payments_snapshot()"))
@@ -172,6 +177,20 @@ def auto_process_job():
         logger.error(f"[AUTO-PROCESSOR] Error en job: {e}", exc_info=True)
 
 
+def adaptive_mv_refresh_job():
+    """Job periódico: muestrea lecturas, recalcula el plan y refresca las MVs que vencieron su intervalo."""
+    from app.services.mv_refresh_scheduler import run_adaptive_refresh
+
+    db = MaintenanceSessionLocal()
+    try:
+        run_adaptive_refresh(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[AUTO-PROCESSOR] Error en refresh adaptativo de MVs: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
 def start_scheduler():
     """Inicia el scheduler para procesamiento automático."""
     global _scheduler
@@ -193,6 +212,17 @@ def start_scheduler():
         replace_existing=True,
         max_instances=1
     )
+    if MV_ADAPTIVE_REFRESH_ENABLED:
+        # Lecturas de la API (engine interactivo) para el plan; cada tick las guarda
+        api_reads.install(engine)
+        _scheduler.add_job(
+            adaptive_mv_refresh_job,
+            trigger=IntervalTrigger(minutes=MV_ADAPTIVE_REFRESH_TICK_MINUTES),
+            id="adaptive_mv_refresh",
+            name="Adaptive MV Refresh",
+            replace_existing=True,
+            max_instances=1
+        )
     _scheduler.start()
     
     logger.info(f"[AUTO-PROCESSOR] Scheduler iniciado. Intervalo: {AUTO_PROCESS_INTERVAL_MINUTES} minutos")
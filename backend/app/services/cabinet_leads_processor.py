@@ -6,10 +6,11 @@ import logging
 from typing import Optional, Dict, Any
 from datetime import date
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 
 from app.services.ingestion import IngestionService
 from app.services.lead_attribution import LeadAttributionService
+from app.services.mv_maintenance import CABINET_LEADS_MVS, refresh_mvs_parallel
+from app.services.person_facts import PersonFactsCache
 from app.models.ops import IngestionRun, RunStatus
 
 logger = logging.getLogger(__name__)
@@ -20,20 +21,27 @@ class CabinetLeadsProcessor:
     
     def __init__(self, db: Session):
         self.db = db
-        self.ingestion_service = IngestionService(db)
-        self.attribution_service = LeadAttributionService(db)
+        # Un cache de hechos por persona para todo el procesamiento: la ingesta lo
+        # invalida al crear links y la atribución lo reutiliza
+        self.person_facts = PersonFactsCache(db)
+        self.ingestion_service = IngestionService(db, person_facts=self.person_facts)
+        self.attribution_service = LeadAttributionService(db, person_facts=self.person_facts)
     
     def process_all(
         self,
         date_from: Optional[date] = None,
         date_to: Optional[date] = None,
-        refresh_index: bool = True
+        refresh_index: bool = True,
+        run_attribution: bool = True,
+        refresh_mvs: bool = True,
+        refresh_only_changed: bool = True
     ) -> Dict[str, Any]:
         """
         Ejecuta todo el procesamiento en secuencia:
         1. Ingesta de identidad (crea identity_links)
-        2. Poblar lead_events (crea eventos en observational.lead_events)
-        3. Refresh materialized views
+        2. Poblar lead_events (crea eventos en observational.lead_events), si run_attribution
+        3. Refresh materialized views, si refresh_mvs (por defecto solo las MVs cuyas
+           tablas base cambiaron desde su último refresh)
         
         Retorna diccionario con estadísticas de cada paso.
         """
@@ -41,6 +49,7 @@ class CabinetLeadsProcessor:
             "ingestion": None,
             "attribution": None,
             "refresh_mvs": None,
+            "person_facts": None,
             "errors": []
         }
         
@@ -69,39 +78,42 @@ class CabinetLeadsProcessor:
                 results["ingestion"] = {"error": error_msg}
             
             # Paso 2: Poblar Lead Events
-            logger.info("Paso 2: Poblando lead_events desde cabinet_leads...")
-            try:
-                attribution_stats = self.attribution_service.populate_events_from_cabinet(
-                    date_from=date_from,
-                    date_to=date_to
-                )
+            if run_attribution:
+                logger.info("Paso 2: Poblando lead_events desde cabinet_leads...")
+                try:
+                    attribution_stats = self.attribution_service.populate_events_from_cabinet(
+                        date_from=date_from,
+                        date_to=date_to
+                    )
                 
-                results["attribution"] = {
-                    "processed": attribution_stats.get("processed", 0),
-                    "created": attribution_stats.get("created", 0),
-                    "updated": attribution_stats.get("updated", 0),
-                    "skipped": attribution_stats.get("skipped", 0),
-                    "errors": attribution_stats.get("errors", 0)
-                }
-                logger.info(f"Atribución completada: {attribution_stats}")
-            except Exception as e:
-                error_msg = f"Error poblando lead_events: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                results["errors"].append(error_msg)
-                results["attribution"] = {"error": error_msg}
+                    results["attribution"] = {
+                        "processed": attribution_stats.get("processed", 0),
+                        "created": attribution_stats.get("created", 0),
+                        "updated": attribution_stats.get("updated", 0),
+                        "skipped": attribution_stats.get("skipped", 0),
+                        "errors": attribution_stats.get("errors", 0)
+                    }
+                    logger.info(f"Atribución completada: {attribution_stats}")
+                except Exception as e:
+                    error_msg = f"Error poblando lead_events: {str(e)}"
+                    logger.error(error_msg, exc_info=True)
+                    results["errors"].append(error_msg)
+                    results["attribution"] = {"error": error_msg}
             
             # Paso 3: Refresh Materialized Views
-            logger.info("Paso 3: Refrescando materialized views...")
-            try:
-                mv_results = self._refresh_materialized_views()
-                results["refresh_mvs"] = mv_results
-                logger.info(f"Refresh de MVs completado: {mv_results}")
-            except Exception as e:
-                error_msg = f"Error refrescando materialized views: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                results["errors"].append(error_msg)
-                results["refresh_mvs"] = {"error": error_msg}
+            if refresh_mvs:
+                logger.info("Paso 3: Refrescando materialized views...")
+                try:
+                    mv_results = self._refresh_materialized_views(only_changed=refresh_only_changed)
+                    results["refresh_mvs"] = mv_results
+                    logger.info(f"Refresh de MVs completado: {mv_results}")
+                except Exception as e:
+                    error_msg = f"Error refrescando materialized views: {str(e)}"
+                    logger.error(error_msg, exc_info=True)
+                    results["errors"].append(error_msg)
+                    results["refresh_mvs"] = {"error": error_msg}
             
+            results["person_facts"] = self.person_facts.metrics()
             return results
             
         except Exception as e:
@@ -110,102 +122,29 @@ class CabinetLeadsProcessor:
             results["errors"].append(error_msg)
             return results
     
-    def _refresh_materialized_views(self) -> Dict[str, Any]:
-        """Refresca TODAS las materialized views relacionadas con cabinet leads"""
+    def _refresh_materialized_views(self, only_changed: bool = True) -> Dict[str, Any]:
+        """
+        Refresca las materialized views relacionadas con cabinet leads.
+        El orden sale del grafo de dependencias y las ramas independientes se refrescan en paralelo.
+        Con only_changed se omiten las MVs cuyas tablas base no cambiaron desde su último refresh.
+        """
+        refresh = refresh_mvs_parallel(CABINET_LEADS_MVS, only_changed=only_changed)
         mv_results = {}
-        
-        # Lista completa de MVs a refrescar (en orden de dependencia)
-        mvs_to_refresh = [
-            "ops.mv_yango_payments_ledger_latest",
-            "ops.mv_yango_payments_ledger_latest_enriched",
-            "ops.mv_cabinet_financial_14d",
-            "ops.mv_yango_cabinet_claims_for_collection",
-            "ops.mv_claims_payment_status_cabinet",
-            "ops.mv_payments_driver_matrix_cabinet",
-            "ops.mv_yango_cabinet_cobranza_enriched_14d",
-        ]
-        
-        for mv_name in mvs_to_refresh:
-            logger.info(f"Refrescando {mv_name}...")
-            try:
-                # Verificar si existe
-                parts = mv_name.split('.')
-                if len(parts) == 2:
-                    schema_name, mv_name_only = parts
-                    check_query = text("""
-                        SELECT EXISTS (
-                            SELECT 1 FROM pg_matviews 
-                            WHERE schemaname = :schema_name 
-                            AND matviewname = :mv_name
-                        )
-                    """)
-                    exists = self.db.execute(check_query, {
-                        "schema_name": schema_name,
-                        "mv_name": mv_name_only
-                    }).scalar()
-                    
-                    if not exists:
-                        logger.info(f"{mv_name} no existe, omitiendo")
-                        mv_results[mv_name] = {"status": "skipped", "reason": "does_not_exist"}
-                        continue
-                
-                # Intentar con CONCURRENTLY primero
-                has_unique = self._check_unique_index(mv_name)
-                
-                if has_unique:
-                    try:
-                        self.db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {mv_name}"))
-                        self.db.commit()
-                        mv_results[mv_name] = {"status": "ok", "method": "concurrent"}
-                        logger.info(f"{mv_name} refrescado con CONCURRENTLY")
-                    except Exception as e:
-                        logger.warning(f"CONCURRENTLY falló para {mv_name}, usando refresh normal: {e}")
-                        self.db.rollback()
-                        self.db.execute(text(f"REFRESH MATERIALIZED VIEW {mv_name}"))
-                        self.db.commit()
-                        mv_results[mv_name] = {"status": "ok", "method": "normal"}
-                else:
-                    self.db.execute(text(f"REFRESH MATERIALIZED VIEW {mv_name}"))
-                    self.db.commit()
-                    mv_results[mv_name] = {"status": "ok", "method": "normal"}
-                    logger.info(f"{mv_name} refrescado")
-                    
-            except Exception as e:
-                error_msg = f"Error refrescando {mv_name}: {str(e)}"
-                logger.error(error_msg)
-                self.db.rollback()
-                mv_results[mv_name] = {"status": "error", "error": str(e)[:100]}
-        
-        return mv_results
-    
-    def _check_unique_index(self, mv_name: str) -> bool:
-        """Verifica si existe un índice único en la materialized view"""
-        try:
-            # Extraer schema y nombre de la MV
-            parts = mv_name.split('.')
-            if len(parts) == 2:
-                schema_name, mv_name_only = parts
+        for result in refresh["results"]:
+            if result["status"] == "success":
+                mv_results[result["mv"]] = {
+                    "status": "ok",
+                    "method": result.get("method"),
+                    "duration_seconds": result.get("duration_seconds")
+                }
+            elif result["status"] == "skipped":
+                logger.info(f"{result['mv']} omitida: {result.get('reason')}")
+                mv_results[result["mv"]] = {"status": "skipped", "reason": result.get("reason")}
             else:
-                return False
-            
-            query = text("""
-                SELECT COUNT(*) > 0 AS has_unique_index
-                FROM pg_index i
-                JOIN pg_class c ON c.oid = i.indexrelid
-                JOIN pg_namespace n ON n.oid = c.relnamespace
-                JOIN pg_class t ON t.oid = i.indrelid
-                JOIN pg_namespace tn ON tn.oid = t.relnamespace
-                WHERE tn.nspname = :schema_name
-                  AND t.relname = :mv_name
-                  AND i.indisunique = true
-            """)
-            
-            result = self.db.execute(query, {
-                "schema_name": schema_name,
-                "mv_name": mv_name_only
-            })
-            has_index = result.scalar()
-            return bool(has_index) if has_index is not None else False
-        except Exception as e:
-            logger.warning(f"Error verificando índice único para {mv_name}: {e}")
-            return False
+                mv_results[result["mv"]] = {"status": "error", "error": (result.get("error") or "")[:100]}
+        logger.info(
+            f"MVs refrescadas en {refresh['summary']['wall_seconds']}s "
+            f"(suma {refresh['summary']['total_duration_seconds']}s, "
+            f"ruta crítica {refresh['summary']['critical_path_seconds']}s)"
+        )
+        return mv_results
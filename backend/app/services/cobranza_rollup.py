@@ -0,0 +1,199 @@
+"""
+Weekly rollup of the Cobranza Yango 14d enriched MV.
+
+`ops.mv_yango_cabinet_cobranza_enriched_14d` has one row per driver. The weekly
+KPIs and scout attribution metrics used to aggregate it on every cache miss.
+`ops.yango_cobranza_weekly_rollup` keeps the same rows pre-aggregated by every
+dimension those endpoints filter or break down on:
+
+    week_start, scout_id, scout_quality_bucket, scout_source_group,
+    has_person_key, reached_m1_14d, reached_m5_14d, reached_m25_14d, has_debt
+
+with row_count, amount_due_sum and total_paid_sum. Any filter combination on
+those dimensions is answered exactly by summing rollup rows. `min_debt` is not
+a dimension: requests with it still read the MV.
+
+The rollup is rebuilt right after each successful refresh of the MV
+(mv_maintenance.POST_REFRESH_REBUILDS), in one transaction, so readers see
+either the old or the new version. The table comes from migration 026.
+
+The same transaction records the rollup watermark in ops.job_watermarks (its
+start time). The endpoints only read the rollup while `rollup_current` holds:
+the watermark must not be older than the MV's last successful refresh in
+ops.mv_refresh_log. If a rebuild fails, or has not run yet, the rollup is
+behind and the endpoints aggregate the MV live until the next rebuild succeeds.
+"""
+import logging
+import time
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.mv_cache import get_relation_info, invalidate
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TABLE = "ops.yango_cobranza_weekly_rollup"
+SOURCE_MV = "ops.mv_yango_cabinet_cobranza_enriched_14d"
+WATERMARK_JOB = "yango_cobranza_weekly_rollup"
+
+# transaction_timestamp(): inicio del rebuild, posterior al log del refresh que lo dispara
+SAVE_WATERMARK_SQL = """
+    INSERT INTO ops.job_watermarks (job_name, watermark, updated_at)
+    VALUES (:job_name, transaction_timestamp(), NOW())
+    ON CONFLICT (job_name) DO UPDATE
+    SET watermark = EXCLUDED.watermark,
+        updated_at = NOW()
+"""
+
+# Rollup al día: reconstruido después del último refresh exitoso de la MV
+ROLLUP_CURRENT_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM ops.job_watermarks w
+        WHERE w.job_name = :job_name
+            AND w.watermark >= COALESCE((
+                SELECT MAX(l.refreshed_at)
+                FROM ops.mv_refresh_log l
+                WHERE l.schema_name = :schema
+                    AND l.mv_name = :mv_name
+                    AND l.status = 'SUCCESS'
+            ), '-infinity'::timestamptz)
+    )
+"""
+
+DIMENSIONS = (
+    "week_start",
+    "scout_id",
+    "scout_quality_bucket",
+    "scout_source_group",
+    "has_person_key",
+    "reached_m1_14d",
+    "reached_m5_14d",
+    "reached_m25_14d",
+    "has_debt",
+)
+
+# Mismos grupos que los contadores source_* de scout-attribution-metrics
+SOURCE_GROUP_SQL = """
+    CASE
+        WHEN scout_source_table = 'observational.lead_ledger' THEN 'lead_ledger'
+        WHEN scout_source_table = 'observational.lead_events' THEN 'lead_events'
+        WHEN scout_source_table LIKE '%migrations%' THEN 'migrations'
+        WHEN scout_source_table LIKE '%scouting_daily%' THEN 'scouting_daily'
+        WHEN scout_source_table LIKE '%cabinet_payments%' THEN 'cabinet_payments'
+    END
+"""
+
+REBUILD_SQL = f"""
+    INSERT INTO {ROLLUP_TABLE} (
+        {", ".join(DIMENSIONS)},
+        row_count, amount_due_sum, total_paid_sum, refreshed_at
+    )
+    SELECT
+        week_start,
+        scout_id,
+        scout_quality_bucket,
+        {SOURCE_GROUP_SQL} AS scout_source_group,
+        person_key IS NOT NULL AS has_person_key,
+        reached_m1_14d,
+        reached_m5_14d,
+        reached_m25_14d,
+        COALESCE(amount_due_yango > 0, false) AS has_debt,
+        COUNT(*) AS row_count,
+        SUM(amount_due_yango) AS amount_due_sum,
+        SUM(total_paid_yango) AS total_paid_sum,
+        now()
+    FROM {SOURCE_MV}
+    GROUP BY {", ".join(str(i) for i in range(1, len(DIMENSIONS) + 1))}
+"""
+
+# Mismas columnas que la agregación semanal sobre la MV (get_weekly_kpis)
+WEEKLY_KPIS_SQL = f"""
+    SELECT
+        week_start,
+        SUM(row_count) AS total_rows,
+        SUM(amount_due_sum) AS debt_sum,
+        COALESCE(SUM(row_count) FILTER (WHERE scout_id IS NOT NULL), 0) AS with_scout,
+        ROUND(COALESCE(SUM(row_count) FILTER (WHERE scout_id IS NOT NULL), 0)::NUMERIC
+            / NULLIF(SUM(row_count), 0) * 100, 2) AS pct_with_scout,
+        COALESCE(SUM(row_count) FILTER (WHERE reached_m1_14d), 0) AS reached_m1,
+        COALESCE(SUM(row_count) FILTER (WHERE reached_m5_14d), 0) AS reached_m5,
+        COALESCE(SUM(row_count) FILTER (WHERE reached_m25_14d), 0) AS reached_m25,
+        SUM(total_paid_sum) AS paid_sum,
+        SUM(amount_due_sum) AS unpaid_sum
+    FROM {ROLLUP_TABLE}
+    WHERE {{where_clause}}
+        AND week_start IS NOT NULL
+    GROUP BY week_start
+    ORDER BY week_start DESC
+    LIMIT :limit_weeks
+"""
+
+# Mismas columnas que las métricas sobre la MV (get_scout_attribution_metrics)
+SCOUT_METRICS_SQL = f"""
+    SELECT
+        COALESCE(SUM(row_count), 0) AS total_drivers,
+        COALESCE(SUM(row_count) FILTER (WHERE scout_id IS NOT NULL), 0) AS drivers_with_scout,
+        COALESCE(SUM(row_count) FILTER (WHERE scout_id IS NULL), 0) AS drivers_without_scout,
+        COALESCE(ROUND(SUM(row_count) FILTER (WHERE scout_id IS NOT NULL)::NUMERIC
+            / NULLIF(SUM(row_count), 0) * 100, 2), 0) AS pct_with_scout,
+        SUM(row_count) FILTER (WHERE scout_quality_bucket = 'SATISFACTORY_LEDGER') AS quality_ledger,
+        SUM(row_count) FILTER (WHERE scout_quality_bucket = 'EVENTS_ONLY') AS quality_events,
+        SUM(row_count) FILTER (WHERE scout_quality_bucket = 'MIGRATIONS_ONLY') AS quality_migrations,
+        SUM(row_count) FILTER (WHERE scout_quality_bucket = 'SCOUTING_DAILY_ONLY') AS quality_scouting,
+        SUM(row_count) FILTER (WHERE scout_quality_bucket = 'CABINET_PAYMENTS_ONLY') AS quality_cabinet,
+        SUM(row_count) FILTER (WHERE scout_quality_bucket = 'MISSING') AS quality_missing,
+        SUM(row_count) FILTER (WHERE scout_source_group = 'lead_ledger') AS source_ledger,
+        SUM(row_count) FILTER (WHERE scout_source_group = 'lead_events') AS source_events,
+        SUM(row_count) FILTER (WHERE scout_source_group = 'migrations') AS source_migrations,
+        SUM(row_count) FILTER (WHERE scout_source_group = 'scouting_daily') AS source_scouting,
+        SUM(row_count) FILTER (WHERE scout_source_group = 'cabinet_payments') AS source_cabinet,
+        SUM(row_count) FILTER (WHERE scout_id IS NULL AND NOT has_person_key) AS no_scout_missing_identity,
+        SUM(row_count) FILTER (WHERE scout_id IS NULL AND has_person_key) AS no_scout_no_source_match
+    FROM {ROLLUP_TABLE}
+    WHERE {{where_clause}}
+"""
+
+
+def rollup_current(db: Session) -> bool:
+    """True if the rollup exists and was rebuilt after the MV's last successful refresh."""
+    schema, name = ROLLUP_TABLE.split(".", 1)
+    if not get_relation_info(db, schema, name).exists:
+        return False
+    mv_schema, mv_name = SOURCE_MV.split(".", 1)
+    try:
+        current = bool(db.execute(
+            text(ROLLUP_CURRENT_SQL),
+            {"job_name": WATERMARK_JOB, "schema": mv_schema, "mv_name": mv_name}
+        ).scalar())
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not read the {ROLLUP_TABLE} watermark: {e}")
+        return False
+    if not current:
+        logger.debug(f"{ROLLUP_TABLE} behind {SOURCE_MV}: aggregating the MV")
+    return current
+
+
+def rebuild_rollup(db: Session) -> Dict:
+    """Recompute the rollup from the MV and record its watermark, in one transaction."""
+    started = time.monotonic()
+    schema, name = ROLLUP_TABLE.split(".", 1)
+    if not get_relation_info(db, schema, name).exists:
+        return {"status": "skipped", "reason": f"{ROLLUP_TABLE} does not exist (run migrations)"}
+    try:
+        # DELETE (no TRUNCATE): los lectores siguen viendo la versión anterior hasta el COMMIT
+        db.execute(text(f"DELETE FROM {ROLLUP_TABLE}"))
+        inserted = db.execute(text(REBUILD_SQL)).rowcount
+        db.execute(text(SAVE_WATERMARK_SQL), {"job_name": WATERMARK_JOB})
+        # Respuestas cacheadas calculadas con el rollup: se notifica con el commit
+        invalidate(db, ROLLUP_TABLE)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Rebuild of {ROLLUP_TABLE} failed: {e}")
+        return {"status": "error", "error": str(e)[:200]}
+    stats = {"status": "rebuilt", "rows": inserted, "duration_seconds": round(time.monotonic() - started, 2)}
+    logger.info(f"{ROLLUP_TABLE}: {stats}")
+    return stats
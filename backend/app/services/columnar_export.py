@@ -0,0 +1,233 @@
+"""
+Columnar exports (Parquet / Arrow IPC stream) of the same queries as the CSV exports.
+
+The query runs on a server-side cursor (csv_export.open_stream). Each fetched batch
+becomes an Arrow record batch, so memory stays bounded as with CSV:
+- arrow: Arrow IPC stream format; schema first, then one record batch per fetch.
+- parquet: zstd-compressed; row groups of PARQUET_ROW_GROUP_ROWS rows, sent as
+  each one is written (the footer goes last).
+
+The schema comes from the Postgres column types of the cursor, not from the values,
+so every batch has the same types: numeric keeps its precision/scale as decimal
+when declared (float64 otherwise), dates stay dates, uuid/json become strings.
+
+pyarrow is imported on first use: the API runs without it and only these formats
+need it.
+"""
+import io
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.db import PROFILE_EXPORT
+from app.services.csv_export import open_export
+
+logger = logging.getLogger(__name__)
+
+FORMAT_ARROW = "arrow"
+FORMAT_PARQUET = "parquet"
+
+MEDIA_TYPES = {
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+}
+EXTENSIONS = {
+    FORMAT_ARROW: "arrows",
+    FORMAT_PARQUET: "parquet",
+}
+PARQUET_ROW_GROUP_ROWS = 64000
+PARQUET_COMPRESSION = "zstd"
+
+# OIDs de tipos de Postgres (pg_type) que tienen equivalente Arrow directo
+PG_BOOL = 16
+PG_INT8 = 20
+PG_INT2 = 21
+PG_INT4 = 23
+PG_FLOAT4 = 700
+PG_FLOAT8 = 701
+PG_NUMERIC = 1700
+PG_DATE = 1082
+PG_TIMESTAMP = 1114
+PG_TIMESTAMPTZ = 1184
+PG_JSON = 114
+PG_JSONB = 3802
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise HTTPException(
+            status_code=501,
+            detail="Los formatos parquet/arrow requieren pyarrow (pip install -r requirements.txt)"
+        )
+    return pyarrow
+
+
+def arrow_type(pa, type_code: int, precision: Optional[int] = None, scale: Optional[int] = None):
+    """Arrow type of a Postgres column (cursor.description type_code); text for anything else."""
+    if type_code == PG_BOOL:
+        return pa.bool_()
+    if type_code == PG_INT2:
+        return pa.int16()
+    if type_code == PG_INT4:
+        return pa.int32()
+    if type_code == PG_INT8:
+        return pa.int64()
+    if type_code == PG_FLOAT4:
+        return pa.float32()
+    if type_code == PG_FLOAT8:
+        return pa.float64()
+    if type_code == PG_NUMERIC:
+        # numeric sin typmod (habitual en vistas) no tiene escala fija
+        if precision and scale is not None and 0 < precision <= 38:
+            return pa.decimal128(precision, scale)
+        return pa.float64()
+    if type_code == PG_DATE:
+        return pa.date32()
+    if type_code == PG_TIMESTAMP:
+        return pa.timestamp("us")
+    if type_code == PG_TIMESTAMPTZ:
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def _converter(pa, arrow_t, type_code: int):
+    """Python value -> value accepted by pa.array for `arrow_t` (None passes through)."""
+    if pa.types.is_string(arrow_t):
+        if type_code in (PG_JSON, PG_JSONB):
+            return lambda v: v if v is None or isinstance(v, str) else json.dumps(v, default=str)
+        return lambda v: v if v is None or isinstance(v, str) else str(v)
+    if pa.types.is_floating(arrow_t):
+        return lambda v: float(v) if isinstance(v, Decimal) else v
+    return None
+
+
+def build_schema(pa, description: Sequence):
+    """Arrow schema and per-column converters from a DBAPI cursor description."""
+    fields = []
+    converters = []
+    for column in description:
+        name, type_code = column[0], column[1]
+        precision = column[4] if len(column) > 4 else None
+        scale = column[5] if len(column) > 5 else None
+        arrow_t = arrow_type(pa, type_code, precision, scale)
+        fields.append(pa.field(name, arrow_t))
+        converters.append(_converter(pa, arrow_t, type_code))
+    return pa.schema(fields), converters
+
+
+def rows_to_batch(pa, schema, converters: List, rows: Sequence[Sequence]):
+    """Arrow record batch from a list of row tuples."""
+    arrays = []
+    for index, field in enumerate(schema):
+        convert = converters[index]
+        values = [row[index] for row in rows]
+        if convert is not None:
+            values = [convert(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object for pyarrow writers; `drain()` returns what was written since the last call."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_arrow(pa, schema, converters, batches: Iterator[Sequence[Sequence]]) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    yield sink.drain()
+    for rows in batches:
+        writer.write_batch(rows_to_batch(pa, schema, converters, rows))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_parquet(pa, schema, converters, batches: Iterator[Sequence[Sequence]]) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    writer = pa.parquet.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+    pending = []
+    pending_rows = 0
+    for rows in batches:
+        pending.append(rows_to_batch(pa, schema, converters, rows))
+        pending_rows += len(rows)
+        if pending_rows >= PARQUET_ROW_GROUP_ROWS:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=pending_rows)
+            pending, pending_rows = [], 0
+            yield sink.drain()
+    if pending:
+        writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=pending_rows)
+    writer.close()
+    yield sink.drain()
+
+
+def stream_columnar(
+    sql: str,
+    params: Optional[Dict],
+    filename_prefix: str,
+    export_format: str,
+    profile: str = PROFILE_EXPORT,
+) -> StreamingResponse:
+    """
+    StreamingResponse with `sql` as Parquet or Arrow IPC. As with stream_csv, the
+    cursor is opened before the response starts so SQL errors reach the endpoint.
+    """
+    pa = _pyarrow()
+    db, result = open_export(sql, params, profile)
+    try:
+        schema, converters = build_schema(pa, result.cursor.description)
+    except Exception:
+        result.close()
+        db.rollback()
+        db.close()
+        raise
+
+    writer = iter_parquet if export_format == FORMAT_PARQUET else iter_arrow
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXTENSIONS[export_format]}"
+
+    def body() -> Iterator[bytes]:
+        try:
+            for chunk in writer(pa, schema, converters, result.partitions()):
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            logger.error(f"{export_format} export {filename} interrupted: {e}", exc_info=True)
+            raise
+        finally:
+            result.close()
+            db.rollback()
+            db.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,167 @@
+"""
+Cached and estimated totals for paginated endpoints.
+
+List endpoints used to run an exact COUNT(*) over the whole filtered view on
+every page, which often cost more than the page itself. `count_rows` replaces it:
+- exact counts are cached per (relation, normalized filter set). Entries on a
+  materialized view live until the MV is refreshed: refresh_mv invalidates the
+  relation through mv_cache, which reaches every worker via LISTEN/NOTIFY.
+  Views and tables can change at any time and get a short TTL;
+- for an unfiltered relation the planner estimate is read first (EXPLAIN, which
+  then is pg_class.reltuples scaled to its current size). When it is at least
+  ESTIMATE_THRESHOLD rows the exact count is skipped and the estimate is
+  returned flagged as such (`total_is_estimate` in the responses). With a
+  filter the planner only guesses the selectivity, often by orders of
+  magnitude, so filtered totals are always counted exactly;
+- an exact count that fails (statement_timeout) falls back to the planner
+  estimate of the same filter, flagged as an estimate and not cached.
+
+Entries live in a response_cache (LRU-bounded to COUNT_CACHE_MAX_ENTRIES) tagged
+with the relation, so its invalidation on refresh reaches them.
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.api_reads import SKIP_READ_TRACKING
+from app.services.mv_cache import INVALIDATE_ALL, get_relation_info
+from app.services.mv_dependencies import split_name
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_MAX_ENTRIES = 1000
+# Segundos: las MVs solo cambian al refrescarse (y el refresh invalida); el TTL solo acota
+# la obsolescencia si el listener está caído. Vistas y tablas cambian en cualquier momento.
+MV_COUNT_TTL = 900
+LIVE_COUNT_TTL = 60
+# A partir de esta estimación del planner no se cuenta exacto
+ESTIMATE_THRESHOLD = 50000
+
+# Parámetros de paginación: no forman parte del filtro
+_PAGING_PARAMS = {"limit", "offset", "skip"}
+_BIND = re.compile(r"(?<!:):(\w+)")
+_AND = re.compile(r"\s+AND\s+", re.IGNORECASE)
+# Condiciones que no filtran (los endpoints arman el WHERE a partir de "1=1")
+_NO_FILTER = {"", "1=1", "1 = 1", "TRUE"}
+
+# Cache: {key: (total, is_estimate)}, TTL por entrada según el tipo de relación
+_counts = response_cache("counts", ttl=LIVE_COUNT_TTL, max_entries=COUNT_CACHE_MAX_ENTRIES)
+
+
+def count_key(relation: str, where_clause: str = "", params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Cache key of a count: the relation, the WHERE clause with normalized whitespace
+    and the values of the parameters it references (paging and keyset ones excluded).
+    """
+    clause = _normalized_clause(where_clause)
+    names = sorted(
+        name for name in set(_BIND.findall(clause))
+        if name not in _PAGING_PARAMS and not name.startswith("ks_")
+    )
+    values = [[name, (params or {}).get(name)] for name in names]
+    return json.dumps([relation, clause, values], default=str, separators=(",", ":"))
+
+
+def _normalized_clause(where_clause: str) -> str:
+    clause = " ".join(where_clause.split())
+    if clause.upper().startswith("WHERE "):
+        clause = clause[6:]
+    return clause
+
+
+def is_unfiltered(where_clause: str = "") -> bool:
+    """True when `where_clause` ("" or "WHERE ...") does not restrict any row."""
+    return all(
+        condition.strip().upper() in _NO_FILTER
+        for condition in _AND.split(_normalized_clause(where_clause))
+    )
+
+
+def count_rows(
+    db: Session,
+    relation: str,
+    where_clause: str = "",
+    params: Optional[Dict[str, Any]] = None,
+    estimate_threshold: int = ESTIMATE_THRESHOLD,
+) -> Tuple[int, bool]:
+    """
+    Total rows of `relation` ("schema.name") matching `where_clause` ("" or "WHERE ...").
+    Only an unfiltered total can be an estimate, or any total whose exact count failed.
+
+    Returns:
+        (total, is_estimate)
+    """
+    key = count_key(relation, where_clause, params)
+    cached = _counts.get(key)
+    if cached is not None:
+        return cached
+
+    ttl = _ttl(db, relation)
+    estimate = None
+    if is_unfiltered(where_clause):
+        estimate = planner_estimate(db, relation, where_clause, params)
+        if estimate is not None and estimate >= estimate_threshold:
+            return _counts.put(key, (estimate, True), tags=[relation], ttl=ttl)
+
+    try:
+        # Savepoint: un timeout del COUNT no aborta la transacción del request
+        with db.begin_nested():
+            # El total acompaña a una página ya contada como lectura (api_reads)
+            total = db.execute(
+                text(f"SELECT COUNT(*) FROM {relation} {where_clause}").execution_options(**{SKIP_READ_TRACKING: True}),
+                params or {}
+            ).scalar() or 0
+    except Exception as e:
+        if estimate is None:
+            # Filtrado: la estimación solo se pide si el COUNT exacto no terminó
+            estimate = planner_estimate(db, relation, where_clause, params)
+        if estimate is None:
+            raise
+        logger.warning(f"COUNT on {relation} failed, using planner estimate {estimate}: {e}")
+        return estimate, True
+
+    return _counts.put(key, (total, False), tags=[relation], ttl=ttl)
+
+
+def planner_estimate(
+    db: Session,
+    relation: str,
+    where_clause: str = "",
+    params: Optional[Dict[str, Any]] = None,
+) -> Optional[int]:
+    """Planner row estimate of the filtered relation (EXPLAIN, nothing is executed); None if unavailable."""
+    try:
+        with db.begin_nested():
+            plan = db.execute(
+                text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {relation} {where_clause}"), params or {}
+            ).scalar()
+    except Exception as e:
+        logger.debug(f"No planner estimate for {relation}: {e}")
+        return None
+    return plan_rows(plan)
+
+
+def plan_rows(plan: Any) -> Optional[int]:
+    """Top-level "Plan Rows" of an EXPLAIN (FORMAT JSON) result (parsed or as text)."""
+    try:
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def invalidate_counts(relation: str = INVALIDATE_ALL) -> None:
+    """Drop the cached counts of `relation` ("schema.name"), or all of them."""
+    _counts.invalidate(relation)
+
+
+def _ttl(db: Session, relation: str) -> float:
+    schema, name = split_name(relation)
+    return MV_COUNT_TTL if get_relation_info(db, schema, name).is_materialized else LIVE_COUNT_TTL
+
@@ -0,0 +1,176 @@
+"""
+Streaming CSV exports.
+
+`stream_csv` runs the export query on a server-side cursor (psycopg2 named
+cursor, via stream_results) and sends the CSV in chunks of FETCH_ROWS rows
+through a StreamingResponse:
+- the first chunk (UTF-8 BOM for Excel + header) leaves as soon as the cursor is
+  declared, before any row is fetched;
+- memory stays at one chunk whatever the size of the export, so no pre-count
+  query or row cap is needed;
+- every cell is escaped as it is written: NULL -> '', UUID -> str, and text
+  starting with a formula character is prefixed with ' (CSV injection).
+
+The query runs on its own export-profile session (app.core.db), independent of
+the request session, which is closed before the body is streamed. A download
+holds its connection, with an open transaction, while the client reads. The
+export pool is therefore small and separate from the batch pool used by
+ingestion. When every export connection is busy, the request gets a 503 after a
+short wait instead of queueing. A client that stops reading for longer than
+idle_in_transaction_session_timeout has its export cut, so it cannot hold back
+vacuum.
+
+`stream_export` is what the export endpoints call: CSV here, Parquet / Arrow IPC
+in columnar_export.
+"""
+import csv
+import io
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Literal, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.engine import Result
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from app.core.db import PROFILE_EXPORT, session_for
+
+logger = logging.getLogger(__name__)
+
+CSV_BOM = "\ufeff"
+# Filas por FETCH del cursor y por chunk de la respuesta
+FETCH_ROWS = 2000
+# Excel/LibreOffice interpretan como fórmula las celdas que empiezan así
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# Valores del query param `format` de los endpoints de export
+ExportFormat = Literal["csv", "parquet", "arrow"]
+FORMAT_CSV = "csv"
+
+
+def escape_cell(value, bool_labels: Optional[Tuple[str, str]] = None):
+    """CSV-safe value of one cell. bool_labels: (true, false) texts, e.g. ('Sí', 'No')."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return (bool_labels[0] if value else bool_labels[1]) if bool_labels else value
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Prefijar con ' para prevenir ejecución de fórmulas en Excel
+        return "'" + value
+    return value
+
+
+def iter_csv(
+    columns: Sequence[str],
+    batches: Iterator[Sequence[Sequence]],
+    bool_labels: Optional[Tuple[str, str]] = None,
+) -> Iterator[bytes]:
+    """BOM + header, then one encoded chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+
+    def flush() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    buffer.write(CSV_BOM)
+    writer.writerow(columns)
+    yield flush()
+    for batch in batches:
+        for row in batch:
+            writer.writerow([escape_cell(value, bool_labels) for value in row])
+        yield flush()
+
+
+def open_stream(db: Session, sql: str, params: Optional[Dict] = None) -> Result:
+    """Execute `sql` on a server-side cursor that fetches FETCH_ROWS rows at a time."""
+    return db.execute(
+        text(sql),
+        params or {},
+        execution_options={"stream_results": True, "yield_per": FETCH_ROWS},
+    )
+
+
+def open_export(sql: str, params: Optional[Dict], profile: str = PROFILE_EXPORT) -> Tuple[Session, Result]:
+    """
+    Session of `profile` and the streaming result of `sql` on it. The caller closes both.
+    HTTP 503 when no export connection frees up within the pool timeout.
+    """
+    db = session_for(profile)
+    try:
+        return db, open_stream(db, sql, params)
+    except PoolTimeoutError:
+        db.close()
+        logger.warning("Export rejected: every export connection is busy")
+        raise HTTPException(
+            status_code=503,
+            detail="Hay demasiadas exportaciones en curso, reintenta en unos segundos",
+            headers={"Retry-After": "30"},
+        )
+    except Exception:
+        db.rollback()
+        db.close()
+        raise
+
+
+def stream_csv(
+    sql: str,
+    params: Optional[Dict],
+    filename_prefix: str,
+    bool_labels: Optional[Tuple[str, str]] = None,
+    profile: str = PROFILE_EXPORT,
+) -> StreamingResponse:
+    """
+    StreamingResponse with the CSV of `sql`.
+
+    The cursor is opened here, so SQL errors (missing view, bad filter) are raised
+    to the endpoint before the response starts and can still become an HTTP error.
+    Column names come from the cursor: an empty result still gets its header.
+    """
+    db, result = open_export(sql, params, profile)
+    columns: List[str] = list(result.keys())
+
+    def body() -> Iterator[bytes]:
+        try:
+            yield from iter_csv(columns, result.partitions(), bool_labels)
+        except Exception as e:
+            # Con la respuesta ya iniciada no se puede cambiar el status: queda un CSV truncado
+            logger.error(f"CSV export {filename} interrupted: {e}", exc_info=True)
+            raise
+        finally:
+            # Cierra el cursor con nombre (también si el cliente corta la descarga)
+            result.close()
+            db.rollback()
+            db.close()
+
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return StreamingResponse(
+        body(),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Type": "text/csv; charset=utf-8",
+        },
+    )
+
+
+def stream_export(
+    sql: str,
+    params: Optional[Dict],
+    filename_prefix: str,
+    export_format: ExportFormat = FORMAT_CSV,
+    bool_labels: Optional[Tuple[str, str]] = None,
+) -> StreamingResponse:
+    """Stream `sql` as CSV, Parquet or Arrow IPC. bool_labels only applies to CSV."""
+    if export_format == FORMAT_CSV:
+        return stream_csv(sql, params, filename_prefix, bool_labels=bool_labels)
+    from app.services.columnar_export import stream_columnar
+    return stream_columnar(sql, params, filename_prefix, export_format)
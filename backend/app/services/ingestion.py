@@ -10,11 +10,12 @@ from datetime import date, datetime
 from typing import Any, Dict, Optional
 from uuid import UUID, uuid4
 
-from sqlalchemy import func, text
+from sqlalchemy import text
 from sqlalchemy.exc import DisconnectionError, OperationalError, PendingRollbackError
 from sqlalchemy.orm import Session
 
-from app.core.db import SessionLocal
+from app.core.db import BatchSessionLocal
+from app.core.db_utils import fetch_by_keys
 from app.models.canon import (
     ConfidenceLevel,
     IdentityLink,
@@ -32,14 +33,18 @@ from app.services.normalization import (
     normalize_plate,
     parse_date,
 )
+from app.services.person_facts import PersonFactsCache
+from app.services.run_report import store_run_report
 
 logger = logging.getLogger(__name__)
 
 
 class IngestionService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, person_facts: Optional[PersonFactsCache] = None):
         self.db = db
         self.matching_engine = MatchingEngine(db)
+        # Cache de hechos compartido con la atribución del mismo run: se invalida al crear links
+        self.person_facts = person_facts
 
     def run_ingestion(self, scope_date_from: Optional[date] = None, scope_date_to: Optional[date] = None,
                      scope_date: Optional[date] = None, source_tables: Optional[list] = None,
@@ -133,17 +138,15 @@ class IngestionService:
             unmatched_by_reason = {}
             
             try:
-                matched_rules = self.db.query(IdentityLink.match_rule, func.count(IdentityLink.id)).filter(
-                    IdentityLink.run_id == run_id
-                ).group_by(IdentityLink.match_rule).all()
-                matched_by_rule = {rule: count for rule, count in matched_rules}
-                
-                unmatched_reasons = self.db.query(IdentityUnmatched.reason_code, func.count(IdentityUnmatched.id)).filter(
-                    IdentityUnmatched.run_id == run_id
-                ).group_by(IdentityUnmatched.reason_code).order_by(func.count(IdentityUnmatched.id).desc()).limit(5).all()
-                unmatched_by_reason = {reason: count for reason, count in unmatched_reasons}
+                # Reporte del run (GET /identity/runs/{run_id}/report lo sirve guardado)
+                report = store_run_report(self.db, run)
+                matched_by_rule = report["matched_breakdown"]["by_match_rule"]
+                unmatched_by_reason = dict(sorted(
+                    report["unmatched_breakdown"]["by_reason_code"].items(), key=lambda item: item[1], reverse=True
+                )[:5])
             except Exception as e:
-                logger.warning({"message": "Error obteniendo breakdown para logging", "run_id": run_id, "error": str(e)})
+                self.db.rollback()
+                logger.warning({"message": "Error guardando reporte del run", "run_id": run_id, "error": str(e)})
 
             total_elapsed = time.time() - start_time
             logger.info({
@@ -166,7 +169,7 @@ class IngestionService:
             error_msg = str(e)[:500]
             logger.error({"message": "Error de conexión en ingesta", "run_id": run_id, "error": error_msg})
             
-            db_new = SessionLocal()
+            db_new = BatchSessionLocal()
             try:
                 run_update = db_new.query(IngestionRun).filter(IngestionRun.id == run_id).first()
                 if run_update:
@@ -197,7 +200,7 @@ class IngestionService:
                 except:
                     pass
                 
-                db_new = SessionLocal()
+                db_new = BatchSessionLocal()
                 try:
                     run_update = db_new.query(IngestionRun).filter(IngestionRun.id == run_id).first()
                     if run_update:
@@ -248,7 +251,7 @@ class IngestionService:
                 self.db.commit()
             except Exception as inner_e:
                 logger.error({"message": "Error actualizando run estado", "run_id": run_id, "error": str(inner_e)})
-                db_new = SessionLocal()
+                db_new = BatchSessionLocal()
                 try:
                     run_update = db_new.query(IngestionRun).filter(IngestionRun.id == run_id).first()
                     if run_update:
@@ -286,10 +289,12 @@ class IngestionService:
         if not source_pks:
             return set()
         
-        existing = self.db.query(IdentityLink.source_pk).filter(
-            IdentityLink.source_table == source_table,
-            IdentityLink.source_pk.in_(source_pks)
-        ).all()
+        existing = fetch_by_keys(
+            self.db,
+            self.db.query(IdentityLink.source_pk).filter(IdentityLink.source_table == source_table),
+            IdentityLink.source_pk,
+            source_pks
+        )
         return {str(e[0]) for e in existing}
 
     def _refresh_drivers_index(self):
@@ -740,6 +745,7 @@ class IngestionService:
                 run_id=run_id
             )
             self.db.add(link)
+        self._invalidate_person_facts(match_result.person_key)
 
         # Limpiar de identity_unmatched si existía previamente
         self.db.query(IdentityUnmatched).filter(
@@ -793,6 +799,11 @@ class IngestionService:
             )
             self.db.add(link)
             self.db.flush()
+            self._invalidate_person_facts(person_key)
+
+    def _invalidate_person_facts(self, person_key: UUID) -> None:
+        if self.person_facts is not None:
+            self.person_facts.invalidate(person_key)
 
     def _serialize_for_json(self, obj: Any) -> Any:
         """Convierte objetos datetime/date a strings para serialización JSON"""
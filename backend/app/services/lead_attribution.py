@@ -14,6 +14,7 @@ from sqlalchemy.exc import IntegrityError, PendingRollbackError, SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from app.core.config import PARK_ID_OBJETIVO
+from app.core.db_utils import any_array, fetch_by_keys
 from app.models.canon import ConfidenceLevel, IdentityLink, IdentityRegistry
 from app.models.observational import (
     AttributionConfidence,
@@ -30,14 +31,16 @@ from app.services.normalization import (
     normalize_phone_pe9,
     normalize_plate,
 )
+from app.services.person_facts import PersonFactsCache
 
 logger = logging.getLogger(__name__)
 
 
 class LeadAttributionService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, person_facts: Optional[PersonFactsCache] = None):
         self.db = db
         self.matching_engine = MatchingEngine(db, park_id_objetivo=PARK_ID_OBJETIVO)
+        self.person_facts = person_facts or PersonFactsCache(db)
 
     def ensure_driver_identity_link(
         self, 
@@ -194,6 +197,8 @@ class LeadAttributionService:
             )
             self.db.add(identity_link)
             self.db.flush()
+            # Nuevo link de driver: los hechos cacheados de la persona ya no valen
+            self.person_facts.invalidate(person_key)
             
             metrics["created_links"] += 1
             logger.info(f"Created identity link drivers:{driver_id_str} -> {person_key} (with lead association)")
@@ -215,10 +220,12 @@ class LeadAttributionService:
         if not source_pks:
             return {}
         
-        existing = self.db.query(LeadEvent).filter(
-            LeadEvent.source_table == source_table,
-            LeadEvent.source_pk.in_(source_pks)
-        ).all()
+        existing = fetch_by_keys(
+            self.db,
+            self.db.query(LeadEvent).filter(LeadEvent.source_table == source_table),
+            LeadEvent.source_pk,
+            source_pks
+        )
         return {str(e.source_pk): e for e in existing}
 
     def _match_by_plate_s3(self, plate_norm: str) -> Dict[str, Any]:
@@ -949,25 +956,10 @@ class LeadAttributionService:
         return stats
 
     def _get_hire_dates_batch(self, person_keys: List[UUID]) -> Dict[UUID, Optional[date]]:
-        """Obtiene hire_dates para múltiples person_keys en una sola consulta"""
+        """Obtiene hire_dates para múltiples person_keys (vía PersonFactsCache del run)"""
         if not person_keys:
             return {}
-        
-        # Usar IN en lugar de ANY para mejor compatibilidad
-        query = text("""
-            SELECT DISTINCT ON (il.person_key) il.person_key, d.hire_date
-            FROM canon.identity_links il
-            JOIN public.drivers d ON d.driver_id::text = il.source_pk
-            WHERE il.person_key IN :person_keys
-            AND il.source_table = 'drivers'
-            AND d.hire_date IS NOT NULL
-            ORDER BY il.person_key, d.hire_date ASC
-        """)
-        
-        # SQLAlchemy requiere que IN use una tupla
-        result = self.db.execute(query, {"person_keys": tuple(person_keys)})
-        hire_dates = {row.person_key: row.hire_date for row in result}
-        return hire_dates
+        return self.person_facts.get_hire_dates(person_keys)
 
     def process_ledger(
         self,
@@ -1013,7 +1005,7 @@ class LeadAttributionService:
         
         # Filtros adicionales
         if person_keys:
-            events_query = events_query.filter(LeadEvent.person_key.in_(person_keys))
+            events_query = events_query.filter(any_array(LeadEvent.person_key, person_keys, "uuid"))
         
         if date_from:
             events_query = events_query.filter(LeadEvent.event_date >= date_from)
@@ -1,105 +1,201 @@
 """
-Materialized View existence cache.
+Catalog metadata cache for materialized views and views.
 
-Caches the existence check of materialized views to avoid
-repeated database queries on every API request.
+Caches, per relation, what request handlers used to query from the catalog on
+every call: existence and kind, column list, unique-index presence (needed for
+REFRESH ... CONCURRENTLY) and populated state.
+
+Each worker keeps its own copy, but copies are kept consistent across workers
+and processes through Postgres LISTEN/NOTIFY on channel `ct4_catalog`:
+- `invalidate()` notifies after refreshes (populated state, contents) and index changes;
+- the event trigger from migration 024 notifies on any DDL, so migrations
+  invalidate every worker without restarting it.
+
+A daemon thread per process listens and drops the notified entries. While the
+listener is down (no database, lost connection), entries expire after
+MV_CACHE_TTL as before.
+
+Other per-process caches derived from a relation (e.g. count_cache) subscribe
+with `on_invalidate` and are dropped together with its catalog entry.
 """
 import logging
+import select
+import threading
 import time
-from typing import Dict, Optional, Tuple
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
-# Cache: {mv_name: (exists: bool, timestamp: float)}
-_mv_cache: Dict[str, Tuple[bool, float]] = {}
+NOTIFY_CHANNEL = "ct4_catalog"
+# Payload que invalida toda la cache (DDL desde el event trigger, clear_cache)
+INVALIDATE_ALL = "*"
 
-# Cache TTL in seconds (5 minutes)
+# Cache TTL in seconds (5 minutes); bounds staleness while the listener is down
 MV_CACHE_TTL = 300
+LISTENER_RETRY_SECONDS = 30
 
 
-def mv_exists(db: Session, schema: str, mv_name: str, use_cache: bool = True) -> bool:
+@dataclass(frozen=True)
+class RelationInfo:
+    """Catalog metadata of one relation."""
+    exists: bool
+    kind: Optional[str] = None  # 'm' materialized view, 'v' view, 'r'/'p' table
+    columns: Tuple[str, ...] = ()
+    has_unique_index: bool = False
+    populated: Optional[bool] = None
+
+    @property
+    def is_materialized(self) -> bool:
+        return self.kind == "m"
+
+
+MISSING = RelationInfo(exists=False)
+
+# Cache: {"schema.name": (RelationInfo, timestamp)}
+_mv_cache: Dict[str, Tuple[RelationInfo, float]] = {}
+_listener_started = False
+_listener_connected = False
+_listener_lock = threading.Lock()
+# Callbacks(relation) llamados en cada invalidación (local o recibida por NOTIFY)
+_invalidation_callbacks: List[Callable[[str], None]] = []
+
+
+def get_relation_info(db: Session, schema: str, name: str, use_cache: bool = True) -> RelationInfo:
     """
-    Check if a materialized view exists, with caching.
-    
+    Catalog metadata of schema.name, cached.
+
     Args:
         db: Database session
         schema: Schema name (e.g., 'ops')
-        mv_name: Materialized view name
+        name: Relation name
         use_cache: Whether to use the cache (default: True)
-        
-    Returns:
-        True if the materialized view exists, False otherwise
     """
-    cache_key = f"{schema}.{mv_name}"
+    _ensure_listener(db)
+    cache_key = f"{schema}.{name}"
     now = time.time()
-    
-    # Check cache first
+
     if use_cache and cache_key in _mv_cache:
-        exists, cached_at = _mv_cache[cache_key]
+        info, cached_at = _mv_cache[cache_key]
         if now - cached_at < MV_CACHE_TTL:
-            return exists
-    
-    # Query database
+            return info
+
     try:
-        result = db.execute(text("""
-            SELECT EXISTS (
-                SELECT 1 FROM pg_matviews 
-                WHERE schemaname = :schema 
-                AND matviewname = :mv_name
-            )
-        """), {"schema": schema, "mv_name": mv_name})
-        exists = result.scalar() or False
-        
-        # Update cache
-        _mv_cache[cache_key] = (exists, now)
-        logger.debug(f"MV cache updated: {cache_key} = {exists}")
-        
-        return exists
+        row = db.execute(text("""
+            SELECT
+                c.relkind,
+                c.relispopulated,
+                ARRAY(
+                    SELECT a.attname::text
+                    FROM pg_attribute a
+                    WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                    ORDER BY a.attnum
+                ) AS columns,
+                EXISTS (
+                    SELECT 1 FROM pg_index i
+                    WHERE i.indrelid = c.oid AND i.indisunique AND i.indisvalid AND i.indpred IS NULL
+                        AND i.indexprs IS NULL
+                ) AS has_unique_index
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relname = :name
+        """), {"schema": schema, "name": name}).fetchone()
     except Exception as e:
-        logger.warning(f"Error checking MV existence for {cache_key}: {e}")
+        db.rollback()
+        logger.warning(f"Error reading catalog for {cache_key}: {e}")
         # If cache has stale data, use it
         if cache_key in _mv_cache:
             return _mv_cache[cache_key][0]
-        return False
+        return MISSING
+
+    if row is None:
+        info = MISSING
+    else:
+        info = RelationInfo(
+            exists=True,
+            kind=row.relkind,
+            columns=tuple(row.columns or ()),
+            has_unique_index=bool(row.has_unique_index),
+            # Solo las MVs pueden estar sin poblar
+            populated=row.relispopulated if row.relkind == "m" else True,
+        )
+    _mv_cache[cache_key] = (info, now)
+    logger.debug(f"Catalog cache updated: {cache_key} = {info}")
+    return info
+
+
+def mv_exists(db: Session, schema: str, mv_name: str, use_cache: bool = True) -> bool:
+    """
+    Check if a materialized view exists, with caching.
+
+    Args:
+        db: Database session
+        schema: Schema name (e.g., 'ops')
+        mv_name: Materialized view name
+        use_cache: Whether to use the cache (default: True)
+
+    Returns:
+        True if the materialized view exists, False otherwise
+    """
+    return get_relation_info(db, schema, mv_name, use_cache).is_materialized
+
+
+def get_columns(db: Session, relation: str) -> Tuple[str, ...]:
+    """Column names of a relation ("schema.name"), cached."""
+    schema, name = relation.split(".", 1)
+    return get_relation_info(db, schema, name).columns
 
 
 def get_best_view(
-    db: Session, 
-    schema: str, 
-    mv_candidates: list[str], 
+    db: Session,
+    schema: str,
+    mv_candidates: list[str],
     fallback_view: str
 ) -> str:
     """
     Get the best available view from a list of candidates.
-    
+
     Checks materialized views in order and returns the first one that exists,
     or falls back to a regular view.
-    
+
     Args:
         db: Database session
         schema: Schema name
         mv_candidates: List of MV names to check (in priority order)
         fallback_view: Regular view to use if no MVs exist
-        
+
     Returns:
         Full view name (schema.view_name) of the best available view
     """
     for mv_name in mv_candidates:
         if mv_exists(db, schema, mv_name):
-            logger.info(f"Using materialized view: {schema}.{mv_name}")
+            logger.debug(f"Using materialized view: {schema}.{mv_name}")
             return f"{schema}.{mv_name}"
-    
+
     logger.info(f"No MVs found, using fallback view: {fallback_view}")
     return fallback_view
 
 
+def invalidate(db: Session, relation: str = INVALIDATE_ALL) -> None:
+    """
+    Drop `relation` ("schema.name", or every entry) from the cache of this
+    process and notify the other workers. The notification is sent when the
+    caller's transaction commits; call it on the session that made the change.
+    """
+    _drop(relation)
+    try:
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": relation})
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not notify catalog invalidation of {relation}: {e}")
+
+
 def clear_cache() -> None:
-    """Clear the MV existence cache."""
-    global _mv_cache
-    _mv_cache.clear()
+    """Clear the catalog cache of this process."""
+    _drop(INVALIDATE_ALL)
     logger.info("MV cache cleared")
 
 
@@ -108,10 +204,74 @@ def get_cache_stats() -> dict:
     now = time.time()
     total = len(_mv_cache)
     valid = sum(1 for _, (_, ts) in _mv_cache.items() if now - ts < MV_CACHE_TTL)
-    
+
     return {
         "total_entries": total,
         "valid_entries": valid,
         "stale_entries": total - valid,
-        "ttl_seconds": MV_CACHE_TTL
+        "ttl_seconds": MV_CACHE_TTL,
+        "listener_connected": _listener_connected
     }
+
+
+def on_invalidate(callback: Callable[[str], None]) -> None:
+    """Call `callback(relation)` whenever `relation` (or INVALIDATE_ALL) is invalidated in this process."""
+    _invalidation_callbacks.append(callback)
+
+
+def _drop(relation: str) -> None:
+    if relation == INVALIDATE_ALL:
+        _mv_cache.clear()
+    else:
+        _mv_cache.pop(relation, None)
+    for callback in _invalidation_callbacks:
+        try:
+            callback(relation)
+        except Exception as e:
+            logger.warning(f"Invalidation callback failed for {relation}: {e}")
+
+
+def _ensure_listener(db: Session) -> None:
+    """Start the LISTEN thread of this process on first use."""
+    global _listener_started
+    if _listener_started:
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        _listener_started = True
+    engine = db.get_bind()
+    thread = threading.Thread(target=_listen_forever, args=(engine,), name="catalog-listener", daemon=True)
+    thread.start()
+
+
+def _listen_forever(engine) -> None:
+    global _listener_connected
+    while True:
+        conn = None
+        try:
+            # Conexión propia fuera del pool: queda ocupada escuchando mientras viva el proceso
+            cargs, cparams = engine.dialect.create_connect_args(engine.url)
+            cparams.update(connect_timeout=10, application_name="ct4-catalog-listener")
+            conn = engine.dialect.connect(*cargs, **cparams)
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            _listener_connected = True
+            # Lo cambiado mientras no se escuchaba se descarta
+            _drop(INVALIDATE_ALL)
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _drop(conn.notifies.pop(0).payload or INVALIDATE_ALL)
+        except Exception as e:
+            logger.debug(f"Catalog listener disconnected, retrying in {LISTENER_RETRY_SECONDS}s: {e}")
+        finally:
+            _listener_connected = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(LISTENER_RETRY_SECONDS)
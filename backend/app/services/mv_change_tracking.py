@@ -0,0 +1,177 @@
+"""
+Change tracking for materialized view inputs.
+
+Each base table's change counter is n_tup_ins + n_tup_upd + n_tup_del from
+pg_stat_user_tables (summed over partitions). Before an MV is refreshed, the
+counters of its transitive base tables are snapshotted. After the refresh
+succeeds, the snapshot is stored in ops.mv_refresh_input_state. An MV whose
+inputs show the same counters on the next run is skipped.
+
+The statistics are updated asynchronously (a write can take about a second
+to show up), so a skipped MV is still refreshed once
+settings.mv_refresh_max_skip_minutes have passed since its last refresh.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.mv_dependencies import MvDependencyGraph, split_name
+
+logger = logging.getLogger(__name__)
+
+# Motivos (se guardan en mv_refresh_log.skip_reason o se devuelven en el resultado)
+REASON_UNCHANGED = "inputs_unchanged"
+REASON_CHANGED = "inputs_changed"
+REASON_NO_STATE = "no_previous_state"
+REASON_UNKNOWN_INPUTS = "unknown_inputs"
+REASON_UPSTREAM = "upstream_refreshed"
+REASON_MAX_AGE = "max_skip_age_exceeded"
+
+
+def decide_refresh(
+    mvs: Iterable[str],
+    deps: Dict[str, Set[str]],
+    inputs: Dict[str, Set[str]],
+    current: Dict[str, Optional[int]],
+    previous: Dict[str, Dict[str, int]],
+    expired: Set[str],
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Split `mvs` into (refresh, skip), each mapping MV -> reason.
+
+    An MV is refreshed when any of its base tables changed, has no counter
+    (foreign table, stats reset) or is new since the last refresh, when it has
+    no stored state, when its last refresh is too old, or when an MV it reads
+    from is being refreshed in this run.
+    """
+    mvs = list(mvs)
+    own: Dict[str, Optional[str]] = {}
+    for mv in mvs:
+        tables = inputs.get(mv) or set()
+        stored = previous.get(mv)
+        if not tables:
+            own[mv] = REASON_UNKNOWN_INPUTS
+        elif not stored:
+            own[mv] = REASON_NO_STATE
+        else:
+            changed = sorted(
+                t for t in tables
+                if current.get(t) is None or stored.get(t) is None or current[t] != stored[t]
+            )
+            if changed:
+                own[mv] = f"{REASON_CHANGED}: {', '.join(changed)}"
+            elif mv in expired:
+                own[mv] = REASON_MAX_AGE
+            else:
+                own[mv] = None
+
+    refresh: Dict[str, str] = {}
+    skip: Dict[str, str] = {}
+
+    def resolve(mv: str, stack: Set[str]) -> bool:
+        if mv in refresh:
+            return True
+        if mv in skip:
+            return False
+        stack.add(mv)
+        upstream = sorted(up for up in deps.get(mv, ()) if up not in stack and resolve(up, stack))
+        stack.discard(mv)
+        if own[mv]:
+            refresh[mv] = own[mv]
+        elif upstream:
+            refresh[mv] = f"{REASON_UPSTREAM}: {', '.join(upstream)}"
+        else:
+            skip[mv] = REASON_UNCHANGED
+        return mv in refresh
+
+    for mv in mvs:
+        resolve(mv, set())
+    return refresh, skip
+
+
+class MvChangeTracker:
+    """Tracks input change counters of a set of MVs across refresh runs."""
+
+    def __init__(self, db: Session, graph: MvDependencyGraph, max_skip_minutes: int):
+        self.db = db
+        self.graph = graph
+        self.max_skip_minutes = max_skip_minutes
+        self._inputs: Dict[str, Set[str]] = {}
+        self._snapshot: Dict[str, Optional[int]] = {}
+
+    def plan(self, mvs: Iterable[str], deps: Dict[str, Set[str]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Snapshot the current counters and decide which MVs need a refresh."""
+        mvs = list(mvs)
+        self._inputs = {mv: self.graph.base_tables(mv) for mv in mvs}
+        tables = set().union(*self._inputs.values()) if self._inputs else set()
+        self._snapshot = self._change_counters(tables)
+        previous, last_captured = self._load_state(mvs)
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=self.max_skip_minutes)
+        expired = {mv for mv, captured_at in last_captured.items() if captured_at < cutoff}
+        return decide_refresh(mvs, deps, self._inputs, self._snapshot, previous, expired)
+
+    def record_success(self, mv: str) -> None:
+        """Store the pre-refresh snapshot as the state of a successfully refreshed MV."""
+        counters = {
+            t: self._snapshot[t] for t in self._inputs.get(mv, ())
+            if self._snapshot.get(t) is not None
+        }
+        schema, name = split_name(mv)
+        try:
+            self.db.execute(text("""
+                DELETE FROM ops.mv_refresh_input_state
+                WHERE schema_name = :schema AND mv_name = :mv_name
+            """), {"schema": schema, "mv_name": name})
+            if counters:
+                self.db.execute(text("""
+                    INSERT INTO ops.mv_refresh_input_state (schema_name, mv_name, table_name, change_counter)
+                    VALUES (:schema, :mv_name, :table_name, :change_counter)
+                """), [
+                    {"schema": schema, "mv_name": name, "table_name": t, "change_counter": c}
+                    for t, c in counters.items()
+                ])
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"Failed to store input state for {mv}: {e}")
+
+    def _change_counters(self, tables: Set[str]) -> Dict[str, Optional[int]]:
+        if not tables:
+            return {}
+        rows = self.db.execute(text("""
+            SELECT
+                t.rel AS table_name,
+                (
+                    SELECT SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del)
+                    FROM pg_partition_tree(to_regclass(t.rel)) pt
+                    JOIN pg_stat_user_tables s ON s.relid = pt.relid
+                ) AS change_counter
+            FROM unnest(CAST(:tables AS text[])) AS t(rel)
+        """), {"tables": sorted(tables)}).fetchall()
+        return {
+            row.table_name: int(row.change_counter) if row.change_counter is not None else None
+            for row in rows
+        }
+
+    def _load_state(self, mvs: Iterable[str]) -> Tuple[Dict[str, Dict[str, int]], Dict[str, datetime]]:
+        try:
+            rows = self.db.execute(text("""
+                SELECT schema_name || '.' || mv_name AS mv, table_name, change_counter, captured_at
+                FROM ops.mv_refresh_input_state
+                WHERE schema_name || '.' || mv_name = ANY(CAST(:mvs AS text[]))
+            """), {"mvs": list(mvs)}).fetchall()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"Could not read ops.mv_refresh_input_state, refreshing all: {e}")
+            return {}, {}
+
+        previous: Dict[str, Dict[str, int]] = {}
+        last_captured: Dict[str, datetime] = {}
+        for row in rows:
+            previous.setdefault(row.mv, {})[row.table_name] = row.change_counter
+            if row.mv not in last_captured or row.captured_at < last_captured[row.mv]:
+                last_captured[row.mv] = row.captured_at
+        return previous, last_captured
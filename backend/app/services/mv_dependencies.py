@@ -0,0 +1,157 @@
+"""
+Materialized view dependency graph.
+
+Discovers which relations each view/materialized view reads from the
+catalog (pg_depend + pg_rewrite) so refresh order is derived from the
+database instead of hand-maintained lists. Plain views are transparent:
+an MV reading a view that reads another MV depends on that MV.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# relkind de pg_class
+RELKIND_MATVIEW = "m"
+RELKIND_VIEW = "v"
+BASE_TABLE_RELKINDS = {"r", "p", "f"}
+
+
+class MvDependencyGraph:
+    """
+    Dependency graph between relations.
+
+    `edges` maps a dependent view/MV (schema.name) to the relations it reads,
+    `kinds` maps every known relation to its pg_class.relkind.
+    """
+
+    def __init__(self, edges: Dict[str, Set[str]], kinds: Dict[str, str]):
+        self.edges = edges
+        self.kinds = kinds
+
+    def upstream_mvs(self, mv: str) -> Set[str]:
+        """MVs this MV reads, looking through plain views (not transitively through MVs)."""
+        return self._walk(mv, stop_kinds={RELKIND_MATVIEW})[RELKIND_MATVIEW]
+
+    def base_tables(self, mv: str) -> Set[str]:
+        """Tables this MV ultimately reads, transitively through views and MVs."""
+        return self._walk(mv, stop_kinds=set())["tables"]
+
+    def refresh_dependencies(self, mvs: Iterable[str]) -> Dict[str, Set[str]]:
+        """
+        For each MV in `mvs`, the MVs of the same set that must be refreshed before it.
+        Dependencies through MVs outside the set are followed transitively so that
+        order is preserved even when an intermediate MV is not being refreshed.
+        """
+        selected = set(mvs)
+        deps: Dict[str, Set[str]] = {}
+        for mv in selected:
+            found: Set[str] = set()
+            pending = list(self.upstream_mvs(mv))
+            seen: Set[str] = set()
+            while pending:
+                up = pending.pop()
+                if up in seen or up == mv:
+                    continue
+                seen.add(up)
+                if up in selected:
+                    found.add(up)
+                else:
+                    pending.extend(self.upstream_mvs(up))
+            deps[mv] = found
+        return deps
+
+    def critical_path(self, mvs: Iterable[str], durations: Dict[str, float]) -> Tuple[List[str], float]:
+        """Longest chain (by expected duration) among `mvs`: the lower bound of a parallel refresh."""
+        deps = self.refresh_dependencies(mvs)
+        best: Dict[str, Tuple[float, List[str]]] = {}
+
+        def visit(mv: str, stack: Set[str]) -> Tuple[float, List[str]]:
+            if mv in best:
+                return best[mv]
+            if mv in stack:
+                raise ValueError(f"Ciclo de dependencias detectado en {mv}")
+            stack.add(mv)
+            cost, path = 0.0, []
+            for up in deps.get(mv, ()):
+                up_cost, up_path = visit(up, stack)
+                if up_cost > cost:
+                    cost, path = up_cost, up_path
+            stack.discard(mv)
+            best[mv] = (cost + durations.get(mv, 0.0), path + [mv])
+            return best[mv]
+
+        result = (0.0, [])
+        for mv in deps:
+            candidate = visit(mv, set())
+            if candidate[0] > result[0]:
+                result = candidate
+        return result[1], round(result[0], 2)
+
+    def _walk(self, start: str, stop_kinds: Set[str]) -> Dict[str, Set[str]]:
+        found: Dict[str, Set[str]] = {RELKIND_MATVIEW: set(), "tables": set()}
+        pending = list(self.edges.get(start, ()))
+        seen: Set[str] = set()
+        while pending:
+            rel = pending.pop()
+            if rel in seen or rel == start:
+                continue
+            seen.add(rel)
+            kind = self.kinds.get(rel)
+            if kind == RELKIND_MATVIEW:
+                found[RELKIND_MATVIEW].add(rel)
+                if RELKIND_MATVIEW in stop_kinds:
+                    continue
+            elif kind in BASE_TABLE_RELKINDS:
+                found["tables"].add(rel)
+                continue
+            pending.extend(self.edges.get(rel, ()))
+        return found
+
+
+def load_dependency_graph(db: Session) -> MvDependencyGraph:
+    """Build the dependency graph of all views/MVs from pg_depend and pg_rewrite."""
+    rows = db.execute(text("""
+        SELECT DISTINCT
+            dep_ns.nspname || '.' || dep.relname AS dependent,
+            dep.relkind AS dependent_kind,
+            src_ns.nspname || '.' || src.relname AS source,
+            src.relkind AS source_kind
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class dep ON dep.oid = r.ev_class
+        JOIN pg_namespace dep_ns ON dep_ns.oid = dep.relnamespace
+        JOIN pg_class src ON src.oid = d.refobjid
+        JOIN pg_namespace src_ns ON src_ns.oid = src.relnamespace
+        WHERE d.classid = 'pg_rewrite'::regclass
+          AND d.refclassid = 'pg_class'::regclass
+          AND d.deptype = 'n'
+          AND dep.oid <> src.oid
+          AND dep.relkind IN ('m', 'v')
+          AND src_ns.nspname NOT IN ('pg_catalog', 'information_schema')
+    """)).fetchall()
+
+    edges: Dict[str, Set[str]] = defaultdict(set)
+    kinds: Dict[str, str] = {}
+    for row in rows:
+        edges[row.dependent].add(row.source)
+        kinds[row.dependent] = row.dependent_kind
+        kinds[row.source] = row.source_kind
+    return MvDependencyGraph(dict(edges), kinds)
+
+
+def split_name(full_name: str, default_schema: str = "ops") -> Tuple[str, str]:
+    """'ops.mv_x' -> ('ops', 'mv_x'); names without schema use `default_schema`."""
+    if "." in full_name:
+        schema, name = full_name.split(".", 1)
+        return schema, name
+    return default_schema, full_name
+
+
+def qualify(name: str, default_schema: Optional[str] = "ops") -> str:
+    schema, mv = split_name(name, default_schema)
+    return f"{schema}.{mv}"
@@ -0,0 +1,191 @@
+"""
+Staleness-aware reads of materialized views.
+
+`read_freshness(db, relation)` returns the freshness metadata of the relation
+an endpoint is about to read, to be attached to its response:
+- MVs: data_as_of is the last successful refresh in ops.mv_refresh_log, or the last
+  refresh skipped because its inputs had not changed.
+- Plain views are as fresh as the MVs they read (through other views, from the
+  dependency graph): data_as_of is the oldest of them, and the view is stale if any
+  of them is. A view that reads no MV is live: data_as_of is now.
+
+When the data is older than the view's max age, a refresh is queued on a background
+thread (stale-while-revalidate). The current request is answered with the stale data
+and never waits for the refresh. MV refreshes go through refresh_mv, so a refresh
+already running in another worker is shared instead of repeated.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.db import MaintenanceSessionLocal
+from app.services.mv_cache import mv_exists
+from app.services.mv_dependencies import MvDependencyGraph, load_dependency_graph, split_name
+from app.services.mv_maintenance import CRITICAL_MVS, refresh_mv
+from app.services.mv_refresh_scheduler import STALENESS_SLO_MINUTES
+
+logger = logging.getLogger(__name__)
+
+# Edad máxima por relación (minutos); las MVs críticas usan el SLO de su prioridad
+MAX_AGE_MINUTES: Dict[str, int] = {
+    "ops.mv_yango_cabinet_cobranza_enriched_14d": 60,
+}
+DEFAULT_MAX_AGE_MINUTES = 60
+# Cache de data_as_of por proceso (evita consultar el log en cada request)
+AS_OF_CACHE_TTL = 10
+# Tras encolar un refresh, no se vuelve a encolar la misma relación durante este tiempo
+REENQUEUE_COOLDOWN_SECONDS = 120
+# Grafo de dependencias (vistas -> MVs) por proceso; las vistas cambian solo con DDL
+GRAPH_CACHE_TTL = 300
+
+SOURCE_MV = "materialized_view"
+SOURCE_VIEW = "view"
+
+_as_of_cache: Dict[str, Tuple[Optional[datetime], float]] = {}
+_enqueued_at: Dict[str, float] = {}
+_graph_cache: Optional[Tuple[MvDependencyGraph, float]] = None
+_lock = threading.Lock()
+# Un solo worker: los refresh en background no compiten entre sí por el pool de mantenimiento
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mv-swr")
+
+
+def read_freshness(db: Session, relation: str) -> Dict:
+    """
+    Freshness of `relation` ("schema.name"); queues a background refresh if it is stale.
+
+    Returns source, source_kind, data_as_of, age_seconds, max_age_seconds, is_stale
+    (None when unknown) and refresh_enqueued.
+    """
+    kind = _source_kind(db, relation)
+    max_age = _max_age_minutes(relation) * 60
+    if kind == SOURCE_VIEW:
+        upstream = _upstream_mvs(db, relation)
+        if upstream:
+            return _view_freshness(relation, [read_freshness(db, mv) for mv in sorted(upstream)])
+        return {
+            "source": relation,
+            "source_kind": kind,
+            "data_as_of": datetime.now(timezone.utc),
+            "age_seconds": 0,
+            "max_age_seconds": max_age,
+            "is_stale": False,
+            "refresh_enqueued": False,
+        }
+
+    data_as_of = _data_as_of(db, relation)
+    age = (datetime.now(timezone.utc) - data_as_of).total_seconds() if data_as_of else None
+    # Sin registro de refresh no se sabe si está desactualizada: no se encola nada
+    is_stale = age > max_age if age is not None else None
+    enqueued = bool(is_stale) and _enqueue_refresh(relation)
+    return {
+        "source": relation,
+        "source_kind": kind,
+        "data_as_of": data_as_of,
+        "age_seconds": round(age) if age is not None else None,
+        "max_age_seconds": max_age,
+        "is_stale": is_stale,
+        "refresh_enqueued": enqueued,
+    }
+
+
+def _view_freshness(relation: str, parts) -> Dict:
+    """Freshness of a view from that of the MVs it reads: the oldest data and the tightest max age."""
+    known = all(part["data_as_of"] is not None for part in parts)
+    stale_flags = [part["is_stale"] for part in parts]
+    if any(stale_flags):
+        is_stale = True
+    else:
+        is_stale = False if known else None
+    return {
+        "source": relation,
+        "source_kind": SOURCE_VIEW,
+        "data_as_of": min(part["data_as_of"] for part in parts) if known else None,
+        "age_seconds": max(part["age_seconds"] for part in parts) if known else None,
+        "max_age_seconds": min(part["max_age_seconds"] for part in parts),
+        "is_stale": is_stale,
+        "refresh_enqueued": any(part["refresh_enqueued"] for part in parts),
+    }
+
+
+def _upstream_mvs(db: Session, relation: str) -> Set[str]:
+    global _graph_cache
+    now = time.time()
+    if _graph_cache is None or now - _graph_cache[1] >= GRAPH_CACHE_TTL:
+        try:
+            _graph_cache = (load_dependency_graph(db), now)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not load the dependency graph: {e}")
+            return set()
+    graph = _graph_cache[0]
+    return graph.upstream_mvs(relation) if relation in graph.edges else set()
+
+
+def _source_kind(db: Session, relation: str) -> str:
+    schema, name = split_name(relation)
+    return SOURCE_MV if mv_exists(db, schema, name) else SOURCE_VIEW
+
+
+def _max_age_minutes(relation: str) -> int:
+    if relation in MAX_AGE_MINUTES:
+        return MAX_AGE_MINUTES[relation]
+    for mv in CRITICAL_MVS:
+        if f"{mv['schema']}.{mv['name']}" == relation:
+            return STALENESS_SLO_MINUTES.get(mv["priority"], DEFAULT_MAX_AGE_MINUTES)
+    return DEFAULT_MAX_AGE_MINUTES
+
+
+def _data_as_of(db: Session, relation: str) -> Optional[datetime]:
+    now = time.time()
+    cached = _as_of_cache.get(relation)
+    if cached and now - cached[1] < AS_OF_CACHE_TTL:
+        return cached[0]
+
+    try:
+        schema, name = split_name(relation)
+        as_of = db.execute(text("""
+            SELECT MAX(refreshed_at)
+            FROM ops.mv_refresh_log
+            WHERE schema_name = :schema
+                AND mv_name = :mv_name
+                AND (status = 'SUCCESS' OR (status = 'SKIPPED' AND skip_reason = 'inputs_unchanged'))
+        """), {"schema": schema, "mv_name": name}).scalar()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not read freshness of {relation}: {e}")
+        return cached[0] if cached else None
+
+    _as_of_cache[relation] = (as_of, now)
+    return as_of
+
+
+def _enqueue_refresh(relation: str) -> bool:
+    """Queue a background refresh unless one was queued for `relation` recently."""
+    with _lock:
+        last = _enqueued_at.get(relation)
+        if last is not None and time.monotonic() - last < REENQUEUE_COOLDOWN_SECONDS:
+            return False
+        _enqueued_at[relation] = time.monotonic()
+    _executor.submit(_background_refresh, relation)
+    logger.info(f"{relation} is stale, background refresh queued")
+    return True
+
+
+def _background_refresh(relation: str) -> None:
+    db = MaintenanceSessionLocal()
+    try:
+        schema, name = split_name(relation)
+        result = refresh_mv(db, schema, name)
+        logger.info(f"Background refresh of {relation}: {result}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Background refresh of {relation} failed: {e}", exc_info=True)
+    finally:
+        db.close()
+        _as_of_cache.pop(relation, None)
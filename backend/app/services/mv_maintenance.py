@@ -2,14 +2,34 @@
 Materialized View maintenance service.
 
 Provides functionality to refresh materialized views and track their status.
+
+Refresh order is not hard-coded: `refresh_mvs_parallel` derives it from the
+dependency graph in the catalog (see mv_dependencies) and refreshes
+independent branches concurrently, each on its own pooled connection.
 """
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.core.db import MaintenanceSessionLocal
+from app.services.cobranza_rollup import SOURCE_MV as COBRANZA_ROLLUP_SOURCE, rebuild_rollup
+from app.services.mv_cache import get_relation_info, invalidate
+from app.services.mv_change_tracking import MvChangeTracker
+from app.services.mv_refresh_coordinator import coordinated_refresh
+from app.services.mv_refresh_metrics import (
+    METRIC_COLUMNS,
+    build_refresh_metrics,
+    capture_relation_stats,
+    lock_for_refresh,
+)
+from app.services.mv_dependencies import MvDependencyGraph, load_dependency_graph, qualify, split_name
+
 logger = logging.getLogger(__name__)
 
 # Lista de MVs críticas que deben mantenerse actualizadas
@@ -23,12 +43,29 @@ CRITICAL_MVS = [
     {"schema": "ops", "name": "mv_yango_payments_raw_current", "priority": 3},
 ]
 
+# MVs que dependen de cabinet leads (se refrescan tras procesar un upload)
+CABINET_LEADS_MVS = [
+    "ops.mv_yango_payments_ledger_latest",
+    "ops.mv_yango_payments_ledger_latest_enriched",
+    "ops.mv_cabinet_financial_14d",
+    "ops.mv_yango_cabinet_claims_for_collection",
+    "ops.mv_claims_payment_status_cabinet",
+    "ops.mv_payments_driver_matrix_cabinet",
+    "ops.mv_yango_cabinet_cobranza_enriched_14d",
+]
+
+# Tablas derivadas que se recalculan justo después de cada refresh exitoso de su MV fuente
+POST_REFRESH_REBUILDS: Dict[str, Callable[[Session], Dict]] = {
+    COBRANZA_ROLLUP_SOURCE: rebuild_rollup,
+}
+
 
 def refresh_mv(
     db: Session, 
     schema: str, 
     mv_name: str, 
-    concurrent: bool = True
+    concurrent: bool = True,
+    coalesce: bool = True
 ) -> Dict:
     """
     Refresh a single materialized view.
@@ -38,46 +75,50 @@ def refresh_mv(
         schema: Schema name
         mv_name: Materialized view name
         concurrent: Use CONCURRENTLY if possible (requires unique index)
+        coalesce: Share an in-flight or just-finished identical refresh instead of
+            running a duplicate (see mv_refresh_coordinator)
         
     Returns:
         Dict with status, duration, and any error message
     """
+    if coalesce:
+        return coordinated_refresh(
+            db, schema, mv_name,
+            lambda: _refresh_mv_now(db, schema, mv_name, concurrent)
+        )
+    return _refresh_mv_now(db, schema, mv_name, concurrent)
+
+
+def _refresh_mv_now(db: Session, schema: str, mv_name: str, concurrent: bool) -> Dict:
+    """Run REFRESH (CONCURRENTLY with fallback to a normal refresh) and log it with its metrics."""
     full_name = f"{schema}.{mv_name}"
     start_time = datetime.now(timezone.utc)
     
     try:
-        # Verificar que la MV existe
-        check = db.execute(text("""
-            SELECT EXISTS (
-                SELECT 1 FROM pg_matviews 
-                WHERE schemaname = :schema AND matviewname = :mv_name
-            )
-        """), {"schema": schema, "mv_name": mv_name})
-        
-        if not check.scalar():
+        # Verificar que la MV existe (cache de catálogo)
+        info = get_relation_info(db, schema, mv_name)
+        if not info.is_materialized:
             return {
                 "mv": full_name,
-                "status": "error",
+                "status": "skipped",
+                "reason": "does_not_exist",
                 "error": "MV does not exist",
                 "duration_seconds": 0
             }
         
-        # Intentar REFRESH CONCURRENTLY primero (más rápido, no bloquea)
-        if concurrent:
+        # Filas, tamaño y dead tuples antes del refresh (ver mv_refresh_metrics)
+        before = capture_relation_stats(db, full_name) if info.populated else {}
+        db.commit()
+        start_time = datetime.now(timezone.utc)
+        
+        # Intentar REFRESH CONCURRENTLY primero (más rápido, no bloquea).
+        # Requiere índice único y MV poblada: sin ellos se va directo al refresh normal.
+        if concurrent and info.has_unique_index and info.populated:
             try:
+                lock_wait = lock_for_refresh(db, full_name, "concurrent")
                 db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {full_name}"))
                 db.commit()
-                duration = (datetime.now(timezone.utc) - start_time).total_seconds()
-                
-                # Log del refresh
-                _log_refresh(db, schema, mv_name, "SUCCESS", duration)
-                
-                return {
-                    "mv": full_name,
-                    "status": "success",
-                    "method": "concurrent",
-                    "duration_seconds": round(duration, 2)
-                }
+                return _refresh_succeeded(db, schema, mv_name, "concurrent", start_time, lock_wait, before)
             except Exception as e:
                 db.rollback()
                 # Si CONCURRENTLY falla (sin índice único), intentar normal
@@ -86,20 +127,16 @@ def refresh_mv(
                 else:
                     raise
         
+        if concurrent and info.populated and not info.has_unique_index:
+            logger.warning(
+                f"{full_name} has no unique index, using a blocking refresh "
+                "(run jobs/provision_mv_unique_indexes.py)"
+            )
         # REFRESH normal (puede bloquear lecturas)
+        lock_wait = lock_for_refresh(db, full_name, "normal")
         db.execute(text(f"REFRESH MATERIALIZED VIEW {full_name}"))
         db.commit()
-        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
-        
-        # Log del refresh
-        _log_refresh(db, schema, mv_name, "SUCCESS", duration)
-        
-        return {
-            "mv": full_name,
-            "status": "success",
-            "method": "normal",
-            "duration_seconds": round(duration, 2)
-        }
+        return _refresh_succeeded(db, schema, mv_name, "normal", start_time, lock_wait, before)
         
     except Exception as e:
         db.rollback()
@@ -118,6 +155,47 @@ def refresh_mv(
         }
 
 
+def _refresh_succeeded(
+    db: Session,
+    schema: str,
+    mv_name: str,
+    method: str,
+    start_time: datetime,
+    lock_wait: float,
+    before: Dict
+) -> Dict:
+    """Log a successful refresh with its before/after metrics and build its result."""
+    full_name = f"{schema}.{mv_name}"
+    metrics = build_refresh_metrics(method, lock_wait, before, capture_relation_stats(db, full_name, method))
+    
+    # Contenido nuevo (y una MV sin poblar queda poblada): invalidar su metadata y los
+    # totales cacheados (count_cache) en todos los workers
+    invalidate(db, full_name)
+    db.commit()
+    # Duración medida justo antes del log: refreshed_at - duration_ms queda entre start_time y
+    # el snapshot del REFRESH (tomado después de lock_for_refresh). El coordinador solo
+    # comparte refresh iniciados después de la petición
+    duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+    
+    # Log del refresh
+    _log_refresh(db, schema, mv_name, "SUCCESS", duration, metrics=metrics)
+    
+    result = {
+        "mv": full_name,
+        "status": "success",
+        "method": method,
+        "duration_seconds": round(duration, 2),
+        "lock_wait_seconds": round(lock_wait, 2),
+        "rows_before": metrics["rows_before"],
+        "rows_after": metrics["rows_after_refresh"]
+    }
+    rebuild = POST_REFRESH_REBUILDS.get(full_name)
+    if rebuild is not None:
+        # Un fallo del rebuild no invalida el refresh: queda en el resultado
+        result["post_refresh"] = rebuild(db)
+    return result
+
+
 def refresh_all_critical_mvs(db: Session, priority: Optional[int] = None) -> Dict:
     """
     Refresh all critical materialized views.
@@ -129,36 +207,148 @@ def refresh_all_critical_mvs(db: Session, priority: Optional[int] = None) -> Dic
     Returns:
         Dict with summary and individual results
     """
-    results = []
-    total_duration = 0
-    success_count = 0
-    error_count = 0
-    
     mvs_to_refresh = CRITICAL_MVS
     if priority is not None:
         mvs_to_refresh = [mv for mv in CRITICAL_MVS if mv["priority"] <= priority]
     
-    for mv in mvs_to_refresh:
-        result = refresh_mv(db, mv["schema"], mv["name"])
-        results.append(result)
-        total_duration += result.get("duration_seconds", 0)
+    return refresh_mvs_parallel(f"{mv['schema']}.{mv['name']}" for mv in mvs_to_refresh)
+
+
+def refresh_mvs_parallel(
+    mvs: Iterable[str],
+    max_parallel: Optional[int] = None,
+    graph: Optional[MvDependencyGraph] = None,
+    refresh_fn: Optional[Callable[[str, str], Dict]] = None,
+    on_result: Optional[Callable[[Dict], None]] = None,
+    only_changed: bool = False,
+) -> Dict:
+    """
+    Refresh a set of MVs following their dependency DAG.
+    
+    An MV is submitted as soon as every MV of the set it depends on has finished,
+    so independent branches run concurrently (up to `max_parallel`) and the wall
+    time approaches the critical path of the DAG. A failed upstream does not block
+    its dependents: they refresh over the previous data, as the sequential lists did.
+    
+    Args:
+        mvs: MV names ("schema.name"; names without schema default to ops)
+        max_parallel: Concurrent refreshes (default: settings.mv_refresh_max_parallel)
+        graph: Dependency graph (loaded from the catalog if not provided)
+        refresh_fn: (schema, name) -> result dict; default refreshes on a new maintenance session
+        on_result: Callback invoked with each result as soon as it finishes
+        only_changed: Skip MVs whose transitive base tables did not change since their
+            last successful refresh (see mv_change_tracking); skips are logged with a reason
         
-        if result["status"] == "success":
-            success_count += 1
-        else:
-            error_count += 1
+    Returns:
+        Dict with summary (incl. wall time and critical path) and individual results
+    """
+    selected = list(dict.fromkeys(qualify(mv) for mv in mvs))
+    max_parallel = max(1, max_parallel or settings.mv_refresh_max_parallel)
+    refresh_fn = refresh_fn or _refresh_on_new_session
+    
+    if graph is None:
+        graph = _load_graph_or_sequential(selected)
+    
+    deps = graph.refresh_dependencies(selected)
+    remaining = {mv: set(deps.get(mv, ())) for mv in selected}
+    results: List[Dict] = []
+    wall_start = time.monotonic()
+    
+    tracker = None
+    skip: Dict[str, str] = {}
+    if only_changed:
+        tracker = MvChangeTracker(MaintenanceSessionLocal(), graph, settings.mv_refresh_max_skip_minutes)
+        try:
+            _, skip = tracker.plan(selected, deps)
+        except Exception as e:
+            tracker.db.rollback()
+            logger.warning(f"Change tracking unavailable, refreshing all MVs: {e}")
+    
+    def complete(mv: str, result: Dict) -> None:
+        results.append(result)
+        # Un refresh compartido pudo empezar antes del snapshot: no se registra como estado
+        if tracker and result["status"] == "success" and not result.get("coalesced"):
+            tracker.record_success(mv)
+        if on_result:
+            on_result(result)
+        for pending in remaining.values():
+            pending.discard(mv)
+    
+    try:
+        for mv, reason in skip.items():
+            del remaining[mv]
+            schema, name = split_name(mv)
+            _log_refresh(tracker.db, schema, name, "SKIPPED", 0, skip_reason=reason)
+            complete(mv, {"mv": mv, "status": "skipped", "reason": reason, "duration_seconds": 0})
+    
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            running = {}
+            while remaining or running:
+                ready = [mv for mv, pending in remaining.items() if not pending]
+                if not ready and not running:
+                    # Solo ocurre con un ciclo en el grafo: refrescar el resto en el orden recibido
+                    logger.warning(f"Dependency cycle among {sorted(remaining)}; refreshing in given order")
+                    ready = [next(iter(remaining))]
+                for mv in ready:
+                    del remaining[mv]
+                    schema, name = split_name(mv)
+                    running[executor.submit(refresh_fn, schema, name)] = mv
+            
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    mv = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"mv": mv, "status": "error", "error": str(e)[:200], "duration_seconds": 0}
+                    complete(mv, result)
+    finally:
+        if tracker:
+            tracker.db.close()
+    
+    durations = {r["mv"]: r.get("duration_seconds", 0) or 0 for r in results}
+    path, path_seconds = graph.critical_path(selected, durations)
+    success_count = sum(1 for r in results if r["status"] == "success")
+    skipped_count = sum(1 for r in results if r["status"] == "skipped")
     
     return {
         "summary": {
             "total": len(results),
             "success": success_count,
-            "errors": error_count,
-            "total_duration_seconds": round(total_duration, 2)
+            "skipped": skipped_count,
+            "errors": len(results) - success_count - skipped_count,
+            "total_duration_seconds": round(sum(durations.values()), 2),
+            "wall_seconds": round(time.monotonic() - wall_start, 2),
+            "max_parallel": max_parallel,
+            "critical_path": path,
+            "critical_path_seconds": path_seconds
         },
         "results": results
     }
 
 
+def _load_graph_or_sequential(mvs: List[str]) -> MvDependencyGraph:
+    """Catalog dependency graph; if it cannot be read, chain `mvs` in the given order."""
+    db = MaintenanceSessionLocal()
+    try:
+        return load_dependency_graph(db)
+    except Exception as e:
+        logger.warning(f"Could not load MV dependency graph, refreshing sequentially: {e}")
+        edges = {mv: {prev} for prev, mv in zip(mvs, mvs[1:])}
+        return MvDependencyGraph(edges, {mv: "m" for mv in mvs})
+    finally:
+        db.close()
+
+
+def _refresh_on_new_session(schema: str, mv_name: str) -> Dict:
+    """Refresh one MV on its own maintenance-profile session (one pooled connection per concurrent refresh)."""
+    db = MaintenanceSessionLocal()
+    try:
+        return refresh_mv(db, schema, mv_name)
+    finally:
+        db.close()
+
+
 def get_mv_status(db: Session) -> List[Dict]:
     """
     Get the current status of all critical MVs.
@@ -170,15 +360,10 @@ def get_mv_status(db: Session) -> List[Dict]:
     
     for mv in CRITICAL_MVS:
         try:
-            # Primero verificar si existe la MV
-            exists_check = db.execute(text("""
-                SELECT EXISTS (
-                    SELECT 1 FROM pg_matviews 
-                    WHERE schemaname = :schema AND matviewname = :mv_name
-                )
-            """), {"schema": mv["schema"], "mv_name": mv["name"]})
+            # Existencia y estado de población desde la cache de catálogo
+            info = get_relation_info(db, mv["schema"], mv["name"])
             
-            if not exists_check.scalar():
+            if not info.is_materialized:
                 results.append({
                     "schema": mv["schema"],
                     "name": mv["name"],
@@ -187,23 +372,19 @@ def get_mv_status(db: Session) -> List[Dict]:
                 })
                 continue
             
-            # Obtener información de la MV
+            # Tamaño de la MV (cambia con cada refresh, no se cachea)
             full_name = f"{mv['schema']}.{mv['name']}"
-            info = db.execute(text("""
-                SELECT 
-                    m.ispopulated,
-                    pg_size_pretty(pg_relation_size(format('%I.%I', m.schemaname, m.matviewname)::regclass)) AS size
-                FROM pg_matviews m
-                WHERE m.schemaname = :schema AND m.matviewname = :mv_name
-            """), {"schema": mv["schema"], "mv_name": mv["name"]}).fetchone()
+            size = db.execute(text("""
+                SELECT pg_size_pretty(pg_relation_size(to_regclass(:full_name)))
+            """), {"full_name": full_name}).scalar()
             
             # Obtener último refresh del log (columnas pueden variar según versión de la tabla)
             try:
                 log_info = db.execute(text("""
-                    SELECT refreshed_at, status, 
-                           COALESCE(duration_seconds, duration_ms / 1000.0) as duration_secs
+                    SELECT refreshed_at, status, duration_ms / 1000.0 as duration_secs
                     FROM ops.mv_refresh_log
                     WHERE schema_name = :schema AND mv_name = :mv_name
+                      AND status <> 'SKIPPED'
                     ORDER BY refreshed_at DESC
                     LIMIT 1
                 """), {"schema": mv["schema"], "mv_name": mv["name"]}).fetchone()
@@ -215,8 +396,8 @@ def get_mv_status(db: Session) -> List[Dict]:
                 "name": mv["name"],
                 "priority": mv["priority"],
                 "exists": True,
-                "populated": info.ispopulated if info else False,
-                "size": info.size if info else "N/A"
+                "populated": bool(info.populated),
+                "size": size or "N/A"
             }
             
             if log_info:
@@ -250,23 +431,41 @@ def _log_refresh(
     mv_name: str, 
     status: str, 
     duration: float,
-    error_message: Optional[str] = None
+    error_message: Optional[str] = None,
+    skip_reason: Optional[str] = None,
+    metrics: Optional[Dict] = None
 ) -> None:
-    """Log a refresh attempt to the mv_refresh_log table."""
+    """Log a refresh attempt (or a skipped refresh) to the mv_refresh_log table."""
+    params = {
+        "schema": schema,
+        "mv_name": mv_name,
+        "status": status,
+        "duration_ms": int(duration * 1000),
+        "error": error_message,
+        "skip_reason": skip_reason
+    }
     try:
-        db.execute(text("""
-            INSERT INTO ops.mv_refresh_log 
-            (schema_name, mv_name, refreshed_at, status, duration_seconds, error_message)
-            VALUES (:schema, :mv_name, NOW(), :status, :duration, :error)
-        """), {
-            "schema": schema,
-            "mv_name": mv_name,
-            "status": status,
-            "duration": duration,
-            "error": error_message
-        })
+        if metrics:
+            columns = ", ".join(METRIC_COLUMNS)
+            values = ", ".join(f":{column}" for column in METRIC_COLUMNS)
+            db.execute(text(f"""
+                INSERT INTO ops.mv_refresh_log 
+                (schema_name, mv_name, refreshed_at, status, duration_ms, error_message, skip_reason, {columns})
+                VALUES (:schema, :mv_name, NOW(), :status, :duration_ms, :error, :skip_reason, {values})
+            """), {**params, **{column: metrics.get(column) for column in METRIC_COLUMNS}})
+        else:
+            db.execute(text("""
+                INSERT INTO ops.mv_refresh_log 
+                (schema_name, mv_name, refreshed_at, status, duration_ms, error_message, skip_reason)
+                VALUES (:schema, :mv_name, NOW(), :status, :duration_ms, :error, :skip_reason)
+            """), params)
         db.commit()
     except Exception as e:
         # Si falla el log, no interrumpir el proceso
         db.rollback()
+        if metrics:
+            # Log sin métricas (migración 025 aún no aplicada)
+            logger.warning(f"Failed to log refresh metrics, logging without them: {e}")
+            _log_refresh(db, schema, mv_name, status, duration, error_message, skip_reason)
+            return
         logger.warning(f"Failed to log refresh: {e}")
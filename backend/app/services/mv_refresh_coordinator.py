@@ -0,0 +1,145 @@
+"""
+Refresh coordination for materialized views.
+
+Refreshes are requested from the ops API, the auto-processor, the cabinet leads
+processor, CSV uploads and scripts. Two identical REFRESH statements would
+only queue behind each other on the MV lock and do the same work twice.
+`coordinated_refresh` serialises refreshes of one MV through a session-level
+Postgres advisory lock, which works across threads, workers and processes.
+
+- The caller waits while another refresh of the MV holds the lock.
+- A request is answered with an existing result only if that refresh started at
+  or after the request, so it saw every change committed before the request.
+- A refresh already running when the request arrived may have missed those
+  changes. The caller waits for it and then runs a follow-up refresh.
+
+A burst of requests therefore collapses into at most two REFRESHes: the one in
+flight and one follow-up shared by everything that arrived during it. The shared
+result is read from ops.mv_refresh_log, so it is visible to every process.
+"""
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Primer entero de la clave de advisory lock (dos int4): espacio de nombres de refresh de MVs
+ADVISORY_LOCK_NAMESPACE = 0x4D56
+LOCK_POLL_SECONDS = 0.5
+
+
+def coordinated_refresh(
+    db: Session,
+    schema: str,
+    mv_name: str,
+    refresh_fn: Callable[[], Dict],
+    wait_timeout_seconds: Optional[int] = None,
+) -> Dict:
+    """
+    Run `refresh_fn` for schema.mv_name unless an equivalent refresh can be shared.
+
+    The returned dict is `refresh_fn`'s result, or, when coalesced, a result
+    built from the shared refresh with `coalesced=True`.
+    """
+    full_name = f"{schema}.{mv_name}"
+    wait_timeout = settings.mv_refresh_wait_timeout_seconds if wait_timeout_seconds is None else wait_timeout_seconds
+
+    # Conexión propia: el lock es de sesión y la Session puede devolver su conexión al pool en cada commit
+    conn = db.get_bind().connect()
+    try:
+        requested_at = conn.execute(text("SELECT clock_timestamp()")).scalar()
+        conn.commit()
+
+        waited = _acquire(conn, full_name, wait_timeout)
+        if waited is None:
+            return {
+                "mv": full_name,
+                "status": "error",
+                "error": f"Timed out after {wait_timeout}s waiting for an in-flight refresh",
+                "duration_seconds": 0
+            }
+        try:
+            shared = _shared_refresh(conn, schema, mv_name, requested_at)
+            if shared:
+                logger.info(f"Refresh of {full_name} coalesced with refresh at {shared['shared_refresh_at']}")
+                shared["waited_seconds"] = round(waited, 2)
+                return shared
+            result = refresh_fn()
+            if waited:
+                result["waited_seconds"] = round(waited, 2)
+            return result
+        finally:
+            _release(conn, full_name)
+    finally:
+        conn.close()
+
+
+def _acquire(conn, full_name: str, wait_timeout: int) -> Optional[float]:
+    """Take the MV's advisory lock, polling while another session holds it. Returns seconds waited."""
+    start = time.monotonic()
+    while True:
+        acquired = conn.execute(
+            text("SELECT pg_try_advisory_lock(:ns, hashtext(:name))"),
+            {"ns": ADVISORY_LOCK_NAMESPACE, "name": full_name}
+        ).scalar()
+        conn.commit()
+        if acquired:
+            return time.monotonic() - start
+        if time.monotonic() - start >= wait_timeout:
+            return None
+        time.sleep(LOCK_POLL_SECONDS)
+
+
+def _release(conn, full_name: str) -> None:
+    try:
+        conn.execute(
+            text("SELECT pg_advisory_unlock(:ns, hashtext(:name))"),
+            {"ns": ADVISORY_LOCK_NAMESPACE, "name": full_name}
+        )
+        conn.commit()
+    except Exception as e:
+        # Al cerrar la conexión el lock se libera de todos modos
+        logger.warning(f"Failed to release refresh lock for {full_name}: {e}")
+
+
+def _shared_refresh(conn, schema: str, mv_name: str, requested_at) -> Optional[Dict]:
+    """Latest successful refresh that started at or after the request arrived."""
+    try:
+        row = _latest_covering_refresh(conn, schema, mv_name, requested_at)
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Could not read ops.mv_refresh_log, not coalescing: {e}")
+        return None
+    if not row:
+        return None
+    return {
+        "mv": f"{schema}.{mv_name}",
+        "status": "success",
+        "method": "coalesced",
+        "coalesced": True,
+        "shared_refresh_at": row.refreshed_at.isoformat(),
+        "duration_seconds": 0
+    }
+
+
+def _latest_covering_refresh(conn, schema: str, mv_name: str, requested_at):
+    # Inicio del refresh = refreshed_at (se registra al terminar) - duration_ms; sin duración
+    # no se puede saber si empezó antes de la petición y no se comparte
+    row = conn.execute(text("""
+        SELECT refreshed_at, duration_ms
+        FROM ops.mv_refresh_log
+        WHERE schema_name = :schema
+            AND mv_name = :mv_name
+            AND status = 'SUCCESS'
+            AND duration_ms IS NOT NULL
+            AND refreshed_at - duration_ms * INTERVAL '1 millisecond' >= :requested_at
+        ORDER BY refreshed_at DESC
+        LIMIT 1
+    """), {"schema": schema, "mv_name": mv_name, "requested_at": requested_at}).fetchone()
+    conn.commit()
+    return row
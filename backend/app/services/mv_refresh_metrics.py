@@ -0,0 +1,188 @@
+"""
+Refresh observability for materialized views.
+
+Each refresh snapshots its MV before and after: row count, table and index
+size, and dead tuples. It also measures how long it waited for the MV lock.
+These metrics are stored with the refresh in ops.mv_refresh_log.
+
+Row counts come from the catalog, never from COUNT(*), which would add two full
+scans to every refresh. They are estimates (`estimate_rows`):
+- a normal REFRESH swaps in a new heap and rebuilds its indexes, which sets
+  pg_class.reltuples;
+- a CONCURRENTLY refresh applies a diff with DELETE/INSERT. Only
+  pg_stat_user_tables.n_live_tup follows it, and reltuples stays as the last
+  VACUUM/ANALYZE left it.
+
+A CONCURRENTLY refresh applies a diff with DELETE/INSERT. Dead tuples and
+index bloat therefore accumulate until vacuum. `bloat_recommendations`
+compares the latest refresh with the MV's own best bytes-per-row over recent
+refreshes and suggests VACUUM / REINDEX when thresholds are crossed.
+"""
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Umbrales de recomendación
+VACUUM_DEAD_TUPLE_RATIO = 0.2
+VACUUM_MIN_DEAD_TUPLES = 10000
+BLOAT_GROWTH_RATIO = 1.5
+BASELINE_DAYS = 30
+
+# Columnas de ops.mv_refresh_log (migración 025) que guarda _log_refresh
+METRIC_COLUMNS = (
+    "refresh_method",
+    "lock_wait_ms",
+    "rows_before",
+    "rows_after_refresh",
+    "table_bytes_before",
+    "table_bytes_after",
+    "index_bytes_before",
+    "index_bytes_after",
+    "dead_tuples_before",
+    "dead_tuples_after",
+)
+
+# Modo de lock que toma cada método de REFRESH
+REFRESH_LOCK_MODES = {
+    "concurrent": "EXCLUSIVE",
+    "normal": "ACCESS EXCLUSIVE",
+}
+
+
+def capture_relation_stats(db: Session, full_name: str, method: Optional[str] = None) -> Dict:
+    """
+    Rows (estimated, see `estimate_rows`), table/index bytes and dead tuples of an MV
+    (empty dict if they cannot be read). `method` is the refresh just applied, if any.
+    """
+    try:
+        row = db.execute(text("""
+            SELECT
+                c.reltuples,
+                s.n_live_tup,
+                pg_table_size(c.oid) AS table_bytes,
+                pg_indexes_size(c.oid) AS index_bytes,
+                s.n_dead_tup AS dead_tuples
+            FROM pg_class c
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = to_regclass(:full_name)
+        """), {"full_name": full_name}).fetchone()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not capture refresh stats of {full_name}: {e}")
+        return {}
+    if row is None:
+        return {}
+    return {
+        "rows": estimate_rows(row.reltuples, row.n_live_tup, method),
+        "table_bytes": row.table_bytes,
+        "index_bytes": row.index_bytes,
+        "dead_tuples": row.dead_tuples,
+    }
+
+
+def estimate_rows(reltuples: Optional[float], n_live_tup: Optional[int], method: Optional[str] = None) -> Optional[int]:
+    """
+    Row estimate of an MV from the catalog: n_live_tup right after a CONCURRENTLY
+    refresh, reltuples otherwise (-1 = never analyzed, then n_live_tup).
+    """
+    if method == "concurrent" and n_live_tup is not None:
+        return int(n_live_tup)
+    if reltuples is not None and reltuples >= 0:
+        return int(reltuples)
+    return int(n_live_tup) if n_live_tup is not None else None
+
+
+def lock_for_refresh(db: Session, full_name: str, method: str) -> float:
+    """
+    Take the lock REFRESH would take, in the current transaction, and return the
+    seconds spent waiting for it. The REFRESH then runs without waiting again.
+    """
+    started = time.monotonic()
+    db.execute(text(f"LOCK TABLE {full_name} IN {REFRESH_LOCK_MODES[method]} MODE"))
+    return time.monotonic() - started
+
+
+def build_refresh_metrics(method: str, lock_wait_seconds: Optional[float], before: Dict, after: Dict) -> Dict:
+    """Map before/after snapshots to the mv_refresh_log metric columns."""
+    return {
+        "refresh_method": method,
+        "lock_wait_ms": int(lock_wait_seconds * 1000) if lock_wait_seconds is not None else None,
+        "rows_before": before.get("rows"),
+        "rows_after_refresh": after.get("rows"),
+        "table_bytes_before": before.get("table_bytes"),
+        "table_bytes_after": after.get("table_bytes"),
+        "index_bytes_before": before.get("index_bytes"),
+        "index_bytes_after": after.get("index_bytes"),
+        "dead_tuples_before": before.get("dead_tuples"),
+        "dead_tuples_after": after.get("dead_tuples"),
+    }
+
+
+def bloat_recommendations(latest: Dict, baseline: Optional[Dict] = None) -> List[str]:
+    """
+    VACUUM / REINDEX recommendations for an MV.
+
+    Args:
+        latest: Metric columns of its latest refresh
+        baseline: Lowest table/index bytes per row over recent refreshes
+            ({"table_bytes_per_row", "index_bytes_per_row"})
+    """
+    recommendations = []
+    rows = latest.get("rows_after_refresh") or 0
+    dead = latest.get("dead_tuples_after") or 0
+    if dead >= VACUUM_MIN_DEAD_TUPLES and dead > VACUUM_DEAD_TUPLE_RATIO * max(rows, 1):
+        recommendations.append(f"VACUUM ANALYZE: {dead} dead tuples for {rows} rows")
+
+    if rows and baseline:
+        table_per_row = (latest.get("table_bytes_after") or 0) / rows
+        index_per_row = (latest.get("index_bytes_after") or 0) / rows
+        best_table = baseline.get("table_bytes_per_row")
+        best_index = baseline.get("index_bytes_per_row")
+        if best_index and index_per_row > BLOAT_GROWTH_RATIO * best_index:
+            recommendations.append(
+                f"REINDEX TABLE CONCURRENTLY: indexes use {index_per_row:.0f} bytes/row "
+                f"(best recent {best_index:.0f})"
+            )
+        if best_table and table_per_row > BLOAT_GROWTH_RATIO * best_table:
+            recommendations.append(
+                f"VACUUM FULL or a non-concurrent REFRESH: table uses {table_per_row:.0f} bytes/row "
+                f"(best recent {best_table:.0f})"
+            )
+    return recommendations
+
+
+def load_baselines(db: Session, mvs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
+    """Lowest bytes per row of each (schema, mv_name) over its recent successful refreshes."""
+    mvs = list(mvs)
+    if not mvs:
+        return {}
+    try:
+        rows = db.execute(text("""
+            SELECT
+                schema_name,
+                mv_name,
+                MIN(table_bytes_after::numeric / rows_after_refresh) AS table_bytes_per_row,
+                MIN(index_bytes_after::numeric / rows_after_refresh) AS index_bytes_per_row
+            FROM ops.mv_refresh_log
+            WHERE status = 'SUCCESS'
+                AND rows_after_refresh > 0
+                AND refreshed_at >= NOW() - :days * INTERVAL '1 day'
+                AND schema_name || '.' || mv_name = ANY(CAST(:mvs AS text[]))
+            GROUP BY schema_name, mv_name
+        """), {"days": BASELINE_DAYS, "mvs": [f"{s}.{n}" for s, n in mvs]}).fetchall()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not load refresh baselines: {e}")
+        return {}
+    return {
+        (row.schema_name, row.mv_name): {
+            "table_bytes_per_row": float(row.table_bytes_per_row) if row.table_bytes_per_row else None,
+            "index_bytes_per_row": float(row.index_bytes_per_row) if row.index_bytes_per_row else None,
+        }
+        for row in rows
+    }
@@ -0,0 +1,250 @@
+"""
+Adaptive refresh scheduling for materialized views.
+
+Each critical MV gets a refresh interval and a time slot. They are derived from:
+- its refresh cost: the p75 duration of recent successful refreshes in ops.mv_refresh_log;
+- its read frequency: API reads counted by every worker (app/services/api_reads.py)
+  in ops.mv_read_stats, charged to the MVs behind the views they read. Scans by
+  the refresh machinery itself are not counted, so refreshing more often does not
+  raise an MV's read frequency;
+- a staleness SLO per priority, and a database time budget for refreshes per hour.
+
+Within the budget, the intervals minimise read-weighted staleness:
+interval ~ sqrt(cost / reads). Hot, cheap MVs are refreshed often; cold,
+expensive ones rarely. An MV is never refreshed less often than its SLO allows, and never
+more often than the minimum interval. Expensive MVs with a daily SLO are moved to the
+off-peak window.
+"""
+import logging
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.api_reads import attribute_reads, flush as flush_api_reads
+from app.services.mv_dependencies import load_dependency_graph
+
+logger = logging.getLogger(__name__)
+
+# SLO de staleness por prioridad (1 = más crítica)
+STALENESS_SLO_MINUTES = {1: 60, 2: 240, 3: 1440}
+# Solo MVs con SLO de al menos un día pueden quedar en la ventana off-peak
+OFFPEAK_MIN_SLO_MINUTES = 1440
+# Coste asumido sin historial de refresh
+DEFAULT_COST_SECONDS = 60.0
+# Piso de lecturas/hora (una MV sin lecturas no tiene intervalo infinito: la limita su SLO)
+MIN_READS_PER_HOUR = 0.1
+COST_HISTORY_SIZE = 20
+READ_WINDOW_HOURS = 24
+
+SLOT_ANYTIME = "anytime"
+SLOT_OFFPEAK = "offpeak"
+
+
+@dataclass(frozen=True)
+class MvRefreshStats:
+    """Inputs of the planner for one MV."""
+    mv: str
+    priority: int
+    cost_seconds: float
+    reads_per_hour: float
+
+
+def plan_schedule(
+    stats: List[MvRefreshStats],
+    budget_seconds_per_hour: float,
+    min_interval_minutes: float,
+    offpeak_cost_seconds: float,
+) -> Tuple[List[Dict], Dict]:
+    """
+    Per-MV refresh interval and slot, plus a summary of the planned load.
+
+    Off-peak MVs run once per SLO period in the off-peak window and do not count
+    against the budget, which applies to the `anytime` MVs.
+    """
+    plan: Dict[str, Dict] = {}
+    anytime = []
+    for s in stats:
+        slo = STALENESS_SLO_MINUTES.get(s.priority, max(STALENESS_SLO_MINUTES.values()))
+        entry = {
+            "mv": s.mv,
+            "priority": s.priority,
+            "slo_minutes": slo,
+            "cost_seconds": round(s.cost_seconds, 2),
+            "reads_per_hour": round(s.reads_per_hour, 2),
+        }
+        if s.cost_seconds >= offpeak_cost_seconds and slo >= OFFPEAK_MIN_SLO_MINUTES:
+            entry.update(slot=SLOT_OFFPEAK, interval_minutes=slo)
+        else:
+            entry["slot"] = SLOT_ANYTIME
+            anytime.append(s)
+        plan[s.mv] = entry
+
+    weights = {
+        s.mv: math.sqrt(max(s.cost_seconds, 0.1) * max(s.reads_per_hour, MIN_READS_PER_HOUR))
+        for s in anytime
+    }
+    # interval_i = alpha * sqrt(cost_i / reads_i) con alpha tal que Σ cost_i * 3600 / interval_i = budget
+    alpha = 3600 * sum(weights.values()) / max(budget_seconds_per_hour, 1.0)
+    for s in anytime:
+        ideal_seconds = alpha * math.sqrt(max(s.cost_seconds, 0.1) / max(s.reads_per_hour, MIN_READS_PER_HOUR))
+        slo = plan[s.mv]["slo_minutes"]
+        plan[s.mv]["interval_minutes"] = round(min(max(ideal_seconds / 60, min_interval_minutes), slo), 1)
+
+    planned_load = 0.0
+    for entry in plan.values():
+        entry["load_seconds_per_hour"] = round(entry["cost_seconds"] * 60 / entry["interval_minutes"], 2)
+        if entry["slot"] == SLOT_ANYTIME:
+            planned_load += entry["load_seconds_per_hour"]
+
+    summary = {
+        "budget_seconds_per_hour": budget_seconds_per_hour,
+        "planned_load_seconds_per_hour": round(planned_load, 2),
+        # Si el SLO obliga a superar el presupuesto, se prioriza el SLO y se reporta aquí
+        "within_budget": planned_load <= budget_seconds_per_hour,
+    }
+    return list(plan.values()), summary
+
+
+def is_due(entry: Dict, last_fresh_at: Optional[datetime], now: datetime, offpeak: bool) -> bool:
+    """Whether a planned MV should be refreshed now."""
+    if entry["slot"] == SLOT_OFFPEAK and not offpeak:
+        return False
+    if last_fresh_at is None:
+        return True
+    return now - last_fresh_at >= timedelta(minutes=entry["interval_minutes"])
+
+
+def in_offpeak_window(hour: int, window: str) -> bool:
+    """`window` is "start-end" in local hours, end exclusive; it may wrap around midnight."""
+    start, end = (int(h) for h in window.split("-", 1))
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def load_stats(db: Session, mvs: List[Dict]) -> Tuple[List[MvRefreshStats], Dict[str, Optional[datetime]]]:
+    """Cost, read frequency and last fresh time of each MV ({"schema", "name", "priority"} dicts)."""
+    names = [f"{mv['schema']}.{mv['name']}" for mv in mvs]
+    history = {
+        row.mv: row for row in db.execute(text("""
+            SELECT
+                mv,
+                percentile_cont(0.75) WITHIN GROUP (ORDER BY duration_ms) FILTER (
+                    WHERE status = 'SUCCESS' AND duration_ms IS NOT NULL AND rn <= :history
+                ) / 1000.0 AS cost_seconds,
+                MAX(refreshed_at) FILTER (
+                    WHERE status = 'SUCCESS' OR (status = 'SKIPPED' AND skip_reason = 'inputs_unchanged')
+                ) AS last_fresh_at
+            FROM (
+                SELECT
+                    schema_name || '.' || mv_name AS mv,
+                    refreshed_at,
+                    status,
+                    skip_reason,
+                    duration_ms,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY schema_name, mv_name, (status = 'SUCCESS' AND duration_ms IS NOT NULL)
+                        ORDER BY refreshed_at DESC
+                    ) AS rn
+                FROM ops.mv_refresh_log
+                WHERE schema_name || '.' || mv_name = ANY(CAST(:mvs AS text[]))
+            ) log
+            GROUP BY mv
+        """), {"mvs": names, "history": COST_HISTORY_SIZE})
+    }
+    reads = _reads_per_hour(db, names)
+
+    stats = []
+    last_fresh: Dict[str, Optional[datetime]] = {}
+    for mv, name in zip(mvs, names):
+        row = history.get(name)
+        cost = row.cost_seconds if row is not None and row.cost_seconds is not None else DEFAULT_COST_SECONDS
+        stats.append(MvRefreshStats(
+            mv=name,
+            priority=mv["priority"],
+            cost_seconds=float(cost),
+            reads_per_hour=reads.get(name, 0.0),
+        ))
+        last_fresh[name] = row.last_fresh_at if row is not None else None
+    return stats, last_fresh
+
+
+def build_plan(db: Session, mvs: List[Dict]) -> Tuple[List[Dict], Dict, Dict[str, Optional[datetime]]]:
+    stats, last_fresh = load_stats(db, mvs)
+    plan, summary = plan_schedule(
+        stats,
+        budget_seconds_per_hour=settings.mv_refresh_budget_seconds_per_hour,
+        min_interval_minutes=settings.mv_refresh_min_interval_minutes,
+        offpeak_cost_seconds=settings.mv_refresh_offpeak_cost_seconds,
+    )
+    return plan, summary, last_fresh
+
+
+def run_adaptive_refresh(db: Session) -> Dict:
+    """One scheduler tick: store this worker's API reads, plan, and refresh the MVs that are due."""
+    from app.services.mv_maintenance import CRITICAL_MVS, refresh_mvs_parallel
+
+    flush_api_reads(db)
+    plan, summary, last_fresh = build_plan(db, CRITICAL_MVS)
+    now = datetime.now(timezone.utc)
+    offpeak = in_offpeak_window(datetime.now().hour, settings.mv_refresh_offpeak_hours)
+    due = [entry["mv"] for entry in plan if is_due(entry, last_fresh.get(entry["mv"]), now, offpeak)]
+
+    result = {"plan_summary": summary, "offpeak": offpeak, "due": due, "refresh": None}
+    if due:
+        result["refresh"] = refresh_mvs_parallel(due, only_changed=True)["summary"]
+    logger.info(f"Adaptive MV refresh tick: {result}")
+    return result
+
+
+def get_schedule_status(db: Session) -> Dict:
+    """Current plan and staleness SLO compliance (does not sample or refresh)."""
+    from app.services.mv_maintenance import CRITICAL_MVS
+
+    plan, summary, last_fresh = build_plan(db, CRITICAL_MVS)
+    now = datetime.now(timezone.utc)
+    violations = []
+    for entry in plan:
+        fresh_at = last_fresh.get(entry["mv"])
+        staleness = (now - fresh_at).total_seconds() / 60 if fresh_at else None
+        entry["last_fresh_at"] = fresh_at.isoformat() if fresh_at else None
+        entry["staleness_minutes"] = round(staleness, 1) if staleness is not None else None
+        entry["slo_compliant"] = staleness is not None and staleness <= entry["slo_minutes"]
+        if not entry["slo_compliant"]:
+            violations.append(entry["mv"])
+
+    compliant = len(plan) - len(violations)
+    return {
+        "plan": plan,
+        "summary": summary,
+        "slo": {
+            "compliant": compliant,
+            "total": len(plan),
+            "compliance_pct": round(100.0 * compliant / len(plan), 1) if plan else 100.0,
+            "violations": violations,
+        },
+        "offpeak_hours": settings.mv_refresh_offpeak_hours,
+    }
+
+
+def _reads_per_hour(db: Session, mvs: List[str]) -> Dict[str, float]:
+    rows = db.execute(text("""
+        SELECT
+            schema_name || '.' || mv_name AS relation,
+            SUM(read_count) AS reads,
+            EXTRACT(EPOCH FROM NOW() - MIN(MIN(sampled_at)) OVER ()) / 3600 AS hours
+        FROM ops.mv_read_stats
+        WHERE sampled_at >= NOW() - :hours * INTERVAL '1 hour'
+        GROUP BY 1
+    """), {"hours": READ_WINDOW_HOURS}).fetchall()
+    if not rows:
+        return {}
+    # Horas cubiertas por las muestras (al menos una: el primer flush trae lecturas anteriores)
+    hours = min(max(float(rows[0].hours or 0), 1.0), READ_WINDOW_HOURS)
+    per_mv = attribute_reads({row.relation: float(row.reads) for row in rows}, load_dependency_graph(db))
+    return {mv: per_mv[mv] / hours for mv in mvs if mv in per_mv}
@@ -0,0 +1,259 @@
+"""
+Unique-key provisioning for materialized views.
+
+REFRESH MATERIALIZED VIEW CONCURRENTLY needs a unique index on plain columns,
+without a WHERE clause, that covers every row. Without one, refresh_mv falls
+back to a blocking refresh that locks out readers.
+
+For each MV without such an index, `provision_unique_index`:
+1. builds candidate keys:
+   - from the definition: DISTINCT ON / GROUP BY columns of the top-level
+     SELECT that are output columns. Both apply after every join of that
+     SELECT, so they bound the grain of the result. A GROUP BY or DISTINCT ON
+     in a CTE or subquery does not: a later join can still fan its rows out.
+     A top-level UNION/INTERSECT/EXCEPT yields no definition key;
+   - from the data: key-like columns ranked by pg_stats n_distinct. Combinations
+     whose distinct estimate cannot reach the row count are discarded;
+2. verifies each candidate against the data: no NULLs and no duplicates;
+3. creates `ux_<mv>_grain` with CREATE UNIQUE INDEX CONCURRENTLY on the first
+   definition key that holds. The definition guarantees it on every refresh.
+
+A data key only shows that today's rows happen to be unique. If a later refresh
+produced a duplicate, the index would make that REFRESH fail. Data keys that hold
+are therefore never applied: the MV is reported as `needs_confirmation` with the
+keys and the DDL to run once someone has confirmed the grain. MVs with no
+verifiable key are reported as unkeyable.
+
+Run from jobs/provision_mv_unique_indexes.py.
+"""
+import logging
+import re
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.mv_cache import get_relation_info, invalidate
+from app.services.mv_dependencies import split_name
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_COLUMNS = 3
+MAX_CANDIDATES_CHECKED = 12
+# Columnas que suelen formar parte del grano (ids, fechas, milestones, semanas)
+KEY_LIKE_COLUMN = re.compile(r"(^id$|_id$|_key$|_pk$|^milestone|_value$|_date$|^week|^iso_week|^pay_week)")
+
+SOURCE_DEFINITION = "definition"
+SOURCE_DATA = "data"
+
+_DISTINCT_ON = re.compile(r"\bDISTINCT\s+ON\s*\(([^()]*)\)", re.IGNORECASE)
+# pg_get_viewdef(pretty) escribe cada GROUP BY en una línea; una expresión con paréntesis
+# corta la captura y deja un fragmento que no es columna de salida, con lo que se descarta
+_GROUP_BY = re.compile(r"\bGROUP\s+BY\s+([^\n;()]*)", re.IGNORECASE)
+_SET_OPERATION = re.compile(r"\b(UNION|INTERSECT|EXCEPT)\b", re.IGNORECASE)
+
+
+def top_level_mask(definition: str) -> str:
+    """
+    `definition` with every character outside the top-level query (inside parentheses:
+    CTE bodies, subqueries, function arguments) and inside literals or quoted
+    identifiers replaced by a space. Same length, so positions match.
+    """
+    masked = []
+    depth = 0
+    quote = None
+    for char in definition:
+        if quote:
+            masked.append(" ")
+            # '' y "" (comilla escapada) cierran y reabren: el resultado es el mismo
+            if char == quote:
+                quote = None
+            continue
+        if char in ("'", '"'):
+            quote = char
+            masked.append(" ")
+            continue
+        if char == "(":
+            depth += 1
+            masked.append(char if depth == 1 else " ")
+            continue
+        if char == ")":
+            masked.append(char if depth == 1 else " ")
+            depth = max(depth - 1, 0)
+            continue
+        masked.append(char if depth == 0 else " ")
+    return "".join(masked)
+
+
+def definition_key_candidates(definition: str, columns: Sequence[str]) -> List[Tuple[str, ...]]:
+    """
+    DISTINCT ON / GROUP BY column lists of the top-level SELECT of `definition` whose
+    expressions are all plain output columns (a table prefix is ignored), shortest first.
+    """
+    top_level = top_level_mask(definition)
+    if _SET_OPERATION.search(top_level):
+        return []
+    output = set(columns)
+    candidates = []
+    matches = list(_DISTINCT_ON.finditer(definition)) + list(_GROUP_BY.finditer(definition))
+    for match in matches:
+        # La palabra clave tiene que estar en la consulta de nivel superior (no en una CTE o subconsulta)
+        if top_level[match.start()] == " ":
+            continue
+        key = []
+        for expression in match.group(1).split(","):
+            column = expression.strip().strip("()").split(".")[-1].strip().strip('"')
+            if column not in output:
+                break
+            key.append(column)
+        else:
+            if key and tuple(key) not in candidates:
+                candidates.append(tuple(key))
+    return sorted(candidates, key=len)
+
+
+def data_key_candidates(
+    column_stats: Dict[str, Tuple[float, float]],
+    row_estimate: float,
+    max_columns: int = MAX_KEY_COLUMNS,
+) -> List[Tuple[str, ...]]:
+    """
+    Key-like column combinations that could be unique given pg_stats.
+
+    Args:
+        column_stats: column -> (n_distinct as in pg_stats, null_frac)
+        row_estimate: reltuples of the MV
+    """
+    def distinct(column: str) -> float:
+        n_distinct, _ = column_stats[column]
+        return -n_distinct * row_estimate if n_distinct < 0 else n_distinct
+
+    # Columnas sin NULLs; las de nombre "de clave" primero y por cardinalidad descendente
+    usable = sorted(
+        (c for c, (_, null_frac) in column_stats.items() if not null_frac),
+        key=lambda c: (not KEY_LIKE_COLUMN.search(c), -distinct(c)),
+    )
+    candidates = []
+    for size in range(1, max_columns + 1):
+        pool = usable if size == 1 else [c for c in usable if KEY_LIKE_COLUMN.search(c)]
+        combos = []
+        for key in combinations(pool, size):
+            product = 1.0
+            for column in key:
+                product *= max(distinct(column), 1.0)
+            if product >= row_estimate:
+                combos.append((product, key))
+        # Para un mismo tamaño, las combinaciones de menor cardinalidad conjunta son más probables como grano
+        candidates.extend(key for _, key in sorted(combos, key=lambda item: item[0]))
+    return candidates
+
+
+def provision_unique_index(db: Session, mv: str, dry_run: bool = False) -> Dict:
+    """Ensure `mv` ("schema.name") has a unique index usable by REFRESH CONCURRENTLY."""
+    schema, name = split_name(mv)
+    info = get_relation_info(db, schema, name, use_cache=False)
+    if not info.is_materialized:
+        return {"mv": mv, "status": "missing"}
+    if info.has_unique_index:
+        return {"mv": mv, "status": "already_keyed"}
+    if not info.populated:
+        return {"mv": mv, "status": "unpopulated", "detail": "Refresh the MV before provisioning its key"}
+
+    definition = db.execute(text("SELECT pg_get_viewdef(to_regclass(:mv), true)"), {"mv": mv}).scalar() or ""
+    tried: List[Dict] = []
+    candidates = [(key, SOURCE_DEFINITION) for key in definition_key_candidates(definition, info.columns)]
+    candidates += [
+        (key, SOURCE_DATA) for key in data_key_candidates(*_column_stats(db, schema, name))
+        if key not in {c for c, _ in candidates}
+    ]
+
+    index_name = _index_name(name)
+    suggested: List[Dict] = []
+    for key, source in candidates[:MAX_CANDIDATES_CHECKED]:
+        problem = _verify_key(db, mv, key)
+        tried.append({"key": list(key), "source": source, "result": problem or "unique"})
+        if problem:
+            continue
+        if source == SOURCE_DATA:
+            # Único hoy según los datos, no garantizado por la definición: solo se reporta
+            suggested.append({"key": list(key), "ddl": _index_ddl(index_name, mv, key)})
+            continue
+        if dry_run:
+            return {"mv": mv, "status": "would_create", "key": list(key), "source": source,
+                    "index": index_name, "tried": tried}
+        error = _create_index_concurrently(db, schema, index_name, mv, key)
+        if error:
+            return {"mv": mv, "status": "error", "key": list(key), "error": error, "tried": tried}
+        invalidate(db, mv)
+        db.commit()
+        logger.info(f"Created unique index {schema}.{index_name} on {mv} ({', '.join(key)}) from {source}")
+        return {"mv": mv, "status": "created", "key": list(key), "source": source,
+                "index": f"{schema}.{index_name}", "tried": tried}
+
+    if suggested:
+        logger.warning(
+            f"{mv}: no key guaranteed by its definition; {len(suggested)} data-inferred key(s) "
+            "hold today and need manual confirmation before indexing"
+        )
+        return {"mv": mv, "status": "needs_confirmation", "suggested": suggested, "tried": tried}
+
+    logger.warning(f"No unique key found for {mv}; it will keep using a blocking refresh")
+    return {"mv": mv, "status": "unkeyable", "tried": tried}
+
+
+def _column_stats(db: Session, schema: str, name: str) -> Tuple[Dict[str, Tuple[float, float]], float]:
+    rows = db.execute(text("""
+        SELECT attname, n_distinct, null_frac
+        FROM pg_stats
+        WHERE schemaname = :schema AND tablename = :name
+    """), {"schema": schema, "name": name}).fetchall()
+    reltuples = db.execute(text("""
+        SELECT GREATEST(reltuples, 0) FROM pg_class WHERE oid = to_regclass(:mv)
+    """), {"mv": f"{schema}.{name}"}).scalar() or 0
+    return {row.attname: (float(row.n_distinct), float(row.null_frac)) for row in rows}, float(reltuples)
+
+
+def _verify_key(db: Session, mv: str, key: Tuple[str, ...]) -> Optional[str]:
+    """None if `key` has no NULLs and no duplicates in `mv`, else the problem found."""
+    columns = ", ".join(f'"{c}"' for c in key)
+    any_null = " OR ".join(f'"{c}" IS NULL' for c in key)
+    try:
+        row = db.execute(text(f"""
+            SELECT
+                EXISTS (SELECT 1 FROM {mv} WHERE {any_null}) AS has_nulls,
+                EXISTS (SELECT 1 FROM {mv} GROUP BY {columns} HAVING COUNT(*) > 1) AS has_duplicates
+        """)).fetchone()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        return f"error: {str(e)[:100]}"
+    if row.has_nulls:
+        return "nulls"
+    if row.has_duplicates:
+        return "duplicates"
+    return None
+
+
+def _index_name(mv_name: str) -> str:
+    return f"ux_{mv_name}"[:57] + "_grain"
+
+
+def _index_ddl(index_name: str, mv: str, key: Tuple[str, ...]) -> str:
+    columns = ", ".join(f'"{c}"' for c in key)
+    return f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" ON {mv} ({columns})'
+
+
+def _create_index_concurrently(db: Session, schema: str, index_name: str, mv: str, key: Tuple[str, ...]) -> Optional[str]:
+    """CREATE UNIQUE INDEX CONCURRENTLY (outside a transaction); drops the index if it ends up invalid."""
+    with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        try:
+            conn.execute(text(_index_ddl(index_name, mv, key)))
+            return None
+        except Exception as e:
+            # Un CREATE INDEX CONCURRENTLY fallido deja un índice INVALID
+            try:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {schema}."{index_name}"'))
+            except Exception as drop_error:
+                logger.warning(f"Could not drop invalid index {schema}.{index_name}: {drop_error}")
+            return str(e)[:200]
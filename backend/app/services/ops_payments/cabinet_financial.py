@@ -3,7 +3,6 @@ Lógica de negocio: cabinet financial 14d, funnel gap, KPI red recovery, claims
 """
 import logging
 from datetime import date
-from time import time
 from typing import Any
 
 from fastapi import HTTPException
@@ -14,29 +13,27 @@ from app.schemas.kpi_red_recovery import (
     KpiRedRecoveryMetricsResponse,
     KpiRedRecoveryMetricsDaily,
 )
+from app.services.mv_cache import mv_exists
+from app.services.response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 
 CACHE_TTL_FUNNEL = 120
-_funnel_gap_cache: dict[str, tuple[float, dict]] = {}
+_funnel_gap_cache = response_cache("funnel_gap_metrics", ttl=CACHE_TTL_FUNNEL, max_entries=1)
 
 
 def get_funnel_gap_metrics(db: Session) -> dict[str, Any]:
     """Métricas del primer gap del embudo: leads sin identidad ni pago."""
-    cache_key = "funnel_gap_metrics"
-    current_time = time()
-    if cache_key in _funnel_gap_cache:
-        cached_time, cached_data = _funnel_gap_cache[cache_key]
-        if current_time - cached_time < CACHE_TTL_FUNNEL:
-            return cached_data
-
-    mv_claims_exists = db.execute(text("""
-        SELECT EXISTS (
-            SELECT 1 FROM pg_matviews
-            WHERE schemaname = 'ops' AND matviewname = 'mv_claims_payment_status_cabinet'
-        )
-    """)).scalar()
-    claims_view = "ops.mv_claims_payment_status_cabinet" if mv_claims_exists else "ops.v_claims_payment_status_cabinet"
+    cache_key = _funnel_gap_cache.key()
+    cached = _funnel_gap_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    claims_view = (
+        "ops.mv_claims_payment_status_cabinet"
+        if mv_exists(db, "ops", "mv_claims_payment_status_cabinet")
+        else "ops.v_claims_payment_status_cabinet"
+    )
 
     total_leads = db.execute(text("SELECT COUNT(*) FROM public.module_ct_cabinet_leads")).scalar() or 0
     leads_with_identity = db.execute(text("""
@@ -65,8 +62,8 @@ def get_funnel_gap_metrics(db: Session) -> dict[str, Any]:
             "without_both": round(((total_leads - leads_with_identity) / total_leads * 100) if total_leads > 0 else 0, 2),
         },
     }
-    _funnel_gap_cache[cache_key] = (current_time, result)
-    return result
+    # Las tablas base (leads, identity_links) no notifican: para ellas rige el TTL
+    return _funnel_gap_cache.put(cache_key, result, tags=[claims_view])
 
 
 def get_kpi_red_recovery_metrics(db: Session) -> KpiRedRecoveryMetricsResponse:
@@ -12,7 +12,10 @@ from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.orm import Session
 
 from app.core.db_utils import row_to_dict
-from app.services.mv_cache import get_best_view
+from app.core.pagination import SortKey, add_condition, keyset_condition, next_cursor, order_by
+from app.services.count_cache import count_rows
+from app.services.mv_cache import get_best_view, get_columns
+from app.services.mv_freshness import read_freshness
 from app.schemas.payments import (
     DriverMatrixRow,
     OpsDriverMatrixResponse,
@@ -40,10 +43,15 @@ def get_driver_matrix(
     limit: int = 200,
     offset: int = 0,
     order: OrderByOption = OrderByOption.week_start_desc,
+    cursor: Optional[str] = None,
 ) -> OpsDriverMatrixResponse:
     """
     Obtiene la matriz de drivers con milestones M1/M5/M25 y estados Yango/window.
     Usa vista materializada si existe, sino vista normal.
+    Con `cursor` (next_cursor de la página anterior) pagina por keyset en vez de offset.
+    El total sale de count_cache: exacto y cacheado hasta el próximo refresh de la MV, o
+    estimado por el planner en recorridos grandes sin filtro o si el COUNT no terminó
+    (meta.total_is_estimate).
     """
     where_conditions = []
     params: dict = {}
@@ -75,35 +83,32 @@ def get_driver_matrix(
         ["mv_payments_driver_matrix_cabinet", "mv_payment_calculation"],
         "ops.v_payment_calculation",
     )
-    try:
-        check_result = db.execute(text(f"SELECT * FROM {view_name} LIMIT 0"))
-        columns = list(check_result.keys())
-        if len(columns) <= 1 and columns and columns[0] == "dummy":
-            logger.warning("%s es un placeholder, usando v_payment_calculation", view_name)
-            view_name = "ops.v_payment_calculation"
-    except Exception as e:
-        logger.warning("Error verificando vista %s: %s", view_name, e)
-
-    if order == OrderByOption.week_start_desc:
-        order_by_clause = "ORDER BY lead_date DESC NULLS LAST, driver_id ASC NULLS LAST"
-    elif order == OrderByOption.week_start_asc:
-        order_by_clause = "ORDER BY lead_date ASC NULLS LAST, driver_id ASC NULLS LAST"
-    elif order == OrderByOption.lead_date_desc:
-        order_by_clause = "ORDER BY lead_date DESC NULLS LAST, driver_id ASC NULLS LAST"
-    elif order == OrderByOption.lead_date_asc:
-        order_by_clause = "ORDER BY lead_date ASC NULLS LAST, driver_id ASC NULLS LAST"
-    else:
-        order_by_clause = "ORDER BY lead_date DESC NULLS LAST, driver_id ASC NULLS LAST"
-
-    count_sql = f"SELECT COUNT(*) AS total FROM {view_name} {where_clause}"
+    # Columnas desde la cache de catálogo (sin consulta por request)
+    columns = get_columns(db, view_name)
+    if len(columns) <= 1 and columns and columns[0] == "dummy":
+        logger.warning("%s es un placeholder, usando v_payment_calculation", view_name)
+        view_name = "ops.v_payment_calculation"
+        columns = get_columns(db, view_name)
+
+    # week_start_* ordena por lead_date (la vista no expone week_start)
+    descending = order in (OrderByOption.week_start_desc, OrderByOption.lead_date_desc)
+    keys = (
+        SortKey("lead_date", descending=descending, nulls_last=True),
+        SortKey("driver_id", nulls_last=True),
+    )
+    if "rule_id" in columns:
+        # Fallback v_payment_calculation: una fila por regla, desempate por su grano
+        keys += (SortKey("origin_tag"), SortKey("rule_id"))
+    data_where_clause = add_condition(where_clause, keyset_condition(keys, cursor, params))
+
     sql = f"""
         SELECT * FROM {view_name}
-        {where_clause}
-        {order_by_clause}
+        {data_where_clause}
+        ORDER BY {order_by(keys)}
         LIMIT :limit OFFSET :offset
     """
     params["limit"] = limit
-    params["offset"] = offset
+    params["offset"] = 0 if cursor else offset
 
     rows = []
     try:
@@ -126,16 +131,12 @@ def get_driver_matrix(
             raise HTTPException(status_code=503, detail=detail_msg) from e
         raise
 
-    total = None
     try:
-        count_result = db.execute(text(count_sql), params)
-        total = count_result.scalar() or 0
-    except (ProgrammingError, OperationalError) as e:
-        error_msg = str(e)
-        if "timeout" in error_msg.lower() or "QueryCanceled" in error_msg or "canceling statement" in error_msg.lower():
-            total = offset + len(rows) + 1 if len(rows) >= limit else offset + len(rows)
-        else:
-            total = offset + len(rows) + 1 if len(rows) >= limit else offset + len(rows)
+        total, total_is_estimate = count_rows(db, view_name, where_clause, params)
+    except (ProgrammingError, OperationalError):
+        # Sin conteo ni estimación: al menos hay una página más si esta vino llena
+        total = offset + len(rows) + 1 if len(rows) >= limit else offset + len(rows)
+        total_is_estimate = True
 
     data = []
     for row in rows:
@@ -162,5 +163,13 @@ def get_driver_matrix(
         else:
             data.append(DriverMatrixRow.model_validate(row_dict))
 
-    meta = OpsDriverMatrixMeta(limit=limit, offset=offset, returned=len(data), total=total)
+    meta = OpsDriverMatrixMeta(
+        limit=limit,
+        offset=offset,
+        returned=len(data),
+        total=total,
+        total_is_estimate=total_is_estimate,
+        next_cursor=next_cursor(keys, rows, limit),
+        freshness=read_freshness(db, view_name),
+    )
     return OpsDriverMatrixResponse(meta=meta, data=data)
@@ -17,10 +17,10 @@ from app.models.canon import (
     DecidedBy,
     IdentityLink,
     IdentityOrigin,
-    IdentityRegistry,
     OriginResolutionStatus,
     OriginTag,
 )
+from app.services.person_facts import PersonFactsCache
 
 logger = logging.getLogger(__name__)
 
@@ -67,9 +67,11 @@ class OriginDeterminationService:
     # Umbral de confianza para considerar conflicto fuerte
     HIGH_CONFIDENCE_THRESHOLD = 85.0
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, person_facts: Optional[PersonFactsCache] = None):
         self.db = db
         self.lead_system_start_date = LEAD_SYSTEM_START_DATE
+        # Cache de hechos por persona; puede compartirse con LeadAttributionService en el mismo run
+        self.person_facts = person_facts or PersonFactsCache(db)
     
     def determine_origin(self, person_key: UUID) -> Optional[OriginResult]:
         """
@@ -325,18 +327,10 @@ class OriginDeterminationService:
     
     def _is_legacy_external(self, person_key: UUID, first_seen_at: date) -> bool:
         """Verifica si una persona es legacy_external"""
-        # Verificar si tiene links a fuentes válidas
-        valid_source_links = self.db.query(IdentityLink).filter(
-            IdentityLink.person_key == person_key,
-            IdentityLink.source_table.in_([
-                "module_ct_cabinet_leads",
-                "module_ct_scouting_daily",
-                "module_ct_migrations"
-            ])
-        ).first()
+        facts = self.person_facts.get(person_key)
         
-        # Si tiene links válidos, no es legacy
-        if valid_source_links:
+        # Si tiene links a fuentes válidas, no es legacy
+        if facts and facts.has_valid_source_link:
             return False
         
         # Si first_seen_at es anterior a LEAD_SYSTEM_START_DATE, es legacy
@@ -347,31 +341,9 @@ class OriginDeterminationService:
         Calcula first_seen_at con prioridad:
         MIN( driver_linked_at, first_activity_at, registry_created_at )
         """
-        # Obtener registry_created_at
-        registry = self.db.query(IdentityRegistry).filter(
-            IdentityRegistry.person_key == person_key
-        ).first()
+        facts = self.person_facts.get(person_key)
         
-        if not registry:
+        if not facts:
             return None
         
-        timestamps = [registry.created_at]
-        
-        # Obtener driver_linked_at (más temprano)
-        driver_link = self.db.query(IdentityLink).filter(
-            IdentityLink.person_key == person_key,
-            IdentityLink.source_table == "drivers"
-        ).order_by(IdentityLink.linked_at).first()
-        
-        if driver_link:
-            timestamps.append(driver_link.linked_at)
-        
-        # Obtener first_activity_at (más temprano de todos los links)
-        first_link = self.db.query(IdentityLink).filter(
-            IdentityLink.person_key == person_key
-        ).order_by(IdentityLink.linked_at).first()
-        
-        if first_link:
-            timestamps.append(first_link.linked_at)
-        
-        return min(timestamps) if timestamps else None
+        return facts.first_seen_at
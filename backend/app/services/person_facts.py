@@ -0,0 +1,190 @@
+"""
+Cache de hechos por persona (hire_date, first_seen_at, links de driver).
+
+Pensado para durar lo que dura un run (backfill de origen, process_ledger, etc.):
+los hechos de un conjunto de person_keys se cargan con una sola query
+`= ANY(:array)` y las consultas repetidas dentro del run no tocan la base.
+El tamaño está acotado con expulsión LRU y expone métricas de hit-rate.
+"""
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.db_utils import chunked
+
+logger = logging.getLogger(__name__)
+
+# Fuentes válidas de origen (coincide con OriginDeterminationService.SOURCE_TABLE_TO_TAG)
+VALID_ORIGIN_SOURCE_TABLES = (
+    "module_ct_cabinet_leads",
+    "module_ct_scouting_daily",
+    "module_ct_migrations",
+)
+
+DEFAULT_MAX_SIZE = 50000
+LOAD_CHUNK_SIZE = 5000
+
+# Marcador para person_keys sin registro (evita volver a consultarlos)
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class PersonFacts:
+    """Hechos de una persona usados por atribución y determinación de origen"""
+    person_key: UUID
+    registry_created_at: Optional[datetime]
+    hire_date: Optional[date]
+    first_link_at: Optional[datetime]
+    first_driver_link_at: Optional[datetime]
+    has_valid_source_link: bool
+
+    @property
+    def first_seen_at(self) -> Optional[datetime]:
+        """MIN(driver_linked_at, first_activity_at, registry_created_at)"""
+        timestamps = [
+            ts for ts in (self.registry_created_at, self.first_driver_link_at, self.first_link_at)
+            if ts is not None
+        ]
+        return min(timestamps) if timestamps else None
+
+
+class PersonFactsCache:
+    """Cache LRU de PersonFacts con carga en lote"""
+
+    _FACTS_QUERY = text("""
+        SELECT
+            ir.person_key,
+            ir.created_at AS registry_created_at,
+            links.first_link_at,
+            links.first_driver_link_at,
+            COALESCE(links.has_valid_source_link, false) AS has_valid_source_link,
+            hd.hire_date
+        FROM canon.identity_registry ir
+        LEFT JOIN LATERAL (
+            SELECT
+                MIN(il.linked_at) AS first_link_at,
+                MIN(il.linked_at) FILTER (WHERE il.source_table = 'drivers') AS first_driver_link_at,
+                BOOL_OR(il.source_table = ANY(CAST(:valid_source_tables AS text[]))) AS has_valid_source_link
+            FROM canon.identity_links il
+            WHERE il.person_key = ir.person_key
+        ) links ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT MIN(d.hire_date) AS hire_date
+            FROM canon.identity_links il
+            JOIN public.drivers d ON d.driver_id::text = il.source_pk
+            WHERE il.person_key = ir.person_key
+                AND il.source_table = 'drivers'
+                AND d.hire_date IS NOT NULL
+        ) hd ON TRUE
+        WHERE ir.person_key = ANY(CAST(:person_keys AS uuid[]))
+    """)
+
+    def __init__(self, db: Session, max_size: int = DEFAULT_MAX_SIZE):
+        self.db = db
+        self.max_size = max_size
+        self._entries: "OrderedDict[UUID, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.queries = 0
+
+    def get(self, person_key: UUID) -> Optional[PersonFacts]:
+        """Hechos de una persona (None si no existe en identity_registry)"""
+        return self.get_many([person_key]).get(self._key(person_key))
+
+    def get_many(self, person_keys: Iterable[UUID]) -> Dict[UUID, PersonFacts]:
+        """Hechos de varias personas; los que faltan se cargan en una sola query"""
+        keys = list(dict.fromkeys(self._key(pk) for pk in person_keys))
+        facts: Dict[UUID, PersonFacts] = {}
+        missing = []
+        for pk in keys:
+            if pk in self._entries:
+                self._entries.move_to_end(pk)
+                entry = self._entries[pk]
+                if entry is not _MISSING:
+                    facts[pk] = entry
+            else:
+                missing.append(pk)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            facts.update(self._load(missing))
+        return facts
+
+    def prefetch(self, person_keys: Iterable[UUID]) -> None:
+        """Precarga hechos de un lote sin contabilizar hits/misses"""
+        missing = list(dict.fromkeys(
+            pk for pk in (self._key(p) for p in person_keys) if pk not in self._entries
+        ))
+        if missing:
+            self._load(missing)
+
+    def get_hire_dates(self, person_keys: Iterable[UUID]) -> Dict[UUID, date]:
+        """hire_date más temprano por persona (solo personas con hire_date)"""
+        return {
+            pk: facts.hire_date
+            for pk, facts in self.get_many(person_keys).items()
+            if facts.hire_date is not None
+        }
+
+    def invalidate(self, person_key: Optional[UUID] = None) -> None:
+        """Invalida una persona (p.ej. tras crear un link) o todo el cache"""
+        if person_key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(self._key(person_key), None)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "queries": self.queries,
+        }
+
+    def _load(self, person_keys: List[UUID]) -> Dict[UUID, PersonFacts]:
+        loaded: Dict[UUID, PersonFacts] = {}
+        for chunk in chunked(person_keys, LOAD_CHUNK_SIZE):
+            result = self.db.execute(self._FACTS_QUERY, {
+                "person_keys": [str(pk) for pk in chunk],
+                "valid_source_tables": list(VALID_ORIGIN_SOURCE_TABLES),
+            })
+            self.queries += 1
+            found = set()
+            for row in result:
+                pk = self._key(row.person_key)
+                found.add(pk)
+                loaded[pk] = PersonFacts(
+                    person_key=pk,
+                    registry_created_at=row.registry_created_at,
+                    hire_date=row.hire_date,
+                    first_link_at=row.first_link_at,
+                    first_driver_link_at=row.first_driver_link_at,
+                    has_valid_source_link=bool(row.has_valid_source_link),
+                )
+                self._store(pk, loaded[pk])
+            for pk in chunk:
+                if pk not in found:
+                    self._store(pk, _MISSING)
+        return loaded
+
+    def _store(self, person_key: UUID, entry: Any) -> None:
+        self._entries[person_key] = entry
+        self._entries.move_to_end(person_key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _key(person_key: Any) -> UUID:
+        return person_key if isinstance(person_key, UUID) else UUID(str(person_key))
@@ -0,0 +1,254 @@
+"""
+Response cache for read endpoints.
+
+One `ResponseCache` per endpoint (or service function), created with
+`response_cache(name, ttl)`:
+- bounded: least recently used entries are evicted past `max_entries`;
+- keys come from `cache.key(**params)`: parameter names sorted, None values
+  dropped, dates/enums/decimals normalized, so equivalent requests share an entry;
+- each entry is tagged with the relations ("schema.name") it was computed from.
+  When mv_cache invalidates a relation (refresh_mv after every refresh, DDL, ...)
+  the entries tagged with it are purged in every worker, through the existing
+  LISTEN/NOTIFY listener. The TTL bounds staleness for changes that are not
+  notified (plain tables, views over them).
+
+Entries live in process memory by default. With RESPONSE_CACHE_REDIS_URL set
+(and the `redis` package installed) they live in Redis instead and all workers
+share one cache; LRU eviction is then Redis' job (maxmemory-policy allkeys-lru).
+A Redis error never fails a request: it is logged and treated as a miss.
+
+None is not cacheable (get returns None on a miss).
+"""
+import json
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.mv_cache import INVALIDATE_ALL, on_invalidate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+REDIS_PREFIX = "ct4:rc"
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def params_key(**params: Any) -> str:
+    """Normalized key of a set of query params (None values dropped, names sorted)."""
+    normalized = {name: _normalize(value) for name, value in params.items() if value is not None}
+    return json.dumps(normalized, sort_keys=True, default=str, separators=(",", ":"))
+
+
+class MemoryBackend:
+    """Per-process LRU with per-entry expiry and a tag -> keys index."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # {key: (value, expires_at, tags)}
+        self._entries: "OrderedDict[str, Tuple[Any, float, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry[1]:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...]) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    """Entries shared by all workers: pickled values with TTL, one set of keys per tag."""
+
+    def __init__(self, client, name: str):
+        self._client = client
+        self._prefix = f"{REDIS_PREFIX}:{name}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            data = self._client.get(f"{self._prefix}:k:{key}")
+            return pickle.loads(data) if data is not None else None
+        except Exception as e:
+            logger.warning(f"Response cache get failed ({self._prefix}): {e}")
+            return None
+
+    def put(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...]) -> None:
+        full_key = f"{self._prefix}:k:{key}"
+        try:
+            pipe = self._client.pipeline()
+            pipe.set(full_key, pickle.dumps(value), px=int(ttl * 1000))
+            for tag in tags:
+                pipe.sadd(f"{self._prefix}:t:{tag}", full_key)
+                pipe.expire(f"{self._prefix}:t:{tag}", int(ttl) + 60)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Response cache put failed ({self._prefix}): {e}")
+
+    def invalidate_tag(self, tag: str) -> int:
+        tag_key = f"{self._prefix}:t:{tag}"
+        try:
+            keys = list(self._client.smembers(tag_key))
+            self._client.delete(tag_key, *keys)
+            return len(keys)
+        except Exception as e:
+            logger.warning(f"Response cache invalidation failed ({self._prefix}, {tag}): {e}")
+            return 0
+
+    def clear(self) -> None:
+        try:
+            keys = list(self._client.scan_iter(f"{self._prefix}:*"))
+            if keys:
+                self._client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Response cache clear failed ({self._prefix}): {e}")
+
+    def size(self) -> int:
+        return -1  # desconocido sin recorrer Redis
+
+
+class ResponseCache:
+    """Cache of one endpoint. See the module docstring."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = DEFAULT_MAX_ENTRIES, backend=None):
+        self.name = name
+        self.ttl = ttl
+        self.backend = backend or MemoryBackend(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, **params: Any) -> str:
+        """Normalized key of a set of query params."""
+        return params_key(**params)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any, tags: Iterable[str] = (), ttl: Optional[float] = None) -> Any:
+        """Store `value` tagged with the relations it depends on; returns `value`."""
+        if value is not None:
+            self.backend.put(key, value, self.ttl if ttl is None else ttl, tuple(tags))
+        return value
+
+    def invalidate(self, tag: str = INVALIDATE_ALL) -> None:
+        """Drop the entries tagged with `tag` ("schema.name"), or all of them."""
+        if tag == INVALIDATE_ALL:
+            self.backend.clear()
+            return
+        dropped = self.backend.invalidate_tag(tag)
+        if dropped:
+            logger.debug(f"Response cache {self.name}: {dropped} entries dropped by {tag}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.backend.size(),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_caches: Dict[str, ResponseCache] = {}
+_redis_client = None
+_redis_checked = False
+
+
+def response_cache(name: str, ttl: float, max_entries: int = DEFAULT_MAX_ENTRIES) -> ResponseCache:
+    """Create (or return) the cache `name`; module-level, once per endpoint."""
+    if name not in _caches:
+        client = _redis()
+        backend = RedisBackend(client, name) if client is not None else None
+        _caches[name] = ResponseCache(name, ttl, max_entries, backend)
+    return _caches[name]
+
+
+def invalidate_relation(relation: str = INVALIDATE_ALL) -> None:
+    """Purge, in every cache of this process, the entries depending on `relation`."""
+    for cache in list(_caches.values()):
+        cache.invalidate(relation)
+
+
+def get_response_cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def _redis():
+    """Redis client when RESPONSE_CACHE_REDIS_URL is set and usable, else None (memory)."""
+    global _redis_client, _redis_checked
+    if _redis_checked:
+        return _redis_client
+    _redis_checked = True
+    if not settings.response_cache_redis_url:
+        return None
+    try:
+        import redis
+        _redis_client = redis.Redis.from_url(settings.response_cache_redis_url, socket_timeout=1)
+        _redis_client.ping()
+    except Exception as e:
+        logger.warning(f"Response cache Redis unavailable, using per-process memory: {e}")
+        _redis_client = None
+    return _redis_client
+
+
+# Refresh de una MV (en este worker o, vía NOTIFY, en otro) -> fuera lo calculado con ella
+on_invalidate(invalidate_relation)
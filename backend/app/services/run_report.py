@@ -0,0 +1,154 @@
+"""
+Identity run report: counts by source, rule, confidence and reason.
+
+Computed with GROUP BY queries over canon.identity_links / canon.identity_unmatched
+(the run's rows are never loaded as objects), plus two 10-row samples.
+
+Once the run is finished (COMPLETED or FAILED) its rows no longer change, so the
+report is stored as JSON in ops.ingestion_runs.report_json (migration 028):
+IngestionService stores it when the run completes, and GET /identity/runs/{id}/report
+serves it from there (storing it on first read for runs finished before this
+column existed). REPORT_VERSION is bumped when the report's shape changes, so
+stored reports from an older version are recomputed.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.models.canon import IdentityLink, IdentityUnmatched
+from app.models.ops import IngestionRun, RunStatus
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+TOP_MISSING_KEYS_SQL = """
+    SELECT mk.key, COUNT(*) AS cnt
+    FROM canon.identity_unmatched iu
+    CROSS JOIN LATERAL jsonb_array_elements_text(iu.details->'missing_keys') AS mk(key)
+    WHERE iu.run_id = :run_id
+      AND iu.reason_code = 'MISSING_KEYS'
+      AND jsonb_typeof(iu.details->'missing_keys') = 'array'
+    GROUP BY mk.key
+    ORDER BY cnt DESC, mk.key
+    LIMIT 10
+"""
+
+
+def _enum_value(value: Any) -> str:
+    return value.value if hasattr(value, "value") else str(value)
+
+
+def build_run_report(db: Session, run_id: int) -> Dict[str, Any]:
+    """Report body (everything but the run itself) computed in SQL."""
+    counts_by_source_table = defaultdict(lambda: {"total_processed": 0, "matched_count": 0, "unmatched_count": 0, "skipped_count": 0})
+    matched_by_rule = defaultdict(int)
+    matched_by_confidence = defaultdict(int)
+    unmatched_by_reason = defaultdict(int)
+
+    links_counts = db.query(
+        IdentityLink.source_table,
+        IdentityLink.match_rule,
+        IdentityLink.confidence_level,
+        func.count(IdentityLink.id).label("cnt")
+    ).filter(IdentityLink.run_id == run_id).group_by(
+        IdentityLink.source_table,
+        IdentityLink.match_rule,
+        IdentityLink.confidence_level
+    ).all()
+
+    for row in links_counts:
+        counts_by_source_table[row.source_table]["matched_count"] += row.cnt
+        counts_by_source_table[row.source_table]["total_processed"] += row.cnt
+        matched_by_rule[row.match_rule] += row.cnt
+        matched_by_confidence[_enum_value(row.confidence_level)] += row.cnt
+
+    unmatched_counts = db.query(
+        IdentityUnmatched.source_table,
+        IdentityUnmatched.reason_code,
+        func.count(IdentityUnmatched.id).label("cnt")
+    ).filter(IdentityUnmatched.run_id == run_id).group_by(
+        IdentityUnmatched.source_table,
+        IdentityUnmatched.reason_code
+    ).all()
+
+    for row in unmatched_counts:
+        counts_by_source_table[row.source_table]["unmatched_count"] += row.cnt
+        counts_by_source_table[row.source_table]["total_processed"] += row.cnt
+        unmatched_by_reason[row.reason_code] += row.cnt
+
+    top_missing_keys = [
+        {"key": row.key, "count": row.cnt}
+        for row in db.execute(text(TOP_MISSING_KEYS_SQL), {"run_id": run_id})
+    ]
+
+    top_unmatched = [
+        {
+            "id": um.id,
+            "source_table": um.source_table,
+            "source_pk": um.source_pk,
+            "reason_code": um.reason_code,
+            "details": um.details,
+            "candidates_preview": um.candidates_preview
+        }
+        for um in db.query(IdentityUnmatched).filter(IdentityUnmatched.run_id == run_id)
+        .order_by(IdentityUnmatched.id).limit(10)
+    ]
+
+    top_matched = [
+        {
+            "id": link.id,
+            "source_table": link.source_table,
+            "source_pk": link.source_pk,
+            "match_rule": link.match_rule,
+            "confidence_level": _enum_value(link.confidence_level),
+            "match_score": link.match_score
+        }
+        for link in db.query(IdentityLink).filter(IdentityLink.run_id == run_id)
+        .order_by(IdentityLink.id).limit(10)
+    ]
+
+    return {
+        "version": REPORT_VERSION,
+        "counts_by_source_table": dict(counts_by_source_table),
+        "matched_breakdown": {
+            "by_match_rule": dict(matched_by_rule),
+            "by_confidence": dict(matched_by_confidence)
+        },
+        "unmatched_breakdown": {
+            "by_reason_code": dict(unmatched_by_reason),
+            "top_missing_keys": top_missing_keys
+        },
+        "samples": {
+            "top_unmatched": top_unmatched,
+            "top_matched": top_matched
+        }
+    }
+
+
+def store_run_report(db: Session, run: IngestionRun) -> Dict[str, Any]:
+    """Compute the report of a finished run and store it on the run."""
+    report = build_run_report(db, run.id)
+    run.report_json = report
+    db.commit()
+    return report
+
+
+def get_run_report(db: Session, run: IngestionRun) -> Dict[str, Any]:
+    """Stored report of a finished run, or the report computed now."""
+    stored = run.report_json
+    if stored and stored.get("version") == REPORT_VERSION:
+        return stored
+    if run.status == RunStatus.RUNNING:
+        # Aún se escriben links/unmatched: se calcula en cada lectura
+        return build_run_report(db, run.id)
+    try:
+        return store_run_report(db, run)
+    except Exception as e:
+        # Si no se puede guardar, el reporte calculado sigue siendo válido
+        db.rollback()
+        logger.warning(f"Could not store report of run {run.id}: {e}")
+        return build_run_report(db, run.id)
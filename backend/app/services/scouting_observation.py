@@ -3,15 +3,20 @@ Scouting observation service for matching scouting data with canonical identitie
 
 Processes scouting daily records and attempts to match them with existing
 identity records using multiple strategies (license, phone, name similarity).
+
+Las búsquedas S1/S2 y la detección de candidatos existentes se resuelven en
+lote antes de recorrer las filas, y los candidatos se escriben con inserts
+multi-fila, de modo que un backfill completo se procesa en una sola pasada.
 """
 import logging
 from datetime import date, datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 from uuid import UUID
 
-from sqlalchemy import and_, func, text
+from sqlalchemy import and_, func, insert, text
 from sqlalchemy.orm import Session
 
+from app.core.db_utils import chunked, fetch_by_keys
 from app.models.canon import IdentityLink, IdentityRegistry
 from app.models.observational import ConfidenceLevelObs, MatchedSource, ScoutingMatchCandidate
 from app.services.data_contract import DataContract
@@ -26,10 +31,13 @@ from app.services.normalization import (
 
 logger = logging.getLogger(__name__)
 
+WRITE_BATCH_SIZE = 1000
+
 
 class ScoutingObservationService:
     def __init__(self, db: Session):
         self.db = db
+        self._s3_drivers: Optional[List[Any]] = None
 
     def process_scouting_observations(
         self,
@@ -66,8 +74,9 @@ class ScoutingObservationService:
         result = self.db.execute(query, params)
         rows = result.fetchall()
 
-        batch_size = 50
-        for idx, row in enumerate(rows):
+        # Primera pasada: mapear filas y recolectar claves para las búsquedas en lote
+        items = []
+        for row in rows:
             try:
                 row_dict = dict(row._mapping) if hasattr(row, '_mapping') else dict(row)
             except Exception as e:
@@ -90,30 +99,53 @@ class ScoutingObservationService:
             else:
                 continue
 
-            week_label = self._get_week_label(scouting_date)
+            items.append({
+                "scouting_row_id": scouting_row_id,
+                "scouting_date": scouting_date,
+                "license_norm": normalize_license_simple(mapped.get("license_raw")),
+                "phone_pe9": normalize_phone_pe9(mapped.get("phone_raw")),
+                "name_raw": mapped.get("name_raw"),
+            })
+
+        existing_keys = self._load_existing_candidate_keys(date_from, date_to)
+        drivers_by_license = self._load_drivers_by_license(
+            {item["license_norm"] for item in items if item["license_norm"]}
+        )
+        drivers_by_phone = self._load_drivers_by_phone(
+            {item["phone_pe9"] for item in items if item["phone_pe9"]}
+        )
+        person_keys_by_driver = self._load_person_keys_for_drivers(
+            {d.driver_id for d in drivers_by_license.values()} | {d.driver_id for d in drivers_by_phone.values()}
+        )
 
-            existing = self.db.query(ScoutingMatchCandidate).filter(
-                ScoutingMatchCandidate.scouting_row_id == scouting_row_id,
-                ScoutingMatchCandidate.scouting_date == scouting_date
-            ).first()
+        pending: List[Dict[str, Any]] = []
+        for item in items:
+            scouting_row_id = item["scouting_row_id"]
+            scouting_date = item["scouting_date"]
 
-            if existing:
+            key = (scouting_row_id, scouting_date)
+            if key in existing_keys:
                 continue
+            existing_keys.add(key)
 
-            phone_raw = mapped.get("phone_raw")
-            name_raw = mapped.get("name_raw")
-            license_raw = mapped.get("license_raw")
+            week_label = self._get_week_label(scouting_date)
 
             candidate_result = None
 
-            if license_raw:
-                candidate_result = self._apply_rule_s1(license_raw, scouting_date, scouting_row_id, week_label, run_id)
+            if item["license_norm"]:
+                candidate_result = self._apply_rule_s1(
+                    item["license_norm"], drivers_by_license, person_keys_by_driver,
+                    scouting_date, scouting_row_id, week_label, run_id
+                )
 
-            if not candidate_result and phone_raw:
-                candidate_result = self._apply_rule_s2(phone_raw, scouting_date, scouting_row_id, week_label, run_id)
+            if not candidate_result and item["phone_pe9"]:
+                candidate_result = self._apply_rule_s2(
+                    item["phone_pe9"], drivers_by_phone, person_keys_by_driver,
+                    scouting_date, scouting_row_id, week_label, run_id
+                )
 
-            if not candidate_result and name_raw:
-                candidate_result = self._apply_rule_s3(name_raw, scouting_date, scouting_row_id, week_label, run_id)
+            if not candidate_result and item["name_raw"]:
+                candidate_result = self._apply_rule_s3(item["name_raw"], scouting_date, scouting_row_id, week_label, run_id)
 
             if candidate_result:
                 if candidate_result.get("rule") == "S1":
@@ -122,144 +154,129 @@ class ScoutingObservationService:
                     stats["candidates_s2_phone"] += 1
                 elif candidate_result.get("rule") == "S3":
                     stats["candidates_s3_name"] += 1
+                pending.append(candidate_result["row"])
             else:
-                self._insert_no_candidate(scouting_row_id, scouting_date, week_label, run_id)
+                pending.append(self._build_no_candidate_row(scouting_row_id, scouting_date, week_label, run_id))
                 stats["no_candidates"] += 1
 
-            # Commit intermedio cada batch_size registros
-            if (idx + 1) % batch_size == 0:
-                try:
-                    self.db.commit()
-                except Exception as e:
-                    self.db.rollback()
-                    raise
+            if len(pending) >= WRITE_BATCH_SIZE:
+                self._write_candidates(pending)
+                pending = []
+
+        if pending:
+            self._write_candidates(pending)
 
         self.db.commit()
         return stats
 
+    def _load_existing_candidate_keys(
+        self,
+        date_from: Optional[date],
+        date_to: Optional[date]
+    ) -> Set[Tuple[str, date]]:
+        """Claves (scouting_row_id, scouting_date) ya procesadas dentro del alcance de fechas."""
+        query = self.db.query(
+            ScoutingMatchCandidate.scouting_row_id,
+            ScoutingMatchCandidate.scouting_date
+        )
+        if date_from:
+            query = query.filter(ScoutingMatchCandidate.scouting_date >= date_from)
+        if date_to:
+            query = query.filter(ScoutingMatchCandidate.scouting_date <= date_to)
+        return {(str(row_id), row_date) for row_id, row_date in query.all()}
+
+    def _load_drivers_by_license(self, license_norms: Set[str]) -> Dict[str, Any]:
+        query = text("""
+            SELECT DISTINCT ON (UPPER(TRIM(license_number)))
+                UPPER(TRIM(license_number)) AS lookup_key, driver_id, hire_date, created_at
+            FROM public.drivers
+            WHERE UPPER(TRIM(license_number)) = ANY(:keys)
+            ORDER BY UPPER(TRIM(license_number)), driver_id
+        """)
+        return self._load_drivers_by_key(query, license_norms)
+
+    def _load_drivers_by_phone(self, phones_pe9: Set[str]) -> Dict[str, Any]:
+        query = text("""
+            SELECT DISTINCT ON (RIGHT(REGEXP_REPLACE(phone, '\\D', '', 'g'), 9))
+                RIGHT(REGEXP_REPLACE(phone, '\\D', '', 'g'), 9) AS lookup_key, driver_id, hire_date, created_at
+            FROM public.drivers
+            WHERE RIGHT(REGEXP_REPLACE(phone, '\\D', '', 'g'), 9) = ANY(:keys)
+            ORDER BY RIGHT(REGEXP_REPLACE(phone, '\\D', '', 'g'), 9), driver_id
+        """)
+        return self._load_drivers_by_key(query, phones_pe9)
+
+    def _load_drivers_by_key(self, query, keys: Set[str]) -> Dict[str, Any]:
+        drivers = {}
+        for chunk in chunked(sorted(keys)):
+            for row in self.db.execute(query, {"keys": chunk}).fetchall():
+                drivers[row.lookup_key] = row
+        return drivers
+
+    def _load_person_keys_for_drivers(self, driver_ids: Set[str]) -> Dict[str, UUID]:
+        person_keys = {}
+        links = fetch_by_keys(
+            self.db,
+            self.db.query(IdentityLink.source_pk, IdentityLink.person_key).filter(IdentityLink.source_table == "drivers"),
+            IdentityLink.source_pk,
+            driver_ids
+        )
+        for source_pk, person_key in links:
+            person_keys.setdefault(source_pk, person_key)
+        return person_keys
+
     def _apply_rule_s1(
         self,
-        license_raw: str,
+        license_norm: str,
+        drivers_by_license: Dict[str, Any],
+        person_keys_by_driver: Dict[str, UUID],
         scouting_date: date,
         scouting_row_id: str,
         week_label: str,
         run_id: Optional[int]
     ) -> Optional[Dict[str, Any]]:
-        license_norm = normalize_license_simple(license_raw)
-        if not license_norm:
+        driver_row = drivers_by_license.get(license_norm)
+        if not driver_row:
             return None
 
-        query = text("""
-            SELECT driver_id, license_number, hire_date, created_at
-            FROM public.drivers
-            WHERE UPPER(TRIM(license_number)) = :license_norm
-            LIMIT 1
-        """)
-
-        result = self.db.execute(query, {"license_norm": license_norm})
-        driver_row = result.first()
-
-        if driver_row:
-            driver_id = driver_row.driver_id
-            person_key = self._get_person_key_for_driver(driver_id)
-            
-            driver_date = driver_row.hire_date or driver_row.created_at
-            if isinstance(driver_date, datetime):
-                driver_date = driver_date.date()
-            elif not isinstance(driver_date, date):
-                driver_date = scouting_date
-            
-            time_to_match = (driver_date - scouting_date).days
-
-            try:
-                self._insert_candidate(
-                    scouting_row_id=scouting_row_id,
-                    scouting_date=scouting_date,
-                    week_label=week_label,
-                    person_key_candidate=person_key,
-                    matched_source=MatchedSource.DRIVERS.value,
-                    match_rule="S1",
-                    score=0.95,
-                    confidence_level=ConfidenceLevelObs.HIGH.value,
-                    matched_source_pk=driver_id,
-                    matched_source_date=driver_date,
-                    time_to_match_days=time_to_match,
-                    run_id=run_id,
-                    notes=f"Match por licencia exacta: {license_norm}"
-                )
-            except Exception as e:
-                raise
-
-            return {
-                "rule": "S1",
-                "person_key": person_key,
-                "matched_source": "drivers",
-                "matched_source_pk": driver_id
-            }
-
-        return None
+        return self._build_driver_match(
+            driver_row=driver_row,
+            person_key=person_keys_by_driver.get(driver_row.driver_id),
+            rule="S1",
+            score=0.95,
+            confidence_level=ConfidenceLevelObs.HIGH.value,
+            scouting_date=scouting_date,
+            scouting_row_id=scouting_row_id,
+            week_label=week_label,
+            run_id=run_id,
+            notes=f"Match por licencia exacta: {license_norm}"
+        )
 
     def _apply_rule_s2(
         self,
-        phone_raw: str,
+        phone_pe9: str,
+        drivers_by_phone: Dict[str, Any],
+        person_keys_by_driver: Dict[str, UUID],
         scouting_date: date,
         scouting_row_id: str,
         week_label: str,
         run_id: Optional[int]
     ) -> Optional[Dict[str, Any]]:
-        phone_pe9 = normalize_phone_pe9(phone_raw)
-        if not phone_pe9:
+        driver_row = drivers_by_phone.get(phone_pe9)
+        if not driver_row:
             return None
 
-        query = text("""
-            SELECT driver_id, phone, hire_date, created_at
-            FROM public.drivers
-            WHERE RIGHT(REGEXP_REPLACE(phone, '\\D', '', 'g'), 9) = :phone_pe9
-            LIMIT 1
-        """)
-
-        result = self.db.execute(query, {"phone_pe9": phone_pe9})
-        driver_row = result.first()
-
-        if driver_row:
-            driver_id = driver_row.driver_id
-            person_key = self._get_person_key_for_driver(driver_id)
-            
-            driver_date = driver_row.hire_date or driver_row.created_at
-            if isinstance(driver_date, datetime):
-                driver_date = driver_date.date()
-            elif not isinstance(driver_date, date):
-                driver_date = scouting_date
-            
-            time_to_match = (driver_date - scouting_date).days
-
-            try:
-                self._insert_candidate(
-                    scouting_row_id=scouting_row_id,
-                    scouting_date=scouting_date,
-                    week_label=week_label,
-                    person_key_candidate=person_key,
-                    matched_source=MatchedSource.DRIVERS.value,
-                    match_rule="S2",
-                    score=0.85,
-                    confidence_level=ConfidenceLevelObs.HIGH.value,
-                    matched_source_pk=driver_id,
-                    matched_source_date=driver_date,
-                    time_to_match_days=time_to_match,
-                    run_id=run_id,
-                    notes=f"Match por teléfono PE9: {phone_pe9}"
-                )
-            except Exception as e:
-                raise
-
-            return {
-                "rule": "S2",
-                "person_key": person_key,
-                "matched_source": "drivers",
-                "matched_source_pk": driver_id
-            }
-
-        return None
+        return self._build_driver_match(
+            driver_row=driver_row,
+            person_key=person_keys_by_driver.get(driver_row.driver_id),
+            rule="S2",
+            score=0.85,
+            confidence_level=ConfidenceLevelObs.HIGH.value,
+            scouting_date=scouting_date,
+            scouting_row_id=scouting_row_id,
+            week_label=week_label,
+            run_id=run_id,
+            notes=f"Match por teléfono PE9: {phone_pe9}"
+        )
 
     def _apply_rule_s3(
         self,
@@ -273,17 +290,16 @@ class ScoutingObservationService:
         if not name_norm:
             return None
 
-        query = text("""
-            SELECT driver_id, full_name, hire_date, created_at
-            FROM public.drivers
-            WHERE full_name IS NOT NULL
-            LIMIT 100
-        """)
-
-        result = self.db.execute(query)
-        drivers = result.fetchall()
+        if self._s3_drivers is None:
+            query = text("""
+                SELECT driver_id, full_name, hire_date, created_at
+                FROM public.drivers
+                WHERE full_name IS NOT NULL
+                LIMIT 100
+            """)
+            self._s3_drivers = self.db.execute(query).fetchall()
 
-        for driver_row in drivers:
+        for driver_row in self._s3_drivers:
             driver_name = driver_row.full_name
             if not driver_name:
                 continue
@@ -294,42 +310,66 @@ class ScoutingObservationService:
 
             similarity = name_similarity(name_norm, driver_name_norm)
             if similarity >= 0.5:
-                driver_id = driver_row.driver_id
-                person_key = self._get_person_key_for_driver(driver_id)
-                
-                driver_date = driver_row.hire_date or driver_row.created_at
-                if isinstance(driver_date, datetime):
-                    driver_date = driver_date.date()
-                elif not isinstance(driver_date, date):
-                    driver_date = scouting_date
-                
-                time_to_match = (driver_date - scouting_date).days
-
-                self._insert_candidate(
-                    scouting_row_id=scouting_row_id,
-                    scouting_date=scouting_date,
-                    week_label=week_label,
-                    person_key_candidate=person_key,
-                    matched_source=MatchedSource.DRIVERS.value,
-                    match_rule="S3",
+                return self._build_driver_match(
+                    driver_row=driver_row,
+                    person_key=self._get_person_key_for_driver(driver_row.driver_id),
+                    rule="S3",
                     score=0.60,
                     confidence_level=ConfidenceLevelObs.LOW.value,
-                    matched_source_pk=driver_id,
-                    matched_source_date=driver_date,
-                    time_to_match_days=time_to_match,
+                    scouting_date=scouting_date,
+                    scouting_row_id=scouting_row_id,
+                    week_label=week_label,
                     run_id=run_id,
                     notes=f"Match por nombre similar: {similarity:.2f}"
                 )
 
-                return {
-                    "rule": "S3",
-                    "person_key": person_key,
-                    "matched_source": "drivers",
-                    "matched_source_pk": driver_id
-                }
-
         return None
 
+    def _build_driver_match(
+        self,
+        driver_row: Any,
+        person_key: Optional[UUID],
+        rule: str,
+        score: float,
+        confidence_level: str,
+        scouting_date: date,
+        scouting_row_id: str,
+        week_label: str,
+        run_id: Optional[int],
+        notes: str
+    ) -> Dict[str, Any]:
+        driver_id = driver_row.driver_id
+
+        driver_date = driver_row.hire_date or driver_row.created_at
+        if isinstance(driver_date, datetime):
+            driver_date = driver_date.date()
+        elif not isinstance(driver_date, date):
+            driver_date = scouting_date
+
+        time_to_match = (driver_date - scouting_date).days
+
+        return {
+            "rule": rule,
+            "person_key": person_key,
+            "matched_source": "drivers",
+            "matched_source_pk": driver_id,
+            "row": self._build_candidate_row(
+                scouting_row_id=scouting_row_id,
+                scouting_date=scouting_date,
+                week_label=week_label,
+                person_key_candidate=person_key,
+                matched_source=MatchedSource.DRIVERS.value,
+                match_rule=rule,
+                score=score,
+                confidence_level=confidence_level,
+                matched_source_pk=driver_id,
+                matched_source_date=driver_date,
+                time_to_match_days=time_to_match,
+                run_id=run_id,
+                notes=notes
+            )
+        }
+
     def _get_person_key_for_driver(self, driver_id: str) -> Optional[UUID]:
         link = self.db.query(IdentityLink).filter(
             IdentityLink.source_table == "drivers",
@@ -338,7 +378,7 @@ class ScoutingObservationService:
         
         return link.person_key if link else None
 
-    def _insert_candidate(
+    def _build_candidate_row(
         self,
         scouting_row_id: str,
         scouting_date: date,
@@ -353,55 +393,51 @@ class ScoutingObservationService:
         time_to_match_days: int,
         run_id: Optional[int],
         notes: Optional[str] = None
-    ):
-        try:
-            # Pasar directamente el string (valor) al modelo
-            # El TypeDecorator lo convertirá al enum correctamente
-            # Asegurarnos de que tenemos el valor, no el nombre del enum
-            if isinstance(matched_source, str):
-                matched_source_value = matched_source
-            elif isinstance(matched_source, MatchedSource):
-                matched_source_value = matched_source.value
-            else:
-                matched_source_value = str(matched_source)
-                
-            if isinstance(confidence_level, str):
-                confidence_level_value = confidence_level
-            elif isinstance(confidence_level, ConfidenceLevelObs):
-                confidence_level_value = confidence_level.value
-            else:
-                confidence_level_value = str(confidence_level)
-            
-            candidate = ScoutingMatchCandidate(
-                week_label=week_label,
-                scouting_row_id=scouting_row_id,
-                scouting_date=scouting_date,
-                person_key_candidate=person_key_candidate,
-                matched_source=matched_source_value,
-                match_rule=match_rule,
-                score=score,
-                confidence_level=confidence_level_value,
-                matched_source_pk=matched_source_pk,
-                matched_source_date=matched_source_date,
-                time_to_match_days=time_to_match_days,
-                notes=notes,
-                run_id=run_id
-            )
-            self.db.add(candidate)
-        except Exception as e:
-            raise
+    ) -> Dict[str, Any]:
+        # Pasar directamente el string (valor) al modelo
+        # El tipo Enum lo convertirá al miembro correcto
+        # Asegurarnos de que tenemos el valor, no el nombre del enum
+        if isinstance(matched_source, str):
+            matched_source_value = matched_source
+        elif isinstance(matched_source, MatchedSource):
+            matched_source_value = matched_source.value
+        else:
+            matched_source_value = str(matched_source)
+
+        if isinstance(confidence_level, str):
+            confidence_level_value = confidence_level
+        elif isinstance(confidence_level, ConfidenceLevelObs):
+            confidence_level_value = confidence_level.value
+        else:
+            confidence_level_value = str(confidence_level)
+
+        return {
+            "week_label": week_label,
+            "scouting_row_id": scouting_row_id,
+            "scouting_date": scouting_date,
+            "person_key_candidate": person_key_candidate,
+            "matched_source": matched_source_value,
+            "match_rule": match_rule,
+            "score": score,
+            "confidence_level": confidence_level_value,
+            "matched_source_pk": matched_source_pk,
+            "matched_source_date": matched_source_date,
+            "time_to_match_days": time_to_match_days,
+            "notes": notes,
+            "run_id": run_id
+        }
 
-    def _insert_no_candidate(
+    def _build_no_candidate_row(
         self,
         scouting_row_id: str,
         scouting_date: date,
         week_label: str,
         run_id: Optional[int]
-    ):
-        candidate = ScoutingMatchCandidate(
-            week_label=week_label,
+    ) -> Dict[str, Any]:
+        return self._build_candidate_row(
             scouting_row_id=scouting_row_id,
             scouting_date=scouting_date,
+            week_label=week_label,
             person_key_candidate=None,
             matched_source=MatchedSource.NONE.value,
             match_rule=None,
@@ -410,14 +446,20 @@ class ScoutingObservationService:
             matched_source_pk=None,
             matched_source_date=None,
             time_to_match_days=None,
-            notes=None,
             run_id=run_id
         )
-        self.db.add(candidate)
+
+    def _write_candidates(self, rows: List[Dict[str, Any]]):
+        """Inserta candidatos con un INSERT multi-fila y confirma el lote."""
+        try:
+            self.db.execute(insert(ScoutingMatchCandidate), rows)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
 
     def _get_week_label(self, date_obj: date) -> str:
         iso_calendar = date_obj.isocalendar()
         year = iso_calendar[0]
         week_num = iso_calendar[1]
         return f"{year}-W{week_num:02d}"
-
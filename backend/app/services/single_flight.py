@@ -0,0 +1,130 @@
+"""
+Request coalescing (single-flight) for expensive read endpoints.
+
+When the dashboard opens, many identical requests arrive at once and each one
+would run the same aggregation. With `@coalesce(name)` on an endpoint, identical
+concurrent requests (same endpoint, same normalized query params) share one
+execution:
+- the first request (leader) runs the endpoint;
+- the others wait for it and get the same result, or the same exception;
+- a waiter that gives up after WAIT_TIMEOUT_SECONDS runs the endpoint itself,
+  so a stuck leader never blocks the others for longer than that.
+
+Nothing is kept once the leader finishes: later requests run again (or hit a
+response_cache inside the endpoint). This is per process; across workers each
+worker runs at most one copy.
+
+Stats per endpoint (calls, executions, coalesced, timeouts) are in the
+performance diagnostics.
+"""
+import functools
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from app.services.response_cache import params_key
+
+logger = logging.getLogger(__name__)
+
+# Más que el statement_timeout interactivo (30s): un líder lento aún suele terminar antes
+WAIT_TIMEOUT_SECONDS = 60
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """In-flight calls of one endpoint, by key."""
+
+    def __init__(self, name: str, wait_timeout: float = WAIT_TIMEOUT_SECONDS):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Return fn(), sharing the execution with identical concurrent calls."""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                with self._lock:
+                    self.coalesced += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            with self._lock:
+                self.timeouts += 1
+                self.executions += 1
+            logger.warning(f"Single-flight {self.name}: leader still running after {self.wait_timeout}s, running again")
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._calls),
+            }
+
+
+_flights: Dict[str, SingleFlight] = {}
+_registry_lock = threading.Lock()
+
+
+def single_flight(name: str) -> SingleFlight:
+    """Create (or return) the SingleFlight `name`."""
+    with _registry_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(name)
+        return _flights[name]
+
+
+def coalesce(name: str, exclude: Iterable[str] = ("db",)):
+    """
+    Decorator for a sync endpoint: identical concurrent calls share one execution.
+    The key is built from the keyword arguments (FastAPI passes them all by name),
+    without `exclude` (the request's Session).
+    """
+    excluded = set(exclude)
+    flight = single_flight(name)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = params_key(**{k: v for k, v in kwargs.items() if k not in excluded})
+            return flight.do(key, lambda: fn(*args, **kwargs))
+        return wrapper
+
+    return decorator
+
+
+def get_single_flight_stats() -> dict:
+    return {name: flight.stats() for name, flight in _flights.items()}
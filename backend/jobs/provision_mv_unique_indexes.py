@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Job de provisión de índices únicos para vistas materializadas.
+Para cada MV sin índice único usable por REFRESH ... CONCURRENTLY infiere un
+grano candidato (definición de la vista + estadísticas), lo verifica contra los
+datos y crea el índice con CREATE UNIQUE INDEX CONCURRENTLY.
+
+  - Por defecto: MVs críticas y las que se refrescan tras procesar cabinet leads.
+  - --all: todas las MVs de los schemas ops y canon.
+  - --dry-run: solo reporta el grano encontrado, sin crear índices.
+
+Solo se crean índices de granos garantizados por la definición (DISTINCT ON / GROUP BY).
+Los inferidos de los datos (pg_stats) se reportan como "needs_confirmation" con su DDL,
+para aplicarlos a mano tras confirmar el grano. Las MVs sin grano verificable se
+reportan como "unkeyable". Ambas siguen con refresh bloqueante.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.db import MaintenanceSessionLocal
+from app.services.mv_maintenance import CABINET_LEADS_MVS, CRITICAL_MVS
+from app.services.mv_unique_keys import provision_unique_index
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisionMvUniqueIndexesJob:
+    """Job que crea los índices únicos que faltan para refrescar MVs con CONCURRENTLY"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def target_mvs(self, all_mvs: bool = False) -> List[str]:
+        if all_mvs:
+            rows = self.db.execute(text("""
+                SELECT schemaname || '.' || matviewname AS mv
+                FROM pg_matviews
+                WHERE schemaname IN ('ops', 'canon')
+                ORDER BY 1
+            """)).fetchall()
+            return [row.mv for row in rows]
+        critical = [f"{mv['schema']}.{mv['name']}" for mv in CRITICAL_MVS]
+        return list(dict.fromkeys(critical + CABINET_LEADS_MVS))
+
+    def run(self, all_mvs: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+        start_time = datetime.utcnow()
+        logger.info(f"Iniciando ProvisionMvUniqueIndexesJob (all={all_mvs}, dry_run={dry_run})")
+        stats: Dict[str, Any] = {"results": [], "by_status": {}, "errors": [], "needs_confirmation": []}
+
+        for mv in self.target_mvs(all_mvs):
+            try:
+                result = provision_unique_index(self.db, mv, dry_run=dry_run)
+            except Exception as e:
+                logger.error(f"Error provisionando índice único de {mv}: {e}", exc_info=True)
+                self.db.rollback()
+                result = {"mv": mv, "status": "error", "error": str(e)[:200]}
+            stats["results"].append(result)
+            stats["by_status"][result["status"]] = stats["by_status"].get(result["status"], 0) + 1
+            if result["status"] in ("unkeyable", "error"):
+                stats["errors"].append(f"{mv}: {result['status']}")
+            elif result["status"] == "needs_confirmation":
+                stats["needs_confirmation"].extend(s["ddl"] for s in result["suggested"])
+
+        duration = (datetime.utcnow() - start_time).total_seconds()
+        logger.info(f"ProvisionMvUniqueIndexesJob finalizado en {duration:.2f} segundos. Resumen: {stats['by_status']}")
+        return stats
+
+
+def run_job(all_mvs: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Función de entrada para ejecutar el job.
+    Puede ser llamada desde CLI, cron, o API.
+    """
+    db = MaintenanceSessionLocal()
+    try:
+        job = ProvisionMvUniqueIndexesJob(db)
+        return job.run(all_mvs=all_mvs, dry_run=dry_run)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:]
+    result = run_job(all_mvs="--all" in args, dry_run="--dry-run" in args)
+    for item in result["results"]:
+        key = f" ({', '.join(item['key'])})" if item.get("key") else ""
+        print(f"[{item['status'].upper()}] {item['mv']}{key}")
+    if result["needs_confirmation"]:
+        print("Granos inferidos de los datos (confirmar antes de aplicar):")
+        for ddl in result["needs_confirmation"]:
+            print(f"  {ddl};")
+    print(f"Resumen: {result['by_status']}")
@@ -6,15 +6,24 @@ Si match:
   - UPSERT canon.identity_links
   - UPSERT canon.identity_origin (FIX ORIGIN_MISSING)
   - Marca queue status=matched
+
+La cola se reclama por chunks con SELECT ... FOR UPDATE SKIP LOCKED y un lease
+(claimed_by, lease_expires_at), así que se pueden ejecutar N workers en threads
+(--workers) o varios procesos en paralelo sin procesar dos veces el mismo lead.
 """
 import logging
-from typing import Dict, Any, Optional
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 from datetime import datetime, date
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import func, text
 from uuid import UUID
 
-from app.core.db import SessionLocal
+from app.core.db import BatchSessionLocal
 from app.models.ops import CabinetKpiRedRecoveryQueue
 from app.models.canon import IdentityLink, IdentityOrigin, OriginTag, DecidedBy, OriginResolutionStatus, IdentityUnmatched
 from app.services.matching import MatchingEngine, IdentityCandidateInput
@@ -26,94 +35,96 @@ logger = logging.getLogger(__name__)
 BATCH_SIZE = 500
 MAX_ATTEMPTS = 5
 DEFAULT_CONFIDENCE = 95.0
+LEASE_SECONDS = 900
+
+
+class _ClaimBudget:
+    """Límite de leads compartido entre workers (None = sin límite)"""
+    
+    def __init__(self, limit: Optional[int]):
+        self._remaining = limit
+        self._lock = threading.Lock()
+    
+    def take(self, size: int) -> int:
+        with self._lock:
+            if self._remaining is None:
+                return size
+            granted = min(size, self._remaining)
+            self._remaining -= granted
+            return granted
 
 
 class RecoverKpiRedLeadsJob:
     """Job para recuperar leads del KPI rojo"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, worker_id: Optional[str] = None):
         self.db = db
         self.matching_engine = MatchingEngine(db)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._lead_data_cache: Dict[str, Dict[str, Any]] = {}
     
     def run(
         self,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        workers: int = 1,
+        chunk_size: int = BATCH_SIZE,
+        lease_seconds: int = LEASE_SECONDS
     ) -> Dict[str, Any]:
         """
         Ejecuta el job para recuperar leads del KPI rojo.
         
+        Cada worker reclama chunks de la cola con FOR UPDATE SKIP LOCKED y un lease,
+        por lo que el job puede ejecutarse en varios threads y/o procesos a la vez.
+        
         Args:
             limit: Número máximo de leads a procesar (None = todos los pending)
+            workers: Número de workers (threads) con sesión propia
+            chunk_size: Leads reclamados por cada claim
+            lease_seconds: Duración del lease; al expirar, otro worker puede reclamar el lead
         
         Returns:
-            Dict con estadísticas del procesamiento
+            Dict con estadísticas del procesamiento (totales y por worker)
         """
         stats = {
             "processed": 0,
             "matched": 0,
             "failed": 0,
             "skipped": 0,
-            "errors": []
+            "errors": [],
+            "workers": []
         }
         
         try:
             start_time = datetime.utcnow()
-            logger.info(f"Iniciando RecoverKpiRedLeadsJob a las {start_time}")
-            
-            # Obtener leads pending de la queue
-            query = self.db.query(CabinetKpiRedRecoveryQueue).filter(
-                CabinetKpiRedRecoveryQueue.status == 'pending'
-            ).order_by(
-                CabinetKpiRedRecoveryQueue.attempt_count.asc(),
-                CabinetKpiRedRecoveryQueue.created_at.asc()
-            )
-            
-            if limit:
-                query = query.limit(limit)
+            logger.info(f"Iniciando RecoverKpiRedLeadsJob a las {start_time} (workers={workers}, chunk_size={chunk_size})")
             
-            pending_leads = query.all()
-            total_leads = len(pending_leads)
+            # Hora de la DB como corte: un lead intentado en esta ejecución no se vuelve a reclamar
+            run_started_at = self.db.execute(text("SELECT NOW()")).scalar()
+            self.db.commit()
+            budget = _ClaimBudget(limit)
             
-            logger.info(f"Encontrados {total_leads} leads pending en la queue (batch_size={BATCH_SIZE})")
+            if workers <= 1:
+                worker_results = [self._run_worker(run_started_at, budget, chunk_size, lease_seconds)]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(
+                            _run_thread_worker,
+                            f"{self.worker_id}-w{i + 1}",
+                            run_started_at,
+                            budget,
+                            chunk_size,
+                            lease_seconds
+                        )
+                        for i in range(workers)
+                    ]
+                    worker_results = [f.result() for f in futures]
             
-            # Procesar en batches
-            for batch_start in range(0, total_leads, BATCH_SIZE):
-                batch_end = min(batch_start + BATCH_SIZE, total_leads)
-                batch = pending_leads[batch_start:batch_end]
-                batch_num = (batch_start // BATCH_SIZE) + 1
-                total_batches = (total_leads + BATCH_SIZE - 1) // BATCH_SIZE
-                
-                logger.info(f"Procesando batch {batch_num}/{total_batches} ({len(batch)} leads)")
-                
-                for queue_entry in batch:
-                    lead_source_pk = queue_entry.lead_source_pk
-                    try:
-                        result = self._process_lead(queue_entry)
-                        stats["processed"] += 1
-                        
-                        if result["status"] == "matched":
-                            stats["matched"] += 1
-                        elif result["status"] == "skipped":
-                            stats["skipped"] += 1
-                        else:
-                            stats["failed"] += 1
-                            stats["errors"].append(f"Lead {lead_source_pk}: {result.get('reason', 'unknown_error')}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error inesperado procesando lead {lead_source_pk}: {e}", exc_info=True)
-                        stats["failed"] += 1
-                        stats["errors"].append(f"Lead {lead_source_pk}: {str(e)}")
-                        self.db.rollback()
-                        continue
-                
-                # Commit después de cada batch
-                try:
-                    self.db.commit()
-                    logger.info(f"Commit de batch {batch_num} completado.")
-                except Exception as e:
-                    logger.error(f"Error haciendo commit de batch {batch_num}: {e}", exc_info=True)
-                    self.db.rollback()
-                    stats["errors"].append(f"Batch {batch_num} commit failed: {str(e)}")
+            for worker_stats in worker_results:
+                for key in ("processed", "matched", "failed", "skipped"):
+                    stats[key] += worker_stats[key]
+                stats["errors"].extend(worker_stats.pop("errors"))
+                stats["workers"].append(worker_stats)
             
             end_time = datetime.utcnow()
             duration = (end_time - start_time).total_seconds()
@@ -126,6 +137,121 @@ class RecoverKpiRedLeadsJob:
         
         return stats
     
+    def _run_worker(
+        self,
+        run_started_at: datetime,
+        budget: "_ClaimBudget",
+        chunk_size: int,
+        lease_seconds: int
+    ) -> Dict[str, Any]:
+        """Reclama y procesa chunks hasta vaciar la cola o agotar el límite"""
+        worker_stats = {
+            "worker_id": self.worker_id,
+            "chunks": 0,
+            "processed": 0,
+            "matched": 0,
+            "failed": 0,
+            "skipped": 0,
+            "errors": []
+        }
+        started = time.monotonic()
+        
+        while True:
+            size = budget.take(chunk_size)
+            if size <= 0:
+                break
+            
+            lead_source_pks = self._claim_chunk(size, run_started_at, lease_seconds)
+            if not lead_source_pks:
+                break
+            
+            worker_stats["chunks"] += 1
+            chunk_num = worker_stats["chunks"]
+            logger.info(f"[{self.worker_id}] Procesando chunk {chunk_num} ({len(lead_source_pks)} leads)")
+            
+            queue_entries = self.db.query(CabinetKpiRedRecoveryQueue).filter(
+                CabinetKpiRedRecoveryQueue.lead_source_pk.in_(lead_source_pks)
+            ).all()
+            self._preload_lead_data(lead_source_pks)
+            
+            for queue_entry in queue_entries:
+                lead_source_pk = queue_entry.lead_source_pk
+                try:
+                    result = self._process_lead(queue_entry)
+                    worker_stats["processed"] += 1
+                    
+                    if result["status"] == "matched":
+                        worker_stats["matched"] += 1
+                    elif result["status"] == "skipped":
+                        worker_stats["skipped"] += 1
+                    else:
+                        worker_stats["failed"] += 1
+                        worker_stats["errors"].append(f"Lead {lead_source_pk}: {result.get('reason', 'unknown_error')}")
+                        
+                except Exception as e:
+                    logger.error(f"Error inesperado procesando lead {lead_source_pk}: {e}", exc_info=True)
+                    worker_stats["failed"] += 1
+                    worker_stats["errors"].append(f"Lead {lead_source_pk}: {str(e)}")
+                    self.db.rollback()
+                    continue
+            
+            # Liberar el lease y commit después de cada chunk
+            try:
+                for queue_entry in queue_entries:
+                    queue_entry.claimed_by = None
+                    queue_entry.lease_expires_at = None
+                self.db.commit()
+                logger.info(f"[{self.worker_id}] Commit de chunk {chunk_num} completado.")
+            except Exception as e:
+                logger.error(f"[{self.worker_id}] Error haciendo commit de chunk {chunk_num}: {e}", exc_info=True)
+                self.db.rollback()
+                worker_stats["errors"].append(f"Chunk {chunk_num} ({self.worker_id}) commit failed: {str(e)}")
+            finally:
+                self._lead_data_cache.clear()
+        
+        elapsed = time.monotonic() - started
+        worker_stats["elapsed_seconds"] = round(elapsed, 2)
+        worker_stats["leads_per_second"] = round(worker_stats["processed"] / elapsed, 2) if elapsed > 0 else 0.0
+        logger.info(
+            f"[{self.worker_id}] Worker finalizado: {worker_stats['processed']} leads en "
+            f"{worker_stats['elapsed_seconds']}s ({worker_stats['leads_per_second']} leads/s)"
+        )
+        return worker_stats
+    
+    def _claim_chunk(self, size: int, run_started_at: datetime, lease_seconds: int) -> List[str]:
+        """
+        Reclama hasta `size` leads pending con FOR UPDATE SKIP LOCKED y les asigna un lease.
+        Se excluyen leads con lease vigente y los ya intentados en esta ejecución.
+        """
+        result = self.db.execute(text("""
+            WITH claimable AS (
+                SELECT lead_source_pk
+                FROM ops.cabinet_kpi_red_recovery_queue
+                WHERE status = 'pending'
+                    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                    AND (last_attempt_at IS NULL OR last_attempt_at < :run_started_at)
+                ORDER BY attempt_count ASC, created_at ASC
+                LIMIT :size
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE ops.cabinet_kpi_red_recovery_queue q
+            SET claimed_by = :worker_id,
+                lease_expires_at = NOW() + make_interval(secs => :lease_seconds),
+                last_attempt_at = NOW()
+            FROM claimable
+            WHERE q.lead_source_pk = claimable.lead_source_pk
+            RETURNING q.lead_source_pk
+        """), {
+            "size": size,
+            "run_started_at": run_started_at,
+            "worker_id": self.worker_id,
+            "lease_seconds": lease_seconds
+        })
+        lead_source_pks = [row.lead_source_pk for row in result.fetchall()]
+        # Commit inmediato: libera los row locks y deja el lease visible para otros workers
+        self.db.commit()
+        return lead_source_pks
+    
     def _process_lead(self, queue_entry: CabinetKpiRedRecoveryQueue) -> Dict[str, Any]:
         """Procesa un lead individual: intenta matching y crea links/origin"""
         lead_source_pk = queue_entry.lead_source_pk
@@ -145,7 +271,7 @@ class RecoverKpiRedLeadsJob:
                 queue_entry.status = 'matched'
                 queue_entry.matched_person_key = person_key
                 queue_entry.fail_reason = None
-                queue_entry.updated_at = datetime.utcnow()
+                queue_entry.updated_at = func.now()
                 self.db.flush()
                 logger.info(f"Lead {lead_source_pk} ya tenía link, origin asegurado y marcado como matched")
                 return {"status": "matched", "person_key": str(person_key), "action": "already_linked"}
@@ -155,7 +281,8 @@ class RecoverKpiRedLeadsJob:
         
         # Incrementar attempt_count
         queue_entry.attempt_count += 1
-        queue_entry.last_attempt_at = datetime.utcnow()
+        # Hora del servidor (timestamptz): el claim compara last_attempt_at con el NOW() del inicio del run
+        queue_entry.last_attempt_at = func.now()
         
         # Obtener datos del lead
         lead_data = self._get_lead_data(lead_source_pk)
@@ -186,7 +313,7 @@ class RecoverKpiRedLeadsJob:
                 queue_entry.status = 'matched'
                 queue_entry.matched_person_key = person_key
                 queue_entry.fail_reason = None
-                queue_entry.updated_at = datetime.utcnow()
+                queue_entry.updated_at = func.now()
                 self.db.flush()
                 
                 logger.info(f"Lead {lead_source_pk} matcheado exitosamente a person_key {person_key}")
@@ -201,7 +328,7 @@ class RecoverKpiRedLeadsJob:
                     queue_entry.status = 'pending'
                 
                 queue_entry.fail_reason = fail_reason
-                queue_entry.updated_at = datetime.utcnow()
+                queue_entry.updated_at = func.now()
                 self.db.flush()
                 
                 logger.debug(f"Lead {lead_source_pk} no matcheado (intento {queue_entry.attempt_count}): {fail_reason}")
@@ -217,12 +344,38 @@ class RecoverKpiRedLeadsJob:
                 queue_entry.status = 'pending'
             
             queue_entry.fail_reason = f"error: {str(e)}"
-            queue_entry.updated_at = datetime.utcnow()
+            queue_entry.updated_at = func.now()
             self.db.flush()
             return {"status": queue_entry.status, "reason": "error"}
     
+    def _preload_lead_data(self, lead_source_pks: List[str]):
+        """Carga en una sola query los datos de todos los leads del chunk"""
+        query = text("""
+            SELECT DISTINCT ON (COALESCE(external_id::text, id::text))
+                COALESCE(external_id::text, id::text) AS lead_source_pk,
+                id,
+                external_id,
+                lead_created_at,
+                park_phone,
+                first_name,
+                middle_name,
+                last_name,
+                asset_plate_number,
+                asset_model
+            FROM public.module_ct_cabinet_leads
+            WHERE COALESCE(external_id::text, id::text) = ANY(:lead_source_pks)
+            ORDER BY COALESCE(external_id::text, id::text)
+        """)
+        result = self.db.execute(query, {"lead_source_pks": list(lead_source_pks)})
+        for row in result.fetchall():
+            lead_data = dict(row._mapping)
+            self._lead_data_cache[lead_data.pop("lead_source_pk")] = lead_data
+    
     def _get_lead_data(self, lead_source_pk: str) -> Optional[Dict[str, Any]]:
-        """Obtiene datos del lead desde module_ct_cabinet_leads"""
+        """Obtiene datos del lead desde module_ct_cabinet_leads (usa el chunk precargado si existe)"""
+        if lead_source_pk in self._lead_data_cache:
+            return self._lead_data_cache[lead_source_pk]
+        
         query = text("""
             SELECT 
                 id,
@@ -406,28 +559,55 @@ class RecoverKpiRedLeadsJob:
                 logger.info(f"Actualizado IdentityOrigin para person_key {person_key} con lead {lead_source_pk}")
 
 
-def run_job(limit: Optional[int] = None) -> Dict[str, Any]:
+def _run_thread_worker(
+    worker_id: str,
+    run_started_at: datetime,
+    budget: _ClaimBudget,
+    chunk_size: int,
+    lease_seconds: int
+) -> Dict[str, Any]:
+    """Entrada de un worker en thread: cada worker usa su propia sesión del pool"""
+    db = BatchSessionLocal()
+    try:
+        job = RecoverKpiRedLeadsJob(db, worker_id=worker_id)
+        return job._run_worker(run_started_at, budget, chunk_size, lease_seconds)
+    finally:
+        db.close()
+
+
+def run_job(
+    limit: Optional[int] = None,
+    workers: int = 1,
+    chunk_size: int = BATCH_SIZE,
+    lease_seconds: int = LEASE_SECONDS
+) -> Dict[str, Any]:
     """
     Función de entrada para ejecutar el job.
     Puede ser llamada desde CLI, cron, o API.
     """
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         job = RecoverKpiRedLeadsJob(db)
-        return job.run(limit)
+        return job.run(limit, workers=workers, chunk_size=chunk_size, lease_seconds=lease_seconds)
     finally:
         db.close()
 
 
 if __name__ == "__main__":
-    import sys
+    import argparse
     
-    _limit = None
-    if len(sys.argv) > 1:
-        try:
-            _limit = int(sys.argv[1])
-        except ValueError:
-            pass
+    parser = argparse.ArgumentParser(description="Recuperar leads del KPI rojo")
+    parser.add_argument("limit_pos", nargs="?", type=int, default=None, help="Límite de leads (posicional, compatibilidad)")
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de leads a procesar")
+    parser.add_argument("--workers", type=int, default=1, help="Número de workers en paralelo")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_SIZE, help="Leads reclamados por chunk")
+    parser.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS, help="Duración del lease de cada chunk")
+    args = parser.parse_args()
     
-    result = run_job(limit=_limit)
+    result = run_job(
+        limit=args.limit if args.limit is not None else args.limit_pos,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        lease_seconds=args.lease_seconds
+    )
     print(f"Job Result: {result}")
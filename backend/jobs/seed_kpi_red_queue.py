@@ -3,6 +3,18 @@
 Job para sembrar la cola de recovery desde el backlog del KPI rojo.
 Inserta/Upsert todos los lead_source_pk de ops.v_cabinet_kpi_red_backlog
 en ops.cabinet_kpi_red_recovery_queue como pending.
+
+El upsert es un único INSERT ... SELECT ... ON CONFLICT DO UPDATE ejecutado en
+la base de datos: el backlog nunca pasa por la aplicación.
+  - Modo full: considera todo el backlog (las filas ya pending no se modifican;
+    las matched/failed que siguen en el backlog vuelven a pending para reintento).
+  - Modo delta (--delta): solo los leads del backlog que aún no están en la cola
+    y los que cambiaron a matched/failed desde la última siembra exitosa
+    (queue.updated_at > watermark). Las filas failed que no cambiaron no se
+    reintentan: eso queda para el modo full. Sin watermark previo se siembra en full.
+
+El watermark (inicio de la última siembra exitosa) se guarda en ops.job_watermarks,
+en la misma transacción que el upsert.
 """
 import logging
 from typing import Dict, Any
@@ -10,12 +22,70 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from app.core.db import SessionLocal
-from app.models.ops import CabinetKpiRedRecoveryQueue
+from app.core.db import BatchSessionLocal
 
 logger = logging.getLogger(__name__)
 
-BATCH_SIZE = 1000
+SEED_SQL = """
+    WITH backlog AS (
+        SELECT DISTINCT b.lead_source_pk
+        FROM ops.v_cabinet_kpi_red_backlog b
+        WHERE b.lead_source_pk IS NOT NULL
+    ),
+    candidates AS (
+        SELECT backlog.lead_source_pk
+        FROM backlog
+        {delta_filter}
+    ),
+    upserted AS (
+        INSERT INTO ops.cabinet_kpi_red_recovery_queue (lead_source_pk, status, attempt_count)
+        SELECT lead_source_pk, 'pending', 0
+        FROM candidates
+        ON CONFLICT (lead_source_pk) DO UPDATE
+        SET status = 'pending',
+            attempt_count = 0,
+            fail_reason = NULL,
+            matched_person_key = NULL,
+            last_attempt_at = NULL,
+            claimed_by = NULL,
+            lease_expires_at = NULL,
+            updated_at = NOW()
+        -- Si ya existe pero está matched/failed, resetear a pending (volvió a entrar al backlog).
+        -- Si ya está pending, no hacer nada.
+        WHERE ops.cabinet_kpi_red_recovery_queue.status IN ('matched', 'failed')
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        (SELECT COUNT(*) FROM backlog) AS backlog_total,
+        (SELECT COUNT(*) FROM candidates) AS processed,
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated
+    FROM upserted
+"""
+
+DELTA_FILTER = """
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM ops.cabinet_kpi_red_recovery_queue q
+            WHERE q.lead_source_pk = backlog.lead_source_pk
+                AND NOT (q.status IN ('matched', 'failed') AND q.updated_at > :watermark)
+        )
+"""
+
+JOB_NAME = "seed_kpi_red_queue"
+
+WATERMARK_SQL = """
+    SELECT watermark FROM ops.job_watermarks WHERE job_name = :job_name
+"""
+
+# transaction_timestamp(): inicio de esta siembra; lo que cambie durante ella entra en la próxima
+SAVE_WATERMARK_SQL = """
+    INSERT INTO ops.job_watermarks (job_name, watermark, updated_at)
+    VALUES (:job_name, transaction_timestamp(), NOW())
+    ON CONFLICT (job_name) DO UPDATE
+    SET watermark = EXCLUDED.watermark,
+        updated_at = NOW()
+"""
 
 
 class SeedKpiRedQueueJob:
@@ -24,14 +94,19 @@ class SeedKpiRedQueueJob:
     def __init__(self, db: Session):
         self.db = db
     
-    def run(self) -> Dict[str, Any]:
+    def run(self, delta: bool = False) -> Dict[str, Any]:
         """
         Ejecuta el job para sembrar la cola.
         
+        Args:
+            delta: Si True, solo leads nuevos en la cola o que cambiaron desde la última siembra
+        
         Returns:
             Dict con estadísticas del procesamiento
         """
         stats = {
+            "mode": "delta" if delta else "full",
+            "backlog_total": 0,
             "processed": 0,
             "inserted": 0,
             "updated": 0,
@@ -40,76 +115,28 @@ class SeedKpiRedQueueJob:
         
         try:
             start_time = datetime.utcnow()
-            logger.info(f"Iniciando SeedKpiRedQueueJob a las {start_time}")
+            logger.info(f"Iniciando SeedKpiRedQueueJob a las {start_time} (modo={stats['mode']})")
             
-            # Obtener todos los lead_source_pk del backlog
-            backlog_query = text("""
-                SELECT lead_source_pk
-                FROM ops.v_cabinet_kpi_red_backlog
-                ORDER BY age_days DESC, lead_date DESC
-            """)
-            backlog_result = self.db.execute(backlog_query)
-            backlog_leads = [row.lead_source_pk for row in backlog_result.fetchall()]
+            params = {}
+            if delta:
+                watermark = self.db.execute(text(WATERMARK_SQL), {"job_name": JOB_NAME}).scalar()
+                if watermark is None:
+                    logger.info("Sin watermark previo: la siembra delta se ejecuta en modo full")
+                    stats["mode"] = "full"
+                    delta = False
+                else:
+                    params["watermark"] = watermark
+                    stats["watermark"] = watermark.isoformat()
             
-            total_leads = len(backlog_leads)
-            logger.info(f"Encontrados {total_leads} leads en el backlog del KPI rojo")
+            query = text(SEED_SQL.format(delta_filter=DELTA_FILTER if delta else ""))
+            row = self.db.execute(query, params).fetchone()
+            self.db.execute(text(SAVE_WATERMARK_SQL), {"job_name": JOB_NAME})
+            self.db.commit()
             
-            # Procesar en batches
-            for batch_start in range(0, total_leads, BATCH_SIZE):
-                batch_end = min(batch_start + BATCH_SIZE, total_leads)
-                batch = backlog_leads[batch_start:batch_end]
-                batch_num = (batch_start // BATCH_SIZE) + 1
-                total_batches = (total_leads + BATCH_SIZE - 1) // BATCH_SIZE
-                
-                logger.info(f"Procesando batch {batch_num}/{total_batches} ({len(batch)} leads)")
-                
-                for lead_source_pk in batch:
-                    try:
-                        # Buscar si ya existe en la queue
-                        existing = self.db.query(CabinetKpiRedRecoveryQueue).filter(
-                            CabinetKpiRedRecoveryQueue.lead_source_pk == lead_source_pk
-                        ).first()
-                        
-                        if existing:
-                            # Si ya existe pero está matched/failed, resetear a pending si está en el backlog
-                            # (puede haber sido removido y vuelto a entrar)
-                            if existing.status in ('matched', 'failed'):
-                                existing.status = 'pending'
-                                existing.attempt_count = 0
-                                existing.fail_reason = None
-                                existing.matched_person_key = None
-                                existing.last_attempt_at = None
-                                existing.updated_at = datetime.utcnow()
-                                stats["updated"] += 1
-                            # Si ya está pending, no hacer nada
-                            else:
-                                pass
-                        else:
-                            # Insertar nuevo registro
-                            queue_entry = CabinetKpiRedRecoveryQueue(
-                                lead_source_pk=lead_source_pk,
-                                status='pending',
-                                attempt_count=0
-                            )
-                            self.db.add(queue_entry)
-                            stats["inserted"] += 1
-                        
-                        stats["processed"] += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Error procesando lead {lead_source_pk}: {e}", exc_info=True)
-                        stats["errors"].append(f"Lead {lead_source_pk}: {str(e)}")
-                        self.db.rollback()
-                        continue
-                
-                # Commit después de cada batch
-                try:
-                    self.db.commit()
-                    logger.info(f"Commit de batch {batch_num} completado.")
-                except Exception as e:
-                    logger.error(f"Error haciendo commit de batch {batch_num}: {e}", exc_info=True)
-                    self.db.rollback()
-                    stats["errors"].append(f"Batch {batch_num} commit failed: {str(e)}")
+            stats["backlog_total"] = row.backlog_total or 0
+            stats["processed"] = row.processed or 0
+            stats["inserted"] = row.inserted or 0
+            stats["updated"] = row.updated or 0
             
             end_time = datetime.utcnow()
             duration = (end_time - start_time).total_seconds()
@@ -123,15 +150,15 @@ class SeedKpiRedQueueJob:
         return stats
 
 
-def run_job() -> Dict[str, Any]:
+def run_job(delta: bool = False) -> Dict[str, Any]:
     """
     Función de entrada para ejecutar el job.
     Puede ser llamada desde CLI, cron, o API.
     """
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         job = SeedKpiRedQueueJob(db)
-        return job.run()
+        return job.run(delta=delta)
     finally:
         db.close()
 
@@ -139,5 +166,5 @@ def run_job() -> Dict[str, Any]:
 if __name__ == "__main__":
     import sys
     
-    result = run_job()
+    result = run_job(delta="--delta" in sys.argv[1:])
     print(f"Job Result: {result}")
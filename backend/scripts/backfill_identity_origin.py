@@ -71,6 +71,9 @@ def backfill_identity_origin(dry_run: bool = True, batch_size: int = 100):
             if not persons:
                 break
             
+            # Precargar hechos del lote (first_seen_at, links válidos) en una sola query
+            service.person_facts.prefetch(p.person_key for p in persons)
+            
             for person_row in persons:
                 person_key = person_row.person_key
                 stats["processed"] += 1
@@ -178,6 +181,7 @@ def backfill_identity_origin(dry_run: bool = True, batch_size: int = 100):
         logger.info(f"Registros actualizados: {stats['updated']}")
         logger.info(f"Requieren revisión manual: {stats['requires_manual_review']}")
         logger.info(f"Errores: {stats['errors']}")
+        logger.info(f"Cache de hechos por persona: {service.person_facts.metrics()}")
         logger.info("="*60)
         
         if dry_run:
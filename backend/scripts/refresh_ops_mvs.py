@@ -3,13 +3,17 @@
 """
 Script oficial para refrescar Materialized Views de Yego/Yango Cabinet Cobranza.
 
-Ejecuta los REFRESH en orden canónico:
-1) mv_yango_payments_raw_current (CONCURRENTLY)
-2) mv_yango_payments_ledger_latest (CONCURRENTLY)
-3) mv_yango_payments_ledger_latest_enriched (CONCURRENTLY)
-4) mv_yango_receivable_payable_detail (CONCURRENTLY)
-5) mv_claims_payment_status_cabinet (CONCURRENTLY)
-6) mv_yango_cabinet_claims_for_collection (CONCURRENTLY)
+Refresca (CONCURRENTLY) estas MVs:
+1) mv_yango_payments_raw_current
+2) mv_yango_payments_ledger_latest
+3) mv_yango_payments_ledger_latest_enriched
+4) mv_yango_receivable_payable_detail
+5) mv_claims_payment_status_cabinet
+6) mv_yango_cabinet_claims_for_collection
+
+El orden real sale del grafo de dependencias de la base (pg_depend): cada MV se
+lanza en cuanto terminan las que lee y las ramas independientes corren en
+paralelo (MV_REFRESH_MAX_PARALLEL conexiones, por defecto 3).
 
 Uso:
     cd backend
@@ -32,7 +36,9 @@ backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
 try:
-    from app.core.db import engine
+    from app.core.db import MaintenanceSessionLocal, maintenance_engine
+    from app.services.mv_maintenance import refresh_mvs_parallel
+    from app.services.mv_refresh_coordinator import coordinated_refresh
     from sqlalchemy import text
 except ImportError as e:
     print("ERROR: No se pueden importar los módulos necesarios.")
@@ -138,7 +144,7 @@ def refresh_mv(mv_name: str, concurrently: bool = True, run_id: str = None, conn
     
     try:
         if conn is None:
-            conn = engine.connect()
+            conn = maintenance_engine.connect()
             should_close = True
         else:
             should_close = False
@@ -265,7 +271,7 @@ def main():
     
     # Intentar crear registro en BD (opcional, no crítico)
     try:
-        with engine.connect() as conn:
+        with maintenance_engine.connect() as conn:
             # Verificar si la tabla existe
             table_check = conn.execute(text("""
                 SELECT EXISTS (
@@ -302,45 +308,66 @@ def main():
         # Mantener una conexión abierta para logging
         if run_id:
             try:
-                conn = engine.connect()
+                conn = maintenance_engine.connect()
             except Exception as e:
                 print(f"[WARN] No se pudo mantener conexión para logging: {e}")
                 conn = None
         
-        for idx, mv_config in enumerate(MVS_REFRESH_ORDER, 1):
-            mv_name = mv_config["name"]
-            concurrently = mv_config["concurrently"]
-            description = mv_config["description"]
-            
-            mode_str = "CONCURRENTLY" if concurrently else "NORMAL"
-            print(f"[{idx}/{len(MVS_REFRESH_ORDER)}] Refrescando {mv_name} ({mode_str})...")
-            print(f"         Descripción: {description}")
-            print(f"         Inicio: {datetime.now().strftime('%H:%M:%S')}", end=" ", flush=True)
+        mv_configs = {mv_config["name"]: mv_config for mv_config in MVS_REFRESH_ORDER}
+        
+        def refresh_step(schema_name: str, mv_name_only: str) -> dict:
+            # Cada refresh abre su propia conexión (incluido el logging del step): corren en paralelo
+            mv_name = f"{schema_name}.{mv_name_only}"
+            mv_config = mv_configs[mv_name]
+            mode_str = "CONCURRENTLY" if mv_config["concurrently"] else "NORMAL"
+            print(f"[START] {mv_name} ({mode_str}) - {mv_config['description']} - {datetime.now().strftime('%H:%M:%S')}", flush=True)
             
-            success, elapsed, error_msg = refresh_mv(mv_name, concurrently, run_id=run_id, conn=conn)
+            def run_refresh() -> dict:
+                success, elapsed, error_msg = refresh_mv(mv_name, mv_config["concurrently"], run_id=run_id)
+                return {
+                    "mv": mv_name,
+                    "status": "success" if success else "error",
+                    "duration_seconds": round(elapsed, 2),
+                    "error": error_msg
+                }
             
+            # Si otro proceso está refrescando la misma MV (o acaba de hacerlo), se comparte su resultado
+            db = MaintenanceSessionLocal()
+            try:
+                result = coordinated_refresh(db, schema_name, mv_name_only, run_refresh)
+            finally:
+                db.close()
+            if result.get("coalesced"):
+                print(f"[SHARED] {mv_name}: refresh compartido ({result['shared_refresh_at']})", flush=True)
+            result.setdefault("error", "")
+            return result
+        
+        def report_step(result: dict):
+            mv_name = result["mv"]
+            success = result["status"] == "success"
+            elapsed = result["duration_seconds"]
+            done = len(results) + 1
             if success:
-                print(f"[OK] Completado en {elapsed:.2f}s")
-                results.append({
-                    "mv": mv_name,
-                    "success": True,
-                    "elapsed": elapsed,
-                    "description": description
-                })
+                print(f"[{done}/{len(MVS_REFRESH_ORDER)}] [OK] {mv_name} completado en {elapsed:.2f}s", flush=True)
             else:
-                print(f"[ERROR] ERROR después de {elapsed:.2f}s")
-                print(f"         Error: {error_msg}")
-                results.append({
-                    "mv": mv_name,
-                    "success": False,
-                    "elapsed": elapsed,
-                    "error": error_msg,
-                    "description": description
-                })
+                print(f"[{done}/{len(MVS_REFRESH_ORDER)}] [ERROR] {mv_name} ERROR después de {elapsed:.2f}s", flush=True)
+                print(f"         Error: {result['error']}")
                 # Si falla, continuar con las siguientes pero marcar como fallido
                 print(f"         Continuando con las siguientes MVs...")
-            
-            print()
+            results.append({
+                "mv": mv_name,
+                "success": success,
+                "elapsed": elapsed,
+                "error": result["error"],
+                "description": mv_configs[mv_name]["description"]
+            })
+        
+        refresh = refresh_mvs_parallel(
+            list(mv_configs),
+            refresh_fn=refresh_step,
+            on_result=report_step
+        )
+        print()
         
         total_elapsed = time.time() - total_start
         
@@ -359,7 +386,11 @@ def main():
                 print(f"           Error: {result.get('error', 'Unknown error')}")
         
         print("=" * 70)
-        print(f"Total: {total_elapsed:.2f} segundos")
+        print(f"Total: {total_elapsed:.2f} segundos "
+              f"(suma de refreshes: {refresh['summary']['total_duration_seconds']:.2f}s, "
+              f"paralelismo: {refresh['summary']['max_parallel']})")
+        print(f"Ruta crítica: {' -> '.join(refresh['summary']['critical_path'])} "
+              f"({refresh['summary']['critical_path_seconds']:.2f}s)")
         print(f"Exitosos: {success_count}/{len(results)}")
         print(f"Fallidos: {failed_count}/{len(results)}")
         print(f"Fin: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -384,7 +415,7 @@ def main():
                     })
                     conn.commit()
                 else:
-                    with engine.connect() as conn2:
+                    with maintenance_engine.connect() as conn2:
                         conn2.execute(text("""
                             UPDATE ops.refresh_runs
                             SET finished_at = :finished_at,
@@ -429,7 +460,7 @@ def main():
                     conn.commit()
                     conn.close()
                 else:
-                    with engine.connect() as conn2:
+                    with maintenance_engine.connect() as conn2:
                         conn2.execute(text("""
                             UPDATE ops.refresh_runs
                             SET finished_at = NOW(),
@@ -465,7 +496,7 @@ def main():
                     conn.commit()
                     conn.close()
                 else:
-                    with engine.connect() as conn2:
+                    with maintenance_engine.connect() as conn2:
                         conn2.execute(text("""
                             UPDATE ops.refresh_runs
                             SET finished_at = NOW(),
@@ -24,6 +24,7 @@ sys.path.insert(0, str(backend_dir))
 from app.core.db import SessionLocal
 from app.services.ingestion import IngestionService
 from app.services.lead_attribution import LeadAttributionService
+from app.services.person_facts import PersonFactsCache
 from datetime import date, timedelta
 import logging
 
@@ -63,7 +64,9 @@ def run_ingestion():
         debug_log("run_identity_ingestion_scheduled.py:run_ingestion", "BEFORE_INGESTION", {}, "H3")
         # #endregion
         
-        ingestion_service = IngestionService(db)
+        # Hechos por persona compartidos entre ingesta y atribución (invalidados al crear links)
+        person_facts = PersonFactsCache(db)
+        ingestion_service = IngestionService(db, person_facts=person_facts)
         
         # Solo procesar scouting_daily si cabinet_leads no existe
         # Verificar si cabinet_leads existe
@@ -113,7 +116,7 @@ def run_ingestion():
         logger.info("Paso 2: Poblando lead_events...")
         logger.info("=" * 60)
         
-        attribution_service = LeadAttributionService(db)
+        attribution_service = LeadAttributionService(db, person_facts=person_facts)
         
         # Obtener fechas desde la última corrida o usar últimos 30 días
         date_to = date.today()
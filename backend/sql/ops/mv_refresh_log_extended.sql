@@ -106,12 +106,17 @@ COMMENT ON COLUMN ops.mv_refresh_log.host IS
 COMMENT ON COLUMN ops.mv_refresh_log.meta IS 
 'Metadata adicional en JSONB (opcional, para información de contexto).';
 
-
-
-
-
-
-
-
-
-
+-- skip_reason: motivo por el que se omitió el refresh (status=SKIPPED, p.ej. inputs_unchanged)
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS skip_reason text;
+
+-- Métricas por refresh (app/services/mv_refresh_metrics.py): método, espera de lock,
+-- filas/tamaño/dead tuples antes y después
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS refresh_method text;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS lock_wait_ms int;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS rows_before bigint;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS table_bytes_before bigint;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS table_bytes_after bigint;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS index_bytes_before bigint;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS index_bytes_after bigint;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS dead_tuples_before bigint;
+ALTER TABLE ops.mv_refresh_log ADD COLUMN IF NOT EXISTS dead_tuples_after bigint;
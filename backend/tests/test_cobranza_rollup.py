@@ -0,0 +1,97 @@
+"""
+Tests del rollup semanal de Cobranza Yango: SQL de rebuild y de lectura,
+rebuild enganchado al refresh de la MV fuente y watermark del rollup.
+No requieren base de datos.
+"""
+from types import SimpleNamespace
+
+from app.services import cobranza_rollup
+from app.services.cobranza_rollup import (
+    DIMENSIONS,
+    REBUILD_SQL,
+    ROLLUP_CURRENT_SQL,
+    ROLLUP_TABLE,
+    SAVE_WATERMARK_SQL,
+    SCOUT_METRICS_SQL,
+    SOURCE_MV,
+    WATERMARK_JOB,
+    WEEKLY_KPIS_SQL,
+    rebuild_rollup,
+    rollup_current,
+)
+from app.services.mv_maintenance import CABINET_LEADS_MVS, POST_REFRESH_REBUILDS
+
+
+def test_rebuild_groups_by_every_dimension():
+    assert f"FROM {SOURCE_MV}" in REBUILD_SQL
+    assert f"GROUP BY {', '.join(str(i) for i in range(1, len(DIMENSIONS) + 1))}" in REBUILD_SQL
+
+
+def test_read_queries_take_the_endpoint_where_clause():
+    weekly = WEEKLY_KPIS_SQL.format(where_clause="has_debt AND scout_id = :scout_id")
+    assert f"FROM {ROLLUP_TABLE}" in weekly
+    assert "WHERE has_debt AND scout_id = :scout_id" in weekly
+    assert ":limit_weeks" in weekly
+    assert "WHERE 1=1" in SCOUT_METRICS_SQL.format(where_clause="1=1")
+
+
+def test_rollup_is_rebuilt_after_its_mv_refresh():
+    assert SOURCE_MV in CABINET_LEADS_MVS
+    assert POST_REFRESH_REBUILDS[SOURCE_MV] is rebuild_rollup
+
+
+class _Session:
+    """Sesión mínima: registra las sentencias; `fail_on` hace fallar la que lo contenga."""
+
+    def __init__(self, fail_on=None, current=True):
+        self.fail_on = fail_on
+        self.current = current
+        self.statements = []
+        self.params = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if self.fail_on and self.fail_on in sql:
+            raise RuntimeError("rebuild failed")
+        self.statements.append(sql)
+        self.params.append(params)
+        return SimpleNamespace(rowcount=3, scalar=lambda: self.current)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _rollup_exists(monkeypatch):
+    monkeypatch.setattr(cobranza_rollup, "get_relation_info", lambda db, schema, name: SimpleNamespace(exists=True))
+    monkeypatch.setattr(cobranza_rollup, "invalidate", lambda db, relation: None)
+
+
+def test_rebuild_saves_watermark_in_the_same_transaction(monkeypatch):
+    _rollup_exists(monkeypatch)
+    db = _Session()
+    assert rebuild_rollup(db)["status"] == "rebuilt"
+    assert db.statements[-1] == SAVE_WATERMARK_SQL
+    assert db.params[-1] == {"job_name": WATERMARK_JOB}
+    assert db.commits == 1
+
+
+def test_failed_rebuild_keeps_the_old_watermark(monkeypatch):
+    _rollup_exists(monkeypatch)
+    db = _Session(fail_on="GROUP BY")
+    assert rebuild_rollup(db)["status"] == "error"
+    assert SAVE_WATERMARK_SQL not in db.statements
+    assert (db.commits, db.rollbacks) == (0, 1)
+
+
+def test_rollup_behind_its_mv_is_not_read(monkeypatch):
+    _rollup_exists(monkeypatch)
+    assert "l.status = 'SUCCESS'" in ROLLUP_CURRENT_SQL
+    db = _Session(current=False)
+    assert rollup_current(db) is False
+    assert db.params[-1] == {"job_name": WATERMARK_JOB, "schema": "ops", "mv_name": SOURCE_MV.split(".", 1)[1]}
+    assert rollup_current(_Session(current=True)) is True
@@ -0,0 +1,59 @@
+"""
+Tests del export Parquet / Arrow IPC (tipos desde cursor.description y round-trip).
+No requieren base de datos; se omiten si pyarrow no está instalado.
+"""
+import io
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq  # noqa: E402
+
+from app.services.columnar_export import (  # noqa: E402
+    PG_BOOL, PG_DATE, PG_INT4, PG_NUMERIC, arrow_type, build_schema, iter_arrow, iter_parquet,
+)
+
+# (name, type_code, display_size, internal_size, precision, scale, null_ok)
+DESCRIPTION = [
+    ("driver_id", 25, None, None, None, None, None),
+    ("person_key", 2950, None, None, None, None, None),
+    ("lead_date", PG_DATE, None, None, None, None, None),
+    ("trips", PG_INT4, None, None, None, None, None),
+    ("amount", PG_NUMERIC, None, None, 12, 2, None),
+    ("ratio", PG_NUMERIC, None, None, None, None, None),
+    ("paid", PG_BOOL, None, None, None, None, None),
+]
+ROWS = [
+    ("d1", UUID(int=1), date(2025, 1, 6), 5, Decimal("25.00"), Decimal("0.5"), True),
+    ("d2", None, None, None, None, None, None),
+]
+
+
+def test_arrow_type_numeric_keeps_declared_scale_only():
+    assert arrow_type(pa, PG_NUMERIC, 12, 2) == pa.decimal128(12, 2)
+    assert arrow_type(pa, PG_NUMERIC) == pa.float64()
+    assert arrow_type(pa, 2950) == pa.string()
+
+
+def test_arrow_stream_round_trip():
+    schema, converters = build_schema(pa, DESCRIPTION)
+    data = b"".join(iter_arrow(pa, schema, converters, iter([ROWS[:1], ROWS[1:]])))
+    table = pa.ipc.open_stream(data).read_all()
+
+    assert table.schema == schema
+    assert table.num_rows == 2
+    assert table.column("person_key").to_pylist() == [str(UUID(int=1)), None]
+    assert table.column("amount").to_pylist() == [Decimal("25.00"), None]
+    assert table.column("ratio").to_pylist() == [0.5, None]
+
+
+def test_parquet_round_trip():
+    schema, converters = build_schema(pa, DESCRIPTION)
+    data = b"".join(iter_parquet(pa, schema, converters, iter([ROWS])))
+    table = pq.read_table(io.BytesIO(data))
+
+    assert table.num_rows == 2
+    assert table.column("lead_date").to_pylist() == [date(2025, 1, 6), None]
@@ -0,0 +1,114 @@
+"""
+Tests de la cache de totales: clave por filtro normalizado, lectura del plan,
+estimaciones solo sin filtro e invalidación al refrescar una MV.
+No requieren base de datos.
+"""
+from contextlib import nullcontext
+from datetime import date
+
+import pytest
+
+from app.services import count_cache
+from app.services.count_cache import count_key, count_rows, invalidate_counts, is_unfiltered, plan_rows
+from app.services.mv_cache import INVALIDATE_ALL, _drop
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    invalidate_counts()
+    yield
+    invalidate_counts()
+
+
+def test_count_key_normalizes_whitespace_and_ignores_paging_params():
+    a = count_key("ops.v", "WHERE  lead_date >= :d\n  AND origin_tag = :o", {"d": date(2025, 1, 1), "o": "cabinet", "limit": 10})
+    b = count_key("ops.v", " WHERE lead_date >= :d AND origin_tag = :o ", {"o": "cabinet", "d": date(2025, 1, 1), "ks_0": 5, "offset": 100})
+    assert a == b
+    assert a != count_key("ops.v", "WHERE lead_date >= :d AND origin_tag = :o", {"d": date(2025, 1, 1), "o": "fleet_migration"})
+    # Los casts de Postgres (::text) no son parámetros
+    assert count_key("ops.v", "WHERE status::text = :status", {"status": "x"}) == '["ops.v","status::text = :status",[["status","x"]]]'
+
+
+def test_plan_rows():
+    assert plan_rows([{"Plan": {"Node Type": "Seq Scan", "Plan Rows": 1234}}]) == 1234
+    assert plan_rows('[{"Plan": {"Plan Rows": 7}}]') == 7
+    assert plan_rows(None) is None
+    assert plan_rows([{}]) is None
+
+
+def test_cached_count_is_served_without_database():
+    key = count_key("ops.mv_x", "WHERE a = :a", {"a": 1})
+    count_cache._counts.put(key, (42, False))
+    assert count_rows(None, "ops.mv_x", "WHERE a = :a", {"a": 1, "limit": 50}) == (42, False)
+
+
+def test_mv_invalidation_drops_only_that_relation():
+    count_cache._counts.put(count_key("ops.mv_a"), (1, False), tags=["ops.mv_a"])
+    count_cache._counts.put(count_key("ops.mv_b"), (2, True), tags=["ops.mv_b"])
+    # Lo que hace el listener al recibir el NOTIFY de refresh_mv
+    _drop("ops.mv_a")
+    assert count_cache._counts.get(count_key("ops.mv_a")) is None
+    assert count_cache._counts.get(count_key("ops.mv_b")) == (2, True)
+    _drop(INVALIDATE_ALL)
+    assert count_cache._counts.get(count_key("ops.mv_b")) is None
+
+
+class _CountingSession:
+    """Sesión mínima: el COUNT devuelve `total` (o lanza `error`)."""
+
+    def __init__(self, total=0, error=None):
+        self.total = total
+        self.error = error
+        self.counts = 0
+
+    def begin_nested(self):
+        return nullcontext()
+
+    def execute(self, statement, params=None):
+        self.counts += 1
+        if self.error:
+            raise self.error
+        return self
+
+    def scalar(self):
+        return self.total
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    calls = []
+
+    def _estimate(db, relation, where_clause="", params=None):
+        calls.append(where_clause)
+        return 80000
+
+    monkeypatch.setattr(count_cache, "planner_estimate", _estimate)
+    monkeypatch.setattr(count_cache, "_ttl", lambda db, relation: 60)
+    return calls
+
+
+def test_is_unfiltered():
+    assert is_unfiltered("")
+    assert is_unfiltered("WHERE 1=1")
+    assert is_unfiltered(" WHERE 1=1 and TRUE ")
+    assert not is_unfiltered("WHERE 1=1 AND scout_id = :scout_id")
+
+
+def test_unfiltered_large_relation_returns_flagged_estimate(planner):
+    db = _CountingSession(total=123)
+    assert count_rows(db, "ops.mv_x", "WHERE 1=1", {}) == (80000, True)
+    assert db.counts == 0
+
+
+def test_filtered_total_is_always_exact(planner):
+    db = _CountingSession(total=123)
+    assert count_rows(db, "ops.mv_x", "WHERE scout_id = :s", {"s": 7}) == (123, False)
+    assert db.counts == 1
+    assert planner == []
+
+
+def test_failed_filtered_count_falls_back_to_flagged_estimate(planner):
+    db = _CountingSession(error=RuntimeError("statement timeout"))
+    assert count_rows(db, "ops.mv_x", "WHERE scout_id = :s", {"s": 7}) == (80000, True)
+    # No se cachea: el siguiente request vuelve a intentar el COUNT exacto
+    assert count_cache._counts.get(count_key("ops.mv_x", "WHERE scout_id = :s", {"s": 7})) is None
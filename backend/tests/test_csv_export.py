@@ -0,0 +1,63 @@
+"""
+Tests del escape de celdas, del troceo del CSV en streaming y del pool de exports.
+No requieren base de datos.
+"""
+from uuid import UUID
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core.db import PROFILE_EXPORT, PROFILES
+from app.services import csv_export
+from app.services.csv_export import escape_cell, iter_csv
+
+
+def test_escape_cell():
+    assert escape_cell(None) == ""
+    assert escape_cell("=SUM(A1)") == "'=SUM(A1)"
+    assert escape_cell("-5") == "'-5"
+    assert escape_cell("\tcmd") == "'\tcmd"
+    assert escape_cell("Juan") == "Juan"
+    # Los números negativos no son texto: no se tocan
+    assert escape_cell(-5) == -5
+    assert escape_cell(True) is True
+    assert escape_cell(False, ("Sí", "No")) == "No"
+    assert escape_cell(UUID(int=1)) == "00000000-0000-0000-0000-000000000001"
+
+
+def test_iter_csv_sends_bom_and_header_first_then_one_chunk_per_batch():
+    batches = iter([[("a", 1), ("@b", None)], [("c", True)]])
+    chunks = list(iter_csv(["name", "value"], batches))
+
+    assert chunks[0] == b"\xef\xbb\xbfname,value\r\n"
+    assert chunks[1] == b"a,1\r\n'@b,\r\n"
+    assert chunks[2] == b"c,True\r\n"
+
+
+def test_iter_csv_empty_result_keeps_header():
+    assert list(iter_csv(["x"], iter([]))) == [b"\xef\xbb\xbfx\r\n"]
+
+
+def test_export_profile_cuts_idle_transactions():
+    options = PROFILES[PROFILE_EXPORT].connect_options()
+    assert "-c idle_in_transaction_session_timeout=" in options
+    assert PROFILES[PROFILE_EXPORT].max_overflow == 0
+
+
+def test_busy_export_pool_answers_503(monkeypatch):
+    closed = []
+
+    class _Session:
+        def close(self):
+            closed.append(True)
+
+    def _pool_exhausted(db, sql, params):
+        raise PoolTimeoutError("QueuePool limit reached")
+
+    monkeypatch.setattr(csv_export, "session_for", lambda profile: _Session())
+    monkeypatch.setattr(csv_export, "open_stream", _pool_exhausted)
+    with pytest.raises(HTTPException) as exc:
+        csv_export.open_export("SELECT 1", None)
+    assert exc.value.status_code == 503
+    assert closed == [True]
@@ -0,0 +1,93 @@
+"""
+Tests de los resúmenes del dashboard: las filas por semana del GROUPING SETS deben
+salir igual que en las consultas por semana que reemplazan (orden DESC con la
+semana NULL primero, LIMIT 52 en scouts). No requieren base de datos: ambas
+consultas se reproducen sobre filas en memoria.
+"""
+import random
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app.api.v1.dashboard import (
+    SCOUT_GROUPING,
+    TOTAL_GROUPING,
+    WEEK_GROUPING,
+    YANGO_TOTAL_GROUPING,
+    YANGO_WEEK_GROUPING,
+    week_rows,
+)
+
+SetsRow = namedtuple("SetsRow", "grouping_id week_start_monday iso_year_week scout_id amount items")
+
+
+def _week(payable_date):
+    if payable_date is None:
+        return None, None
+    year, week, _ = payable_date.isocalendar()
+    return payable_date - timedelta(days=payable_date.weekday()), f"{year}-{week:02d}"
+
+
+def _ledger():
+    rng = random.Random(47)
+    start = date(2025, 1, 6)
+    rows = [
+        (start + timedelta(days=rng.randrange(60 * 7)), Decimal(rng.randrange(1, 500)), rng.randrange(1, 6))
+        for _ in range(400)
+    ]
+    # Items sin payable_date: semana NULL
+    rows += [(None, Decimal("25"), 1), (None, Decimal("40"), 2)]
+    return rows
+
+
+def _by_week(ledger):
+    weeks = {}
+    for payable_date, amount, _scout in ledger:
+        key = _week(payable_date)
+        total, items = weeks.get(key, (Decimal("0"), 0))
+        weeks[key] = (total + amount, items + 1)
+    return weeks
+
+
+def _old_by_week(ledger, limit=None):
+    """GROUP BY semana, iso_semana ORDER BY semana DESC [LIMIT n]: Postgres ordena NULL primero en DESC."""
+    weeks = _by_week(ledger)
+    keys = [k for k in weeks if k[0] is None] + sorted((k for k in weeks if k[0] is not None), reverse=True)
+    result = [(week, iso, weeks[(week, iso)][0], weeks[(week, iso)][1]) for week, iso in keys]
+    return result[:limit] if limit is not None else result
+
+
+def _grouping_sets(ledger, total_grouping, week_grouping, scout_grouping=None):
+    """Filas de GROUP BY GROUPING SETS, en el orden arbitrario en que las devuelve Postgres."""
+    rows = [SetsRow(total_grouping, None, None, None, sum(a for _, a, _ in ledger), len(ledger))]
+    for (week, iso), (amount, items) in _by_week(ledger).items():
+        rows.append(SetsRow(week_grouping, week, iso, None, amount, items))
+    if scout_grouping is not None:
+        for scout in {s for _, _, s in ledger}:
+            scout_rows = [a for _, a, s in ledger if s == scout]
+            rows.append(SetsRow(scout_grouping, None, None, scout, sum(scout_rows), len(scout_rows)))
+    random.Random(1).shuffle(rows)
+    return rows
+
+
+def _as_tuples(rows):
+    return [(r.week_start_monday, r.iso_year_week, r.amount, r.items) for r in rows]
+
+
+def test_scout_weeks_match_old_query():
+    ledger = _ledger()
+    rows = _grouping_sets(ledger, TOTAL_GROUPING, WEEK_GROUPING, SCOUT_GROUPING)
+    new = _as_tuples(week_rows(rows, WEEK_GROUPING, limit=52))
+    assert new == _old_by_week(ledger, limit=52)
+    # La semana NULL se conserva y va primero
+    assert new[0][0] is None
+    assert new[0][2] == Decimal("65")
+
+
+def test_yango_weeks_match_old_query():
+    ledger = _ledger()
+    rows = _grouping_sets(ledger, YANGO_TOTAL_GROUPING, YANGO_WEEK_GROUPING)
+    new = _as_tuples(week_rows(rows, YANGO_WEEK_GROUPING))
+    assert new == _old_by_week(ledger)
+    assert new[0][0] is None
+    assert [week for week, *_ in new[1:]] == sorted((week for week, *_ in new[1:]), reverse=True)
@@ -0,0 +1,67 @@
+"""
+Tests de los helpers de binding de listas grandes (app.core.db_utils).
+No requieren base de datos: compilan SQL con el dialecto de Postgres o registran las
+sentencias en una sesión mínima.
+"""
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.elements import TextClause
+
+from app.core.db_utils import any_array, array_keys, chunked, fetch_by_keys
+from app.models.canon import IdentityLink
+
+
+def _compile(stmt):
+    return stmt.compile(dialect=postgresql.psycopg2.dialect())
+
+
+def test_chunked_splits_in_fixed_size_lists():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunked([], 2)) == []
+
+
+def test_array_keys_dedupes_and_drops_none():
+    key = uuid4()
+    assert array_keys(["a", None, "b", "a", key]) == ["a", "b", str(key)]
+
+
+def test_any_array_binds_single_array_parameter():
+    keys = [str(i) for i in range(5000)]
+    compiled = _compile(select(IdentityLink.source_pk).where(any_array(IdentityLink.source_pk, keys)))
+
+    sql = str(compiled)
+    assert "= ANY (CAST(%(keys)s" in sql
+    assert "AS TEXT[]" in sql
+    assert compiled.params["keys"] == keys
+
+
+def test_any_array_casts_uuid_keys():
+    key = uuid4()
+    compiled = _compile(select(IdentityLink.id).where(any_array(IdentityLink.person_key, [key], "uuid")))
+
+    assert "AS UUID[]" in str(compiled)
+    assert compiled.params["keys"] == [str(key)]
+
+
+class _JoinFailsSession:
+    """Sesión mínima: el SQL de texto (tabla temporal) funciona, la consulta con JOIN falla."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        if not isinstance(statement, TextClause):
+            raise RuntimeError("join failed")
+        self.statements.append(str(statement))
+
+
+def test_temp_table_is_dropped_on_commit_and_failure_is_not_masked():
+    db = _JoinFailsSession()
+    with pytest.raises(RuntimeError, match="join failed"):
+        fetch_by_keys(db, select(IdentityLink.id), IdentityLink.source_pk, ["a", "b", "c"], temp_table_threshold=1)
+    assert db.statements[0].endswith("ON COMMIT DROP")
+    # Transacción abortada: ningún DROP después del error
+    assert not any(sql.startswith("DROP TABLE") for sql in db.statements)
@@ -0,0 +1,112 @@
+"""
+Tests del grafo de dependencias de MVs, del refresh paralelo por DAG y de la
+decisión de refresh por cambios. No requieren base de datos: el grafo se
+construye a mano y el refresh es simulado.
+"""
+import threading
+import time
+
+from app.services.mv_change_tracking import decide_refresh
+from app.services.mv_dependencies import MvDependencyGraph
+from app.services.mv_maintenance import refresh_mvs_parallel
+
+# raw -> ledger -> (vista) ledger_v -> enriched ; raw -> claims ; enriched + claims -> matrix
+GRAPH = MvDependencyGraph(
+    edges={
+        "ops.mv_raw": {"public.payments"},
+        "ops.mv_ledger": {"ops.mv_raw"},
+        "ops.v_ledger": {"ops.mv_ledger"},
+        "ops.mv_enriched": {"ops.v_ledger", "canon.identity_links"},
+        "ops.mv_claims": {"ops.mv_raw"},
+        "ops.mv_matrix": {"ops.mv_enriched", "ops.mv_claims"},
+    },
+    kinds={
+        "public.payments": "r",
+        "canon.identity_links": "r",
+        "ops.mv_raw": "m",
+        "ops.mv_ledger": "m",
+        "ops.v_ledger": "v",
+        "ops.mv_enriched": "m",
+        "ops.mv_claims": "m",
+        "ops.mv_matrix": "m",
+    },
+)
+
+
+def test_upstream_mvs_looks_through_views():
+    assert GRAPH.upstream_mvs("ops.mv_enriched") == {"ops.mv_ledger"}
+    assert GRAPH.base_tables("ops.mv_matrix") == {"public.payments", "canon.identity_links"}
+
+
+def test_refresh_dependencies_skip_unselected_mvs():
+    deps = GRAPH.refresh_dependencies(["ops.mv_raw", "ops.mv_enriched", "ops.mv_matrix"])
+    assert deps == {
+        "ops.mv_raw": set(),
+        "ops.mv_enriched": {"ops.mv_raw"},
+        "ops.mv_matrix": {"ops.mv_enriched", "ops.mv_raw"},
+    }
+
+
+def test_refresh_mvs_parallel_respects_dag_and_runs_branches_concurrently():
+    mvs = ["mv_matrix", "ops.mv_claims", "ops.mv_enriched", "ops.mv_ledger", "ops.mv_raw"]
+    deps = GRAPH.refresh_dependencies(["ops." + mv.split(".")[-1] for mv in mvs])
+    finished = []
+    running = set()
+    max_running = [0]
+    lock = threading.Lock()
+
+    def fake_refresh(schema, name):
+        mv = f"{schema}.{name}"
+        with lock:
+            for up in deps[mv]:
+                assert up in finished, f"{mv} empezó antes que {up}"
+            running.add(mv)
+            max_running[0] = max(max_running[0], len(running))
+        time.sleep(0.05)
+        with lock:
+            running.discard(mv)
+            finished.append(mv)
+        status = "error" if mv == "ops.mv_claims" else "success"
+        return {"mv": mv, "status": status, "duration_seconds": 1}
+
+    result = refresh_mvs_parallel(mvs, max_parallel=4, graph=GRAPH, refresh_fn=fake_refresh)
+
+    assert finished[0] == "ops.mv_raw" and finished[-1] == "ops.mv_matrix"
+    assert max_running[0] == 2
+    assert result["summary"]["success"] == 4
+    assert result["summary"]["errors"] == 1
+    assert result["summary"]["critical_path"] == ["ops.mv_raw", "ops.mv_ledger", "ops.mv_enriched", "ops.mv_matrix"]
+    assert result["summary"]["critical_path_seconds"] == 4
+
+
+def test_decide_refresh_skips_unchanged_and_propagates_downstream():
+    mvs = ["ops.mv_raw", "ops.mv_ledger", "ops.mv_enriched", "ops.mv_claims", "ops.mv_matrix"]
+    deps = GRAPH.refresh_dependencies(mvs)
+    inputs = {mv: GRAPH.base_tables(mv) for mv in mvs}
+    previous = {mv: {"public.payments": 10, "canon.identity_links": 5} for mv in mvs}
+    previous.pop("ops.mv_claims")
+
+    # Solo cambió identity_links: raw/ledger se omiten, enriched y matrix se refrescan
+    refresh, skip = decide_refresh(
+        mvs, deps, inputs, {"public.payments": 10, "canon.identity_links": 7}, previous, expired=set()
+    )
+    assert set(skip) == {"ops.mv_raw", "ops.mv_ledger"}
+    assert refresh["ops.mv_enriched"] == "inputs_changed: canon.identity_links"
+    assert refresh["ops.mv_claims"] == "no_previous_state"
+    assert refresh["ops.mv_matrix"].startswith("inputs_changed")
+
+    # Sin cambios: solo se refresca lo que no tiene estado y lo que depende de ello
+    refresh, skip = decide_refresh(
+        mvs, deps, inputs, {"public.payments": 10, "canon.identity_links": 5}, previous, expired={"ops.mv_raw"}
+    )
+    assert refresh["ops.mv_raw"] == "max_skip_age_exceeded"
+    assert refresh["ops.mv_ledger"] == "upstream_refreshed: ops.mv_raw"
+    assert skip == {}
+
+
+def test_decide_refresh_always_refreshes_unknown_counters():
+    refresh, skip = decide_refresh(
+        ["ops.mv_raw"], {}, {"ops.mv_raw": {"public.payments"}},
+        {"public.payments": None}, {"ops.mv_raw": {"public.payments": 3}}, expired=set()
+    )
+    assert refresh == {"ops.mv_raw": "inputs_changed: public.payments"} and skip == {}
@@ -0,0 +1,45 @@
+"""
+Tests de la frescura de una vista a partir de las MVs que lee. No requieren base
+de datos: la frescura de cada MV se pasa directamente.
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.services.mv_freshness import _view_freshness
+
+NOW = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def _mv(name, age_minutes, max_age_minutes=60, enqueued=False):
+    known = age_minutes is not None
+    return {
+        "source": name,
+        "source_kind": "materialized_view",
+        "data_as_of": NOW - timedelta(minutes=age_minutes) if known else None,
+        "age_seconds": age_minutes * 60 if known else None,
+        "max_age_seconds": max_age_minutes * 60,
+        "is_stale": age_minutes > max_age_minutes if known else None,
+        "refresh_enqueued": enqueued,
+    }
+
+
+def test_view_is_as_old_as_its_oldest_mv():
+    freshness = _view_freshness("ops.v_x", [_mv("ops.mv_a", 10), _mv("ops.mv_b", 30, max_age_minutes=240)])
+    assert freshness["source"] == "ops.v_x"
+    assert freshness["source_kind"] == "view"
+    assert freshness["data_as_of"] == NOW - timedelta(minutes=30)
+    assert freshness["age_seconds"] == 1800
+    assert freshness["max_age_seconds"] == 3600
+    assert freshness["is_stale"] is False
+
+
+def test_view_is_stale_if_any_mv_is_stale():
+    freshness = _view_freshness("ops.v_x", [_mv("ops.mv_a", 90, enqueued=True), _mv("ops.mv_b", None)])
+    assert freshness["is_stale"] is True
+    assert freshness["refresh_enqueued"] is True
+    # Una MV sin registro de refresh: no se conoce data_as_of de la vista
+    assert freshness["data_as_of"] is None
+
+
+def test_unknown_mv_makes_staleness_unknown():
+    freshness = _view_freshness("ops.v_x", [_mv("ops.mv_a", 5), _mv("ops.mv_b", None)])
+    assert freshness["is_stale"] is None
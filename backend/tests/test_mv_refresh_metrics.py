@@ -0,0 +1,43 @@
+"""
+Tests de las recomendaciones de VACUUM/REINDEX a partir de las métricas de refresh.
+No requieren base de datos.
+"""
+from app.services.mv_refresh_metrics import bloat_recommendations, build_refresh_metrics, estimate_rows
+
+
+def test_build_refresh_metrics_maps_snapshots():
+    metrics = build_refresh_metrics(
+        "concurrent", 0.25,
+        {"rows": 100, "table_bytes": 8192, "index_bytes": 4096, "dead_tuples": 0},
+        {"rows": 120, "table_bytes": 16384, "index_bytes": 8192, "dead_tuples": 40},
+    )
+    assert metrics["refresh_method"] == "concurrent"
+    assert metrics["lock_wait_ms"] == 250
+    assert (metrics["rows_before"], metrics["rows_after_refresh"]) == (100, 120)
+    assert metrics["dead_tuples_after"] == 40
+    assert build_refresh_metrics("normal", None, {}, {})["rows_before"] is None
+
+
+def test_estimate_rows_follows_the_refresh_method():
+    # CONCURRENTLY aplica DELETE/INSERT: reltuples queda del último ANALYZE
+    assert estimate_rows(1000.0, 1200, "concurrent") == 1200
+    # Refresh normal: heap nuevo e índices reconstruidos actualizan reltuples
+    assert estimate_rows(1000.0, 1200, "normal") == 1000
+    assert estimate_rows(-1.0, 50) == 50
+    assert estimate_rows(None, None) is None
+
+
+def test_bloat_recommendations_thresholds():
+    healthy = {"rows_after_refresh": 100000, "dead_tuples_after": 5000,
+               "table_bytes_after": 10_000_000, "index_bytes_after": 2_000_000}
+    baseline = {"table_bytes_per_row": 100.0, "index_bytes_per_row": 20.0}
+    assert bloat_recommendations(healthy, baseline) == []
+
+    bloated = dict(healthy, dead_tuples_after=50000, index_bytes_after=4_000_000, table_bytes_after=16_000_000)
+    recommendations = bloat_recommendations(bloated, baseline)
+    assert any(r.startswith("VACUUM ANALYZE") for r in recommendations)
+    assert any(r.startswith("REINDEX") for r in recommendations)
+    assert any(r.startswith("VACUUM FULL") for r in recommendations)
+
+    # Sin baseline solo se evalúan los dead tuples
+    assert len(bloat_recommendations(bloated)) == 1
@@ -0,0 +1,77 @@
+"""
+Tests del planificador de refresh adaptativo y del conteo de lecturas de la API.
+No requieren base de datos: coste y lecturas se pasan directamente al planificador.
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.services.api_reads import attribute_reads, extract_relations
+from app.services.mv_dependencies import MvDependencyGraph
+from app.services.mv_refresh_scheduler import (
+    MvRefreshStats,
+    in_offpeak_window,
+    is_due,
+    plan_schedule,
+)
+
+
+def _plan(stats, budget=600):
+    plan, summary = plan_schedule(stats, budget_seconds_per_hour=budget, min_interval_minutes=5, offpeak_cost_seconds=120)
+    return {entry["mv"]: entry for entry in plan}, summary
+
+
+def test_hot_cheap_mvs_refresh_more_often_than_cold_expensive_ones():
+    plan, summary = _plan([
+        MvRefreshStats("ops.mv_hot", priority=1, cost_seconds=5, reads_per_hour=500),
+        MvRefreshStats("ops.mv_cold", priority=2, cost_seconds=90, reads_per_hour=2),
+        MvRefreshStats("ops.mv_heavy", priority=3, cost_seconds=600, reads_per_hour=50),
+    ])
+    assert plan["ops.mv_hot"]["interval_minutes"] < plan["ops.mv_cold"]["interval_minutes"]
+    assert plan["ops.mv_cold"]["interval_minutes"] <= plan["ops.mv_cold"]["slo_minutes"]
+    assert plan["ops.mv_heavy"]["slot"] == "offpeak"
+    assert summary["within_budget"]
+
+
+def test_slo_wins_over_budget_and_is_reported():
+    plan, summary = _plan([
+        MvRefreshStats("ops.mv_a", priority=1, cost_seconds=300, reads_per_hour=10),
+        MvRefreshStats("ops.mv_b", priority=1, cost_seconds=300, reads_per_hour=0),
+    ], budget=60)
+    assert plan["ops.mv_a"]["interval_minutes"] == 60
+    assert plan["ops.mv_b"]["interval_minutes"] == 60
+    assert not summary["within_budget"]
+
+
+def test_is_due_and_offpeak_window():
+    now = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    anytime = {"slot": "anytime", "interval_minutes": 30}
+    offpeak = {"slot": "offpeak", "interval_minutes": 1440}
+    assert is_due(anytime, None, now, offpeak=False)
+    assert not is_due(anytime, now - timedelta(minutes=10), now, offpeak=False)
+    assert is_due(anytime, now - timedelta(minutes=31), now, offpeak=False)
+    assert not is_due(offpeak, now - timedelta(days=2), now, offpeak=False)
+    assert is_due(offpeak, now - timedelta(days=2), now, offpeak=True)
+    assert in_offpeak_window(3, "1-6") and not in_offpeak_window(6, "1-6")
+    assert in_offpeak_window(23, "22-4") and in_offpeak_window(2, "22-4") and not in_offpeak_window(12, "22-4")
+
+
+def test_only_api_selects_count_as_reads():
+    assert extract_relations(
+        "SELECT * FROM ops.v_cabinet_financial_14d v JOIN ops.mv_driver_name_index n ON n.driver_id = v.driver_id"
+    ) == {"ops.v_cabinet_financial_14d", "ops.mv_driver_name_index"}
+    assert extract_relations("WITH x AS (SELECT 1 FROM OPS.MV_A) SELECT * FROM x") == {"ops.mv_a"}
+    assert extract_relations("REFRESH MATERIALIZED VIEW CONCURRENTLY ops.mv_a") == set()
+    assert extract_relations("INSERT INTO ops.mv_read_stats SELECT 1 FROM ops.mv_a") == set()
+
+
+def test_view_reads_are_charged_to_the_mvs_behind_them():
+    graph = MvDependencyGraph(
+        edges={
+            "ops.v_enriched": {"ops.v_ledger"},
+            "ops.v_ledger": {"ops.mv_ledger"},
+            "ops.mv_ledger": {"ops.mv_raw"},
+        },
+        kinds={"ops.v_enriched": "v", "ops.v_ledger": "v", "ops.mv_ledger": "m", "ops.mv_raw": "m"},
+    )
+    reads = attribute_reads({"ops.v_enriched": 10, "ops.mv_ledger": 5, "ops.some_table": 7}, graph)
+    # Una lectura de mv_ledger no es lectura de mv_raw (la MV intermedia ya materializa sus datos)
+    assert reads == {"ops.mv_ledger": 15}
@@ -0,0 +1,96 @@
+"""
+Tests de la inferencia de granos candidatos para índices únicos de MVs.
+No requieren base de datos: se usan definiciones y estadísticas de ejemplo.
+"""
+from types import SimpleNamespace
+
+from app.services import mv_unique_keys
+from app.services.mv_unique_keys import data_key_candidates, definition_key_candidates, provision_unique_index
+
+
+def test_definition_candidates_use_plain_output_columns_only():
+    definition = """ SELECT DISTINCT ON (c.driver_id, c.milestone_value) c.driver_id,
+    c.milestone_value,
+    c.amount
+   FROM ops.claims c
+  ORDER BY c.driver_id, c.milestone_value, c.created_at DESC;"""
+    assert definition_key_candidates(definition, ["driver_id", "milestone_value", "amount"]) == [
+        ("driver_id", "milestone_value")
+    ]
+
+    grouped = """ SELECT l.driver_id,
+    date_trunc('week', l.lead_date) AS week_start,
+    count(*) AS leads
+   FROM ops.leads l
+  GROUP BY l.driver_id, (date_trunc('week', l.lead_date));"""
+    assert definition_key_candidates(grouped, ["driver_id", "week_start", "leads"]) == []
+
+
+def test_definition_candidates_ignore_nested_grouping():
+    # GROUP BY en una CTE: el LEFT JOIN posterior puede repetir driver_id
+    cte = """ WITH agg AS (
+         SELECT c.driver_id,
+            sum(c.amount) AS amount
+           FROM ops.claims c
+          GROUP BY c.driver_id
+        )
+ SELECT agg.driver_id,
+    agg.amount,
+    m.milestone_value
+   FROM agg
+     LEFT JOIN ops.milestones m ON m.driver_id = agg.driver_id;"""
+    assert definition_key_candidates(cte, ["driver_id", "amount", "milestone_value"]) == []
+
+    subquery = """ SELECT s.driver_id,
+    m.milestone_value
+   FROM ( SELECT DISTINCT ON (l.driver_id) l.driver_id
+           FROM ops.leads l
+          WHERE l.source = 'a)b'::text
+          ORDER BY l.driver_id, l.lead_date DESC) s
+     JOIN ops.milestones m ON m.driver_id = s.driver_id
+  GROUP BY s.driver_id, m.milestone_value;"""
+    # Solo cuenta el GROUP BY de nivel superior (el paréntesis dentro del literal no confunde la profundidad)
+    assert definition_key_candidates(subquery, ["driver_id", "milestone_value"]) == [("driver_id", "milestone_value")]
+
+
+def test_definition_candidates_skip_set_operations():
+    union = """ SELECT a.driver_id
+   FROM ops.a a
+  GROUP BY a.driver_id
+UNION ALL
+ SELECT b.driver_id
+   FROM ops.b b
+  GROUP BY b.driver_id;"""
+    assert definition_key_candidates(union, ["driver_id"]) == []
+
+
+def test_data_candidates_skip_nullable_and_low_cardinality_keys():
+    stats = {
+        "driver_id": (-0.5, 0.0),       # 500 de 1000 filas
+        "milestone_value": (3, 0.0),
+        "amount": (10, 0.0),
+        "lead_date": (300, 0.1),        # con NULLs: no sirve como clave
+    }
+    candidates = data_key_candidates(stats, row_estimate=1000)
+    assert candidates[0] == ("driver_id", "milestone_value")
+    assert all("lead_date" not in key for key in candidates)
+    assert data_key_candidates({"id": (-1, 0.0)}, row_estimate=1000) == [("id",)]
+
+
+def test_data_inferred_keys_are_reported_not_created(monkeypatch):
+    created = []
+    db = SimpleNamespace(execute=lambda *args, **kwargs: SimpleNamespace(scalar=lambda: " SELECT x.driver_id FROM t x;"))
+    monkeypatch.setattr(mv_unique_keys, "get_relation_info", lambda *args, **kwargs: SimpleNamespace(
+        is_materialized=True, has_unique_index=False, populated=True, columns=["driver_id", "milestone_value"]
+    ))
+    monkeypatch.setattr(mv_unique_keys, "_column_stats", lambda *args: (
+        {"driver_id": (-0.5, 0.0), "milestone_value": (3, 0.0)}, 1000.0
+    ))
+    monkeypatch.setattr(mv_unique_keys, "_verify_key", lambda db, mv, key: None)
+    monkeypatch.setattr(mv_unique_keys, "_create_index_concurrently", lambda *args: created.append(args))
+
+    result = provision_unique_index(db, "ops.mv_x")
+    assert result["status"] == "needs_confirmation"
+    assert result["suggested"][0]["key"] == ["driver_id", "milestone_value"]
+    assert result["suggested"][0]["ddl"].startswith('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "ux_mv_x_grain"')
+    assert created == []
@@ -0,0 +1,69 @@
+"""
+Tests de la paginación keyset (condición SQL y cursor opaco).
+No requieren base de datos.
+"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.pagination import (
+    SortKey, add_condition, encode_cursor, keyset_condition, next_cursor, order_by,
+)
+
+LEDGER = (SortKey("l.pay_date", descending=True), SortKey("l.payment_key", nullable=False))
+CLAIMS = (
+    SortKey("days_overdue_yango", descending=True),
+    SortKey("expected_amount", descending=True),
+    SortKey("driver_id"),
+)
+
+
+def test_order_by_makes_null_ordering_explicit():
+    assert order_by(LEDGER) == "l.pay_date DESC NULLS FIRST, l.payment_key ASC NULLS LAST"
+
+
+def test_cursor_round_trip_keeps_types():
+    cursor = encode_cursor(CLAIMS, {"days_overdue_yango": 3, "expected_amount": Decimal("25.00"), "driver_id": "d1"})
+    params = {}
+    condition = keyset_condition(CLAIMS, cursor, params)
+    assert params == {"ks_0": 3, "ks_1": Decimal("25.00"), "ks_2": "d1"}
+    # Direcciones mezcladas: forma expandida
+    assert condition.startswith("((days_overdue_yango < :ks_0) OR ")
+    assert "(days_overdue_yango = :ks_0 AND expected_amount = :ks_1 AND (driver_id > :ks_2 OR driver_id IS NULL))" in condition
+
+
+def test_same_direction_uses_row_comparison():
+    keys = (SortKey("detected_at", descending=True, nullable=False), SortKey("driver_id", descending=True, nullable=False))
+    cursor = encode_cursor(keys, {"detected_at": date(2025, 1, 6), "driver_id": "d9"})
+    params = {}
+    assert keyset_condition(keys, cursor, params) == "(detected_at, driver_id) < (:ks_0, :ks_1)"
+    assert params["ks_0"] == date(2025, 1, 6)
+
+
+def test_null_cursor_value():
+    cursor = encode_cursor(LEDGER, {"pay_date": None, "payment_key": "p1"})
+    # pay_date DESC NULLS FIRST: tras los NULL vienen todas las fechas no nulas
+    assert keyset_condition(LEDGER, cursor, {}) == (
+        "((l.pay_date IS NOT NULL) OR (l.pay_date IS NULL AND l.payment_key > :ks_1))"
+    )
+
+
+def test_cursor_from_other_keys_is_rejected():
+    cursor = encode_cursor(LEDGER, {"pay_date": None, "payment_key": "p1"})
+    with pytest.raises(HTTPException) as error:
+        keyset_condition(CLAIMS, cursor, {})
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        keyset_condition(LEDGER, "not-a-cursor", {})
+
+
+def test_next_cursor_only_on_full_page_and_add_condition():
+    rows = [{"pay_date": date(2025, 1, 1), "payment_key": "p"}]
+    assert next_cursor(LEDGER, rows, limit=2) is None
+    assert next_cursor(LEDGER, rows, limit=1) is not None
+    assert keyset_condition(LEDGER, None, {}) is None
+    assert add_condition("", "a > 1") == "WHERE a > 1"
+    assert add_condition("WHERE b = 2", "a > 1") == "WHERE b = 2 AND a > 1"
+    assert add_condition("WHERE b = 2", None) == "WHERE b = 2"
@@ -0,0 +1,56 @@
+"""
+Tests de la cache de respuestas: clave normalizada, LRU, TTL e invalidación
+por tags al refrescar una MV.
+No requieren base de datos.
+"""
+from datetime import date
+from enum import Enum
+
+from app.services.mv_cache import INVALIDATE_ALL, _drop
+from app.services.response_cache import ResponseCache, response_cache
+
+
+class Order(str, Enum):
+    desc = "desc"
+
+
+def test_key_ignores_param_order_and_none_values():
+    cache = ResponseCache("t", ttl=60)
+    assert cache.key(a=1, b=date(2025, 1, 6), c=None) == cache.key(b=date(2025, 1, 6), a=1)
+    assert cache.key(order=Order.desc, search=" x ") == cache.key(order="desc", search="x")
+    assert cache.key(a=1) != cache.key(a=2)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache("t", ttl=60, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache("t", ttl=60)
+    cache.put("a", 1, ttl=0)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_mv_refresh_purges_tagged_entries_in_every_cache():
+    first = response_cache("test_first", ttl=60)
+    second = response_cache("test_second", ttl=60)
+    first.put("k", "from mv_a", tags=["ops.mv_a"])
+    second.put("k", "from mv_a and mv_b", tags=["ops.mv_a", "ops.mv_b"])
+    second.put("other", "from mv_b", tags=["ops.mv_b"])
+
+    # Lo que hace el listener al recibir el NOTIFY de refresh_mv
+    _drop("ops.mv_a")
+    assert first.get("k") is None
+    assert second.get("k") is None
+    assert second.get("other") == "from mv_b"
+
+    _drop(INVALIDATE_ALL)
+    assert second.get("other") is None
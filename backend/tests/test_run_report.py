@@ -0,0 +1,21 @@
+"""
+Tests del reporte de runs guardado en ops.ingestion_runs.report_json.
+No requieren base de datos.
+"""
+from types import SimpleNamespace
+
+from app.models.ops import RunStatus
+from app.services import run_report
+from app.services.run_report import REPORT_VERSION, get_run_report
+
+
+def test_stored_report_is_served_without_queries():
+    stored = {"version": REPORT_VERSION, "counts_by_source_table": {}}
+    run = SimpleNamespace(id=1, status=RunStatus.COMPLETED, report_json=stored)
+    assert get_run_report(None, run) is stored
+
+
+def test_report_from_older_version_is_recomputed(monkeypatch):
+    monkeypatch.setattr(run_report, "build_run_report", lambda db, run_id: {"version": REPORT_VERSION, "run_id": run_id})
+    run = SimpleNamespace(id=7, status=RunStatus.RUNNING, report_json={"version": REPORT_VERSION - 1})
+    assert get_run_report(None, run) == {"version": REPORT_VERSION, "run_id": 7}
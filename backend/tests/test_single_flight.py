@@ -0,0 +1,87 @@
+"""
+Tests del coalescing de requests idénticos concurrentes (single-flight).
+No requieren base de datos.
+"""
+import threading
+import time
+
+from app.services.single_flight import SingleFlight, coalesce, single_flight
+
+
+def _run_concurrently(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_identical_concurrent_calls_share_one_execution():
+    flight = SingleFlight("t")
+    executions = []
+
+    def slow():
+        executions.append(1)
+        time.sleep(0.2)
+        return {"total": 1}
+
+    results, errors = _run_concurrently(5, lambda: flight.do("k", slow))
+
+    assert executions == [1]
+    assert all(r == {"total": 1} for r in results)
+    assert errors == [None] * 5
+    assert flight.stats()["coalesced"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_waiters_get_the_leader_exception():
+    flight = SingleFlight("t")
+
+    def failing():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    _, errors = _run_concurrently(3, lambda: flight.do("k", failing))
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.stats()["executions"] == 1
+
+
+def test_waiter_runs_itself_after_timeout():
+    flight = SingleFlight("t", wait_timeout=0.05)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return len(calls)
+
+    _run_concurrently(2, lambda: flight.do("k", slow))
+    assert len(calls) == 2
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_coalesce_keys_on_params_without_session():
+    calls = []
+
+    @coalesce("test_endpoint")
+    def endpoint(db=None, week_start=None, limit=10):
+        calls.append((week_start, limit))
+        time.sleep(0.2)
+        return limit
+
+    results, _ = _run_concurrently(4, lambda: endpoint(db=object(), week_start=None, limit=10))
+    assert results == [10] * 4
+    assert len(calls) == 1
+    assert endpoint(db=object(), limit=20) == 20
+    assert single_flight("test_endpoint").stats()["executions"] == 2
+    assert endpoint.__name__ == "endpoint"